@@ -30,9 +30,9 @@ DATAFILE 'discount_data01.dbf' SIZE 200M AUTOEXTEND ON;
 CREATE SEQUENCE seq_users START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE seq_roles START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE seq_plant_categories START WITH 1 INCREMENT BY 1;
-CREATE SEQUENCE seq_plants START WITH 1 INCREMENT BY 1;
-CREATE SEQUENCE seq_plant_images START WITH 1 INCREMENT BY 1;
-CREATE SEQUENCE seq_plant_sizes START WITH 1 INCREMENT BY 1;
+CREATE SEQUENCE seq_plants START WITH 1 INCREMENT BY 1 CACHE 1000;
+CREATE SEQUENCE seq_plant_images START WITH 1 INCREMENT BY 1 CACHE 1000;
+CREATE SEQUENCE seq_plant_sizes START WITH 1 INCREMENT BY 1 CACHE 1000;
 CREATE SEQUENCE seq_discount_types START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE seq_discounts START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE seq_plant_discounts START WITH 1 INCREMENT BY 1;
@@ -44,8 +44,8 @@ CREATE SEQUENCE seq_delivery_agents START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE seq_order_assignments START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE seq_favorites START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE review_id_seq START WITH 1 INCREMENT BY 1 NOCACHE NOCYCLE;
-CREATE SEQUENCE seq_plant_features START WITH 1 INCREMENT BY 1;
-CREATE SEQUENCE seq_plant_care_tips START WITH 1 INCREMENT BY 1;
+CREATE SEQUENCE seq_plant_features START WITH 1 INCREMENT BY 1 CACHE 1000;
+CREATE SEQUENCE seq_plant_care_tips START WITH 1 INCREMENT BY 1 CACHE 1000;
 CREATE SEQUENCE seq_carts START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE role_scret_keys START WITH 1 INCREMENT BY 1;
 
@@ -123,14 +123,27 @@ CREATE TABLE plants (
     stock_quantity NUMBER NOT NULL,
     created_at TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL,
     updated_at TIMESTAMP,
-    is_active NUMBER(1) DEFAULT 1 NOT NULL
+    is_active NUMBER(1) DEFAULT 1 NOT NULL,
+    -- Review aggregates kept up to date by apply_review_rating
+    -- (manage.py rebuild_plant_ratings recomputes them from reviews)
+    avg_rating NUMBER(6,4) DEFAULT 0 NOT NULL,
+    review_count NUMBER DEFAULT 0 NOT NULL,
+    rating_sum NUMBER DEFAULT 0 NOT NULL,
+    rating_1_count NUMBER DEFAULT 0 NOT NULL,
+    rating_2_count NUMBER DEFAULT 0 NOT NULL,
+    rating_3_count NUMBER DEFAULT 0 NOT NULL,
+    rating_4_count NUMBER DEFAULT 0 NOT NULL,
+    rating_5_count NUMBER DEFAULT 0 NOT NULL
 ) TABLESPACE plant_data;
 
 CREATE OR REPLACE TRIGGER trg_plants_id
 BEFORE INSERT ON plants
 FOR EACH ROW
 BEGIN
-  :NEW.plant_id := seq_plants.NEXTVAL;
+  -- Bulk imports take their ids from seq_plants up front
+  IF :NEW.plant_id IS NULL THEN
+    :NEW.plant_id := seq_plants.NEXTVAL;
+  END IF;
 END;
 /
 
@@ -147,6 +160,8 @@ CREATE TABLE plant_images (
     plant_id NUMBER NOT NULL,
     image_url VARCHAR2(255) NOT NULL,
     is_primary NUMBER(1) DEFAULT 0 NOT NULL,
+    content_hash VARCHAR2(64), -- SHA-256 of the uploaded file
+    upload_status VARCHAR2(10) DEFAULT 'ready' NOT NULL, -- 'pending' while the upload runs, 'failed'
     CONSTRAINT fk_plant_images_plant FOREIGN KEY (plant_id) REFERENCES plants(plant_id)
 ) TABLESPACE plant_data;
 
@@ -482,7 +497,7 @@ CREATE TABLE delivery_slots (
     CONSTRAINT uk_delivery_slot UNIQUE (agent_id, slot_date, slot_time)
 ) TABLESPACE order_data;
 
-CREATE SEQUENCE seq_delivery_slots START WITH 1 INCREMENT BY 1;
+CREATE SEQUENCE seq_delivery_slots START WITH 1 INCREMENT BY 1 CACHE 1000;
 
 CREATE OR REPLACE TRIGGER trg_delivery_slots_id
 BEFORE INSERT ON delivery_slots
@@ -492,6 +507,31 @@ BEGIN
 END;
 /
 
+-- A cancelled or returned order gives back the delivery slot it held, if
+-- the day hasn't passed, so checkout and assignment can hand it out again
+CREATE OR REPLACE TRIGGER trg_orders_free_slot
+AFTER UPDATE OF status_id ON orders
+FOR EACH ROW
+WHEN (NEW.status_id <> OLD.status_id)
+DECLARE
+    v_status_name order_statuses.status_name%TYPE;
+BEGIN
+    SELECT status_name INTO v_status_name
+    FROM order_statuses
+    WHERE status_id = :NEW.status_id;
+
+    IF v_status_name IN ('Cancelled', 'Returned') THEN
+        UPDATE delivery_slots
+        SET is_available = 1, order_id = NULL
+        WHERE order_id = :NEW.order_id
+        AND slot_date >= TRUNC(SYSDATE);
+    END IF;
+EXCEPTION
+    WHEN NO_DATA_FOUND THEN
+        NULL;
+END;
+/
+
 -- Activity log table
 CREATE TABLE activity_log (
     log_id NUMBER PRIMARY KEY,
@@ -503,10 +543,11 @@ CREATE TABLE activity_log (
     CONSTRAINT fk_activity_log_user FOREIGN KEY (user_id) REFERENCES users(user_id)
 ) TABLESPACE user_data;
 
+-- Cached: activity rows arrive in executemany batches from greencart/activity.py
 CREATE SEQUENCE seq_activity_log
     START WITH 1
     INCREMENT BY 1
-    NOCACHE
+    CACHE 1000
     NOCYCLE;
 
 CREATE OR REPLACE TRIGGER trg_activity_log_id
@@ -539,6 +580,79 @@ BEGIN
 END;
 /
 
+-- Effective price of every plant and size (size_id 0: the plant without a
+-- size), kept by greencart/discounts.py. A row holds while unit_price still
+-- matches, fingerprint matches the discounts on the plant and valid_until
+-- (the next discount window opening or closing on the plant) hasn't passed.
+-- Refresh expired rows with `manage.py refresh_prices`.
+CREATE TABLE plant_prices (
+    plant_id NUMBER NOT NULL,
+    size_id NUMBER DEFAULT 0 NOT NULL,
+    unit_price NUMBER(10,2) NOT NULL,
+    effective_price NUMBER(10,2) NOT NULL,
+    discount_id NUMBER,
+    valid_until TIMESTAMP,
+    fingerprint NUMBER NOT NULL,
+    computed_at TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL,
+    CONSTRAINT pk_plant_prices PRIMARY KEY (plant_id, size_id),
+    CONSTRAINT fk_plant_prices_plant FOREIGN KEY (plant_id) REFERENCES plants(plant_id)
+) TABLESPACE plant_data;
+
+-- Monthly earnings rollups, kept up to date by the trg_*_earnings triggers.
+-- A delivered order counts in the month of actual_delivery_date (order_date
+-- when that is missing). Sellers earn 90% of what the items sold for, after
+-- order_items.discount_applied. Rebuild with `manage.py rebuild_earnings_rollups`.
+CREATE TABLE agent_monthly_earnings (
+    agent_id NUMBER NOT NULL,
+    month_start DATE NOT NULL,
+    deliveries_completed NUMBER DEFAULT 0 NOT NULL,
+    earnings NUMBER(14,4) DEFAULT 0 NOT NULL,
+    CONSTRAINT pk_agent_monthly_earnings PRIMARY KEY (agent_id, month_start),
+    CONSTRAINT fk_agent_monthly_earnings FOREIGN KEY (agent_id) REFERENCES delivery_agents(agent_id)
+) ORGANIZATION INDEX TABLESPACE order_data;
+
+CREATE TABLE seller_monthly_earnings (
+    seller_id NUMBER NOT NULL,
+    month_start DATE NOT NULL,
+    items_sold NUMBER DEFAULT 0 NOT NULL,
+    earnings NUMBER(14,4) DEFAULT 0 NOT NULL,
+    CONSTRAINT pk_seller_monthly_earnings PRIMARY KEY (seller_id, month_start),
+    CONSTRAINT fk_seller_monthly_earnings FOREIGN KEY (seller_id) REFERENCES users(user_id)
+) ORGANIZATION INDEX TABLESPACE order_data;
+
+-- Bulk catalog imports (seller/catalog_import.py). rows_done is the last
+-- source row committed, a resumed import starts after it.
+CREATE TABLE catalog_imports (
+    import_id NUMBER PRIMARY KEY,
+    seller_id NUMBER NOT NULL,
+    source_name VARCHAR2(255),
+    status VARCHAR2(20) DEFAULT 'running' NOT NULL, -- 'running', 'completed'
+    rows_done NUMBER DEFAULT 0 NOT NULL,
+    rows_imported NUMBER DEFAULT 0 NOT NULL,
+    rows_failed NUMBER DEFAULT 0 NOT NULL,
+    started_at TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL,
+    updated_at TIMESTAMP,
+    CONSTRAINT fk_catalog_imports_seller FOREIGN KEY (seller_id) REFERENCES users(user_id)
+) TABLESPACE plant_data;
+
+CREATE SEQUENCE seq_catalog_imports START WITH 1 INCREMENT BY 1;
+
+CREATE OR REPLACE TRIGGER trg_catalog_imports_id
+BEFORE INSERT ON catalog_imports
+FOR EACH ROW
+BEGIN
+  :NEW.import_id := seq_catalog_imports.NEXTVAL;
+END;
+/
+
+CREATE TABLE catalog_import_errors (
+    import_id NUMBER NOT NULL,
+    source_row NUMBER NOT NULL,
+    message VARCHAR2(500) NOT NULL,
+    CONSTRAINT pk_catalog_import_errors PRIMARY KEY (import_id, source_row),
+    CONSTRAINT fk_catalog_import_errors FOREIGN KEY (import_id) REFERENCES catalog_imports(import_id)
+) ORGANIZATION INDEX TABLESPACE plant_data;
+
 ALTER TABLE plant_discounts DROP CONSTRAINT chk_plant_or_category;
 
 -- Update discount_types with new types
@@ -562,6 +676,24 @@ CREATE INDEX idx_order_items_order ON order_items(order_id) TABLESPACE index_dat
 CREATE INDEX idx_order_items_plant ON order_items(plant_id) TABLESPACE index_data;
 CREATE INDEX idx_reviews_plant ON reviews(plant_id) TABLESPACE index_data;
 CREATE INDEX idx_reviews_user ON reviews(user_id) TABLESPACE index_data;
+-- Keyset pagination on the plant collection pages
+CREATE INDEX idx_plants_active_price ON plants(is_active, base_price, plant_id) TABLESPACE index_data;
+CREATE INDEX idx_plants_active_name ON plants(is_active, name, plant_id) TABLESPACE index_data;
+CREATE INDEX idx_plant_category_map_cat ON plant_category_mapping(category_id, plant_id) TABLESPACE index_data;
+CREATE INDEX idx_plants_active_rating ON plants(is_active, avg_rating DESC, plant_id) TABLESPACE index_data;
+-- Delivery agent dashboard
+CREATE INDEX idx_order_assignments_agent ON order_assignments(agent_id, order_id) TABLESPACE index_data;
+-- Delivery slot index load and the slot held by an order
+CREATE INDEX idx_delivery_slots_date ON delivery_slots(slot_date) TABLESPACE index_data;
+CREATE INDEX idx_delivery_slots_order ON delivery_slots(order_id) TABLESPACE index_data;
+-- Filling in images when their upload completes
+CREATE INDEX idx_plant_images_hash ON plant_images(content_hash) TABLESPACE index_data;
+-- Open alert lookups from the low-stock triggers and the bulk stock sync
+CREATE INDEX idx_low_stock_alerts_plant ON low_stock_alerts(plant_id, is_resolved) TABLESPACE index_data;
+-- Discount index load and the price rows due for a refresh
+CREATE INDEX idx_discounts_active_end ON discounts(is_active, end_date) TABLESPACE index_data;
+CREATE INDEX idx_plant_discounts_discount ON plant_discounts(discount_id) TABLESPACE index_data;
+CREATE INDEX idx_plant_prices_valid ON plant_prices(valid_until) TABLESPACE index_data;
 
 -- Views
 
@@ -573,28 +705,22 @@ SELECT
     DBMS_LOB.SUBSTR(p.description, 4000, 1) AS description,
     p.base_price,
     p.stock_quantity,
-    LISTAGG(pc.name, ', ') WITHIN GROUP (ORDER BY pc.name) AS categories,
+    (SELECT LISTAGG(pc.name, ', ') WITHIN GROUP (ORDER BY pc.name)
+     FROM plant_category_mapping pcm
+     JOIN plant_categories pc ON pcm.category_id = pc.category_id
+     WHERE pcm.plant_id = p.plant_id) AS categories,
     pi.image_url AS primary_image,
-    NVL(AVG(r.rating), 0) AS avg_rating,
-    COUNT(r.review_id) AS review_count,
+    p.avg_rating,
+    p.review_count,
     (SELECT LISTAGG(image_url, ',') WITHIN GROUP (ORDER BY image_id)
      FROM plant_images pi2 
      WHERE pi2.plant_id = p.plant_id) AS all_images
 FROM 
     plants p
-LEFT JOIN 
-    plant_category_mapping pcm ON p.plant_id = pcm.plant_id
-LEFT JOIN 
-    plant_categories pc ON pcm.category_id = pc.category_id
 LEFT JOIN 
     plant_images pi ON p.plant_id = pi.plant_id AND pi.is_primary = 1
-LEFT JOIN
-    reviews r ON p.plant_id = r.plant_id
 WHERE 
-    p.is_active = 1
-GROUP BY 
-    p.plant_id, p.name, DBMS_LOB.SUBSTR(p.description, 4000, 1), 
-    p.base_price, p.stock_quantity, pi.image_url;
+    p.is_active = 1;
 
 
 
@@ -645,10 +771,22 @@ SELECT
     d.end_date
 FROM 
     plants p
-LEFT JOIN plant_category_mapping pcm ON p.plant_id = pcm.plant_id
-JOIN plant_discounts pd ON (p.plant_id = pd.plant_id 
-                            OR pcm.category_id = pd.category_id 
-                            OR (pd.plant_id IS NULL AND pd.category_id IS NULL))
+-- One branch per kind of target, so each can use its own index
+JOIN (
+    SELECT pd.plant_id, pd.discount_id
+    FROM plant_discounts pd
+    WHERE pd.plant_id IS NOT NULL
+    UNION
+    SELECT pcm.plant_id, pd.discount_id
+    FROM plant_discounts pd
+    JOIN plant_category_mapping pcm ON pcm.category_id = pd.category_id
+    WHERE pd.plant_id IS NULL
+    UNION
+    SELECT p2.plant_id, pd.discount_id
+    FROM plant_discounts pd
+    CROSS JOIN plants p2
+    WHERE pd.plant_id IS NULL AND pd.category_id IS NULL
+) pd ON pd.plant_id = p.plant_id
 JOIN discounts d ON pd.discount_id = d.discount_id
 JOIN discount_types dt ON d.discount_type_id = dt.discount_type_id
 WHERE 
@@ -693,6 +831,37 @@ BEGIN
 END;
 /
 
+-- Upload tracking on plant_images for databases created before it
+BEGIN
+  EXECUTE IMMEDIATE 'ALTER TABLE plant_images ADD (content_hash VARCHAR2(64), upload_status VARCHAR2(10) DEFAULT ''ready'' NOT NULL)';
+EXCEPTION
+  WHEN OTHERS THEN
+    IF SQLCODE != -1430 THEN  -- Ignore if column already exists
+      RAISE;
+    END IF;
+END;
+/
+
+-- Review aggregates on plants for databases created before them; fill them
+-- in afterwards with `manage.py rebuild_plant_ratings`
+BEGIN
+  EXECUTE IMMEDIATE 'ALTER TABLE plants ADD (
+      avg_rating NUMBER(6,4) DEFAULT 0 NOT NULL,
+      review_count NUMBER DEFAULT 0 NOT NULL,
+      rating_sum NUMBER DEFAULT 0 NOT NULL,
+      rating_1_count NUMBER DEFAULT 0 NOT NULL,
+      rating_2_count NUMBER DEFAULT 0 NOT NULL,
+      rating_3_count NUMBER DEFAULT 0 NOT NULL,
+      rating_4_count NUMBER DEFAULT 0 NOT NULL,
+      rating_5_count NUMBER DEFAULT 0 NOT NULL)';
+EXCEPTION
+  WHEN OTHERS THEN
+    IF SQLCODE != -1430 THEN  -- Ignore if column already exists
+      RAISE;
+    END IF;
+END;
+/
+
 -- PL/SQL Procedure for Top 4 Categories (by plant count, using cursor)
 CREATE OR REPLACE PROCEDURE get_top_4_categories (p_cursor OUT SYS_REFCURSOR) AS
 BEGIN
@@ -717,11 +886,9 @@ CREATE OR REPLACE FUNCTION get_top_4_plants RETURN SYS_REFCURSOR IS
   v_cursor SYS_REFCURSOR;
 BEGIN
   OPEN v_cursor FOR
-  SELECT p.plant_id, p.name, AVG(r.rating) AS avg_rating, COUNT(r.review_id) AS review_count
+  SELECT p.plant_id, p.name, p.avg_rating, p.review_count
   FROM plants p
-  LEFT JOIN reviews r ON p.plant_id = r.plant_id
-  GROUP BY p.plant_id, p.name
-  ORDER BY avg_rating DESC, review_count DESC
+  ORDER BY p.avg_rating DESC, p.review_count DESC
   FETCH FIRST 4 ROWS ONLY;
   RETURN v_cursor;
 END;
@@ -779,6 +946,173 @@ BEGIN
 END;
 /
 
+-- Earnings rollups (agent_monthly_earnings, seller_monthly_earnings)
+
+CREATE OR REPLACE FUNCTION earnings_month (
+    p_actual_delivery_date IN TIMESTAMP,
+    p_order_date IN TIMESTAMP
+) RETURN DATE DETERMINISTIC AS
+BEGIN
+    RETURN TRUNC(CAST(NVL(p_actual_delivery_date, p_order_date) AS DATE), 'MM');
+END;
+/
+
+CREATE OR REPLACE PROCEDURE apply_agent_earnings (
+    p_agent_id IN NUMBER,
+    p_month IN DATE,
+    p_total_amount IN NUMBER,
+    p_delta IN NUMBER
+) AS
+BEGIN
+    MERGE INTO agent_monthly_earnings e
+    USING (SELECT p_agent_id AS agent_id, p_month AS month_start FROM dual) s
+    ON (e.agent_id = s.agent_id AND e.month_start = s.month_start)
+    WHEN MATCHED THEN UPDATE SET
+        e.deliveries_completed = e.deliveries_completed + p_delta,
+        e.earnings = e.earnings + p_delta * p_total_amount * 0.05
+    WHEN NOT MATCHED THEN
+        INSERT (agent_id, month_start, deliveries_completed, earnings)
+        VALUES (s.agent_id, s.month_start, p_delta, p_delta * p_total_amount * 0.05);
+END;
+/
+
+CREATE OR REPLACE PROCEDURE apply_seller_earnings (
+    p_seller_id IN NUMBER,
+    p_month IN DATE,
+    p_quantity IN NUMBER,
+    p_amount IN NUMBER,
+    p_delta IN NUMBER
+) AS
+BEGIN
+    IF p_seller_id IS NULL THEN
+        RETURN;
+    END IF;
+    MERGE INTO seller_monthly_earnings e
+    USING (SELECT p_seller_id AS seller_id, p_month AS month_start FROM dual) s
+    ON (e.seller_id = s.seller_id AND e.month_start = s.month_start)
+    WHEN MATCHED THEN UPDATE SET
+        e.items_sold = e.items_sold + p_delta * p_quantity,
+        e.earnings = e.earnings + p_delta * p_amount * 0.9
+    WHEN NOT MATCHED THEN
+        INSERT (seller_id, month_start, items_sold, earnings)
+        VALUES (s.seller_id, s.month_start, p_delta * p_quantity, p_delta * p_amount * 0.9);
+END;
+/
+
+-- Adds (p_delta = 1) or takes back (p_delta = -1) a delivered order
+CREATE OR REPLACE PROCEDURE apply_order_earnings (
+    p_order_id IN NUMBER,
+    p_month IN DATE,
+    p_total_amount IN NUMBER,
+    p_delta IN NUMBER
+) AS
+BEGIN
+    FOR a IN (SELECT agent_id FROM order_assignments WHERE order_id = p_order_id) LOOP
+        apply_agent_earnings(a.agent_id, p_month, p_total_amount, p_delta);
+    END LOOP;
+
+    FOR s IN (
+        SELECT p.seller_id, SUM(oi.quantity) AS quantity, SUM(ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2)) AS amount
+        FROM order_items oi
+        JOIN plants p ON oi.plant_id = p.plant_id
+        WHERE oi.order_id = p_order_id
+        GROUP BY p.seller_id
+    ) LOOP
+        apply_seller_earnings(s.seller_id, p_month, s.quantity, s.amount, p_delta);
+    END LOOP;
+END;
+/
+
+-- An order enters or leaves the rollups when it moves to or from Delivered,
+-- and moves between months / amounts when those change while delivered
+CREATE OR REPLACE TRIGGER trg_orders_earnings
+AFTER INSERT OR UPDATE OF status_id, actual_delivery_date, total_amount ON orders
+FOR EACH ROW
+DECLARE
+    v_delivered order_statuses.status_id%TYPE;
+    v_old_month DATE;
+    v_new_month DATE;
+BEGIN
+    SELECT status_id INTO v_delivered FROM order_statuses WHERE status_name = 'Delivered';
+
+    IF UPDATING AND :OLD.status_id = v_delivered THEN
+        v_old_month := earnings_month(:OLD.actual_delivery_date, :OLD.order_date);
+    END IF;
+    IF :NEW.status_id = v_delivered THEN
+        v_new_month := earnings_month(:NEW.actual_delivery_date, :NEW.order_date);
+    END IF;
+
+    IF v_old_month = v_new_month AND :OLD.total_amount = :NEW.total_amount THEN
+        RETURN;
+    END IF;
+    IF v_old_month IS NOT NULL THEN
+        apply_order_earnings(:OLD.order_id, v_old_month, :OLD.total_amount, -1);
+    END IF;
+    IF v_new_month IS NOT NULL THEN
+        apply_order_earnings(:NEW.order_id, v_new_month, :NEW.total_amount, 1);
+    END IF;
+END;
+/
+
+-- Items added to / removed from an order that is already delivered
+-- (record_manual_sale inserts the order as Delivered before its items)
+CREATE OR REPLACE TRIGGER trg_order_items_earnings
+AFTER INSERT OR DELETE OR UPDATE OF plant_id, quantity, unit_price, discount_applied ON order_items
+FOR EACH ROW
+DECLARE
+    v_month DATE;
+    v_seller_id NUMBER;
+BEGIN
+    SELECT MAX(earnings_month(o.actual_delivery_date, o.order_date))
+    INTO v_month
+    FROM orders o
+    JOIN order_statuses os ON o.status_id = os.status_id
+    WHERE o.order_id = NVL(:NEW.order_id, :OLD.order_id)
+    AND os.status_name = 'Delivered';
+
+    IF v_month IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF DELETING OR UPDATING THEN
+        SELECT MAX(seller_id) INTO v_seller_id FROM plants WHERE plant_id = :OLD.plant_id;
+        apply_seller_earnings(v_seller_id, v_month, :OLD.quantity, ROUND(:OLD.quantity * :OLD.unit_price * (1 - NVL(:OLD.discount_applied, 0) / 100), 2), -1);
+    END IF;
+    IF INSERTING OR UPDATING THEN
+        SELECT MAX(seller_id) INTO v_seller_id FROM plants WHERE plant_id = :NEW.plant_id;
+        apply_seller_earnings(v_seller_id, v_month, :NEW.quantity, ROUND(:NEW.quantity * :NEW.unit_price * (1 - NVL(:NEW.discount_applied, 0) / 100), 2), 1);
+    END IF;
+END;
+/
+
+-- Agents assigned to / taken off an order that is already delivered
+CREATE OR REPLACE TRIGGER trg_order_assignments_earnings
+AFTER INSERT OR DELETE OR UPDATE OF agent_id ON order_assignments
+FOR EACH ROW
+DECLARE
+    v_month DATE;
+    v_total_amount NUMBER;
+BEGIN
+    SELECT MAX(earnings_month(o.actual_delivery_date, o.order_date)), MAX(o.total_amount)
+    INTO v_month, v_total_amount
+    FROM orders o
+    JOIN order_statuses os ON o.status_id = os.status_id
+    WHERE o.order_id = NVL(:NEW.order_id, :OLD.order_id)
+    AND os.status_name = 'Delivered';
+
+    IF v_month IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF DELETING OR UPDATING THEN
+        apply_agent_earnings(:OLD.agent_id, v_month, v_total_amount, -1);
+    END IF;
+    IF INSERTING OR UPDATING THEN
+        apply_agent_earnings(:NEW.agent_id, v_month, v_total_amount, 1);
+    END IF;
+END;
+/
+
 
 
 -- plant collection page 
@@ -797,8 +1131,8 @@ BEGIN
       p.base_price, 
       p.stock_quantity, 
       pi.image_url AS primary_image,
-      NVL(AVG(r.rating), 0) AS avg_rating,
-      COUNT(r.review_id) AS review_count,
+      p.avg_rating,
+      p.review_count,
       (SELECT LISTAGG(image_url, ',') WITHIN GROUP (ORDER BY image_id)
        FROM plant_images pi2 
        WHERE pi2.plant_id = p.plant_id) AS all_images
@@ -806,10 +1140,7 @@ BEGIN
   JOIN plant_category_mapping pcm ON p.plant_id = pcm.plant_id
   JOIN plant_categories pc ON pcm.category_id = pc.category_id
   LEFT JOIN plant_images pi ON p.plant_id = pi.plant_id AND pi.is_primary = 1
-  LEFT JOIN reviews r ON p.plant_id = r.plant_id
-  WHERE pc.slug = p_slug AND p.is_active = 1
-  GROUP BY p.plant_id, p.name, DBMS_LOB.SUBSTR(p.description, 4000, 1), 
-           p.base_price, p.stock_quantity, pi.image_url;
+  WHERE pc.slug = p_slug AND p.is_active = 1;
 END;
 /
 
@@ -827,20 +1158,17 @@ BEGIN
       p.base_price, 
       p.stock_quantity, 
       pi.image_url AS primary_image,
-      NVL(AVG(r.rating), 0) AS avg_rating,
-      COUNT(r.review_id) AS review_count,
+      p.avg_rating,
+      p.review_count,
       (SELECT LISTAGG(image_url, ',') WITHIN GROUP (ORDER BY image_id)
        FROM plant_images pi2 
        WHERE pi2.plant_id = p.plant_id) AS all_images
   FROM plants p
   LEFT JOIN plant_images pi ON p.plant_id = pi.plant_id AND pi.is_primary = 1
-  LEFT JOIN reviews r ON p.plant_id = r.plant_id
   WHERE (LOWER(p.name) LIKE '%' || LOWER(p_search_term) || '%' 
          OR LOWER(DBMS_LOB.SUBSTR(p.description, 4000, 1)) LIKE '%' || LOWER(p_search_term) || '%')
     AND p.is_active = 1
-  GROUP BY p.plant_id, p.name, DBMS_LOB.SUBSTR(p.description, 4000, 1), 
-           p.base_price, p.stock_quantity, pi.image_url
-  ORDER BY avg_rating DESC, p.name;
+  ORDER BY p.avg_rating DESC, p.name;
 END;
 /
 
@@ -854,14 +1182,12 @@ BEGIN
       p.name, 
       p.base_price,
       pi.image_url AS primary_image,
-      NVL(AVG(r.rating), 0) AS avg_rating, 
-      COUNT(r.review_id) AS review_count
+      p.avg_rating, 
+      p.review_count
   FROM plants p
   LEFT JOIN plant_images pi ON p.plant_id = pi.plant_id AND pi.is_primary = 1
-  LEFT JOIN reviews r ON p.plant_id = r.plant_id
   WHERE p.is_active = 1
-  GROUP BY p.plant_id, p.name, p.base_price, pi.image_url
-  ORDER BY avg_rating DESC, review_count DESC
+  ORDER BY p.avg_rating DESC, p.review_count DESC
   FETCH FIRST 4 ROWS ONLY;
   RETURN v_cursor;
 END;
@@ -907,13 +1233,11 @@ BEGIN
        FROM plant_features pf WHERE pf.plant_id = p.plant_id) AS features,
       (SELECT LISTAGG(pct.tip_text, '|') WITHIN GROUP (ORDER BY pct.tip_id)
        FROM plant_care_tips pct WHERE pct.plant_id = p.plant_id) AS care_tips,
-      NVL(AVG(r.rating), 0) AS avg_rating,
-      COUNT(r.review_id) AS review_count
+      p.avg_rating,
+      p.review_count
   FROM plants p
   LEFT JOIN plant_images pi ON p.plant_id = pi.plant_id AND pi.is_primary = 1
-  LEFT JOIN reviews r ON p.plant_id = r.plant_id
-  WHERE p.plant_id = p_plant_id AND p.is_active = 1
-  GROUP BY p.plant_id, p.name, DBMS_LOB.SUBSTR(p.description, 4000, 1), p.base_price, p.stock_quantity, pi.image_url;
+  WHERE p.plant_id = p_plant_id AND p.is_active = 1;
 END;
 /
 
@@ -1016,6 +1340,33 @@ END;
 /
 
 
+-- Keeps the review aggregates on plants in step with reviews. Call in the same
+-- transaction as the INSERT (p_delta = 1) or DELETE (p_delta = -1) of a review.
+CREATE OR REPLACE PROCEDURE apply_review_rating (
+    p_plant_id IN NUMBER,
+    p_rating   IN NUMBER,
+    p_delta    IN NUMBER DEFAULT 1
+) AS
+BEGIN
+    -- Right-hand sides see the values from before the update
+    UPDATE plants
+    SET review_count = review_count + p_delta,
+        rating_sum = rating_sum + p_delta * p_rating,
+        avg_rating = CASE
+                         WHEN review_count + p_delta > 0
+                         THEN ROUND((rating_sum + p_delta * p_rating) / (review_count + p_delta), 4)
+                         ELSE 0
+                     END,
+        rating_1_count = rating_1_count + CASE WHEN p_rating = 1 THEN p_delta ELSE 0 END,
+        rating_2_count = rating_2_count + CASE WHEN p_rating = 2 THEN p_delta ELSE 0 END,
+        rating_3_count = rating_3_count + CASE WHEN p_rating = 3 THEN p_delta ELSE 0 END,
+        rating_4_count = rating_4_count + CASE WHEN p_rating = 4 THEN p_delta ELSE 0 END,
+        rating_5_count = rating_5_count + CASE WHEN p_rating = 5 THEN p_delta ELSE 0 END
+    WHERE plant_id = p_plant_id;
+END;
+/
+
+
 --  Deletes a review only if requestor is the review owner or admin.
 
 CREATE OR REPLACE PROCEDURE delete_review (
@@ -1023,11 +1374,14 @@ CREATE OR REPLACE PROCEDURE delete_review (
     p_review_id    IN NUMBER
 ) AS
     v_owner_id NUMBER;
+    v_plant_id NUMBER;
+    v_rating   NUMBER;
     v_is_admin NUMBER := 0;
 BEGIN
     -- fetch owner
     BEGIN
-        SELECT user_id INTO v_owner_id FROM reviews WHERE review_id = p_review_id;
+        SELECT user_id, plant_id, rating INTO v_owner_id, v_plant_id, v_rating
+        FROM reviews WHERE review_id = p_review_id;
     EXCEPTION
         WHEN NO_DATA_FOUND THEN
             RAISE_APPLICATION_ERROR(-20033, 'Review not found');
@@ -1050,6 +1404,8 @@ BEGIN
         RAISE_APPLICATION_ERROR(-20035, 'Failed to delete review');
     END IF;
 
+    apply_review_rating(v_plant_id, v_rating, -1);
+
     COMMIT;
 EXCEPTION
     WHEN OTHERS THEN
@@ -1256,6 +1612,7 @@ BEGIN
         p.plant_id,
         p.name AS plant_name,
         ps.size_name,
+        c.size_id,
         c.quantity,
         (p.base_price + ps.price_adjustment) AS unit_price,
         pi.image_url AS primary_image,
@@ -1807,6 +2164,8 @@ BEGIN
     INSERT INTO reviews (review_id, user_id, plant_id, order_id, rating, review_text, review_date, is_approved)
     VALUES (v_review_id, p_user_id, p_plant_id, p_order_id, p_rating, p_review_text, SYSTIMESTAMP, 1);
 
+    apply_review_rating(p_plant_id, p_rating, 1);
+
     COMMIT;
     p_success := 1;
     p_message := 'Review added successfully';
@@ -1835,7 +2194,7 @@ BEGIN
         ps.size_id,
         ps.size_name,
         ps.price_adjustment,
-        (oi.quantity * oi.unit_price) AS subtotal,
+        ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS subtotal,
         CASE WHEN r.review_id IS NOT NULL THEN 1 ELSE 0 END AS has_review
     FROM order_items oi
     JOIN plants p ON oi.plant_id = p.plant_id
@@ -2144,6 +2503,9 @@ CREATE OR REPLACE PROCEDURE assign_delivery_agent (
     v_user_id NUMBER;
     v_status_id NUMBER;
     v_valid_status_count NUMBER;
+    v_slot_id NUMBER;
+    v_held_agent_id NUMBER;
+    v_held_date DATE;
 BEGIN
     -- Check if order exists and get details
     BEGIN
@@ -2179,15 +2541,34 @@ BEGIN
         v_slot_date := TRUNC(v_order_date) + 1;
     END IF;
     
-    -- Determine slot time
-    v_slot_time := CASE 
-        WHEN EXTRACT(HOUR FROM SYSTIMESTAMP) < 12 THEN 'morning'
-        WHEN EXTRACT(HOUR FROM SYSTIMESTAMP) < 17 THEN 'afternoon'
-        ELSE 'evening'
+    -- The slot the order reserved at checkout, if any
+    BEGIN
+        SELECT slot_id, agent_id, slot_date
+        INTO v_slot_id, v_held_agent_id, v_held_date
+        FROM delivery_slots
+        WHERE order_id = p_order_id
+        AND ROWNUM = 1;
+    EXCEPTION
+        WHEN NO_DATA_FOUND THEN
+            v_slot_id := NULL;
     END;
-    
+
+    IF v_slot_id IS NOT NULL AND (p_agent_id IS NULL OR p_agent_id = v_held_agent_id) THEN
+        -- Keep the held slot and its agent
+        v_available_agent_id := v_held_agent_id;
+        v_slot_date := v_held_date;
+    ELSIF v_slot_id IS NOT NULL THEN
+        -- Another agent was chosen, give the held slot back
+        UPDATE delivery_slots
+        SET is_available = 1, order_id = NULL
+        WHERE slot_id = v_slot_id;
+        v_slot_id := NULL;
+    END IF;
+
     -- If no specific agent provided, find one with available slots
-    IF p_agent_id IS NULL THEN
+    IF v_slot_id IS NOT NULL THEN
+        NULL;
+    ELSIF p_agent_id IS NULL THEN
         BEGIN
             SELECT agent_id INTO v_available_agent_id
             FROM (
@@ -2234,9 +2615,57 @@ BEGIN
     INSERT INTO order_assignments (order_id, agent_id)
     VALUES (p_order_id, v_available_agent_id);
     
-    -- Create delivery slot
-    INSERT INTO delivery_slots (agent_id, slot_date, slot_time, is_available, order_id)
-    VALUES (v_available_agent_id, v_slot_date, v_slot_time, 0, p_order_id);
+    -- Claim one of the agent's free slots that day (generate_delivery_slots
+    -- creates them), the same conditional update checkout uses
+    IF v_slot_id IS NULL THEN
+        FOR s IN (
+            SELECT slot_id
+            FROM delivery_slots
+            WHERE agent_id = v_available_agent_id
+            AND slot_date = v_slot_date
+            AND is_available = 1
+            AND order_id IS NULL
+            ORDER BY CASE slot_time WHEN 'morning' THEN 1 WHEN 'afternoon' THEN 2 ELSE 3 END
+        ) LOOP
+            UPDATE delivery_slots
+            SET is_available = 0, order_id = p_order_id
+            WHERE slot_id = s.slot_id
+            AND is_available = 1
+            AND order_id IS NULL;
+
+            IF SQL%ROWCOUNT = 1 THEN
+                v_slot_id := s.slot_id;
+                EXIT;
+            END IF;
+        END LOOP;
+    END IF;
+
+    -- Days past the generated window have no rows yet: add the first slot
+    -- time the agent doesn't have that day
+    IF v_slot_id IS NULL THEN
+        BEGIN
+            SELECT slot_time INTO v_slot_time
+            FROM (
+                SELECT 'morning' AS slot_time, 1 AS slot_rank FROM dual
+                UNION ALL SELECT 'afternoon', 2 FROM dual
+                UNION ALL SELECT 'evening', 3 FROM dual
+            ) t
+            WHERE NOT EXISTS (
+                SELECT 1 FROM delivery_slots ds
+                WHERE ds.agent_id = v_available_agent_id
+                AND ds.slot_date = v_slot_date
+                AND ds.slot_time = t.slot_time
+            )
+            ORDER BY t.slot_rank
+            FETCH FIRST 1 ROW ONLY;
+        EXCEPTION
+            WHEN NO_DATA_FOUND THEN
+                RAISE_APPLICATION_ERROR(-20004, 'Selected agent has no available slots for the delivery date');
+        END;
+
+        INSERT INTO delivery_slots (agent_id, slot_date, slot_time, is_available, order_id)
+        VALUES (v_available_agent_id, v_slot_date, v_slot_time, 0, p_order_id);
+    END IF;
     
     -- Create delivery confirmation record
     INSERT INTO delivery_confirmations (order_id, user_id, agent_id)
@@ -2434,7 +2863,7 @@ BEGIN
         oi.quantity,
         oi.unit_price,
         oi.discount_applied,
-        (oi.quantity * oi.unit_price * (1 - oi.discount_applied/100)) AS item_total,
+        ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS item_total,
         pi.image_url AS plant_image
     FROM 
         order_items oi
@@ -2532,6 +2961,14 @@ EXCEPTION
 END;
 /
 
+-- Bulk stock sync (seller/inventory.py) sets g_active around its MERGE; the
+-- two low-stock triggers below then leave the alerts to it, and it settles
+-- them for all plants at once in the same transaction
+CREATE OR REPLACE PACKAGE stock_sync AS
+    g_active BOOLEAN := FALSE;
+END stock_sync;
+/
+
 -- 9. Trigger to detect low stock and create alerts
 CREATE OR REPLACE TRIGGER trg_check_low_stock
 AFTER UPDATE OF stock_quantity ON plants
@@ -2540,6 +2977,10 @@ WHEN (NEW.stock_quantity < 10 AND OLD.stock_quantity >= 10)
 DECLARE
     v_alert_exists NUMBER;
 BEGIN
+    IF stock_sync.g_active THEN
+        RETURN;
+    END IF;
+
     -- Check if an unresolved alert already exists for this plant
     SELECT COUNT(*) INTO v_alert_exists
     FROM low_stock_alerts
@@ -2559,6 +3000,10 @@ AFTER UPDATE OF stock_quantity ON plants
 FOR EACH ROW
 WHEN (NEW.stock_quantity >= 10 AND OLD.stock_quantity < 10)
 BEGIN
+    IF stock_sync.g_active THEN
+        RETURN;
+    END IF;
+
     -- Resolve any unresolved alerts for this plant
     UPDATE low_stock_alerts
     SET is_resolved = 1, resolved_date = SYSTIMESTAMP
@@ -2714,8 +3159,8 @@ BEGIN
         (SELECT LISTAGG(size_name || ' (+₹' || price_adjustment || ')', ', ') 
          FROM plant_sizes WHERE plant_id = p.plant_id) AS available_sizes,
         -- Get review statistics
-        NVL(AVG(r.rating), 0) AS avg_rating,
-        COUNT(r.review_id) AS total_reviews,
+        p.avg_rating,
+        p.review_count AS total_reviews,
         -- Get total sales
         (SELECT NVL(SUM(oi.quantity), 0) 
          FROM order_items oi 
@@ -2725,11 +3170,10 @@ BEGIN
     FROM plants p
     LEFT JOIN plant_category_mapping pcm ON p.plant_id = pcm.plant_id
     LEFT JOIN plant_categories pc ON pcm.category_id = pc.category_id
-    LEFT JOIN reviews r ON p.plant_id = r.plant_id
     WHERE p.seller_id = p_seller_id
     GROUP BY 
         p.plant_id, p.name, DBMS_LOB.SUBSTR(p.description, 4000, 1), p.base_price, p.stock_quantity,
-        p.created_at, p.updated_at, p.is_active
+        p.created_at, p.updated_at, p.is_active, p.avg_rating, p.review_count
     ORDER BY p.created_at DESC;
 END;
 /
@@ -2746,7 +3190,7 @@ BEGIN
         TO_CHAR(o.order_date, 'YYYY-MM-DD') AS order_date,
         p.name AS plant_name,
         oi.quantity,
-        (oi.quantity * oi.unit_price) AS total_amount
+        ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS total_amount
     FROM order_items oi
     JOIN plants p ON oi.plant_id = p.plant_id
     JOIN orders o ON oi.order_id = o.order_id
@@ -2820,8 +3264,8 @@ BEGIN
         p.stock_quantity,
         (SELECT image_url FROM plant_images WHERE plant_id = p.plant_id AND is_primary = 1 AND ROWNUM = 1) AS image,
         LISTAGG(pc.name, ', ') WITHIN GROUP (ORDER BY pc.name) AS categories,
-        NVL(AVG(r.rating), 0) AS avg_rating,
-        (SELECT COUNT(*) FROM reviews WHERE plant_id = p.plant_id) AS review_count,
+        p.avg_rating,
+        p.review_count,
         (SELECT NVL(SUM(oi.quantity), 0) 
          FROM order_items oi 
          JOIN orders o ON oi.order_id = o.order_id 
@@ -2830,25 +3274,18 @@ BEGIN
     FROM plants p
     LEFT JOIN plant_category_mapping pcm ON p.plant_id = pcm.plant_id
     LEFT JOIN plant_categories pc ON pcm.category_id = pc.category_id
-    LEFT JOIN reviews r ON p.plant_id = r.plant_id
     WHERE p.seller_id = p_seller_id
-    GROUP BY p.plant_id, p.name, p.base_price, p.stock_quantity
+    GROUP BY p.plant_id, p.name, p.base_price, p.stock_quantity, p.avg_rating, p.review_count, p.created_at
     ORDER BY p.created_at DESC;
 
     -- Get seller statistics
     OPEN p_stats_cursor FOR
     SELECT 
         (SELECT COUNT(*) FROM plants WHERE seller_id = p_seller_id AND is_active = 1) AS total_plants,
-        (SELECT NVL(SUM(oi.quantity), 0) FROM order_items oi 
-         JOIN plants p ON oi.plant_id = p.plant_id 
-         JOIN orders o ON oi.order_id = o.order_id 
-         WHERE p.seller_id = p_seller_id 
-         AND o.status_id IN (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered')) AS total_sales,
-        (SELECT NVL(SUM(oi.quantity * oi.unit_price * 0.9), 0) FROM order_items oi 
-         JOIN plants p ON oi.plant_id = p.plant_id 
-         JOIN orders o ON oi.order_id = o.order_id 
-         WHERE p.seller_id = p_seller_id 
-         AND o.status_id IN (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered')) AS total_earnings,
+        (SELECT NVL(SUM(items_sold), 0) FROM seller_monthly_earnings
+         WHERE seller_id = p_seller_id) AS total_sales,
+        (SELECT NVL(SUM(earnings), 0) FROM seller_monthly_earnings
+         WHERE seller_id = p_seller_id) AS total_earnings,
         (SELECT COUNT(*) FROM plants WHERE seller_id = p_seller_id AND stock_quantity < 10) AS low_stock_count
     FROM dual;
 
@@ -3728,22 +4165,22 @@ CREATE OR REPLACE PROCEDURE get_delivery_agent_monthly_earnings (
     p_year IN NUMBER DEFAULT EXTRACT(YEAR FROM SYSDATE),
     p_earnings_out OUT SYS_REFCURSOR
 ) AS
+    v_year_start DATE := TO_DATE(NVL(p_year, EXTRACT(YEAR FROM SYSDATE)) || '-01-01', 'YYYY-MM-DD');
 BEGIN
+    -- Reads the rollup, at most 12 rows per agent and year
     OPEN p_earnings_out FOR
     SELECT 
-        EXTRACT(MONTH FROM o.actual_delivery_date) AS month,
-        TO_CHAR(o.actual_delivery_date, 'Month') AS month_name,
-        COUNT(*) AS deliveries_completed,
-        SUM(o.total_amount * 0.05) AS monthly_earnings,
-        AVG(o.total_amount * 0.05) AS avg_earnings_per_delivery
-    FROM orders o
-    JOIN order_assignments oa ON o.order_id = oa.order_id
-    JOIN order_statuses os ON o.status_id = os.status_id
-    WHERE oa.agent_id = p_agent_id
-    AND os.status_name = 'Delivered'
-    AND EXTRACT(YEAR FROM o.actual_delivery_date) = p_year
-    GROUP BY EXTRACT(MONTH FROM o.actual_delivery_date), TO_CHAR(o.actual_delivery_date, 'Month')
-    ORDER BY EXTRACT(MONTH FROM o.actual_delivery_date);
+        EXTRACT(MONTH FROM e.month_start) AS month,
+        TO_CHAR(e.month_start, 'Month') AS month_name,
+        e.deliveries_completed,
+        e.earnings AS monthly_earnings,
+        e.earnings / e.deliveries_completed AS avg_earnings_per_delivery
+    FROM agent_monthly_earnings e
+    WHERE e.agent_id = p_agent_id
+    AND e.month_start >= v_year_start
+    AND e.month_start < ADD_MONTHS(v_year_start, 12)
+    AND e.deliveries_completed > 0
+    ORDER BY e.month_start;
 END get_delivery_agent_monthly_earnings;
 /
 
@@ -3,6 +3,10 @@ from django.views.decorators.csrf import csrf_exempt
 from django.db import connection
 import json
 import hashlib
+from greencart.activity import log_activity, touch_last_login
+from greencart.refdata import refdata
+from greencart.tokens import issue_token
+from delivery_agent.identity import invalidate_agents
 
 def get_client_ip(request):
     """Get the client's IP address from the request"""
@@ -54,6 +58,10 @@ def signup(request):
                             last_name, phone, address, role_name
                         ])
                     
+                    # signup_user creates the delivery_agents row for agents
+                    if role_name == 'delivery_agent':
+                        invalidate_agents()
+                    
                     return JsonResponse({
                         'success': True,
                         'message': 'User created successfully'
@@ -102,10 +110,11 @@ def login(request):
                 # Check if user exists and credentials match
                 cursor.execute("""
                     SELECT u.user_id, u.username, u.email, u.first_name, u.last_name, 
-                           r.role_name, u.phone, u.address, u.is_active, u.password_hash
+                           ur.role_id, u.phone, u.address, u.is_active, u.password_hash,
+                           da.agent_id
                     FROM users u
                     JOIN user_roles ur ON u.user_id = ur.user_id
-                    JOIN roles r ON ur.role_id = r.role_id
+                    LEFT JOIN delivery_agents da ON u.user_id = da.user_id
                     WHERE u.email = :email
                 """, {'email': email})
                 
@@ -113,10 +122,7 @@ def login(request):
                 
                 if not user_data:
                     # Log failed login attempt
-                    cursor.execute("""
-                        INSERT INTO activity_log (activity_type, activity_details, ip_address)
-                        VALUES ('LOGIN_FAILED', 'User not found: ' || :email, :ip_address)
-                    """, {'email': email, 'ip_address': ip_address})
+                    log_activity('LOGIN_FAILED', f'User not found: {email}', ip_address=ip_address)
                     
                     return JsonResponse({
                         'success': False,
@@ -124,14 +130,12 @@ def login(request):
                     }, status=401)
                 
                 # Extract user data
-                user_id, username, user_email, first_name, last_name, role, phone, address, is_active, stored_hash = user_data
+                user_id, username, user_email, first_name, last_name, role_id, phone, address, is_active, stored_hash, agent_id = user_data
+                role = refdata.role_name(role_id)
                 
                 # Check if account is active
                 if is_active == 0:
-                    cursor.execute("""
-                        INSERT INTO activity_log (user_id, activity_type, activity_details, ip_address)
-                        VALUES (:user_id, 'LOGIN_FAILED', 'Account inactive', :ip_address)
-                    """, {'user_id': user_id, 'ip_address': ip_address})
+                    log_activity('LOGIN_FAILED', 'Account inactive', user_id, ip_address)
                     
                     return JsonResponse({
                         'success': False,
@@ -140,27 +144,16 @@ def login(request):
                 
                 # Check password
                 if stored_hash != password_hash:
-                    cursor.execute("""
-                        INSERT INTO activity_log (user_id, activity_type, activity_details, ip_address)
-                        VALUES (:user_id, 'LOGIN_FAILED', 'Invalid password', :ip_address)
-                    """, {'user_id': user_id, 'ip_address': ip_address})
+                    log_activity('LOGIN_FAILED', 'Invalid password', user_id, ip_address)
                     
                     return JsonResponse({
                         'success': False,
                         'message': 'INVALID CREDENTIALS'
                     }, status=401)
                 
-                # Successful login - update last login and log activity
-                cursor.execute("""
-                    UPDATE users 
-                    SET last_login = SYSTIMESTAMP 
-                    WHERE user_id = :user_id
-                """, {'user_id': user_id})
-                
-                cursor.execute("""
-                    INSERT INTO activity_log (user_id, activity_type, activity_details, ip_address)
-                    VALUES (:user_id, 'LOGIN', 'User logged in successfully', :ip_address)
-                """, {'user_id': user_id, 'ip_address': ip_address})
+                # Successful login - update last login and log activity (both written in the background)
+                touch_last_login(user_id)
+                log_activity('LOGIN', 'User logged in successfully', user_id, ip_address)
                 
                 # Prepare user info
                 user_info = {
@@ -178,17 +171,17 @@ def login(request):
                     'success': True,
                     'message': 'Login successful',
                     'user': user_info,
-                    'token': f'auth_token_{user_id}_{role}'
+                    'token': issue_token(
+                        user_id, role,
+                        agent_id=agent_id if role == 'delivery_agent' else None,
+                        seller_id=user_id if role == 'seller' else None,
+                    )
                 })
                 
         except Exception as e:
             # Log the error
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        INSERT INTO activity_log (activity_type, activity_details, ip_address)
-                        VALUES ('LOGIN_ERROR', 'Server error: ' || :error, :ip_address)
-                    """, {'error': str(e), 'ip_address': get_client_ip(request)})
+                log_activity('LOGIN_ERROR', f'Server error: {e}', ip_address=get_client_ip(request))
             except:
                 pass
             
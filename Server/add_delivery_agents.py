@@ -15,6 +15,7 @@ django.setup()
 
 from django.db import connection
 import hashlib
+from delivery_agent.identity import invalidate_agents
 
 def add_delivery_agents():
     """Add sample delivery agents to the database"""
@@ -82,6 +83,9 @@ def add_delivery_agents():
                 else:
                     print(f"❌ Failed to add delivery agent {agent['username']}: {error_str}")
     
+    # Let running workers resolve the new agents right away
+    invalidate_agents()
+    
     # Verify the delivery agents were created
     print("\n=== Verifying Delivery Agents ===")
     with connection.cursor() as cursor:
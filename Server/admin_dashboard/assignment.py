@@ -0,0 +1,320 @@
+"""Batch delivery agent assignment.
+
+assign_delivery_agent() places one order at a time. This takes every
+unassigned Processing/Confirmed order and every active agent and assigns
+them all in one pass:
+
+  * each order is due on its estimated_delivery_date, or order date plus
+    the delivery method's days the way assign_delivery_agent computes it
+    (never earlier than today), and orders are placed earliest due first;
+  * an agent can take one order per slot ('morning', 'afternoon',
+    'evening') and day, the same three slots delivery_slots allows;
+  * among agents with a free slot that day the one with the least open
+    work (unfinished assignments, including the ones made in this run)
+    gets the order;
+  * when nobody is free on the due day the next ASSIGNMENT_MAX_SLIP_DAYS
+    days are tried, after that the order is left for the next run;
+  * an order that already holds a delivery slot from checkout goes to that
+    slot's agent.
+
+Free slots come from the slot index (delivery_agent/slots.py). Planning is
+pure Python (plan_assignments) and the result is written with one
+executemany per table inside a single transaction. Slots are claimed with
+the same conditional update checkout uses, so an order whose slot was
+taken in the meantime is left for the next run instead.
+"""
+import heapq
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from delivery_agent.kpis import invalidate_agent_kpis
+from delivery_agent.slots import slot_index
+from greencart.activity import log_activity
+from greencart.events import orders_assigned
+from greencart.refdata import refdata
+
+SLOT_TIMES = ('morning', 'afternoon', 'evening')
+
+ASSIGNABLE_STATUSES = ('Processing', 'Confirmed')
+CLOSED_STATUSES = ('Delivered', 'Cancelled', 'Returned')
+
+# held: (agent_id, slot_date, slot_time, slot_id) of a slot reserved at checkout
+Order = namedtuple('Order', 'order_id user_id due_date held', defaults=(None,))
+# slot_id is set when a free delivery_slots row is reused, None for a new row
+Assignment = namedtuple('Assignment', 'order_id user_id agent_id slot_date slot_time slot_id')
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class AssignmentPlanner:
+
+    def __init__(self, agent_ids, open_load, slots, max_slip_days):
+        """
+        agent_ids: active agents
+        open_load: {agent_id: unfinished assignments}
+        slots: {(agent_id, slot_date): {slot_time: slot_id or None if taken}},
+               existing delivery_slots rows for the dates being planned
+        """
+        self.agent_ids = sorted(agent_ids)
+        self.load = {agent_id: open_load.get(agent_id, 0) for agent_id in self.agent_ids}
+        self.slots = slots
+        self.max_slip_days = max_slip_days
+        self._taken = {}   # (agent_id, slot_date) -> slot times used in this run
+        self._heaps = {}   # slot_date -> [(load, agent_id)] of agents with a free slot
+
+    def _free_slot(self, agent_id, slot_date):
+        """(slot_time, slot_id) of the first free slot, None when the day is full"""
+        existing = self.slots.get((agent_id, slot_date), {})
+        taken = self._taken.get((agent_id, slot_date), ())
+        for slot_time in SLOT_TIMES:
+            if slot_time in taken:
+                continue
+            if slot_time not in existing:
+                return slot_time, None
+            if existing[slot_time] is not None:
+                return slot_time, existing[slot_time]
+        return None
+
+    def _heap(self, slot_date):
+        heap = self._heaps.get(slot_date)
+        if heap is None:
+            heap = [(self.load[agent_id], agent_id) for agent_id in self.agent_ids
+                    if self._free_slot(agent_id, slot_date) is not None]
+            heapq.heapify(heap)
+            self._heaps[slot_date] = heap
+        return heap
+
+    def _pick(self, slot_date):
+        heap = self._heap(slot_date)
+        while heap:
+            load, agent_id = heap[0]
+            if load != self.load[agent_id]:
+                # Picked for another day since this entry was pushed
+                heapq.heapreplace(heap, (self.load[agent_id], agent_id))
+                continue
+
+            slot_time, slot_id = self._free_slot(agent_id, slot_date)
+            self._taken.setdefault((agent_id, slot_date), set()).add(slot_time)
+            self.load[agent_id] = load + 1
+            if self._free_slot(agent_id, slot_date) is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (load + 1, agent_id))
+            return agent_id, slot_time, slot_id
+        return None
+
+    def assign(self, order):
+        if order.held is not None and order.held[0] in self.load:
+            agent_id, slot_date, slot_time, slot_id = order.held
+            self._taken.setdefault((agent_id, slot_date), set()).add(slot_time)
+            self.load[agent_id] += 1
+            return Assignment(order.order_id, order.user_id, agent_id, slot_date, slot_time, slot_id)
+
+        for slip in range(self.max_slip_days + 1):
+            slot_date = order.due_date + timedelta(days=slip)
+            picked = self._pick(slot_date)
+            if picked is not None:
+                agent_id, slot_time, slot_id = picked
+                return Assignment(order.order_id, order.user_id, agent_id, slot_date, slot_time, slot_id)
+        return None
+
+
+def plan_assignments(orders, agent_ids, open_load, slots, max_slip_days):
+    """Returns (assignments, unassigned orders); `orders` sorted by due date"""
+    planner = AssignmentPlanner(agent_ids, open_load, slots, max_slip_days)
+    assignments = []
+    unassigned = []
+    for order in orders:
+        assignment = planner.assign(order)
+        if assignment is None:
+            unassigned.append(order)
+        else:
+            assignments.append(assignment)
+    return assignments, unassigned
+
+
+def _status_ids(names):
+    return [status_id for status_id in (refdata.status_id(name) for name in names) if status_id is not None]
+
+
+def _in_list(values):
+    return ', '.join(f':{i + 1}' for i in range(len(values)))
+
+
+def load_open_orders(cursor, today, lock=False):
+    statuses = _status_ids(ASSIGNABLE_STATUSES)
+    if not statuses:
+        return []
+    cursor.execute(f"""
+        SELECT o.order_id, o.user_id,
+               CAST(NVL(o.estimated_delivery_date, TRUNC(o.order_date) +
+                   CASE
+                       WHEN dm.estimated_days LIKE '1-2%' THEN 2
+                       WHEN dm.estimated_days LIKE '3-5%' THEN 4
+                       ELSE 1
+                   END) AS DATE) AS due_date,
+               ds.agent_id, ds.slot_date, ds.slot_time, ds.slot_id
+        FROM orders o
+        JOIN delivery_methods dm ON o.delivery_method_id = dm.method_id
+        LEFT JOIN delivery_slots ds ON ds.order_id = o.order_id
+        WHERE o.status_id IN ({_in_list(statuses)})
+        AND NOT EXISTS (SELECT 1 FROM order_assignments oa WHERE oa.order_id = o.order_id)
+        {'FOR UPDATE OF o.status_id SKIP LOCKED' if lock else ''}
+    """, statuses)
+    orders = [
+        Order(order_id, user_id, max(_day(due_date), today),
+              (agent_id, _day(slot_date), slot_time, slot_id) if slot_id is not None else None)
+        for order_id, user_id, due_date, agent_id, slot_date, slot_time, slot_id in cursor
+    ]
+    # Overdue orders were moved to today, so sort after that. Orders holding a
+    # slot go first in their day so their agent's load counts for the rest
+    orders.sort(key=lambda order: (order.due_date, order.held is None, order.order_id))
+    return orders
+
+
+def load_agents(cursor):
+    cursor.execute("SELECT agent_id FROM delivery_agents WHERE is_active = 1")
+    agent_ids = [row[0] for row in cursor]
+
+    closed = _status_ids(CLOSED_STATUSES)
+    cursor.execute(f"""
+        SELECT oa.agent_id, COUNT(*)
+        FROM order_assignments oa
+        JOIN orders o ON oa.order_id = o.order_id
+        WHERE oa.completed_at IS NULL
+        {f'AND o.status_id NOT IN ({_in_list(closed)})' if closed else ''}
+        GROUP BY oa.agent_id
+    """, closed)
+    return agent_ids, dict(cursor.fetchall())
+
+
+def load_slots(cursor):
+    """Reload the slot index in this transaction, returns its rows for the planner"""
+    slot_index.load(cursor)
+    return slot_index.rows_between(slot_index.first_date, slot_index.last_date)
+
+
+def claim_slots(cursor, assignments):
+    """Write the slots, returns the order_ids whose slot was taken meanwhile"""
+    lost = set()
+
+    # Free rows (and rows the order already holds from checkout) are claimed
+    # only if still free, the same way checkout reserves them
+    reused = [a for a in assignments if a.slot_id is not None]
+    if reused:
+        cursor.executemany("""
+            UPDATE delivery_slots SET is_available = 0, order_id = :1
+            WHERE slot_id = :2 AND (order_id = :3 OR (is_available = 1 AND order_id IS NULL))
+        """, [(a.order_id, a.slot_id, a.order_id) for a in reused], arraydmlrowcounts=True)
+        for a, count in zip(reused, cursor.getarraydmlrowcounts()):
+            if count != 1:
+                lost.add(a.order_id)
+
+    # Slots outside the index window may exist already, UNIQUE(agent_id, slot_date, slot_time) says so
+    new = [a for a in assignments if a.slot_id is None]
+    if new:
+        cursor.executemany("""
+            INSERT INTO delivery_slots (agent_id, slot_date, slot_time, is_available, order_id)
+            VALUES (:1, :2, :3, 0, :4)
+        """, [(a.agent_id, a.slot_date, a.slot_time, a.order_id) for a in new], batcherrors=True)
+        for error in cursor.getbatcherrors():
+            lost.add(new[error.offset].order_id)
+    return lost
+
+
+def write_assignments(cursor, assignments):
+    """Returns (written, lost) where lost lost their slot to a concurrent checkout"""
+    if not assignments:
+        return [], []
+    shipped = refdata.status_id('Shipped')
+
+    lost_ids = claim_slots(cursor, assignments)
+    lost = [a for a in assignments if a.order_id in lost_ids]
+    assignments = [a for a in assignments if a.order_id not in lost_ids]
+    if not assignments:
+        return assignments, lost
+
+    cursor.executemany("""
+        INSERT INTO order_assignments (order_id, agent_id) VALUES (:1, :2)
+    """, [(a.order_id, a.agent_id) for a in assignments])
+
+    cursor.executemany("""
+        INSERT INTO delivery_confirmations (order_id, user_id, agent_id) VALUES (:1, :2, :3)
+    """, [(a.order_id, a.user_id, a.agent_id) for a in assignments])
+
+    cursor.executemany("""
+        UPDATE orders
+        SET status_id = :1,
+            estimated_delivery_date = NVL(estimated_delivery_date, :2)
+        WHERE order_id = :3
+    """, [(shipped, a.slot_date, a.order_id) for a in assignments])
+    return assignments, lost
+
+
+def summarize(assignments, unassigned, open_load, seconds, dry_run):
+    per_agent = {}
+    for a in assignments:
+        per_agent[a.agent_id] = per_agent.get(a.agent_id, 0) + 1
+    loads = [open_load.get(agent_id, 0) + count for agent_id, count in per_agent.items()]
+    return {
+        'dry_run': dry_run,
+        'assigned': len(assignments),
+        'unassigned': len(unassigned),
+        'unassigned_order_ids': [order.order_id for order in unassigned[:100]],
+        'agents_used': len(per_agent),
+        'max_open_load': max(loads, default=0),
+        'min_open_load': min(loads, default=0),
+        'slots_reused': sum(1 for a in assignments if a.slot_id is not None),
+        'planning_ms': round(seconds * 1000, 1),
+        'assignments': [
+            {
+                'order_id': a.order_id,
+                'agent_id': a.agent_id,
+                'slot_date': a.slot_date.isoformat(),
+                'slot_time': a.slot_time,
+            }
+            for a in assignments[:500]
+        ],
+    }
+
+
+def assign_open_orders(dry_run=False, max_slip_days=None, requested_by=None):
+    """Plan (and unless dry_run, write) assignments for every open order"""
+    if max_slip_days is None:
+        max_slip_days = settings.ASSIGNMENT_MAX_SLIP_DAYS
+    today = date.today()
+
+    with transaction.atomic(), connection.cursor() as django_cursor, django_cursor.connection.cursor() as cursor:
+        cursor.arraysize = 1000
+        cursor.prefetchrows = 1000
+
+        orders = load_open_orders(cursor, today, lock=not dry_run)
+        agent_ids, open_load = load_agents(cursor)
+        slots = load_slots(cursor) if orders else {}
+
+        start = time.perf_counter()
+        assignments, unassigned = plan_assignments(orders, agent_ids, open_load, slots, max_slip_days)
+        seconds = time.perf_counter() - start
+
+        if not dry_run:
+            assignments, lost = write_assignments(cursor, assignments)
+            unassigned.extend(Order(a.order_id, a.user_id, a.slot_date) for a in lost)
+
+    if not dry_run:
+        for a in assignments:
+            slot_index.mark_taken(a.agent_id, a.slot_date, a.slot_time)
+
+    if not dry_run and assignments:
+        invalidate_agent_kpis(*{a.agent_id for a in assignments})
+        orders_assigned(assignments)
+        log_activity('DELIVERY_BATCH_ASSIGNED',
+                     f'{len(assignments)} orders assigned, {len(unassigned)} left unassigned',
+                     user_id=requested_by)
+
+    return summarize(assignments, unassigned, open_load, seconds, dry_run)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.assignment import assign_open_orders
+
+
+class Command(BaseCommand):
+    help = "Assign every unassigned Processing order to a delivery agent in one pass"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Plan only, write nothing")
+        parser.add_argument('--max-slip-days', type=int, default=None,
+                            help="Days past the due date an order may be pushed (default ASSIGNMENT_MAX_SLIP_DAYS)")
+
+    def handle(self, *args, **options):
+        summary = assign_open_orders(dry_run=options['dry_run'], max_slip_days=options['max_slip_days'])
+
+        verb = "Would assign" if summary['dry_run'] else "Assigned"
+        self.stdout.write(
+            f"{verb} {summary['assigned']} order(s) to {summary['agents_used']} agent(s) "
+            f"in {summary['planning_ms']} ms, {summary['unassigned']} left unassigned"
+        )
+        self.stdout.write(f"Open load per agent now {summary['min_open_load']}-{summary['max_open_load']}, "
+                          f"{summary['slots_reused']} free slot row(s) reused")
+        for order_id in summary['unassigned_order_ids'][:20]:
+            self.stdout.write(f"  unassigned: order {order_id}")
+        if not summary['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Done"))
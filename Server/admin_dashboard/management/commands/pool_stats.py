@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from greencart.db.pool import pool_stats, warm_up_pool
+
+
+class Command(BaseCommand):
+    help = "Show open, busy and waiting sessions for the Oracle connection pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--warm-up', action='store_true', help="Open the pool before reporting")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if options['warm_up']:
+            warm_up_pool(alias)
+
+        stats = pool_stats(alias)
+        if stats is None:
+            self.stdout.write(f"Database '{alias}' is not using a connection pool (set ORACLE_POOL=1)")
+            return
+
+        for key, value in stats.items():
+            self.stdout.write(f"{key:>16}: {value}")
@@ -1,3 +1,58 @@
-from django.test import TestCase
+from datetime import date
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .assignment import Order, plan_assignments
+
+DAY = date(2025, 6, 2)
+NEXT_DAY = date(2025, 6, 3)
+
+
+class PlanAssignmentsTests(SimpleTestCase):
+
+    def plan(self, orders, agent_ids, open_load=None, slots=None, max_slip_days=0):
+        return plan_assignments(orders, agent_ids, open_load or {}, slots or {}, max_slip_days)
+
+    def test_least_loaded_agent_first_and_ties_go_to_the_lower_id(self):
+        orders = [Order(1, 100, DAY), Order(2, 101, DAY), Order(3, 102, DAY)]
+        assignments, unassigned = self.plan(orders, [3, 2, 1], open_load={1: 2})
+
+        self.assertEqual(unassigned, [])
+        # 2 and 3 start level, 2 wins the tie; then 3; then 2 and 3 are on one
+        # order each while 1 still has two
+        self.assertEqual([(a.order_id, a.agent_id) for a in assignments], [(1, 2), (2, 3), (3, 2)])
+        self.assertEqual([a.slot_time for a in assignments], ['morning', 'morning', 'afternoon'])
+
+    def test_an_agent_takes_one_order_per_slot(self):
+        orders = [Order(order_id, 100, DAY) for order_id in range(1, 5)]
+        assignments, unassigned = self.plan(orders, [1])
+
+        self.assertEqual([a.slot_time for a in assignments], ['morning', 'afternoon', 'evening'])
+        self.assertEqual(unassigned, [orders[3]])
+
+    def test_full_days_slip_to_the_next_one(self):
+        orders = [Order(order_id, 100, DAY) for order_id in range(1, 5)]
+        assignments, unassigned = self.plan(orders, [1], max_slip_days=1)
+
+        self.assertEqual(unassigned, [])
+        self.assertEqual((assignments[3].slot_date, assignments[3].slot_time), (NEXT_DAY, 'morning'))
+
+    def test_generated_free_slots_are_reused_and_taken_ones_skipped(self):
+        slots = {(1, DAY): {'morning': None, 'afternoon': 41, 'evening': 42}}
+        assignments, _ = self.plan([Order(1, 100, DAY), Order(2, 101, DAY)], [1], slots=slots)
+
+        self.assertEqual([(a.slot_time, a.slot_id) for a in assignments], [('afternoon', 41), ('evening', 42)])
+
+    def test_an_order_holding_a_slot_keeps_it_and_counts_for_its_agent(self):
+        held = Order(1, 100, DAY, (2, DAY, 'evening', 77))
+        assignments, _ = self.plan([held, Order(2, 101, DAY)], [1, 2])
+
+        self.assertEqual(assignments[0][2:], (2, DAY, 'evening', 77))
+        # Agent 2 now has one order, so the next one goes to agent 1
+        self.assertEqual(assignments[1].agent_id, 1)
+
+    def test_a_slot_held_by_an_inactive_agent_is_planned_again(self):
+        held = Order(1, 100, DAY, (9, DAY, 'evening', 77))
+        assignments, _ = self.plan([held], [1])
+
+        self.assertEqual((assignments[0].agent_id, assignments[0].slot_id), (1, None))
@@ -7,6 +7,7 @@ urlpatterns = [
     path('activity-log/', views.get_activity_log, name='activity_log'),
     path('user-list/<str:role_name>/', views.get_user_list, name='user_list'),
     path('assign-delivery-agent/', views.assign_delivery_agent, name='assign_delivery_agent'),
+    path('auto-assign-delivery-agents/', views.auto_assign_delivery_agents, name='auto_assign_delivery_agents'),
     path('low-stock-alerts/', views.get_low_stock_alerts, name='low_stock_alerts'),
     path('all-orders/', views.get_all_orders_with_delivery, name='all_orders'),
     path('order-details/<int:order_id>/', views.get_order_details, name='order_details'),
@@ -21,4 +22,5 @@ urlpatterns = [
     path('all-categories/', views.get_all_categories, name='get_all_categories'),
     path('all-discounts/', views.get_all_discounts, name='get_all_discounts'),
     path('active-discounts/', views.get_active_discounts, name='get_active_discounts'),
-]
\ No newline at end of file
+    path('db-pool-stats/', views.get_db_pool_stats, name='db_pool_stats'),
+]
\ No newline at end of file
@@ -4,6 +4,12 @@ from django.db import connection, DatabaseError
 import json
 from datetime import datetime
 import oracledb
+from greencart.db.pool import pool_stats
+from greencart.cache import invalidate, plant_tag, ALL_DISCOUNTS
+from greencart.events import order_changed
+from greencart.refdata import refdata, bump_version
+from greencart import discounts
+from .assignment import assign_open_orders
 
 @csrf_exempt
 def get_admin_dashboard_stats(request):
@@ -269,6 +275,7 @@ def assign_delivery_agent(request):
                     """, [order_id, agent_id])
                     
                     print(f"Assignment procedure executed successfully")
+                    order_changed(cursor, order_id, 'order.assigned')
                     
                     return JsonResponse({
                         'status': 'success',
@@ -532,19 +539,15 @@ def apply_discount(request):
                 # Validate discount type
                 print(f"Validating discount type ID: {discount_type_id}")
                 print(f"Type of discount_type_id: {type(discount_type_id)}")
-                cursor.execute("""
-                    SELECT name FROM discount_types WHERE discount_type_id = :discount_type_id
-                """, {'discount_type_id': discount_type_id})
-                discount_type_result = cursor.fetchone()
+                discount_type = refdata.discount_type(discount_type_id)
                 
-                if not discount_type_result:
+                if not discount_type:
                     # Let's see what discount types are actually available
-                    cursor.execute("SELECT discount_type_id, name FROM discount_types")
-                    available_types = cursor.fetchall()
+                    available_types = [(d.discount_type_id, d.name) for d in refdata.all_discount_types()]
                     print(f"Available discount types: {available_types}")
                     return JsonResponse({'status': 'error', 'message': f'Invalid discount type. Available types: {available_types}'}, status=400)
                 
-                discount_type_name = discount_type_result[0]
+                discount_type_name = discount_type.name
                 print(f"Found discount type: {discount_type_name}")
                 
                 # Validate required fields based on discount type
@@ -584,17 +587,34 @@ def apply_discount(request):
                         INSERT INTO plant_discounts (plant_id, discount_id)
                         VALUES (:plant_id, :discount_id)
                     """, {'plant_id': plant_id, 'discount_id': discount_id})
+                    plant_ids = [int(plant_id)]
+                    invalidate(plant_tag(plant_id))
                 elif discount_type_name == 'Category':
                     cursor.execute("""
                         INSERT INTO plant_discounts (category_id, discount_id)
                         VALUES (:category_id, :discount_id)
                     """, {'category_id': category_id, 'discount_id': discount_id})
+                    # Only the detail pages of plants in the category show the discount
+                    cursor.execute("""
+                        SELECT plant_id FROM plant_category_mapping WHERE category_id = :category_id
+                    """, {'category_id': category_id})
+                    plant_ids = [row[0] for row in cursor.fetchall()]
+                    invalidate(*[plant_tag(pid) for pid in plant_ids])
                 else:
                     # For global discounts (Seasonal, Festive, Special), apply to all plants
                     cursor.execute("""
                         INSERT INTO plant_discounts (plant_id, discount_id)
                         SELECT plant_id, :discount_id FROM plants WHERE is_active = 1
                     """, {'discount_id': discount_id})
+                    invalidate(ALL_DISCOUNTS)
+
+                # Every worker reloads its discounts and works out the new
+                # prices on read; a single plant's rows are written now, the
+                # rest by `refresh_prices --watch`
+                discounts.bump_version()
+                if discount_type_name == 'Plant-specific':
+                    with cursor.connection.cursor() as raw_cursor:
+                        discounts.refresh_prices(raw_cursor, plant_ids)
                 
                 return JsonResponse({
                     'status': 'success',
@@ -684,6 +704,34 @@ def get_delivery_agent_performance(request):
             return JsonResponse({'status': 'error', 'message': f'Unexpected error: {str(e)}'}, status=500)
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
 
+@csrf_exempt
+def auto_assign_delivery_agents(request):
+    """Assign every open order in one pass; {"dry_run": true} only returns the plan"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST method required'}, status=405)
+    try:
+        data = json.loads(request.body or '{}')
+        dry_run = bool(data.get('dry_run', False))
+        max_slip_days = data.get('max_slip_days')
+        if max_slip_days is not None:
+            max_slip_days = int(max_slip_days)
+            if max_slip_days < 0:
+                raise ValueError('max_slip_days must not be negative')
+
+        identity = getattr(request, 'identity', None)
+        summary = assign_open_orders(
+            dry_run=dry_run,
+            max_slip_days=max_slip_days,
+            requested_by=identity.user_id if identity else None,
+        )
+        return JsonResponse({'status': 'success', 'data': summary}, status=200)
+    except (json.JSONDecodeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid request: {str(e)}'}, status=400)
+    except DatabaseError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': f'Unexpected error: {str(e)}'}, status=500)
+
 @csrf_exempt
 def get_available_delivery_agents(request):
     if request.method == 'GET':
@@ -813,6 +861,16 @@ def delete_customer(request):
 def get_discount_types(request):
     if request.method == 'GET':
         try:
+            discount_types = [
+                {'discount_type_id': d.discount_type_id, 'name': d.name, 'description': d.description}
+                for d in refdata.all_discount_types()
+            ]
+            if discount_types:
+                return JsonResponse({
+                    'status': 'success',
+                    'data': discount_types
+                }, status=200)
+            
             with connection.cursor() as cursor:
                 cursor.execute("""
                     SELECT discount_type_id, name, description
@@ -846,6 +904,7 @@ def get_discount_types(request):
                             INSERT INTO discount_types (name, description)
                             VALUES (:name, :description)
                         """, {'name': name, 'description': description})
+                    bump_version()
                     
                     # Fetch the newly created discount types
                     cursor.execute("""
@@ -954,25 +1013,15 @@ def get_all_plants(request):
 def get_all_categories(request):
     if request.method == 'GET':
         try:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT category_id, name
-                    FROM plant_categories
-                    ORDER BY name
-                """)
-                
-                columns = [col[0].lower() for col in cursor.description]
-                categories = []
-                while True:
-                    row = cursor.fetchone()
-                    if row is None:
-                        break
-                    categories.append(dict(zip(columns, row)))
-                
-                return JsonResponse({
-                    'status': 'success',
-                    'data': categories
-                }, status=200)
+            categories = [
+                {'category_id': c.category_id, 'name': c.name}
+                for c in refdata.all_categories()
+            ]
+            
+            return JsonResponse({
+                'status': 'success',
+                'data': categories
+            }, status=200)
         except DatabaseError as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
         except Exception as e:
@@ -1116,3 +1165,17 @@ def get_active_discounts(request):
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': f'Unexpected error: {str(e)}'}, status=500)
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+@csrf_exempt
+def get_db_pool_stats(request):
+    if request.method == 'GET':
+        try:
+            stats = pool_stats()
+            if stats is None:
+                return JsonResponse({'status': 'success', 'data': {'pooled': False}}, status=200)
+            return JsonResponse({'status': 'success', 'data': {'pooled': True, **stats}}, status=200)
+        except DatabaseError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': f'Unexpected error: {str(e)}'}, status=500)
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
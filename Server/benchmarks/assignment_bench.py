@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Plan a batch delivery assignment over synthetic open orders.
+
+Usage: python benchmarks/assignment_bench.py [--orders 50000] [--agents 2500] [--runs 5]
+
+No database needed. Generates orders due over the next --days days,
+agents with some existing open load and partly booked slots, then reports
+planning time, how many orders fit, and how evenly the work is spread.
+Building the executemany bind arrays is timed as well.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
+django.setup()
+
+from admin_dashboard.assignment import SLOT_TIMES, Order, plan_assignments
+
+
+def synthetic(orders, agents, days, booked_share, seed):
+    rng = random.Random(seed)
+    today = date.today()
+    open_orders = [
+        Order(order_id, rng.randint(1, 100000), today + timedelta(days=rng.randrange(days)))
+        for order_id in range(1, orders + 1)
+    ]
+    open_orders.sort(key=lambda order: (order.due_date, order.order_id))
+
+    agent_ids = list(range(1, agents + 1))
+    open_load = {agent_id: rng.randint(0, 6) for agent_id in agent_ids}
+
+    slots = {}
+    slot_id = 0
+    for agent_id in agent_ids:
+        for day in range(days + 3):
+            for slot_time in SLOT_TIMES:
+                roll = rng.random()
+                if roll < booked_share:
+                    slots.setdefault((agent_id, today + timedelta(days=day)), {})[slot_time] = None
+                elif roll < booked_share * 1.5:
+                    slot_id += 1
+                    slots.setdefault((agent_id, today + timedelta(days=day)), {})[slot_time] = slot_id
+    return open_orders, agent_ids, open_load, slots
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--agents', type=int, default=2500)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--booked', type=float, default=0.2, help="Share of slots already taken")
+    parser.add_argument('--slip', type=int, default=2)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    open_orders, agent_ids, open_load, slots = synthetic(args.orders, args.agents, args.days, args.booked, 42)
+    print(f"{len(open_orders)} open orders, {len(agent_ids)} agents, {len(slots)} agent-days with booked slots")
+
+    plan_times = []
+    bind_times = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        assignments, unassigned = plan_assignments(open_orders, agent_ids, open_load, slots, args.slip)
+        plan_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        binds = [
+            [(a.order_id, a.agent_id) for a in assignments],
+            [(a.agent_id, a.slot_date, a.slot_time, a.order_id) for a in assignments if a.slot_id is None],
+            [(a.order_id, a.slot_id) for a in assignments if a.slot_id is not None],
+            [(a.order_id, a.user_id, a.agent_id) for a in assignments],
+            [(3, a.slot_date, a.order_id) for a in assignments],
+        ]
+        bind_times.append(time.perf_counter() - start)
+
+    per_agent = {agent_id: open_load[agent_id] for agent_id in agent_ids}
+    slipped = 0
+    due = {order.order_id: order.due_date for order in open_orders}
+    for a in assignments:
+        per_agent[a.agent_id] += 1
+        slipped += a.slot_date != due[a.order_id]
+    loads = list(per_agent.values())
+
+    print(f"planning: median {statistics.median(plan_times) * 1000:.1f} ms, "
+          f"best {min(plan_times) * 1000:.1f} ms over {args.runs} runs")
+    print(f"bind arrays: median {statistics.median(bind_times) * 1000:.1f} ms "
+          f"({sum(len(b) for b in binds)} rows in {len(binds)} executemany calls)")
+    print(f"assigned {len(assignments)}, unassigned {len(unassigned)}, pushed past due date {slipped}")
+    print(f"open load per agent: min {min(loads)} max {max(loads)} "
+          f"mean {statistics.mean(loads):.2f} stdev {statistics.pstdev(loads):.2f}")
+
+
+if __name__ == '__main__':
+    main()
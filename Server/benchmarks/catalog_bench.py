@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Filtered, faceted and sorted listings from the columnar catalog.
+
+Usage: python benchmarks/catalog_bench.py [--plants 200000] [--categories 60] [--queries 500]
+
+No database needed. Builds the catalog from synthetic plants (1-3
+categories each, registered in the reference-data registry here), then
+times random listing queries, category + price range + rating + in stock
+in varying combinations and sorts, paged with the keyset cursor, with and
+without facets. Incremental refresh of a batch of changed plants is timed
+as well.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
+django.setup()
+
+from greencart.refdata import Category, refdata
+from plant_collection.catalog import SORTS, ColumnarCatalog, Filters
+
+
+def seed_categories(count):
+    categories = {i: Category(i, f'Category {i}', f'category-{i}', None, None) for i in range(1, count + 1)}
+    refdata.categories = categories
+    refdata._category_by_slug = {c.slug: c for c in categories.values()}
+    refdata._version.catch_up()
+    refdata._loaded_at = refdata._last_miss_reload = time.monotonic()
+
+
+def synthetic_plant(rng, plant_id, categories, now):
+    plant = (
+        plant_id,
+        f'Plant {rng.randrange(plant_id * 10):08d}',
+        round(rng.lognormvariate(3.3, 0.8), 2),
+        rng.choice([0, 0, 3, 8, 15, 40, 120]),
+        round(rng.uniform(1, 5), 4) if rng.random() < 0.8 else 0,
+        rng.randint(0, 400),
+        now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60)),
+    )
+    return plant, rng.sample(range(1, categories + 1), rng.randint(1, 3))
+
+
+def random_filters(rng, categories):
+    low = rng.choice([None, 5, 10, 25])
+    return Filters(
+        categories=tuple(rng.sample(range(1, categories + 1), rng.randint(0, 2))),
+        min_price=low,
+        max_price=rng.choice([None, 50, 100]) if low is None or low < 50 else None,
+        min_rating=rng.choice([None, None, 3, 4]),
+        in_stock=rng.random() < 0.5,
+    )
+
+
+def timed(queries, run):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        run(*query)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e6, sorted(times)[int(len(times) * 0.95)] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plants', type=int, default=200000)
+    parser.add_argument('--categories', type=int, default=60)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=24)
+    parser.add_argument('--changed', type=int, default=1000, help="Plants per incremental refresh")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    now = datetime.now()
+    seed_categories(args.categories)
+    plants, plant_categories = [], {}
+    for plant_id in range(1, args.plants + 1):
+        plant, category_ids = synthetic_plant(rng, plant_id, args.categories, now)
+        plants.append(plant)
+        plant_categories[plant_id] = category_ids
+
+    catalog = ColumnarCatalog()
+    start = time.perf_counter()
+    catalog.build(plants, plant_categories)
+    print(f"build: {len(catalog)} plants in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    queries = []
+    for _ in range(args.queries):
+        filters = random_filters(rng, args.categories)
+        sort = rng.choice(list(SORTS))
+        first = catalog.query(filters, sort, None, args.limit)
+        # Half of the queries ask for a later page
+        after = first.next_after if rng.random() < 0.5 else None
+        queries.append((filters, sort, after))
+
+    catalog.query(Filters(), 'name', None, args.limit)   # name ranks are built on first use
+    median, p95 = timed(queries, lambda f, s, a: catalog.query(f, s, a, args.limit))
+    print(f"page: median {median:.0f} µs, p95 {p95:.0f} µs over {len(queries)} queries")
+    median, p95 = timed(queries, lambda f, s, a: catalog.query(f, s, a, args.limit, facets=True))
+    print(f"page + facets: median {median:.0f} µs, p95 {p95:.0f} µs")
+
+    changed = []
+    for plant_id in rng.sample(range(1, args.plants + 1), args.changed):
+        plant, category_ids = synthetic_plant(rng, plant_id, args.categories, now)
+        changed.append((plant, category_ids))
+    start = time.perf_counter()
+    catalog.update([plant for plant, _ in changed], {plant[0]: ids for plant, ids in changed})
+    print(f"refresh of {args.changed} changed plants: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
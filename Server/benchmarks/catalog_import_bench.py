@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Catalog import throughput on the Python side, in rows per second.
+
+Usage: python benchmarks/catalog_import_bench.py [--rows 20000] [--chunk 1000]
+
+No database needed. Generates a nursery catalog as CSV and as JSONL, then
+times reading, validating (categories from the reference-data registry,
+seeded here with --categories categories) and building every executemany
+bind array. Also counts the statements the import sends next to what
+add_plant would send for the same rows. The database side is reported by
+`manage.py import_catalog`, which prints rows/s for a real import.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
+django.setup()
+
+from greencart.refdata import Category, refdata
+from seller.catalog_import import CHILD_SQL, RowError, child_rows, parse_row, read_rows
+
+FIELDS = ['name', 'description', 'base_price', 'stock_quantity', 'categories', 'images', 'features',
+          'care_tips', 'sizes']
+
+
+def seed_categories(count):
+    categories = {i: Category(i, f'Category {i}', f'category-{i}', None, None) for i in range(1, count + 1)}
+    refdata.categories = categories
+    refdata._category_by_slug = {c.slug: c for c in categories.values()}
+    refdata._version.catch_up()
+    refdata._loaded_at = refdata._last_miss_reload = time.monotonic()
+
+
+def synthetic(rows, categories, bad_share, seed):
+    rng = random.Random(seed)
+    records = []
+    for i in range(1, rows + 1):
+        slugs = [f'category-{rng.randint(1, categories)}' for _ in range(rng.randint(1, 3))]
+        if rng.random() < bad_share:
+            slugs.append('no-such-category')
+        records.append({
+            'name': f'Plant {i}',
+            'description': 'A hardy plant. ' * rng.randint(1, 20),
+            'base_price': f'{rng.uniform(2, 200):.2f}',
+            'stock_quantity': str(rng.randint(0, 500)),
+            'categories': ','.join(slugs),
+            'images': ','.join(f'https://img.example.com/{i}/{n}.jpg' for n in range(rng.randint(1, 4))),
+            'features': ','.join(f'Feature {n}' for n in range(rng.randint(0, 5))),
+            'care_tips': ','.join(f'Tip {n}' for n in range(rng.randint(0, 4))),
+            'sizes': ','.join(f'{size}:{n * 5}' for n, size in enumerate(['Small', 'Medium', 'Large'][:rng.randint(1, 3)])),
+        })
+
+    csv_text = io.StringIO()
+    writer = csv.DictWriter(csv_text, FIELDS)
+    writer.writeheader()
+    writer.writerows(records)
+    jsonl_text = '\n'.join(json.dumps(record) for record in records)
+    return csv_text.getvalue().encode(), jsonl_text.encode()
+
+
+def run_once(data, fmt, chunk):
+    plants, errors = [], 0
+    statements = 0
+    next_id = 1
+    for number, raw in read_rows(io.BytesIO(data), fmt):
+        try:
+            plants.append(parse_row(number, raw))
+        except RowError:
+            errors += 1
+        if len(plants) >= chunk:
+            ids = list(range(next_id, next_id + len(plants)))
+            next_id += len(plants)
+            binds = child_rows(plants, ids)
+            statements += 3 + sum(1 for table in CHILD_SQL if binds[table])
+            plants = []
+    if plants:
+        binds = child_rows(plants, list(range(next_id, next_id + len(plants))))
+        statements += 3 + sum(1 for table in CHILD_SQL if binds[table])
+    return errors, statements
+
+
+def add_plant_statements(data):
+    total = 0
+    for _, raw in read_rows(io.BytesIO(data), 'csv'):
+        # role check, INSERT, CURRVAL, then one INSERT per child row
+        total += 3 + sum(len([v for v in raw[field].split(',') if v])
+                         for field in ('categories', 'images', 'features', 'care_tips', 'sizes'))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--chunk', type=int, default=1000)
+    parser.add_argument('--categories', type=int, default=60)
+    parser.add_argument('--bad', type=float, default=0.01, help="Share of rows with an unknown category")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    seed_categories(args.categories)
+    csv_data, jsonl_data = synthetic(args.rows, args.categories, args.bad, 42)
+    print(f"{args.rows} rows: CSV {len(csv_data) / 1024 / 1024:.1f} MiB, JSONL {len(jsonl_data) / 1024 / 1024:.1f} MiB")
+
+    for fmt, data in (('csv', csv_data), ('jsonl', jsonl_data)):
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            errors, statements = run_once(data, fmt, args.chunk)
+            times.append(time.perf_counter() - start)
+        seconds = statistics.median(times)
+        print(f"{fmt:5s} read + validate + bind arrays: {args.rows / seconds:,.0f} rows/s "
+              f"({seconds * 1000:.0f} ms), {errors} rows rejected")
+
+    print(f"statements: {statements} with chunks of {args.chunk} rows "
+          f"(+1 per chunk with errors), add_plant one by one: {add_plant_statements(csv_data):,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Compare the per-section and single-query plant detail loaders.
+
+Usage: python benchmarks/plant_detail_bench.py [plant_id ...] [--runs 200]
+
+Reports database round trips (from v$mystat, falls back to counting
+statements) and p50/p95 latency for each mode against the configured DB.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
+django.setup()
+
+from django.db import connection
+
+from plant_detail.views import fetch_plant_details, fetch_plant_document
+
+ROUND_TRIPS_SQL = """
+    SELECT ms.value
+    FROM v$mystat ms
+    JOIN v$statname sn ON ms.statistic# = sn.statistic#
+    WHERE sn.name = 'SQL*Net roundtrips to/from client'
+"""
+
+
+def round_trips(cursor):
+    try:
+        cursor.execute(ROUND_TRIPS_SQL)
+        return cursor.fetchone()[0]
+    except Exception:
+        return None
+
+
+def measure(loader, plant_ids, runs):
+    timings = []
+    statements = []
+
+    def count_statements(execute, sql, params, many, context):
+        statements.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.cursor() as cursor:
+        # Warm up parse/statement cache so we compare steady state
+        for plant_id in plant_ids:
+            loader(cursor, plant_id)
+
+        before = round_trips(cursor)
+        with connection.execute_wrapper(count_statements):
+            for i in range(runs):
+                plant_id = plant_ids[i % len(plant_ids)]
+                started = time.perf_counter()
+                loader(cursor, plant_id)
+                timings.append((time.perf_counter() - started) * 1000)
+        after = round_trips(cursor)
+
+    if before is not None and after is not None:
+        # minus the v$mystat query itself
+        trips = (after - before - 1) / runs
+    else:
+        trips = len(statements) / runs
+
+    timings.sort()
+    return {
+        'round_trips': trips,
+        'p50_ms': statistics.median(timings),
+        'p95_ms': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('plant_ids', nargs='*', type=int)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    plant_ids = args.plant_ids
+    if not plant_ids:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT plant_id FROM plants WHERE is_active = 1 AND ROWNUM <= 20")
+            plant_ids = [row[0] for row in cursor.fetchall()]
+    if not plant_ids:
+        print("No active plants to benchmark")
+        return
+
+    # Both loaders must agree before timing them
+    with connection.cursor() as cursor:
+        for plant_id in plant_ids:
+            if fetch_plant_details(cursor, plant_id) != fetch_plant_document(cursor, plant_id):
+                print(f"Mismatch for plant {plant_id}")
+
+    print(f"{'mode':<14}{'round trips':>14}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, loader in (('per-section', fetch_plant_details), ('single-query', fetch_plant_document)):
+        stats = measure(loader, plant_ids, args.runs)
+        print(f"{name:<14}{stats['round_trips']:>14.1f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
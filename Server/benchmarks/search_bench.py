@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Build the plant search index over a synthetic catalog and time queries.
+
+Usage: python benchmarks/search_bench.py [--plants 1000000] [--queries 500]
+
+No database needed. Reports build time, memory growth (peak RSS),
+incremental update cost and p50/p95 latency for exact, multi-word and
+misspelled queries.
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
+django.setup()
+
+from plant_collection.search import PlantSearchIndex
+
+GENUS = ['monstera', 'ficus', 'pothos', 'calathea', 'philodendron', 'sansevieria', 'aloe',
+         'begonia', 'peperomia', 'dracaena', 'alocasia', 'anthurium', 'hoya', 'fern',
+         'orchid', 'cactus', 'succulent', 'palm', 'lavender', 'basil', 'rosemary', 'jasmine']
+ADJECTIVES = ['variegated', 'dwarf', 'giant', 'golden', 'silver', 'marble', 'velvet', 'trailing',
+              'compact', 'rare', 'classic', 'striped', 'spotted', 'red', 'pink', 'white']
+CATEGORIES = ['Indoor Plants', 'Outdoor Plants', 'Succulents', 'Herbs', 'Flowering Plants',
+              'Air Purifying', 'Low Light', 'Pet Friendly', 'Hanging Plants', 'Rare Plants']
+WORDS = ('bright indirect light water weekly soil drainage humidity leaves growth easy care '
+         'tropical native shade sun fertilize spring summer pot repot prune mist roots '
+         'beginner office bedroom balcony garden fragrant bloom evergreen hardy fast slow').split()
+
+
+def synthetic_catalog(count, seed=42):
+    rng = random.Random(seed)
+    # A long tail of made-up cultivar names keeps the vocabulary realistic
+    cultivars = [''.join(rng.choice('aeioulmnrstkv') for _ in range(rng.randint(5, 9))) for _ in range(20000)]
+    for plant_id in range(1, count + 1):
+        yield plant_id, {
+            'name': f"{rng.choice(ADJECTIVES)} {rng.choice(GENUS)} {rng.choice(cultivars)}",
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 25))),
+            'categories': rng.sample(CATEGORIES, 2),
+            'features': [' '.join(rng.choice(WORDS) for _ in range(3)) for _ in range(3)],
+            'care_tips': [' '.join(rng.choice(WORDS) for _ in range(4)) for _ in range(2)],
+        }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[max(0, int(len(values) * pct) - 1)]
+
+
+def time_queries(index, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, top_k=50)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), percentile(timings, 0.95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plants', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    index = PlantSearchIndex()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    index.build(synthetic_catalog(args.plants))
+    build_seconds = time.perf_counter() - started
+    # ru_maxrss is in KB on Linux
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    print(f"plants indexed   : {len(index):,}")
+    print(f"vocabulary       : {len(index.terms):,} terms")
+    print(f"build time       : {build_seconds:.1f} s")
+    print(f"memory growth    : {rss_growth / 1024:.0f} MB")
+
+    rng = random.Random(7)
+    exact = [f"{rng.choice(ADJECTIVES)} {rng.choice(GENUS)}" for _ in range(args.queries)]
+    single = [rng.choice(GENUS) for _ in range(args.queries)]
+
+    def misspell(word):
+        i = rng.randrange(1, len(word) - 1)
+        return word[:i] + word[i + 1:]
+
+    typos = [misspell(rng.choice(GENUS)) for _ in range(args.queries)]
+    prefixes = [rng.choice(GENUS)[:4] for _ in range(args.queries)]
+
+    print(f"\n{'query kind':<18}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, queries in (('single word', single), ('two words', exact),
+                          ('misspelled', typos), ('prefix', prefixes)):
+        p50, p95 = time_queries(index, queries)
+        print(f"{name:<18}{p50:>10.1f}{p95:>10.1f}")
+
+    # Incremental updates: re-index 1000 changed plants
+    changed = list(synthetic_catalog(1000, seed=99))
+    started = time.perf_counter()
+    index.update(changed)
+    print(f"\nre-index 1000 plants: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Build the delivery slot index and time earliest-slot lookups.
+
+Usage: python benchmarks/slot_index_bench.py [--agents 3000] [--days 30] [--lookups 50000]
+
+No database needed. Builds the index from synthetic delivery_slots rows
+(agents x days x 3 slots, some already taken), then reports build time,
+peek latency (earliest()) and take latency (what reserve() does before
+its UPDATE) while the earliest days fill up.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
+django.setup()
+
+from delivery_agent.slots import SLOT_TIMES, SlotIndex
+
+
+def synthetic(agents, days, booked_share, seed):
+    rng = random.Random(seed)
+    today = date.today()
+    rows = []
+    slot_id = 0
+    for agent_id in range(1, agents + 1):
+        for day in range(days):
+            for slot_time in SLOT_TIMES:
+                slot_id += 1
+                rows.append((slot_id, agent_id, today + timedelta(days=day), slot_time,
+                             0 if rng.random() < booked_share else 1))
+    return rows
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--booked', type=float, default=0.3, help="Share of slots already taken")
+    parser.add_argument('--lookups', type=int, default=50000)
+    args = parser.parse_args()
+
+    rows = synthetic(args.agents, args.days, args.booked, 42)
+    today = date.today()
+    index = SlotIndex()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index.build(rows, today, today + timedelta(days=args.days))
+    build_seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{len(rows)} slot rows, {index.free_count()} free: built in {build_seconds * 1000:.0f} ms, "
+          f"{memory / 1024 / 1024:.1f} MiB")
+
+    rng = random.Random(7)
+    peek = []
+    take = []
+    taken = 0
+    for _ in range(args.lookups):
+        earliest = today + timedelta(days=rng.randint(1, 5))
+
+        start = time.perf_counter()
+        index.earliest(earliest)
+        peek.append((time.perf_counter() - start) * 1_000_000)
+
+        start = time.perf_counter()
+        taken += index._take(earliest) is not None
+        take.append((time.perf_counter() - start) * 1_000_000)
+
+    for name, samples in (('earliest()', peek), ('take', take)):
+        p50, p95 = percentiles(samples)
+        print(f"{name:12s} p50 {p50:6.2f} us   p95 {p95:6.2f} us   max {max(samples):8.1f} us")
+    print(f"{taken} slots taken, {index.free_count()} still free")
+
+
+if __name__ == '__main__':
+    main()
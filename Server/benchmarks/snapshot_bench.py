@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Shared catalog snapshot: build, map, read, and memory across workers.
+
+Usage: python benchmarks/snapshot_bench.py [--plants 200000] [--workers 4] [--reads 2000]
+
+No database needed. Builds snapshot arrays from synthetic plants (images,
+sizes, 1-3 categories each), writes them to a temporary snapshot directory
+and times mapping the file, listing rows, detail pages and building the
+columnar catalog from it, against building the catalog from the same rows
+loaded as tuples. Then forks --workers processes that map the snapshot and
+read every page of it, and reports how much of the mapping each one holds
+privately versus shares (Pss over Rss of the file, from /proc, Linux only).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
+django.setup()
+
+from plant_collection.catalog import ColumnarCatalog
+from plant_collection.snapshot import CatalogSnapshot, build_sections, write_snapshot
+
+SIZES = [('Small', 0), ('Medium', 5), ('Large', 12.5)]
+
+
+def synthetic_rows(rng, count, categories):
+    now = datetime.now()
+    plants, images, sizes, mappings = [], [], [], []
+    size_id = image_id = 0
+    for plant_id in range(1, count + 1):
+        ratings = [rng.randint(0, 80) for _ in range(5)]
+        reviews = sum(ratings)
+        avg = round(sum(stars * n for stars, n in enumerate(ratings, 1)) / reviews, 4) if reviews else 0
+        plants.append((
+            plant_id, f'Plant {rng.randrange(count * 10):08d}', 'A hardy plant. ' * rng.randint(2, 20),
+            round(rng.lognormvariate(3.3, 0.8), 2), rng.choice([0, 3, 8, 15, 40, 120]), avg, reviews,
+            *ratings, now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60)), rng.randint(1, 500),
+        ))
+        for i in range(rng.randint(1, 4)):
+            image_id += 1
+            images.append((plant_id, f'https://img.example.com/plants/{image_id:08x}.jpg', int(i == 0)))
+        for name, adjustment in SIZES[:rng.randint(1, 3)]:
+            size_id += 1
+            sizes.append((plant_id, size_id, name, adjustment))
+        for category_id in sorted(rng.sample(range(1, categories + 1), rng.randint(1, 3))):
+            mappings.append((plant_id, category_id))
+    table = [(i, f'Category {i}', f'category-{i}', None, 0) for i in range(1, categories + 1)]
+    return plants, images, sizes, mappings, table
+
+
+def ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def mapping_memory(path):
+    """(Rss, Pss) in kB of this process's mapping of `path`"""
+    rss = pss = 0
+    inside = False
+    with open('/proc/self/smaps') as smaps:
+        for line in smaps:
+            fields = line.split()
+            if '-' in fields[0] and len(fields) >= 5:
+                inside = fields[-1] == str(path)
+            elif inside and fields[0] == 'Rss:':
+                rss += int(fields[1])
+            elif inside and fields[0] == 'Pss:':
+                pss += int(fields[1])
+    return rss, pss
+
+
+def worker(path, barrier, results):
+    snapshot = CatalogSnapshot(path)
+    for name in vars(snapshot):
+        array = getattr(snapshot, name)
+        if hasattr(array, 'sum'):
+            array.sum()
+    barrier.wait()       # every worker has the whole file mapped and paged in
+    results.put(mapping_memory(path))
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plants', type=int, default=200000)
+    parser.add_argument('--categories', type=int, default=60)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--reads', type=int, default=2000, help="Listing pages and detail pages read")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    rows = synthetic_rows(rng, args.plants, args.categories)
+
+    start = time.perf_counter()
+    sections = build_sections(*rows)
+    print(f"sections: {args.plants} plants in {ms(start):.0f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        path = write_snapshot(directory, sections, change_seq=0)
+        print(f"write: {path.stat().st_size / 1e6:.1f} MB in {ms(start):.0f} ms")
+
+        start = time.perf_counter()
+        snapshot = CatalogSnapshot(path)
+        print(f"map: {ms(start):.2f} ms, arrays are read-only views: "
+              f"{not snapshot.price.flags.writeable and not snapshot.price.flags.owndata}")
+
+        pages = [rng.sample(range(1, args.plants + 1), 24) for _ in range(args.reads)]
+        times = []
+        for plant_ids in pages:
+            start = time.perf_counter()
+            [snapshot.plant_row(snapshot.row(plant_id)) for plant_id in plant_ids]
+            times.append(time.perf_counter() - start)
+        print(f"listing rows (24): median {statistics.median(times) * 1e6:.0f} µs")
+
+        times = []
+        for plant_id in rng.sample(range(1, args.plants + 1), args.reads):
+            start = time.perf_counter()
+            snapshot.plant_detail(snapshot.row(plant_id))
+            times.append(time.perf_counter() - start)
+        print(f"detail core: median {statistics.median(times) * 1e6:.0f} µs")
+
+        start = time.perf_counter()
+        snapshot.top_plants(4), snapshot.top_categories(4)
+        print(f"top plants + categories: {ms(start) * 1000:.0f} µs")
+
+        catalog = ColumnarCatalog()
+        start = time.perf_counter()
+        catalog.build_from_snapshot(snapshot)
+        print(f"catalog from snapshot: {ms(start):.0f} ms")
+
+        loaded = [(p[0], p[1], p[3], p[4], p[5], p[6], p[12]) for p in rows[0]]
+        plant_categories = {}
+        for plant_id, category_id in rows[3]:
+            plant_categories.setdefault(plant_id, []).append(category_id)
+        start = time.perf_counter()
+        ColumnarCatalog().build(loaded, plant_categories)
+        print(f"catalog from loaded rows (excludes the Oracle round trips): {ms(start):.0f} ms")
+
+        if sys.platform.startswith('linux') and args.workers:
+            context = multiprocessing.get_context('fork')
+            barrier = context.Barrier(args.workers)
+            results = context.Queue()
+            processes = [context.Process(target=worker, args=(path, barrier, results))
+                         for _ in range(args.workers)]
+            for process in processes:
+                process.start()
+            memory = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            rss = statistics.mean(m[0] for m in memory) / 1024
+            pss = statistics.mean(m[1] for m in memory) / 1024
+            print(f"{args.workers} workers: each maps {rss:.1f} MB, accounted {pss:.1f} MB (Pss), "
+                  f"{rss * args.workers:.1f} MB if each held a copy")
+
+
+if __name__ == '__main__':
+    main()
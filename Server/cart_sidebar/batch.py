@@ -0,0 +1,192 @@
+"""Many cart changes in one request, e.g. select-all or clear-cart.
+
+apply_operations() takes an ordered list of operations:
+
+    {"op": "add", "plant_id": 3, "size": "Medium", "quantity": 2}
+    {"op": "add", "plant_id": 3, "size_id": 12}
+    {"op": "set_quantity", "cart_id": 40, "quantity": 5}
+    {"op": "toggle", "cart_id": 40}                  (or "selected": true/false)
+    {"op": "delete", "cart_id": 40}
+
+and applies them in one transaction and a handful of statements:
+
+  1. lock the user's cart rows;
+  2. read the plants being added, with their sizes, in one query that
+     binds the plant ids as one collection;
+  3. play the operations in order over the rows read, checking each one
+     as the single-item procedures do (add_to_cart, toggle_cart_item_selection,
+     update_cart_item_quantity, delete_cart_item);
+  4. write what changed with one array-bound DELETE, UPDATE and INSERT.
+
+An operation that fails leaves the cart as it was. The procedures commit
+on their own, so they can't take part in the batch.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from greencart.db.binds import number_list
+
+OPERATIONS = ('add', 'set_quantity', 'toggle', 'delete')
+
+LOCK_SQL = """
+    SELECT cart_id, plant_id, size_id, quantity, selected
+    FROM carts
+    WHERE user_id = :user_id
+    FOR UPDATE
+"""
+
+PLANTS_SQL = """
+    SELECT p.plant_id, p.seller_id, p.stock_quantity, ps.size_id, ps.size_name
+    FROM plants p
+    LEFT JOIN plant_sizes ps ON ps.plant_id = p.plant_id
+    WHERE p.plant_id IN (SELECT column_value FROM TABLE(:plant_ids))
+    AND p.is_active = 1
+"""
+
+DELETE_SQL = "DELETE FROM carts WHERE cart_id = :1 AND user_id = :2"
+
+UPDATE_SQL = """
+    UPDATE carts
+    SET quantity = :1, selected = :2,
+        added_at = CASE WHEN :3 = 1 THEN SYSTIMESTAMP ELSE added_at END
+    WHERE cart_id = :4 AND user_id = :5
+"""
+
+INSERT_SQL = """
+    INSERT INTO carts (user_id, plant_id, size_id, quantity, added_at)
+    VALUES (:1, :2, :3, :4, SYSTIMESTAMP)
+"""
+
+
+class BatchError(ValueError):
+    """An operation that can't be applied, `index` is its position"""
+
+    def __init__(self, index, message):
+        super().__init__(f"Operation {index}: {message}")
+        self.index = index
+
+
+def _int(operation, field, index):
+    try:
+        return int(operation[field])
+    except (KeyError, TypeError, ValueError):
+        raise BatchError(index, f"{field} must be a whole number")
+
+
+def parse_operations(operations):
+    """Operations checked for shape, with ints where ids and quantities go"""
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations must be a non-empty list")
+    if len(operations) > settings.CART_BATCH_MAX_OPERATIONS:
+        raise ValueError(f"At most {settings.CART_BATCH_MAX_OPERATIONS} operations per request")
+
+    parsed = []
+    for i, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise BatchError(i, f"op must be one of {', '.join(OPERATIONS)}")
+        op = operation['op']
+        if op == 'add':
+            item = {'op': op, 'plant_id': _int(operation, 'plant_id', i),
+                    'quantity': _int(operation, 'quantity', i) if 'quantity' in operation else 1}
+            if operation.get('size_id') is not None:
+                item['size_id'] = _int(operation, 'size_id', i)
+            elif operation.get('size'):
+                item['size'] = str(operation['size'])
+            else:
+                raise BatchError(i, "size or size_id is required")
+            if item['quantity'] <= 0:
+                raise BatchError(i, "Quantity must be positive")
+        else:
+            item = {'op': op, 'cart_id': _int(operation, 'cart_id', i)}
+            if op == 'set_quantity':
+                item['quantity'] = _int(operation, 'quantity', i)
+                if item['quantity'] < 1:
+                    raise BatchError(i, "Quantity must be at least 1")
+            elif op == 'toggle' and operation.get('selected') is not None:
+                item['selected'] = 1 if operation['selected'] else 0
+        parsed.append(item)
+    return parsed
+
+
+def apply_operations(cursor, user_id, operations):
+    """Apply parsed operations to the user's cart in order, `cursor` is a
+    plain oracledb cursor. Raises BatchError, with nothing written, when
+    one of them can't be applied. Returns how many rows were deleted,
+    updated and inserted"""
+    with transaction.atomic():
+        cursor.execute(LOCK_SQL, {'user_id': user_id})
+        rows = {
+            int(cart_id): {'plant_id': int(plant_id), 'size_id': int(size_id), 'quantity': int(quantity),
+                           'selected': int(selected), 'touched': False, 'bumped': False}
+            for cart_id, plant_id, size_id, quantity, selected in cursor.fetchall()
+        }
+        by_item = {(row['plant_id'], row['size_id']): cart_id for cart_id, row in rows.items()}
+
+        plants = {}
+        added = [op['plant_id'] for op in operations if op['op'] == 'add']
+        if added:
+            cursor.execute(PLANTS_SQL, {'plant_ids': number_list(cursor, added)})
+            for plant_id, seller_id, stock, size_id, size_name in cursor.fetchall():
+                plant = plants.setdefault(int(plant_id), {'seller_id': seller_id, 'stock': int(stock or 0),
+                                                          'sizes': {}, 'size_ids': set()})
+                if size_id is not None:
+                    plant['sizes'][size_name] = int(size_id)
+                    plant['size_ids'].add(int(size_id))
+
+        deleted, inserts = [], {}
+        for i, op in enumerate(operations):
+            if op['op'] == 'add':
+                plant = plants.get(op['plant_id'])
+                if plant is None:
+                    raise BatchError(i, "Plant not found or inactive")
+                if plant['seller_id'] is None:
+                    raise BatchError(i, "Plant has no seller assigned")
+                if 'size_id' in op:
+                    size_id = op['size_id'] if op['size_id'] in plant['size_ids'] else None
+                    if size_id is None:
+                        raise BatchError(i, "Invalid size ID")
+                else:
+                    size_id = plant['sizes'].get(op['size'])
+                    if size_id is None:
+                        raise BatchError(i, f"Size '{op['size']}' not found for this plant")
+                if plant['stock'] < op['quantity']:
+                    raise BatchError(i, "Insufficient stock for plant")
+
+                key = (op['plant_id'], size_id)
+                if key in by_item:
+                    row = rows[by_item[key]]
+                    row['quantity'] += op['quantity']
+                    row['touched'] = row['bumped'] = True
+                else:
+                    inserts[key] = inserts.get(key, 0) + op['quantity']
+                continue
+
+            row = rows.get(op['cart_id'])
+            if row is None:
+                raise BatchError(i, "Cart item not found or user not authorized")
+            if op['op'] == 'delete':
+                del rows[op['cart_id']]
+                del by_item[(row['plant_id'], row['size_id'])]
+                deleted.append(op['cart_id'])
+                # Adding the same plant and size again later starts a new row
+                continue
+            if op['op'] == 'set_quantity':
+                row['quantity'] = op['quantity']
+            else:
+                row['selected'] = op.get('selected', 1 - row['selected'])
+            row['touched'] = True
+
+        updates = [
+            (row['quantity'], row['selected'], 1 if row['bumped'] else 0, cart_id, user_id)
+            for cart_id, row in rows.items() if row['touched']
+        ]
+        if deleted:
+            cursor.executemany(DELETE_SQL, [(cart_id, user_id) for cart_id in deleted])
+        if updates:
+            cursor.executemany(UPDATE_SQL, updates)
+        if inserts:
+            cursor.executemany(INSERT_SQL, [
+                (user_id, plant_id, size_id, quantity) for (plant_id, size_id), quantity in inserts.items()
+            ])
+
+    return len(deleted), len(updates), len(inserts)
@@ -1,3 +1,107 @@
-from django.test import TestCase
+from contextlib import nullcontext
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from . import batch
+from .batch import BatchError, apply_operations, parse_operations
+
+
+class FakeCursor:
+    """The user's cart rows for LOCK_SQL and plant rows for PLANTS_SQL,
+    records what is written"""
+
+    def __init__(self, cart, plants):
+        self.cart = cart
+        self.plants = plants
+        self.written = {}
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self._rows = self.cart if sql == batch.LOCK_SQL else self.plants
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def executemany(self, sql, rows):
+        self.written[sql] = rows
+
+
+@override_settings(CART_BATCH_MAX_OPERATIONS=3)
+class ParseOperationsTests(SimpleTestCase):
+
+    def test_ids_and_quantities_become_ints(self):
+        self.assertEqual(parse_operations([
+            {'op': 'add', 'plant_id': '3', 'size': 'Medium'},
+            {'op': 'set_quantity', 'cart_id': 40, 'quantity': '5'},
+            {'op': 'toggle', 'cart_id': '40', 'selected': False},
+        ]), [
+            {'op': 'add', 'plant_id': 3, 'quantity': 1, 'size': 'Medium'},
+            {'op': 'set_quantity', 'cart_id': 40, 'quantity': 5},
+            {'op': 'toggle', 'cart_id': 40, 'selected': 0},
+        ])
+
+    def test_the_error_names_the_failing_operation(self):
+        with self.assertRaises(BatchError) as raised:
+            parse_operations([{'op': 'delete', 'cart_id': 1}, {'op': 'add', 'plant_id': 'x', 'size': 'S'}])
+        self.assertEqual(raised.exception.index, 1)
+
+        with self.assertRaises(BatchError) as raised:
+            parse_operations([{'op': 'set_quantity', 'cart_id': 1, 'quantity': 0}])
+        self.assertEqual(raised.exception.index, 0)
+
+    def test_list_shape_and_size_are_checked(self):
+        for operations in ([], {'op': 'delete'}, [{'op': 'delete', 'cart_id': 1}] * 4):
+            with self.assertRaises(ValueError):
+                parse_operations(operations)
+
+
+@mock.patch.object(batch, 'number_list', lambda cursor, values: list(values))
+@mock.patch.object(batch.transaction, 'atomic', nullcontext)
+class ApplyOperationsTests(SimpleTestCase):
+
+    # cart_id, plant_id, size_id, quantity, selected
+    CART = [(40, 3, 12, 1, 1), (41, 4, 20, 2, 0)]
+    # plant_id, seller_id, stock, size_id, size_name
+    PLANTS = [(3, 9, 50, 12, 'Medium'), (3, 9, 50, 13, 'Large')]
+
+    def apply(self, operations):
+        cursor = FakeCursor(self.CART, self.PLANTS)
+        counts = apply_operations(cursor, 7, parse_operations(operations))
+        return counts, cursor.written
+
+    def test_delete_then_add_the_same_item_inserts_a_new_row(self):
+        counts, written = self.apply([
+            {'op': 'delete', 'cart_id': 40},
+            {'op': 'add', 'plant_id': 3, 'size': 'Medium', 'quantity': 2},
+        ])
+
+        self.assertEqual(counts, (1, 0, 1))
+        self.assertEqual(written[batch.DELETE_SQL], [(40, 7)])
+        self.assertEqual(written[batch.INSERT_SQL], [(7, 3, 12, 2)])
+
+    def test_adding_an_item_already_in_the_cart_updates_it(self):
+        counts, written = self.apply([
+            {'op': 'add', 'plant_id': 3, 'size_id': 12},
+            {'op': 'toggle', 'cart_id': 41},
+        ])
+
+        self.assertEqual(counts, (0, 2, 0))
+        self.assertEqual(sorted(written[batch.UPDATE_SQL]), [(2, 1, 0, 41, 7), (2, 1, 1, 40, 7)])
+
+    def test_a_failing_operation_writes_nothing(self):
+        with self.assertRaises(BatchError) as raised:
+            self.apply([
+                {'op': 'set_quantity', 'cart_id': 40, 'quantity': 3},
+                {'op': 'add', 'plant_id': 3, 'size': 'Small'},
+            ])
+        self.assertEqual(raised.exception.index, 1)
+
+    def test_an_item_deleted_earlier_in_the_batch_is_gone(self):
+        with self.assertRaises(BatchError) as raised:
+            self.apply([{'op': 'delete', 'cart_id': 41}, {'op': 'toggle', 'cart_id': 41}])
+        self.assertEqual(raised.exception.index, 1)
+
+    def test_stock_is_checked(self):
+        with self.assertRaises(BatchError):
+            self.apply([{'op': 'add', 'plant_id': 3, 'size': 'Large', 'quantity': 51}])
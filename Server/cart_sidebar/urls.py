@@ -8,4 +8,5 @@ urlpatterns = [
     path('toggle/', views.toggle_cart_item_view, name='toggle_cart_item'),
     path('update_quantity/', views.update_cart_item_quantity_view, name='update_cart_item_quantity'),
     path('delete/', views.delete_cart_item_view, name='delete_cart_item'),
+    path('batch/', views.cart_batch_view, name='cart_batch'),
 ]
\ No newline at end of file
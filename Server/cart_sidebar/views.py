@@ -2,20 +2,20 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.db import connection, DatabaseError
 import json
+import oracledb
+from greencart.discounts import prices, discount_detail
+from .batch import BatchError, apply_operations, parse_operations
 
-# Fetch cart items
-@csrf_exempt
-def cart_sidebar_view(request, user_id):
-    with connection.cursor() as cursor:
-        out_cursor = cursor.connection.cursor()
-        try:
-            cursor.callproc("get_user_cart", [user_id, out_cursor])
-            columns = [col[0].lower() for col in out_cursor.description]
-            rows = out_cursor.fetchall()
-        except DatabaseError as e:
-            return JsonResponse({"error": str(e)}, status=400)
-        finally:
-            out_cursor.close()
+
+def fetch_cart(cursor, user_id):
+    """The user's cart items as the sidebar shows them"""
+    with cursor.connection.cursor() as out_cursor:
+        cursor.callproc("get_user_cart", [user_id, out_cursor])
+        columns = [col[0].lower() for col in out_cursor.description]
+        rows = out_cursor.fetchall()
+    # Same prices checkout charges
+    with cursor.connection.cursor() as raw_cursor:
+        plant_prices = prices(raw_cursor, [row[columns.index('plant_id')] for row in rows])
 
     cart_items = []
     for row in rows:
@@ -26,11 +26,68 @@ def cart_sidebar_view(request, user_id):
         # Map database field 'primary_image' to frontend expected 'image_url'
         if 'primary_image' in item:
             item['image_url'] = item['primary_image']
+        price = plant_prices.get((item['plant_id'], item['size_id']))
+        item['effective_price'] = price.effective_price if price else item['unit_price']
+        item['discount'] = discount_detail(price.discount) if price else None
         cart_items.append(item)
+    return cart_items
+
+
+# Fetch cart items
+@csrf_exempt
+def cart_sidebar_view(request, user_id):
+    with connection.cursor() as cursor:
+        try:
+            cart_items = fetch_cart(cursor, user_id)
+        # fetch_cart reads through plain oracledb cursors too
+        except (DatabaseError, oracledb.DatabaseError) as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
     return JsonResponse({"cart_items": cart_items})
 
 
+# Apply several cart changes at once and return the cart
+@csrf_exempt
+def cart_batch_view(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=400)
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(data, dict) or not data.get("user_id"):
+        return JsonResponse({"error": "User ID is required"}, status=400)
+    try:
+        user_id = int(data["user_id"])
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "User ID must be a whole number"}, status=400)
+    try:
+        operations = parse_operations(data.get("operations"))
+    except BatchError as e:
+        return JsonResponse({"error": str(e), "operation": e.index}, status=400)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    with connection.cursor() as cursor:
+        try:
+            with cursor.connection.cursor() as raw_cursor:
+                deleted, updated, inserted = apply_operations(raw_cursor, user_id, operations)
+            cart_items = fetch_cart(cursor, user_id)
+        except BatchError as e:
+            return JsonResponse({"error": str(e), "operation": e.index}, status=400)
+        except (DatabaseError, oracledb.DatabaseError) as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({
+        "success": True,
+        "deleted": deleted,
+        "updated": updated,
+        "inserted": inserted,
+        "cart_items": cart_items,
+    })
+
+
 # Add this to your views.py
 @csrf_exempt
 def add_to_cart_view(request):
@@ -0,0 +1,122 @@
+"""Turning the id a delivery agent view was called with into an agent_id.
+
+The client passes either the agent's user_id or their agent_id. When the
+request carries a login token for that agent, the agent_id claim answers it
+without touching the database. Otherwise the per-worker AgentResolver does:
+a user_id <-> agent_id pair never changes once an agent exists (deleting the
+account only deactivates the agent), so both directions are loaded once and
+kept. Unknown ids are looked up with an index-friendly query, and the
+misses are remembered for AGENT_RESOLVER_MISS_SECONDS.
+
+invalidate_agents() forgets those misses in every worker. Call it after
+creating delivery agents (signup, add_delivery_agents.py) so a new agent
+resolves straight away.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from greencart.versions import SharedVersion
+
+LOOKUP_SQL = """
+    SELECT agent_id, user_id FROM delivery_agents WHERE user_id = %s
+    UNION ALL
+    SELECT agent_id, user_id FROM delivery_agents WHERE agent_id = %s
+"""
+
+
+def _as_int(value):
+    # VariableWrapper from an earlier query, or a string from JSON
+    if hasattr(value, 'value'):
+        value = value.value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AgentResolver:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_user = {}
+        self._agent_ids = set()
+        self._missing = {}   # id -> when it was last found not to be an agent
+        self._version = SharedVersion('agents:version')
+
+    def load(self, cursor=None):
+        with self._lock:
+            if cursor is None:
+                with connection.cursor() as cursor:
+                    self._load(cursor)
+            else:
+                self._load(cursor)
+
+    def _load(self, cursor):
+        cursor.execute("SELECT agent_id, user_id FROM delivery_agents")
+        rows = cursor.fetchall()
+        self._by_user = {user_id: agent_id for agent_id, user_id in rows}
+        self._agent_ids = {agent_id for agent_id, user_id in rows}
+        self._missing = {}
+        self._loaded = True
+
+    def _remember(self, agent_id, user_id):
+        self._by_user[user_id] = agent_id
+        self._agent_ids.add(agent_id)
+
+    def _check_version(self):
+        if self._version.changed():
+            self._missing = {}
+
+    def resolve(self, cursor, value):
+        """agent_id for a user_id or agent_id, None if there is no such agent"""
+        key = _as_int(value)
+        if key is None:
+            return None
+        if not self._loaded:
+            self.load(cursor)
+        self._check_version()
+
+        # user_id first, it's what the client usually sends
+        agent_id = self._by_user.get(key)
+        if agent_id is not None:
+            return agent_id
+        if key in self._agent_ids:
+            return key
+
+        missed_at = self._missing.get(key)
+        if missed_at is not None and time.monotonic() - missed_at < settings.AGENT_RESOLVER_MISS_SECONDS:
+            return None
+
+        cursor.execute(LOOKUP_SQL, [key, key])
+        rows = cursor.fetchall()
+        if not rows:
+            self._missing[key] = time.monotonic()
+            return None
+        for agent_id, user_id in rows:
+            self._remember(agent_id, user_id)
+        return self._by_user.get(key, key)
+
+    def invalidate(self):
+        self._missing = {}
+        self._version.bump()
+
+
+agents = AgentResolver()
+
+
+def invalidate_agents():
+    agents.invalidate()
+
+
+def resolve_agent_id(request, cursor, agent_id):
+    """agent_id for a user_id or agent_id, None if there is no such agent"""
+    identity = getattr(request, 'identity', None)
+    if (identity is not None and identity.role == 'delivery_agent' and identity.agent_id is not None
+            and str(agent_id) in (str(identity.user_id), str(identity.agent_id))):
+        return identity.agent_id
+
+    return agents.resolve(cursor, agent_id)
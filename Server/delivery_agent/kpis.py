@@ -0,0 +1,70 @@
+"""Delivery agent dashboard KPIs.
+
+All five numbers come from one conditional-aggregation pass over the
+agent's assignments and are cached per agent, since agents keep polling the
+dashboard during a shift. Views that change an agent's orders call
+invalidate_agent_kpis() (or invalidate_kpis_for_order() when they only
+know the order). Assignments made by the database itself are picked up
+when the entry expires after AGENT_KPI_CACHE_SECONDS.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from greencart.refdata import refdata
+
+PENDING_STATUSES = ('Processing', 'Shipped', 'Out for Delivery')
+
+KPI_KEY = 'agent_kpis:{}'
+
+KPI_SQL = """
+    SELECT
+        COUNT(*),
+        COUNT(CASE WHEN o.status_id IN (%s, %s, %s) AND oa.completed_at IS NULL THEN 1 END),
+        COUNT(CASE WHEN o.status_id = %s THEN 1 END),
+        NVL(SUM(CASE WHEN o.status_id = %s THEN o.total_amount * 0.05 END), 0),
+        NVL(AVG(CASE
+            WHEN o.status_id = %s AND NVL(oa.completed_at, o.actual_delivery_date) IS NOT NULL THEN
+                EXTRACT(DAY FROM (NVL(oa.completed_at, o.actual_delivery_date) - oa.assigned_at)) * 24 +
+                EXTRACT(HOUR FROM (NVL(oa.completed_at, o.actual_delivery_date) - oa.assigned_at)) +
+                EXTRACT(MINUTE FROM (NVL(oa.completed_at, o.actual_delivery_date) - oa.assigned_at)) / 60
+        END), 0)
+    FROM order_assignments oa
+    LEFT JOIN orders o ON oa.order_id = o.order_id
+    WHERE oa.agent_id = %s
+"""
+
+
+def fetch_agent_kpis(cursor, agent_id):
+    """Dashboard stats for one agent, in a single query"""
+    pending = [refdata.status_id(name) for name in PENDING_STATUSES]
+    delivered = refdata.status_id('Delivered')
+    cursor.execute(KPI_SQL, pending + [delivered, delivered, delivered, agent_id])
+    total, pending_count, completed, earnings, avg_hours = cursor.fetchone()
+    return {
+        'total_assignments': total or 0,
+        'pending_assignments': pending_count or 0,
+        'completed_assignments': completed or 0,
+        'total_earnings': float(earnings or 0),
+        'avg_delivery_time': float(avg_hours or 0),
+    }
+
+
+def get_agent_kpis(cursor, agent_id):
+    key = KPI_KEY.format(agent_id)
+    kpis = cache.get(key)
+    if kpis is None:
+        kpis = fetch_agent_kpis(cursor, agent_id)
+        cache.set(key, kpis, settings.AGENT_KPI_CACHE_SECONDS)
+    return kpis
+
+
+def invalidate_agent_kpis(*agent_ids):
+    keys = [KPI_KEY.format(agent_id) for agent_id in agent_ids if agent_id is not None]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_kpis_for_order(cursor, order_id):
+    """Drop the cached KPIs of whoever is assigned to `order_id`"""
+    cursor.execute("SELECT agent_id FROM order_assignments WHERE order_id = %s", [order_id])
+    invalidate_agent_kpis(*[row[0] for row in cursor.fetchall()])
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from delivery_agent.slots import SLOT_TIMES, bump_version
+
+# Every active agent x day x slot time that has no row yet
+GENERATE_SQL = """
+    INSERT INTO delivery_slots (agent_id, slot_date, slot_time, is_available)
+    SELECT da.agent_id, d.slot_date, t.slot_time, 1
+    FROM delivery_agents da
+    CROSS JOIN (SELECT :first_date + LEVEL - 1 AS slot_date FROM dual CONNECT BY LEVEL <= :days) d
+    CROSS JOIN (
+        SELECT 'morning' AS slot_time FROM dual
+        UNION ALL SELECT 'afternoon' FROM dual
+        UNION ALL SELECT 'evening' FROM dual
+    ) t
+    WHERE da.is_active = 1
+    AND NOT EXISTS (
+        SELECT 1 FROM delivery_slots ds
+        WHERE ds.agent_id = da.agent_id AND ds.slot_date = d.slot_date AND ds.slot_time = t.slot_time
+    )
+"""
+
+
+class Command(BaseCommand):
+    help = "Create the free delivery slots of every active agent for the coming days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Days from today to cover (default SLOT_INDEX_DAYS)")
+
+    def handle(self, *args, **options):
+        days = options['days'] or settings.SLOT_INDEX_DAYS
+        first_date = date.today()
+
+        with transaction.atomic(), connection.cursor() as django_cursor, django_cursor.connection.cursor() as cursor:
+            cursor.execute(GENERATE_SQL, {'first_date': first_date, 'days': days})
+            created = cursor.rowcount
+
+        bump_version()
+        last_date = first_date + timedelta(days=days - 1)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} slot(s) ({', '.join(SLOT_TIMES)}) from {first_date} to {last_date}"
+        ))
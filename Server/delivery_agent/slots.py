@@ -0,0 +1,200 @@
+"""In-memory index of delivery slot capacity.
+
+delivery_slots holds one row per agent, day and slot ('morning',
+'afternoon', 'evening'). `manage.py generate_delivery_slots` creates the
+free rows (is_available = 1) for the coming SLOT_INDEX_DAYS days. Each
+worker keeps the rows of that window in memory:
+
+  * a sorted list of the days that still have a free slot, so the
+    earliest day on or after a date is a bisect;
+  * per day, a heap of free slots (mornings first, so a day fills up
+    across agents before anyone gets a second order);
+  * per agent and day, which slots are free, for the assignment planner.
+
+Reserving a slot pops it from the index and claims the row with a
+conditional UPDATE (still free and without an order). If another worker
+got there first the UPDATE touches nothing and the next slot is tried, so
+the database stays the arbiter and the index only has to be close.
+
+assign_delivery_agent claims the same rows (or keeps the one checkout
+reserved), and trg_orders_free_slot frees an order's slot when it is
+cancelled or returned.
+
+The index reloads after SLOT_INDEX_REFRESH_SECONDS, or when bump_version()
+is called (new slots generated, slots freed). One thread per worker
+reloads while the others keep using the rows already loaded; callers
+reload before opening their transaction so the read holds no locks.
+"""
+import bisect
+import heapq
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+
+from greencart.versions import SharedVersion
+
+SLOT_TIMES = ('morning', 'afternoon', 'evening')
+TIME_RANK = {slot_time: rank for rank, slot_time in enumerate(SLOT_TIMES)}
+
+Slot = namedtuple('Slot', 'slot_id agent_id slot_date slot_time')
+
+LOAD_SQL = """
+    SELECT ds.slot_id, ds.agent_id, ds.slot_date, ds.slot_time,
+           CASE WHEN ds.is_available = 1 AND ds.order_id IS NULL AND da.is_active = 1 THEN 1 ELSE 0 END
+    FROM delivery_slots ds
+    JOIN delivery_agents da ON ds.agent_id = da.agent_id
+    WHERE ds.slot_date BETWEEN :1 AND :2
+"""
+
+RESERVE_SQL = """
+    UPDATE delivery_slots
+    SET is_available = 0, order_id = :1
+    WHERE slot_id = :2 AND is_available = 1 AND order_id IS NULL
+"""
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class SlotIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._version = SharedVersion('slots:version')
+        self.first_date = None
+        self.last_date = None
+        self._dates = []   # days with at least one free slot, sorted
+        self._free = {}    # slot_date -> heap of (time rank, slot_id, agent_id)
+        self._rows = {}    # (agent_id, slot_date) -> {slot_time: slot_id while free, None once taken}
+
+    # Loading
+
+    def load(self, cursor):
+        """Reload the window; `cursor` is a plain oracledb cursor"""
+        with self._load_lock:
+            self._load(cursor)
+
+    def _load(self, cursor):
+        first_date = date.today()
+        last_date = first_date + timedelta(days=settings.SLOT_INDEX_DAYS)
+        # Thousands of agents x 30 days x 3 slots, fetch in big batches
+        cursor.arraysize = 5000
+        cursor.prefetchrows = 5000
+        cursor.execute(LOAD_SQL, [first_date, last_date])
+        self.build(cursor, first_date, last_date)
+
+    def build(self, rows, first_date, last_date):
+        free = {}
+        slot_rows = {}
+        for slot_id, agent_id, slot_date, slot_time, is_free in rows:
+            slot_date = _day(slot_date)
+            slot_rows.setdefault((agent_id, slot_date), {})[slot_time] = slot_id if is_free else None
+            if is_free:
+                free.setdefault(slot_date, []).append((TIME_RANK.get(slot_time, len(SLOT_TIMES)), slot_id, agent_id))
+        for heap in free.values():
+            heapq.heapify(heap)
+
+        with self._lock:
+            self._free = free
+            self._dates = sorted(free)
+            self._rows = slot_rows
+            self.first_date = first_date
+            self.last_date = last_date
+            self._loaded_at = time.monotonic()
+
+    def _stale(self):
+        if self._version.changed():
+            # Stays stale until a reload, even if another thread is busy with one
+            self._loaded_at = None
+        if self._loaded_at is None:
+            return True
+        if time.monotonic() - self._loaded_at >= settings.SLOT_INDEX_REFRESH_SECONDS:
+            return True
+        return self.first_date != date.today()
+
+    def ensure_loaded(self, cursor):
+        """Reload if due. Only the first load waits for another thread's
+        reload, after that the thread that gets the lock does it"""
+        if not self._stale():
+            return
+        loaded_at = self._loaded_at
+        if not self._load_lock.acquire(blocking=self.first_date is None):
+            return
+        try:
+            # Skip it if another thread reloaded while this one waited
+            if self.first_date is None or self._loaded_at == loaded_at:
+                self._load(cursor)
+        finally:
+            self._load_lock.release()
+
+    # Lookups (callers hold no lock)
+
+    def _top(self, earliest):
+        """Free slot at the head of the first day >= earliest, dropping taken ones"""
+        i = bisect.bisect_left(self._dates, earliest)
+        while i < len(self._dates):
+            slot_date = self._dates[i]
+            heap = self._free[slot_date]
+            while heap:
+                rank, slot_id, agent_id = heap[0]
+                slot_time = SLOT_TIMES[rank] if rank < len(SLOT_TIMES) else None
+                if self._rows.get((agent_id, slot_date), {}).get(slot_time) == slot_id:
+                    return Slot(slot_id, agent_id, slot_date, slot_time)
+                heapq.heappop(heap)
+            del self._dates[i]
+            del self._free[slot_date]
+        return None
+
+    def earliest(self, earliest_date):
+        """Earliest free slot on or after `earliest_date`, without taking it"""
+        with self._lock:
+            return self._top(earliest_date)
+
+    def _take(self, earliest_date):
+        with self._lock:
+            slot = self._top(earliest_date)
+            if slot is not None:
+                self._rows[(slot.agent_id, slot.slot_date)][slot.slot_time] = None
+            return slot
+
+    def reserve(self, cursor, order_id, earliest_date):
+        """Claim the earliest free slot on or after `earliest_date` for
+        `order_id`, None when there is none. `cursor` is a plain oracledb
+        cursor inside the caller's transaction"""
+        for _ in range(settings.SLOT_RESERVE_ATTEMPTS):
+            slot = self._take(earliest_date)
+            if slot is None:
+                return None
+            cursor.execute(RESERVE_SQL, [order_id, slot.slot_id])
+            if cursor.rowcount == 1:
+                return slot
+            # Taken by another worker since the last load, try the next one
+        return None
+
+    def rows_between(self, first_date, last_date):
+        """{(agent_id, slot_date): {slot_time: slot_id or None}} for the planner"""
+        with self._lock:
+            return {key: dict(times) for key, times in self._rows.items() if first_date <= key[1] <= last_date}
+
+    def mark_taken(self, agent_id, slot_date, slot_time):
+        with self._lock:
+            self._rows.setdefault((agent_id, slot_date), {})[slot_time] = None
+
+    def free_count(self):
+        with self._lock:
+            return sum(1 for times in self._rows.values() for slot_id in times.values() if slot_id is not None)
+
+
+slot_index = SlotIndex()
+
+
+def bump_version():
+    """Make every worker reload, call after adding or freeing slots"""
+    slot_index._version.bump()
+    slot_index._loaded_at = None
@@ -1,3 +1,82 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .slots import Slot, SlotIndex
+
+TODAY = date(2025, 6, 2)
+TOMORROW = TODAY + timedelta(days=1)
+
+
+class ReserveCursor:
+    """Claims RESERVE_SQL for every slot id but the ones in `taken`"""
+
+    def __init__(self, taken=()):
+        self.taken = set(taken)
+        self.claimed = []
+        self.rowcount = 0
+
+    def execute(self, sql, params):
+        order_id, slot_id = params
+        self.rowcount = 0 if slot_id in self.taken else 1
+        if self.rowcount:
+            self.claimed.append((order_id, slot_id))
+
+
+def build(rows):
+    index = SlotIndex()
+    index.build(rows, TODAY, TODAY + timedelta(days=30))
+    return index
+
+
+@override_settings(SLOT_RESERVE_ATTEMPTS=3)
+class SlotIndexTests(SimpleTestCase):
+
+    def test_earliest_is_the_first_free_slot_on_or_after_the_date(self):
+        index = build([
+            (1, 10, TODAY, 'morning', 0),
+            (2, 10, TOMORROW, 'evening', 1),
+            (3, 11, TOMORROW, 'morning', 1),
+        ])
+
+        self.assertEqual(index.earliest(TODAY), Slot(3, 11, TOMORROW, 'morning'))
+        self.assertIsNone(index.earliest(TOMORROW + timedelta(days=1)))
+
+    def test_reserve_skips_slots_taken_by_another_worker(self):
+        index = build([
+            (1, 10, TODAY, 'morning', 1),
+            (2, 11, TODAY, 'morning', 1),
+            (3, 10, TODAY, 'afternoon', 1),
+        ])
+        cursor = ReserveCursor(taken={1})
+
+        self.assertEqual(index.reserve(cursor, 500, TODAY), Slot(2, 11, TODAY, 'morning'))
+        self.assertEqual(cursor.claimed, [(500, 2)])
+        # Neither comes back
+        self.assertEqual(index.earliest(TODAY), Slot(3, 10, TODAY, 'afternoon'))
+        self.assertEqual(index.free_count(), 1)
+
+    def test_reserve_gives_up_after_the_configured_attempts(self):
+        index = build([(slot_id, slot_id, TODAY, 'morning', 1) for slot_id in range(1, 6)])
+
+        self.assertIsNone(index.reserve(ReserveCursor(taken={1, 2, 3}), 500, TODAY))
+
+    def test_mark_taken_hides_the_slot_from_lookups(self):
+        index = build([(1, 10, TODAY, 'morning', 1), (2, 10, TODAY, 'evening', 1)])
+        index.mark_taken(10, TODAY, 'morning')
+
+        self.assertEqual(index.earliest(TODAY), Slot(2, 10, TODAY, 'evening'))
+        self.assertEqual(index.rows_between(TODAY, TODAY), {(10, TODAY): {'morning': None, 'evening': 2}})
+
+    def test_ensure_loaded_only_reloads_once_for_concurrent_callers(self):
+        index = SlotIndex()
+        loads = []
+        with mock.patch.object(index, '_load', lambda cursor: loads.append(cursor)):
+            index.first_date = TODAY
+            index.ensure_loaded('first')
+            with index._load_lock:
+                # Another thread is reloading: the current rows are used
+                index.ensure_loaded('second')
+
+        self.assertEqual(loads, ['first'])
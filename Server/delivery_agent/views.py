@@ -4,6 +4,11 @@ from django.db import connection
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
+from greencart.events import order_changed
+from greencart.refdata import refdata
+from .identity import resolve_agent_id
+from .kpis import get_agent_kpis, invalidate_agent_kpis, invalidate_kpis_for_order
+from .slots import bump_version as bump_slots_version
 
 def dictfetchall(cursor):
     """Return all rows from a cursor as a list of dictionaries with lowercase column names"""
@@ -17,81 +22,15 @@ def delivery_agent_dashboard(request, agent_id):
     try:
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            actual_agent_id = agent_record[0]
-            # Ensure we're passing the actual integer value, not a VariableWrapper
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
-            # 1. Get agent statistics using direct SQL queries
-            # Total assignments
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM order_assignments
-                WHERE agent_id = %s
-            """, [actual_agent_id])
-            total_assignments = cursor.fetchone()[0] or 0
-
-            # Pending assignments
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM order_assignments oa
-                JOIN orders o ON oa.order_id = o.order_id
-                JOIN order_statuses os ON o.status_id = os.status_id
-                WHERE oa.agent_id = %s
-                AND os.status_name IN ('Processing', 'Shipped', 'Out for Delivery')
-                AND oa.completed_at IS NULL
-            """, [actual_agent_id])
-            pending_assignments = cursor.fetchone()[0] or 0
-
-            # Completed assignments
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM order_assignments oa
-                JOIN orders o ON oa.order_id = o.order_id
-                JOIN order_statuses os ON o.status_id = os.status_id
-                WHERE oa.agent_id = %s
-                AND os.status_name = 'Delivered'
-            """, [actual_agent_id])
-            completed_assignments = cursor.fetchone()[0] or 0
-
-            # Total earnings (5% of order total)
-            cursor.execute("""
-                SELECT NVL(SUM(o.total_amount * 0.05), 0) 
-                FROM orders o
-                JOIN order_assignments oa ON o.order_id = oa.order_id
-                JOIN order_statuses os ON o.status_id = os.status_id
-                WHERE oa.agent_id = %s
-                AND os.status_name = 'Delivered'
-            """, [actual_agent_id])
-            total_earnings = cursor.fetchone()[0] or 0
-
-            # Average delivery time in hours
-            cursor.execute("""
-                SELECT NVL(AVG(EXTRACT(DAY FROM (NVL(oa.completed_at, o.actual_delivery_date) - oa.assigned_at)) * 24 +
-                               EXTRACT(HOUR FROM (NVL(oa.completed_at, o.actual_delivery_date) - oa.assigned_at)) +
-                               EXTRACT(MINUTE FROM (NVL(oa.completed_at, o.actual_delivery_date) - oa.assigned_at)) / 60), 0) 
-                FROM order_assignments oa
-                JOIN orders o ON oa.order_id = o.order_id
-                JOIN order_statuses os ON o.status_id = os.status_id
-                WHERE oa.agent_id = %s
-                AND os.status_name = 'Delivered'
-                AND (oa.completed_at IS NOT NULL OR o.actual_delivery_date IS NOT NULL)
-            """, [actual_agent_id])
-            avg_delivery_time = cursor.fetchone()[0] or 0
+            # 1. Agent statistics, one aggregation pass cached per agent
+            stats = get_agent_kpis(cursor, actual_agent_id)
 
             # 2. Get pending orders using direct SQL
             cursor.execute("""
@@ -166,6 +105,7 @@ def delivery_agent_dashboard(request, agent_id):
                 WHERE oa.agent_id = %s
                 AND os.status_name = 'Delivered'
                 ORDER BY o.actual_delivery_date DESC
+                FETCH FIRST 10 ROWS ONLY
             """, [actual_agent_id])
             
             completed_orders = dictfetchall(cursor)
@@ -173,15 +113,9 @@ def delivery_agent_dashboard(request, agent_id):
             return JsonResponse({
                 'success': True,
                 'data': {
-                    'stats': {
-                        'total_assignments': total_assignments,
-                        'pending_assignments': pending_assignments,
-                        'completed_assignments': completed_assignments,
-                        'total_earnings': float(total_earnings),
-                        'avg_delivery_time': float(avg_delivery_time)
-                    },
+                    'stats': stats,
                     'pending_orders': pending_orders or [],
-                    'completed_orders': completed_orders[:10] if completed_orders else []
+                    'completed_orders': completed_orders or []
                 }
             })
             
@@ -204,24 +138,13 @@ def delivery_agent_orders(request, agent_id):
         
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            actual_agent_id = agent_record[0]
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
             if status:
                 cursor.execute("""
                     SELECT 
@@ -352,24 +275,13 @@ def delivery_agent_pending_orders(request, agent_id):
     try:
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            actual_agent_id = agent_record[0]
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
             result_cursor = cursor.connection.cursor()
             cursor.callproc('get_delivery_agent_pending_orders', [actual_agent_id, result_cursor])
             orders = dictfetchall(result_cursor)
@@ -393,24 +305,13 @@ def delivery_agent_completed_orders(request, agent_id):
     try:
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            actual_agent_id = agent_record[0]
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
             result_cursor = cursor.connection.cursor()
             cursor.callproc('get_delivery_agent_completed_orders', [actual_agent_id, result_cursor])
             orders = dictfetchall(result_cursor)
@@ -452,24 +353,13 @@ def update_delivery_status(request):
             
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            actual_agent_id = agent_record[0]
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
             # Check if assignment exists and belongs to this agent
             cursor.execute("""
                 SELECT COUNT(*)
@@ -485,21 +375,13 @@ def update_delivery_status(request):
                 }, status=400)
             
             # Get status ID
-            cursor.execute("""
-                SELECT status_id 
-                FROM order_statuses 
-                WHERE status_name = %s
-            """, [status])
-            
-            status_result = cursor.fetchone()
-            if not status_result:
+            status_id = refdata.status_id(status)
+            if status_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Invalid status'
                 }, status=400)
             
-            status_id = status_result[0]
-            
             # Update order status
             cursor.execute("""
                 UPDATE orders
@@ -516,6 +398,11 @@ def update_delivery_status(request):
                 """, [notes, order_id])
             
             connection.commit()
+            invalidate_agent_kpis(actual_agent_id)
+            if status in ('Cancelled', 'Returned'):
+                # trg_orders_free_slot gave the order's slot back
+                bump_slots_version()
+            order_changed(cursor, order_id)
             
             return JsonResponse({
                 'success': True,
@@ -559,24 +446,13 @@ def mark_delivery_completed(request):
             
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            actual_agent_id = agent_record[0]
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
             # Check if agent has already confirmed
             cursor.execute("""
                 SELECT COUNT(*) 
@@ -602,9 +478,9 @@ def mark_delivery_completed(request):
             # Update order status to "Out for Delivery" if not already delivered
             cursor.execute("""
                 UPDATE orders
-                SET status_id = (SELECT status_id FROM order_statuses WHERE status_name = 'Out for Delivery')
-                WHERE order_id = %s AND status_id != (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered')
-            """, [order_id])
+                SET status_id = %s
+                WHERE order_id = %s AND status_id != %s
+            """, [refdata.status_id('Out for Delivery'), order_id, refdata.status_id('Delivered')])
             
             # Check if delivery confirmation record exists
             cursor.execute("""
@@ -664,11 +540,13 @@ def mark_delivery_completed(request):
                     # If customer already confirmed, mark as delivered
                     cursor.execute("""
                         UPDATE orders
-                        SET status_id = (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered'),
+                        SET status_id = %s,
                             actual_delivery_date = SYSTIMESTAMP
                         WHERE order_id = %s
-                    """, [order_id])
+                    """, [refdata.status_id('Delivered'), order_id])
                 else:
+                    invalidate_agent_kpis(actual_agent_id)
+                    order_changed(cursor, order_id, 'delivery.confirmation')
                     return JsonResponse({
                         'success': True,
                         'message': 'Order marked as delivered. Waiting for customer confirmation.'
@@ -687,22 +565,28 @@ def mark_delivery_completed(request):
                     # If customer already confirmed, mark as delivered
                     cursor.execute("""
                         UPDATE orders
-                        SET status_id = (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered'),
+                        SET status_id = %s,
                             actual_delivery_date = SYSTIMESTAMP
                         WHERE order_id = %s
-                    """, [order_id])
+                    """, [refdata.status_id('Delivered'), order_id])
                     
+                    invalidate_agent_kpis(actual_agent_id)
+                    order_changed(cursor, order_id, 'delivery.confirmation')
                     return JsonResponse({
                         'success': True,
                         'message': 'Order delivered successfully'
                     })
                 else:
+                    invalidate_agent_kpis(actual_agent_id)
+                    order_changed(cursor, order_id, 'delivery.confirmation')
                     return JsonResponse({
                         'success': True,
                         'message': 'Order marked as delivered. Waiting for customer confirmation.'
                     })
             
             connection.commit()
+            invalidate_agent_kpis(actual_agent_id)
+            order_changed(cursor, order_id, 'delivery.confirmation')
             
     except json.JSONDecodeError:
         return JsonResponse({
@@ -728,24 +612,13 @@ def get_assignment_count(request, agent_id):
         
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            actual_agent_id = agent_record[0]
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
             if status:
                 cursor.execute("""
                     SELECT get_delivery_agent_assignment_count(%s, %s) FROM dual
@@ -778,24 +651,13 @@ def get_agent_earnings(request, agent_id):
         
         with connection.cursor() as cursor:
             # Convert user_id to agent_id if needed
-            cursor.execute("""
-                SELECT da.agent_id 
-                FROM delivery_agents da 
-                WHERE da.user_id = %s OR da.agent_id = %s
-            """, [agent_id, agent_id])
-            
-            agent_record = cursor.fetchone()
-            if not agent_record:
+            actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+            if actual_agent_id is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'Delivery agent not found'
                 }, status=404)
             
-            actual_agent_id = agent_record[0]
-            # Extract the actual value from the database result to avoid VariableWrapper error
-            if hasattr(actual_agent_id, 'value'):
-                actual_agent_id = actual_agent_id.value
-            
             result_cursor = cursor.connection.cursor()
             
             # Handle year parameter properly
@@ -841,24 +703,13 @@ def confirm_agent_delivery(request):
             
             with connection.cursor() as cursor:
                 # Convert user_id to agent_id if needed
-                cursor.execute("""
-                    SELECT da.agent_id 
-                    FROM delivery_agents da 
-                    WHERE da.user_id = %s OR da.agent_id = %s
-                """, [agent_id, agent_id])
-                
-                agent_record = cursor.fetchone()
-                if not agent_record:
+                actual_agent_id = resolve_agent_id(request, cursor, agent_id)
+                if actual_agent_id is None:
                     return JsonResponse({
                         'success': False, 
                         'error': 'Delivery agent not found.'
                     })
                 
-                actual_agent_id = agent_record[0]
-                # Extract the actual value from the database result to avoid VariableWrapper error
-                if hasattr(actual_agent_id, 'value'):
-                    actual_agent_id = actual_agent_id.value
-                
                 # Get customer ID (user_id) from the order
                 cursor.execute("""
                     SELECT user_id FROM orders WHERE order_id = %s
@@ -915,6 +766,8 @@ def confirm_agent_delivery(request):
                 # If both confirmed, the trigger will automatically update the order status to Delivered
                 # We just need to commit and return the appropriate message
                 connection.commit()
+                invalidate_agent_kpis(actual_agent_id)
+                order_changed(cursor, order_id, 'delivery.confirmation')
                 
                 if agent_confirmed == 1 and customer_confirmed == 1:
                     return JsonResponse({
@@ -1012,18 +865,22 @@ def confirm_customer_delivery(request):
                 if agent_confirmed == 1 and customer_confirmed == 1:
                     cursor.execute("""
                         UPDATE orders
-                        SET status_id = (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered'),
+                        SET status_id = %s,
                             actual_delivery_date = SYSTIMESTAMP
                         WHERE order_id = %s
-                    """, [order_id])
+                    """, [refdata.status_id('Delivered'), order_id])
                     
                     connection.commit()
+                    invalidate_kpis_for_order(cursor, order_id)
+                    order_changed(cursor, order_id, 'delivery.confirmation')
                     return JsonResponse({
                         'success': True,
                         'message': 'Delivery completed! Order status updated to Delivered.'
                     })
                 else:
                     connection.commit()
+                    invalidate_kpis_for_order(cursor, order_id)
+                    order_changed(cursor, order_id, 'delivery.confirmation')
                     if agent_confirmed == 1:
                         return JsonResponse({
                             'success': True,
@@ -0,0 +1,221 @@
+"""Buffered activity logging.
+
+Views call log_activity() (and touch_last_login() on a successful login)
+instead of writing to activity_log themselves. Events go into a bounded
+in-process queue and a background thread writes them with one executemany
+per batch, every ACTIVITY_LOG_FLUSH_MS or as soon as ACTIVITY_LOG_BATCH_SIZE
+events are waiting, whichever comes first.
+
+When the queue is full, ACTIVITY_LOG_OVERFLOW decides what happens:
+'drop' discards the event straight away, 'block' waits up to
+ACTIVITY_LOG_BLOCK_SECONDS for room and drops it after that. Dropped
+events are counted in /metrics. Whatever is still queued is written when
+the process exits.
+
+activity_timestamp and last_login come from SYSTIMESTAMP when the batch is
+written, so they trail the request by at most the flush interval; log_id
+still follows the order events were logged in.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from greencart import metrics
+
+logger = logging.getLogger(__name__)
+
+# activity_log.activity_details is VARCHAR2(500)
+MAX_DETAILS_LENGTH = 500
+
+INSERT_SQL = """
+    INSERT INTO activity_log (user_id, activity_type, activity_details, ip_address)
+    VALUES (:1, :2, :3, :4)
+"""
+
+LAST_LOGIN_SQL = """
+    UPDATE users
+    SET last_login = SYSTIMESTAMP
+    WHERE user_id = :1
+"""
+
+ACTIVITY = 'activity'
+LAST_LOGIN = 'last_login'
+
+# Sent through the queue to wake the writer up for a flush
+_FLUSH = object()
+
+
+class ActivityLogWriter:
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._flushed = threading.Condition()
+        self._flush_requests = threading.Lock()
+        self._requested = 0
+        self._written = 0
+        self._last_drop_warning = 0.0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'ACTIVITY_LOG_ASYNC', True)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._queue is None:
+                    self._queue = queue.Queue(maxsize=settings.ACTIVITY_LOG_QUEUE_SIZE)
+                self._thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, kind, params):
+        if not self.enabled or self._stopping:
+            self._write([(kind, params)])
+            return True
+
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+
+        try:
+            if settings.ACTIVITY_LOG_OVERFLOW == 'block':
+                self._queue.put((kind, params), timeout=settings.ACTIVITY_LOG_BLOCK_SECONDS)
+            else:
+                self._queue.put_nowait((kind, params))
+        except queue.Full:
+            self._dropped(kind)
+            return False
+        return True
+
+    def _dropped(self, kind):
+        metrics.activity_log_dropped.inc(1, kind)
+        now = time.monotonic()
+        if now - self._last_drop_warning >= 10:
+            self._last_drop_warning = now
+            logger.warning("Activity log queue is full (%s events), dropping %s events",
+                           settings.ACTIVITY_LOG_QUEUE_SIZE, kind)
+
+    def _run(self):
+        batch_size = settings.ACTIVITY_LOG_BATCH_SIZE
+        interval = settings.ACTIVITY_LOG_FLUSH_MS / 1000
+        try:
+            while True:
+                batch = []
+                flush_now = False
+                deadline = time.monotonic() + interval
+                while len(batch) < batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _FLUSH:
+                        flush_now = True
+                        break
+                    batch.append(item)
+
+                if batch:
+                    self._write(batch)
+                if flush_now:
+                    # Anything queued before the flush request goes out too,
+                    # and flush requests queued behind it are answered with it
+                    batch, flushes = self._drain()
+                    self._write(batch)
+                    with self._flushed:
+                        self._written += 1 + flushes
+                        self._flushed.notify_all()
+                if batch or flush_now:
+                    # Back to the pool until the next batch rather than held while idle
+                    connection.close()
+                if self._stopping and self._queue.empty():
+                    return
+        finally:
+            connection.close()
+
+    def _drain(self):
+        """(events, flush requests) waiting in the queue"""
+        batch, flushes = [], 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch, flushes
+            if item is _FLUSH:
+                flushes += 1
+            else:
+                batch.append(item)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        activities = [params for kind, params in batch if kind == ACTIVITY]
+        logins = [params for kind, params in batch if kind == LAST_LOGIN]
+        try:
+            with connection.cursor() as django_cursor, django_cursor.connection.cursor() as cursor:
+                if activities:
+                    # One bad row (say a user deleted meanwhile) must not lose the rest of the batch
+                    cursor.executemany(INSERT_SQL, activities, batcherrors=True)
+                    for error in cursor.getbatcherrors():
+                        logger.warning("Activity log row %s not written: %s", activities[error.offset], error.message)
+                if logins:
+                    cursor.executemany(LAST_LOGIN_SQL, logins)
+        except Exception:
+            logger.exception("Could not write %s activity log events", len(batch))
+            connection.close()
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far; returns False on timeout"""
+        if self._thread is None or not self._thread.is_alive():
+            if self._queue is not None:
+                self._write(self._drain()[0])
+            return True
+        deadline = time.monotonic() + timeout
+        # Flush requests are numbered in queue order; the writer counts them
+        # off as it reaches them. It never takes this lock, so waiting for
+        # room in a full queue doesn't hold it up
+        with self._flush_requests:
+            try:
+                self._queue.put(_FLUSH, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                return False
+            self._requested += 1
+            target = self._requested
+        with self._flushed:
+            return self._flushed.wait_for(lambda: self._written >= target,
+                                          max(deadline - time.monotonic(), 0))
+
+    def shutdown(self, timeout=5.0):
+        self._stopping = True
+        if self._thread is not None and self._thread.is_alive():
+            self.flush(timeout)
+            self._thread.join(timeout)
+        elif self._queue is not None:
+            self._write(self._drain()[0])
+
+
+writer = ActivityLogWriter()
+atexit.register(writer.shutdown)
+
+
+def log_activity(activity_type, details=None, user_id=None, ip_address=None):
+    """Queue one activity_log row. Returns False if the event was dropped"""
+    if details is not None:
+        details = str(details)[:MAX_DETAILS_LENGTH]
+    return writer.submit(ACTIVITY, [user_id, activity_type, details, ip_address])
+
+
+def touch_last_login(user_id):
+    """Queue the users.last_login update for a successful login"""
+    return writer.submit(LAST_LOGIN, [user_id])
+
+
+def flush(timeout=5.0):
+    return writer.flush(timeout)
@@ -2,6 +2,8 @@
 ASGI config for greencart project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django, WebSockets to the live update consumers in
+greencart/routing.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
 
-application = get_asgi_application()
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+from django.conf import settings
+from greencart.db.pool import warm_up_pool
+from greencart.refdata import warm_up as warm_up_refdata
+from plant_collection.catalog import warm_up as warm_up_catalog
+from plant_collection.search import build_in_background as build_search_index
+from greencart.routing import websocket_urlpatterns
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(URLRouter(websocket_urlpatterns)),
+})
+
+if settings.ORACLE_POOL_WARM_UP:
+    warm_up_pool()
+    warm_up_refdata()
+    if settings.CATALOG_INDEX_ENABLED:
+        warm_up_catalog()
+    if settings.SEARCH_INDEX_ENABLED:
+        build_search_index()
@@ -0,0 +1,226 @@
+"""Tag-invalidated response cache for catalog reads.
+
+Responses are kept in a small in-process LRU in front of a shared Django
+cache (settings.RESPONSE_CACHE_ALIAS: locmem by default, Redis when
+REDIS_URL is set). Every entry remembers the versions of its tags at the
+time it was built; invalidating a tag bumps its version in the shared cache
+so stale entries are ignored by every worker.
+
+Tags:
+    plant:<id>        a single plant (detail page, its batch summary); also
+                      bumped for every plant in the catalog change log
+    category:<slug>   plants listed under one category
+    plant:*, category:*, discount:*
+                      collection-wide pages (top lists, category list) and
+                      discounts applied to every plant
+    seller:*          the top sellers list, bumped whenever items are sold
+                      (checkout, manual sales)
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+ALL_PLANTS = 'plant:*'
+ALL_CATEGORIES = 'category:*'
+ALL_SELLERS = 'seller:*'
+ALL_DISCOUNTS = 'discount:*'
+
+
+def plant_tag(plant_id):
+    return f'plant:{plant_id}'
+
+
+def category_tag(slug):
+    return f'category:{slug}'
+
+
+class LocalLRU:
+    """Thread-safe LRU of (expires_at, entry) pairs"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ResponseCache:
+
+    def __init__(self, alias, timeout, local_size):
+        self.alias = alias
+        self.timeout = timeout
+        self.local = LocalLRU(local_size)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _tag_key(self, tag):
+        return f'tagv:{tag}'
+
+    def tag_versions(self, tags):
+        """Current version of each tag, creating missing ones"""
+        keys = {self._tag_key(tag): tag for tag in tags}
+        found = self.shared.get_many(list(keys))
+        versions = {}
+        for key, tag in keys.items():
+            if key in found:
+                versions[tag] = found[key]
+            else:
+                # A fresh version, so entries built before the tag was evicted never match
+                self.shared.add(key, time.time_ns(), None)
+                versions[tag] = self.shared.get(key)
+        return versions
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is None:
+            entry = self.shared.get(key)
+            if entry is None:
+                return None
+        if self.tag_versions(entry['tags']) != entry['tags']:
+            self.local.delete(key)
+            return None
+        self.local.set(key, entry, self.timeout)
+        return entry
+
+    def get_many(self, keys):
+        """{key: entry} for the keys with a current entry, one shared lookup
+        for the entries the LRU doesn't have and one for all their tags"""
+        entries, missing = {}, []
+        for key in keys:
+            entry = self.local.get(key)
+            if entry is None:
+                missing.append(key)
+            else:
+                entries[key] = entry
+        if missing:
+            entries.update(self.shared.get_many(missing))
+
+        versions = self.tag_versions({tag for entry in entries.values() for tag in entry['tags']})
+        current = {}
+        for key, entry in entries.items():
+            if all(versions[tag] == version for tag, version in entry['tags'].items()):
+                current[key] = entry
+                self.local.set(key, entry, self.timeout)
+            else:
+                self.local.delete(key)
+        return current
+
+    def set(self, key, entry, timeout=None):
+        timeout = timeout or self.timeout
+        self.shared.set(key, entry, timeout)
+        self.local.set(key, entry, timeout)
+
+    def set_many(self, entries, timeout=None):
+        timeout = timeout or self.timeout
+        self.shared.set_many(entries, timeout)
+        for key, entry in entries.items():
+            self.local.set(key, entry, timeout)
+
+    def invalidate(self, *tags):
+        tags = set(tag for tag in tags if tag)
+        if not tags:
+            return
+        version = time.time_ns()
+        self.shared.set_many({self._tag_key(tag): version for tag in tags}, None)
+
+
+response_cache = ResponseCache(
+    getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default'),
+    getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300),
+    getattr(settings, 'RESPONSE_CACHE_LOCAL_SIZE', 1024),
+)
+
+
+def invalidate(*tags):
+    """Drop every cached response carrying any of `tags`"""
+    response_cache.invalidate(*tags)
+
+
+def cache_response(tags, timeout=None):
+    """Cache successful GET responses of a view under the tags returned by
+    `tags(*view_args, **view_kwargs)`"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not getattr(settings, 'RESPONSE_CACHE_ENABLED', True):
+                return view(request, *args, **kwargs)
+
+            path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'resp:{view.__module__}.{view.__name__}:{path_hash}'
+            entry = response_cache.get(key)
+            if entry is not None:
+                return HttpResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+
+            # Versions are read before the view runs so a write that lands
+            # while we build the response leaves this entry already stale
+            versions = response_cache.tag_versions(tags(*args, **kwargs))
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                response_cache.set(key, {
+                    'tags': versions,
+                    'status': response.status_code,
+                    'content_type': response['Content-Type'],
+                    'content': response.content,
+                }, timeout)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def tags_for_plants(cursor, plant_ids):
+    """plant:<id> and category:<slug> tags for the given plants"""
+    plant_ids = [int(plant_id) for plant_id in plant_ids if plant_id is not None]
+    if not plant_ids:
+        return []
+    tags = [plant_tag(plant_id) for plant_id in plant_ids]
+    slugs = set()
+    # Oracle allows at most 1000 expressions in an IN list
+    for start in range(0, len(plant_ids), 1000):
+        chunk = plant_ids[start:start + 1000]
+        placeholders = ','.join(['%s'] * len(chunk))
+        cursor.execute(f"""
+            SELECT DISTINCT pc.slug
+            FROM plant_category_mapping pcm
+            JOIN plant_categories pc ON pcm.category_id = pc.category_id
+            WHERE pcm.plant_id IN ({placeholders})
+        """, chunk)
+        slugs.update(row[0] for row in cursor.fetchall())
+    tags.extend(category_tag(slug) for slug in slugs)
+    return tags
@@ -0,0 +1,40 @@
+"""WebSocket endpoint for live updates, see greencart/events.py.
+
+Browsers can't set an Authorization header on a WebSocket, so the login
+token comes in the query string: /ws/events/?token=<token>. Sockets
+without a valid token are refused. The client may send {"type": "ping"}
+to keep idle connections alive through proxies.
+"""
+from urllib.parse import parse_qs
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from greencart.events import groups_for
+from greencart.tokens import verify_token
+
+
+class EventConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        raw = (query.get('token') or [''])[0]
+        identity = verify_token(raw) if raw and not raw.startswith('auth_token_') else None
+        if identity is None or identity.user_id is None:
+            await self.close()
+            return
+
+        self.joined = groups_for(identity)
+        for group in self.joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'joined', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if isinstance(content, dict) and content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+
+    async def event_message(self, message):
+        await self.send_json(message['event'])
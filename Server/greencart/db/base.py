@@ -0,0 +1,70 @@
+"""Oracle backend with python-oracledb session pooling.
+
+Identical to django.db.backends.oracle except when OPTIONS['pool'] is set:
+sessions come from a shared pool, the NLS session setup runs once per
+session (see pool.session_callback) and the pool's statement cache size is
+kept instead of Django's hardcoded 20.
+
+Cursors report to greencart.db.sqlstats unless SQL_STATS_ENABLED is off.
+"""
+from django.db.backends.oracle.base import DatabaseWrapper as OracleDatabaseWrapper
+from django.conf import settings
+from django.db.backends.oracle.base import Database
+from django.utils.asyncio import async_unsafe
+
+from . import pool as pool_utils
+from .sqlstats import InstrumentedCursor
+
+
+class DatabaseWrapper(OracleDatabaseWrapper):
+
+    def _pool_key(self):
+        return (self.alias, self.settings_dict["USER"])
+
+    def _session_setup_in_pool(self):
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        return (
+            isinstance(pool_options, dict)
+            and pool_options.get("session_callback") is pool_utils.session_callback
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool:
+            return pool_utils.acquire(pool, self._pool_key())
+        return super().get_new_connection(conn_params)
+
+    @async_unsafe
+    def create_cursor(self, name=None):
+        if getattr(settings, "SQL_STATS_ENABLED", True):
+            return InstrumentedCursor(self.connection, self)
+        return super().create_cursor(name)
+
+    def init_connection_state(self):
+        if not self.pool or not self._session_setup_in_pool():
+            super().init_connection_state()
+            if self.pool:
+                self.connection.stmtcachesize = self.pool.stmtcachesize
+            return
+
+        # Skip OracleDatabaseWrapper's ALTER SESSION round trips, the pool's
+        # session_callback already did them when the session was created.
+        super(OracleDatabaseWrapper, self).init_connection_state()
+        if "operators" not in self.__dict__:
+            cursor = self.create_cursor()
+            try:
+                cursor.execute(
+                    "SELECT 1 FROM DUAL WHERE DUMMY %s"
+                    % self._standard_operators["contains"],
+                    ["X"],
+                )
+            except Database.DatabaseError:
+                self.operators = self._likec_operators
+                self.pattern_ops = self._likec_pattern_ops
+            else:
+                self.operators = self._standard_operators
+                self.pattern_ops = self._standard_pattern_ops
+            cursor.close()
+        self.connection.stmtcachesize = self.pool.stmtcachesize
+        if not self.get_autocommit():
+            self.commit()
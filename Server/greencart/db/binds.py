@@ -0,0 +1,32 @@
+"""Array binds for raw oracledb cursors.
+
+Use these with `cursor.connection.cursor()` (the plain oracledb cursor), since
+Django's cursor wrapper turns unknown bind objects into strings.
+"""
+from django.db.backends.oracle.base import FormatStylePlaceholderCursor
+
+NUMBER_LIST_TYPE = 'SYS.ODCINUMBERLIST'
+VARCHAR_LIST_TYPE = 'SYS.ODCIVARCHAR2LIST'
+
+
+def number_list(raw_cursor, values):
+    """A SYS.ODCINUMBERLIST to bind as `IN (SELECT column_value FROM TABLE(:ids))`.
+
+    The SQL text stays the same whatever the number of values, so it is parsed
+    once; python-oracledb caches the type description per session.
+    """
+    list_type = raw_cursor.connection.gettype(NUMBER_LIST_TYPE)
+    return list_type.newobject([int(value) for value in values])
+
+
+def django_numbers(raw_cursor):
+    """Have the plain cursor fetch numbers as Decimal / int the way Django's
+    cursor does, so its rows serialize the same. Returns the cursor"""
+    raw_cursor.outputtypehandler = FormatStylePlaceholderCursor._output_type_handler
+    return raw_cursor
+
+
+def varchar_list(raw_cursor, values):
+    """A SYS.ODCIVARCHAR2LIST, same idea as number_list() for strings"""
+    list_type = raw_cursor.connection.gettype(VARCHAR_LIST_TYPE)
+    return list_type.newobject([str(value) for value in values])
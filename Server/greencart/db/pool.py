@@ -0,0 +1,100 @@
+"""Helpers for the pooled Oracle backend (greencart.db)."""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Per-pool counters kept by DatabaseWrapper.get_new_connection(). oracledb
+# doesn't expose how many threads are blocked in acquire(), so we count them.
+_lock = threading.Lock()
+_counters = {}
+
+
+def _pool_counters(pool_key):
+    with _lock:
+        return _counters.setdefault(pool_key, {
+            'waiting': 0,
+            'acquires': 0,
+            'acquire_ms_total': 0.0,
+            'acquire_ms_max': 0.0,
+        })
+
+
+def acquire(pool, pool_key):
+    """Acquire a session from the pool, keeping waiting/latency counters."""
+    counters = _pool_counters(pool_key)
+    with _lock:
+        counters['waiting'] += 1
+    started = time.perf_counter()
+    try:
+        return pool.acquire()
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _lock:
+            counters['waiting'] -= 1
+            counters['acquires'] += 1
+            counters['acquire_ms_total'] += elapsed_ms
+            counters['acquire_ms_max'] = max(counters['acquire_ms_max'], elapsed_ms)
+
+
+def session_callback(connection, requested_tag):
+    """Runs once per new pooled session instead of on every checkout."""
+    from django.conf import settings
+
+    cursor = connection.cursor()
+    # Same session setup Django's oracle backend does for plain connections
+    cursor.execute("ALTER SESSION SET NLS_TERRITORY = 'AMERICA'")
+    cursor.execute(
+        "ALTER SESSION SET NLS_DATE_FORMAT = 'YYYY-MM-DD HH24:MI:SS'"
+        " NLS_TIMESTAMP_FORMAT = 'YYYY-MM-DD HH24:MI:SS.FF'"
+        + (" TIME_ZONE = 'UTC'" if settings.USE_TZ else "")
+    )
+    cursor.close()
+
+
+def pool_stats(alias='default'):
+    """Return open/busy/waiting counts for the pool behind `alias`, or None."""
+    from django.db import connections
+
+    conn = connections[alias]
+    pool = conn.pool
+    if pool is None:
+        return None
+
+    counters = _pool_counters((alias, conn.settings_dict['USER']))
+    with _lock:
+        acquires = counters['acquires']
+        stats = {
+            'open': pool.opened,
+            'busy': pool.busy,
+            'idle': pool.opened - pool.busy,
+            'waiting': counters['waiting'],
+            'min': pool.min,
+            'max': pool.max,
+            'increment': pool.increment,
+            'stmtcachesize': pool.stmtcachesize,
+            'acquires': acquires,
+            'avg_acquire_ms': round(counters['acquire_ms_total'] / acquires, 3) if acquires else 0.0,
+            'max_acquire_ms': round(counters['acquire_ms_max'], 3),
+        }
+    return stats
+
+
+def warm_up_pool(alias='default'):
+    """Create the pool and check one session out so the first request doesn't pay for it."""
+    from django.db import connections
+
+    conn = connections[alias]
+    try:
+        pool = conn.pool
+        if pool is None:
+            return False
+        session = pool.acquire()
+        pool.release(session)
+        logger.info("Oracle pool '%s' warmed up: %s open", alias, pool.opened)
+        return True
+    except Exception as e:
+        # Don't stop the worker from booting; requests will retry the pool
+        logger.warning("Oracle pool warm-up failed for '%s': %s", alias, e)
+        return False
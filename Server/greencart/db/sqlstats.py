@@ -0,0 +1,283 @@
+"""Per-request SQL statistics.
+
+Cursors made by the backend (and the plain oracledb cursors views get from
+cursor.connection.cursor()) time every execute, executemany, callproc,
+callfunc and fetch. The numbers go to the RequestStats of the current
+request, set up by greencart.middleware.SqlStatsMiddleware, and stored
+procedure timings go straight to the /metrics histograms.
+
+Round trips are counted the way python-oracledb makes them: one per
+statement or procedure call, plus one per `arraysize` rows fetched past the
+rows prefetched by the execute itself. Nothing extra is sent to the
+database to measure them.
+
+Statements slower than SQL_SLOW_STATEMENT_MS are logged to the
+'greencart.sql.slow' logger with their bind values.
+"""
+import logging
+import math
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.oracle.base import FormatStylePlaceholderCursor
+
+from greencart import metrics
+
+slow_logger = logging.getLogger('greencart.sql.slow')
+
+_request_stats = ContextVar('greencart_sql_stats', default=None)
+
+# Longest SQL text / bind value kept in the slow log
+MAX_SQL_LENGTH = 2000
+MAX_BIND_LENGTH = 200
+
+
+class RequestStats:
+    """Database work done while serving one request"""
+
+    def __init__(self):
+        self.statements = 0
+        self.round_trips = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.slowest_sql = None
+        self.slowest_time = 0.0
+
+    def add_statement(self, sql, seconds):
+        self.statements += 1
+        self.round_trips += 1
+        self.db_time += seconds
+        if self.slowest_sql is None or seconds > self.slowest_time:
+            self.slowest_sql = sql
+            self.slowest_time = seconds
+
+    def add_fetch(self, rows, round_trips, seconds):
+        self.rows += rows
+        self.round_trips += round_trips
+        self.db_time += seconds
+
+
+def start_request():
+    return _request_stats.set(RequestStats())
+
+
+def finish_request(token):
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    return stats
+
+
+def current_stats():
+    """RequestStats of the request being served, None outside a request"""
+    return _request_stats.get()
+
+
+def _shorten(text, limit):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def _format_value(key, value):
+    if key is not None and 'password' in str(key).lower():
+        return '***'
+    return _shorten(repr(value), MAX_BIND_LENGTH)
+
+
+def format_binds(params, many=False):
+    if not getattr(settings, 'SQL_SLOW_LOG_BINDS', True):
+        return '(hidden)'
+    if params is None:
+        return '()'
+    if many:
+        params = list(params)
+        if not params:
+            return '[]'
+        return f'{len(params)} rows, first: {format_binds(params[0])}'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {_format_value(key, value)}' for key, value in params.items()) + '}'
+    return '[' + ', '.join(_format_value(None, value) for value in params) + ']'
+
+
+def _record_statement(sql, params, seconds, many=False, procedure=None):
+    stats = _request_stats.get()
+    label = f'CALL {procedure}' if procedure else sql
+    if stats is not None:
+        stats.add_statement(label, seconds)
+    if procedure:
+        metrics.observe_procedure(procedure, seconds)
+
+    threshold = getattr(settings, 'SQL_SLOW_STATEMENT_MS', None)
+    if threshold is not None and seconds * 1000 >= threshold:
+        slow_logger.warning(
+            'Slow statement (%.1f ms): %s binds=%s',
+            seconds * 1000, _shorten(label, MAX_SQL_LENGTH), format_binds(params, many)
+        )
+
+
+def _unwrap(params):
+    # Ref cursors handed to callproc must be the real oracledb cursor
+    if isinstance(params, dict):
+        return {key: _unwrap_value(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_unwrap_value(value) for value in params]
+    return params
+
+
+def _unwrap_value(value):
+    return value.cursor if isinstance(value, RawCursor) else value
+
+
+class _Timed:
+    """Timing shared by both cursor classes; `_driver_cursor` is the
+    python-oracledb cursor underneath"""
+
+    def _reset_fetch_count(self):
+        object.__setattr__(self, '_fetched_rows', 0)
+        object.__setattr__(self, '_fetch_round_trips', 0)
+
+    def _statement(self, call, sql, params, *args, many=False, procedure=None, **kwargs):
+        self._reset_fetch_count()
+        start = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            _record_statement(sql, params, time.perf_counter() - start, many, procedure)
+
+    def _fetch(self, call, *args):
+        start = time.perf_counter()
+        result = call(*args)
+        seconds = time.perf_counter() - start
+
+        if result is None:
+            rows = 0
+        elif isinstance(result, list):
+            rows = len(result)
+        else:
+            rows = 1
+        self._count_rows(rows, seconds)
+        return result
+
+    def _count_rows(self, rows, seconds):
+        driver = self._driver_cursor
+        fetched = getattr(self, '_fetched_rows', 0) + rows
+        round_trips = math.ceil(max(0, fetched - driver.prefetchrows) / max(driver.arraysize, 1))
+        new_round_trips = round_trips - getattr(self, '_fetch_round_trips', 0)
+        object.__setattr__(self, '_fetched_rows', fetched)
+        object.__setattr__(self, '_fetch_round_trips', round_trips)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add_fetch(rows, new_round_trips, seconds)
+
+    def _iterate(self, rows):
+        for row in rows:
+            self._count_rows(1, 0.0)
+            yield row
+
+
+class InstrumentedCursor(_Timed, FormatStylePlaceholderCursor):
+    """FormatStylePlaceholderCursor that reports to the request's stats"""
+
+    @property
+    def _driver_cursor(self):
+        return self.cursor
+
+    @property
+    def connection(self):
+        return RawConnection(self.cursor.connection)
+
+    def execute(self, query, params=None):
+        return self._statement(super().execute, query, params, query, _unwrap(params))
+
+    def executemany(self, query, params=None):
+        return self._statement(super().executemany, query, params, query, params, many=True)
+
+    def callproc(self, name, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        return self._statement(self.cursor.callproc, name, args[0] if args else None, name, *args,
+                               procedure=name, **kwargs)
+
+    def callfunc(self, name, return_type, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        return self._statement(self.cursor.callfunc, name, args[0] if args else None, name, return_type, *args,
+                               procedure=name, **kwargs)
+
+    def fetchone(self):
+        return self._fetch(self.cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetch(lambda: self.cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._fetch(self.cursor.fetchall)
+
+    def __iter__(self):
+        return self._iterate(self.cursor)
+
+
+class RawConnection:
+    """The oracledb connection behind a cursor, handing out RawCursors"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return RawCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, attr):
+        return getattr(self._connection, attr)
+
+
+class RawCursor(_Timed):
+    """Plain oracledb cursor (ref cursors, collection binds, RETURNING INTO)
+    that still reports to the request's stats"""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, 'cursor', cursor)
+
+    @property
+    def _driver_cursor(self):
+        return self.cursor
+
+    def execute(self, statement, parameters=None, **kwargs):
+        parameters = _unwrap(parameters)
+        return self._statement(self.cursor.execute, statement, parameters or kwargs, statement, parameters, **kwargs)
+
+    def executemany(self, statement, parameters, **kwargs):
+        return self._statement(self.cursor.executemany, statement, parameters, statement, parameters, many=True,
+                               **kwargs)
+
+    def callproc(self, name, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        return self._statement(self.cursor.callproc, name, args[0] if args else None, name, *args,
+                               procedure=name, **kwargs)
+
+    def callfunc(self, name, return_type, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        return self._statement(self.cursor.callfunc, name, args[0] if args else None, name, return_type, *args,
+                               procedure=name, **kwargs)
+
+    def fetchone(self):
+        return self._fetch(self.cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetch(lambda: self.cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._fetch(self.cursor.fetchall)
+
+    def __iter__(self):
+        return self._iterate(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.cursor, attr, value)
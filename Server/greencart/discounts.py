@@ -0,0 +1,443 @@
+"""Discount resolution and the effective price of every plant and size.
+
+A discount applies to one plant, to the plants of one category, or to
+every plant (plant_discounts rows with no plant and no category), between
+its start_date and end_date. DiscountIndex keeps a timeline per target:
+the times at which the set of discounts running on it changes, and for
+each stretch between two of them the best percentage and the best fixed
+discount. "What applies to this plant at time t" is a binary search on
+the plant's timeline, each of its categories' and the global one; the
+best discount is the candidate that takes the most off the price.
+
+The result is materialized in plant_prices, one row per plant and size
+(size_id 0 for the plant without a size): the unit price it was worked out
+from, the effective price, the discount and the next time a discount
+window on it opens or closes. A row is only used while it still holds:
+
+  * its unit_price is still base_price + price_adjustment;
+  * its fingerprint matches the discounts on the plant, its categories and
+    every plant that haven't ended (a hash of the discount rows, so every
+    worker works out the same one);
+  * valid_until hasn't passed.
+
+prices() reads rows for a set of plants and works out the ones that no
+longer hold in memory, so catalog, cart and checkout always agree; it
+never writes. Rows are only written by refresh_prices(): apply_discount
+refreshes a plant-specific discount's plant straight away, and
+`manage.py refresh_prices --watch` refreshes rows whose window has passed
+and the plants of discounts that changed since its last run (and, by
+looking at the index, drops cached pages when a window opens or closes).
+
+Every worker keeps its own index. It reloads after
+DISCOUNT_INDEX_REFRESH_SECONDS, or when bump_version() is called after
+discounts change. Crossing a window boundary also drops the cached
+responses tagged discount:*, once for all workers.
+"""
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import oracledb
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from greencart.cache import ALL_DISCOUNTS, invalidate
+from greencart.db.binds import number_list
+from greencart.versions import VERSION_CHECK_SECONDS, SharedVersion
+
+BOUNDARY_KEY = 'discounts:boundary:{}'
+
+# Timeline key of discounts that apply to every plant
+EVERY_PLANT = ('all', None)
+
+Discount = namedtuple('Discount', 'discount_id name description value is_percentage start end')
+Price = namedtuple('Price', 'unit_price effective_price discount valid_until')
+
+DISCOUNTS_SQL = """
+    SELECT d.discount_id, d.name, d.description, d.discount_value, d.is_percentage,
+           d.start_date, d.end_date, pd.plant_id, pd.category_id
+    FROM discounts d
+    JOIN discount_types dt ON d.discount_type_id = dt.discount_type_id
+    JOIN plant_discounts pd ON pd.discount_id = d.discount_id
+    WHERE d.is_active = 1 AND d.end_date >= SYS_EXTRACT_UTC(SYSTIMESTAMP)
+"""
+
+# Every size of the plants (and size 0, the plant itself) with its stored price row
+PRICE_ROWS_SQL = """
+    SELECT p.plant_id, s.size_id, p.base_price + s.price_adjustment,
+           pp.unit_price, pp.effective_price, pp.discount_id, pp.valid_until, pp.fingerprint
+    FROM plants p
+    CROSS APPLY (
+        SELECT 0 AS size_id, 0 AS price_adjustment FROM dual
+        UNION ALL
+        SELECT ps.size_id, ps.price_adjustment FROM plant_sizes ps WHERE ps.plant_id = p.plant_id
+    ) s
+    LEFT JOIN plant_prices pp ON pp.plant_id = p.plant_id AND pp.size_id = s.size_id
+    WHERE p.plant_id IN (SELECT column_value FROM TABLE(:plant_ids))
+"""
+
+CATEGORIES_SQL = """
+    SELECT plant_id, category_id
+    FROM plant_category_mapping
+    WHERE plant_id IN (SELECT column_value FROM TABLE(:plant_ids))
+"""
+
+# Plants with a price row whose window has passed
+DUE_SQL = """
+    SELECT DISTINCT plant_id
+    FROM plant_prices
+    WHERE valid_until <= SYS_EXTRACT_UTC(SYSTIMESTAMP)
+"""
+
+CATEGORY_PLANTS_SQL = """
+    SELECT DISTINCT plant_id
+    FROM plant_category_mapping
+    WHERE category_id IN (SELECT column_value FROM TABLE(:category_ids))
+"""
+
+MERGE_SQL = """
+    MERGE INTO plant_prices pp
+    USING (SELECT :1 AS plant_id, :2 AS size_id, :3 AS unit_price, :4 AS effective_price,
+                  :5 AS discount_id, :6 AS valid_until, :7 AS fingerprint FROM dual) s
+    ON (pp.plant_id = s.plant_id AND pp.size_id = s.size_id)
+    WHEN MATCHED THEN UPDATE SET
+        pp.unit_price = s.unit_price,
+        pp.effective_price = s.effective_price,
+        pp.discount_id = s.discount_id,
+        pp.valid_until = s.valid_until,
+        pp.fingerprint = s.fingerprint,
+        pp.computed_at = SYSTIMESTAMP
+    WHEN NOT MATCHED THEN INSERT
+        (plant_id, size_id, unit_price, effective_price, discount_id, valid_until, fingerprint)
+        VALUES (s.plant_id, s.size_id, s.unit_price, s.effective_price, s.discount_id, s.valid_until, s.fingerprint)
+"""
+
+
+def _micros(value):
+    # Timestamps are stored in UTC without a zone
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1_000_000)
+
+
+def _datetime(micros):
+    return datetime.fromtimestamp(micros / 1_000_000, timezone.utc).replace(tzinfo=None)
+
+
+def _now():
+    return int(time.time() * 1_000_000)
+
+
+def amount_off(discount, price):
+    """What `discount` takes off `price`"""
+    if discount.is_percentage:
+        return round(price * discount.value / 100, 2)
+    return min(discount.value, price)
+
+
+class _Timeline:
+    """Best percentage and best fixed discount on one target, per stretch of time"""
+
+    def __init__(self, discounts):
+        self.discounts = sorted(discounts)
+        events = {}
+        for discount in discounts:
+            # end_date is inclusive
+            events.setdefault(discount.start, []).append((True, discount))
+            events.setdefault(discount.end + 1, []).append((False, discount))
+        self.times = sorted(events)
+        self.best = []
+        running = {}
+        for at in self.times:
+            for started, discount in events[at]:
+                if started:
+                    running[discount.discount_id] = discount
+                else:
+                    running.pop(discount.discount_id, None)
+            percentage = [d for d in running.values() if d.is_percentage]
+            fixed = [d for d in running.values() if not d.is_percentage]
+            self.best.append(tuple(
+                max(group, key=lambda d: (d.value, -d.discount_id)) for group in (percentage, fixed) if group
+            ))
+
+    def at(self, t):
+        i = bisect_right(self.times, t) - 1
+        return self.best[i] if i >= 0 else ()
+
+    def next_change(self, t):
+        i = bisect_right(self.times, t)
+        return self.times[i] if i < len(self.times) else None
+
+
+class DiscountIndex:
+    """Discounts by target, from DISCOUNTS_SQL rows"""
+
+    def __init__(self, rows=()):
+        self.discounts = {}
+        targets = {}
+        for discount_id, name, description, value, is_percentage, start, end, plant_id, category_id in rows:
+            discount = self.discounts.get(discount_id)
+            if discount is None:
+                discount = self.discounts[discount_id] = Discount(
+                    int(discount_id), name, description, float(value or 0), int(is_percentage or 0),
+                    _micros(start), _micros(end))
+            if plant_id is not None:
+                key = ('plant', int(plant_id))
+            elif category_id is not None:
+                key = ('category', int(category_id))
+            else:
+                key = EVERY_PLANT
+            targets.setdefault(key, {})[discount.discount_id] = discount
+        self._timelines = {key: _Timeline(discounts.values()) for key, discounts in targets.items()}
+        self.boundaries = sorted({at for timeline in self._timelines.values() for at in timeline.times})
+
+    def _keys(self, plant_id, category_ids):
+        return [('plant', plant_id), EVERY_PLANT] + [('category', category_id) for category_id in category_ids]
+
+    def fingerprint(self, plant_id, category_ids, t=None):
+        """Hash of the discounts on the plant that haven't ended at `t`. It
+        only depends on the discount rows, not on when they were loaded: a
+        row worked out with a discount that has since ended is past its
+        valid_until anyway"""
+        t = _now() if t is None else t
+        found = set()
+        for key in self._keys(plant_id, category_ids):
+            timeline = self._timelines.get(key)
+            if timeline is not None:
+                found.update(d for d in timeline.discounts if d.end >= t)
+        return zlib.crc32(repr(sorted(found)).encode())
+
+    def changed_targets(self, other):
+        """Targets whose discounts differ between this index and `other`"""
+        keys = set(self._timelines) | set(other._timelines)
+        return {
+            key for key in keys
+            if getattr(self._timelines.get(key), 'discounts', None) != getattr(other._timelines.get(key), 'discounts', None)
+        }
+
+    def candidates(self, plant_id, category_ids, t=None):
+        """Discounts that may be the best for the plant at `t` (microseconds, default now)"""
+        t = _now() if t is None else t
+        found = {}
+        for key in self._keys(plant_id, category_ids):
+            timeline = self._timelines.get(key)
+            if timeline is not None:
+                found.update((d.discount_id, d) for d in timeline.at(t))
+        return list(found.values())
+
+    def best(self, plant_id, category_ids, price, t=None):
+        """(discount, amount off) taking the most off `price` at `t`, (None, 0) when none runs"""
+        best, best_amount = None, 0
+        for discount in self.candidates(plant_id, category_ids, t):
+            amount = amount_off(discount, price)
+            if amount > best_amount or (amount == best_amount and best is not None
+                                        and discount.discount_id < best.discount_id):
+                best, best_amount = discount, amount
+        return best, best_amount
+
+    def next_change(self, plant_id, category_ids, t=None):
+        """When a discount window on the plant next opens or closes, None if never"""
+        t = _now() if t is None else t
+        times = []
+        for key in self._keys(plant_id, category_ids):
+            timeline = self._timelines.get(key)
+            if timeline is not None:
+                times.append(timeline.next_change(t))
+        times = [at for at in times if at is not None]
+        return min(times) if times else None
+
+    def price(self, plant_id, category_ids, unit_price, t=None):
+        """Price of one plant or size at `t`"""
+        t = _now() if t is None else t
+        discount, amount = self.best(plant_id, category_ids, unit_price, t)
+        return Price(unit_price, round(max(unit_price - amount, 0), 2), discount,
+                     self.next_change(plant_id, category_ids, t))
+
+
+class DiscountRegistry:
+    """This worker's DiscountIndex, reloaded like the reference-data registry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = None
+        self._version = SharedVersion('discounts:version')
+        self._boundary_checked_at = 0.0
+
+    def load(self):
+        with connection.cursor() as cursor:
+            with cursor.connection.cursor() as raw_cursor:
+                raw_cursor.execute(DISCOUNTS_SQL)
+                index = DiscountIndex(raw_cursor.fetchall())
+        self._index = index
+        self._loaded_at = time.monotonic()
+
+    def expire(self):
+        self._loaded_at = None
+
+    def _due(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > settings.DISCOUNT_INDEX_REFRESH_SECONDS
+
+    @property
+    def index(self):
+        if self._version.changed():
+            self.expire()
+        if self._due():
+            with self._lock:
+                # Another thread may have reloaded while this one waited
+                if self._due():
+                    self.load()
+        now = time.monotonic()
+        if now - self._boundary_checked_at >= VERSION_CHECK_SECONDS:
+            self._boundary_checked_at = now
+            self._crossed_boundary()
+        return self._index
+
+    def _crossed_boundary(self):
+        # Pages cached while a discount was running (or not yet) go stale when
+        # its window closes (or opens); the first worker to notice drops them
+        index, t = self._index, _now()
+        i = bisect_left(index.boundaries, t)
+        if i and cache.add(BOUNDARY_KEY.format(index.boundaries[i - 1]), 1, 24 * 60 * 60):
+            invalidate(ALL_DISCOUNTS)
+
+
+active_discounts = DiscountRegistry()
+
+
+def bump_version():
+    """Make every worker reload its discounts, call after changing one"""
+    active_discounts._version.bump()
+    active_discounts.expire()
+
+
+def _price_rows(raw_cursor, plant_ids):
+    """Prices of the plants, and the plant_prices rows that no longer hold
+    worked out again, ready for MERGE_SQL"""
+    plant_ids = list({int(plant_id) for plant_id in plant_ids if plant_id is not None})
+    if not plant_ids:
+        return {}, []
+    index = active_discounts.index
+    now = _now()
+    plant_bind = number_list(raw_cursor, plant_ids)
+    raw_cursor.execute(CATEGORIES_SQL, {'plant_ids': plant_bind})
+    categories = {}
+    for plant_id, category_id in raw_cursor.fetchall():
+        categories.setdefault(int(plant_id), []).append(int(category_id))
+
+    result, stale, fingerprints = {}, [], {}
+    raw_cursor.execute(PRICE_ROWS_SQL, {'plant_ids': plant_bind})
+    for plant_id, size_id, unit_price, stored_unit, effective, discount_id, valid_until, fingerprint \
+            in raw_cursor.fetchall():
+        key, unit_price = (int(plant_id), int(size_id)), float(unit_price or 0)
+        category_ids = categories.get(key[0], ())
+        if key[0] not in fingerprints:
+            fingerprints[key[0]] = index.fingerprint(key[0], category_ids, now)
+        holds = (
+            stored_unit is not None
+            and float(stored_unit) == unit_price
+            and fingerprint == fingerprints[key[0]]
+            and (valid_until is None or _micros(valid_until) > now)
+            and (discount_id is None or discount_id in index.discounts)
+        )
+        if holds:
+            result[key] = Price(unit_price, float(effective),
+                                index.discounts.get(discount_id) if discount_id is not None else None,
+                                _micros(valid_until) if valid_until is not None else None)
+            continue
+        price = result[key] = index.price(key[0], category_ids, unit_price, now)
+        stale.append((key[0], key[1], unit_price, price.effective_price,
+                      price.discount.discount_id if price.discount else None,
+                      _datetime(price.valid_until) if price.valid_until is not None else None,
+                      fingerprints[key[0]]))
+    return result, stale
+
+
+def prices(raw_cursor, plant_ids):
+    """{(plant_id, size_id): Price} for every size of the plants, size_id 0
+    being the plant itself. Rows of plant_prices that no longer hold are
+    worked out in memory, nothing is written"""
+    return _price_rows(raw_cursor, plant_ids)[0]
+
+
+def plant_prices(plant_id, category_ids, unit_prices):
+    """{size_id: Price} of one plant from `unit_prices` ({size_id: unit
+    price}) and its categories, worked out from the index alone when the
+    caller already has them. Same prices as prices() gives"""
+    index = active_discounts.index
+    now = _now()
+    return {size_id: index.price(int(plant_id), [int(c) for c in category_ids], float(unit_price), now)
+            for size_id, unit_price in unit_prices.items()}
+
+
+def refresh_prices(raw_cursor, plant_ids):
+    """Write the price rows of the plants that no longer hold,
+    PRICE_REFRESH_CHUNK plants per statement. Returns how many rows were written"""
+    plant_ids = list(plant_ids)
+    written = 0
+    for start in range(0, len(plant_ids), settings.PRICE_REFRESH_CHUNK):
+        rows = _price_rows(raw_cursor, plant_ids[start:start + settings.PRICE_REFRESH_CHUNK])[1]
+        if not rows:
+            continue
+        raw_cursor.setinputsizes(None, None, None, None, oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_TIMESTAMP, None)
+        try:
+            raw_cursor.executemany(MERGE_SQL, rows)
+        except oracledb.IntegrityError:
+            # Another refresh inserted one of the rows first, they match now
+            raw_cursor.executemany(MERGE_SQL, rows)
+        written += len(rows)
+    return written
+
+
+def changed_plants(raw_cursor, old_index, new_index):
+    """Plants whose discounts differ between the two indexes"""
+    plant_ids, category_ids = set(), set()
+    for kind, target_id in new_index.changed_targets(old_index):
+        if kind == 'plant':
+            plant_ids.add(target_id)
+        elif kind == 'category':
+            category_ids.add(target_id)
+        else:
+            raw_cursor.execute("SELECT plant_id FROM plants WHERE is_active = 1")
+            return {plant_id for plant_id, in raw_cursor.fetchall()}
+    if category_ids:
+        raw_cursor.execute(CATEGORY_PLANTS_SQL, {'category_ids': number_list(raw_cursor, category_ids)})
+        plant_ids.update(plant_id for plant_id, in raw_cursor.fetchall())
+    return plant_ids
+
+
+def refresh_due(raw_cursor, since=None, everything=False):
+    """Refresh the plants whose price window has passed, and those whose
+    discounts changed since the index `since` (every active plant with
+    `everything`). Returns how many plants were looked at and the index
+    used, to pass as `since` next time"""
+    index = active_discounts.index
+    if everything:
+        raw_cursor.execute("SELECT plant_id FROM plants WHERE is_active = 1")
+        plant_ids = {plant_id for plant_id, in raw_cursor.fetchall()}
+    else:
+        raw_cursor.execute(DUE_SQL)
+        plant_ids = {plant_id for plant_id, in raw_cursor.fetchall()}
+        if since is not None and since is not index:
+            plant_ids |= changed_plants(raw_cursor, since, index)
+    refresh_prices(raw_cursor, sorted(plant_ids))
+    return len(plant_ids), index
+
+
+def discount_detail(discount):
+    """The discount as the plant detail page shows it"""
+    if discount is None:
+        return None
+    return {
+        'discount_id': discount.discount_id,
+        'name': discount.name,
+        'description': discount.description,
+        'discount_value': discount.value,
+        'is_percentage': discount.is_percentage,
+        'start_date': _datetime(discount.start).isoformat(),
+        'end_date': _datetime(discount.end).isoformat(),
+    }
@@ -0,0 +1,204 @@
+"""Live updates pushed to dashboards and order pages over WebSockets.
+
+A page opens one socket to /ws/events/?token=<login token> (see
+greencart/consumers.py) and is put in the groups it may hear about:
+
+  user.<user_id>     everyone: their own orders; for sellers (seller_id is
+                     the user_id) also orders of their plants and their
+                     low-stock alerts
+  agent.<agent_id>   delivery agents: orders assigned to them
+  admins             admins: every order and low-stock alert
+
+Views call the helpers below after changing something. Messages go out
+once the transaction commits, all of a call's groups in one hop to the
+channel layer. A layer that is down or full is logged and counted in
+/metrics, never raised: a missed push only leaves a page as stale as it
+was when it polled.
+
+Every message is a JSON object with a "type" and its fields:
+
+  order.status, order.assigned, delivery.confirmation
+      order_id, order_number, status, agent_id, agent_confirmed,
+      customer_confirmed, slot_date (batch assignments send order_id,
+      status, agent_id, slot_date and slot_time, and admins get one
+      message with the count instead)
+  stock.low, stock.replenished
+      plant_id, name, stock, threshold
+  plant.image (to the seller), profile.image (to the user)
+      status ('ready' or 'failed'), url; plant.image also plant_id and
+      content_hash
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from greencart import metrics
+
+logger = logging.getLogger(__name__)
+
+ADMINS_GROUP = 'admins'
+
+# Same threshold trg_check_low_stock and trg_resolve_low_stock use
+LOW_STOCK_THRESHOLD = 10
+
+ORDER_SQL = """
+    SELECT o.user_id, o.order_number, os.status_name, oa.agent_id,
+           dc.agent_confirmed, dc.customer_confirmed, o.estimated_delivery_date
+    FROM orders o
+    JOIN order_statuses os ON o.status_id = os.status_id
+    LEFT JOIN order_assignments oa ON o.order_id = oa.order_id
+    LEFT JOIN delivery_confirmations dc ON o.order_id = dc.order_id
+    WHERE o.order_id = %s
+"""
+
+ORDER_SELLERS_SQL = """
+    SELECT DISTINCT p.seller_id
+    FROM order_items oi
+    JOIN plants p ON oi.plant_id = p.plant_id
+    WHERE oi.order_id = %s AND p.seller_id IS NOT NULL
+"""
+
+
+def user_group(user_id):
+    return f'user.{user_id}'
+
+
+def agent_group(agent_id):
+    return f'agent.{agent_id}'
+
+
+def groups_for(identity):
+    """Groups a socket opened with this login token listens to"""
+    groups = [user_group(identity.user_id)]
+    if identity.role == 'delivery_agent' and identity.agent_id is not None:
+        groups.append(agent_group(identity.agent_id))
+    if identity.role == 'admin':
+        groups.append(ADMINS_GROUP)
+    return groups
+
+
+async def _send_all(layer, sends):
+    # All the group sends at once rather than one round trip after another
+    results = await asyncio.gather(*(
+        layer.group_send(group, {'type': 'event.message', 'event': message}) for group, message in sends
+    ), return_exceptions=True)
+    for (group, message), result in zip(sends, results):
+        if isinstance(result, Exception):
+            logger.error("Live update %s to %s failed", message['type'], group, exc_info=result)
+            metrics.live_events_failed.inc(1, message['type'])
+        else:
+            metrics.live_events_sent.inc(1, message['type'])
+
+
+def _send(sends):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(_send_all)(layer, sends)
+    except Exception:
+        logger.exception("Live updates not sent")
+
+
+def publish_many(sends):
+    """Send [(group, message)] once the current transaction commits"""
+    if not settings.LIVE_EVENTS_ENABLED or not sends:
+        return
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _send(sends))
+    else:
+        _send(sends)
+
+
+def publish(groups, event_type, **fields):
+    message = {'type': event_type, **fields}
+    publish_many([(group, message) for group in dict.fromkeys(groups)])
+
+
+def order_changed(cursor, order_id, event_type='order.status'):
+    """Tell the customer, agent, sellers and admins about an order's state"""
+    if not settings.LIVE_EVENTS_ENABLED:
+        return
+    cursor.execute(ORDER_SQL, [order_id])
+    row = cursor.fetchone()
+    if row is None:
+        return
+    user_id, order_number, status, agent_id, agent_confirmed, customer_confirmed, delivery_date = row
+
+    cursor.execute(ORDER_SELLERS_SQL, [order_id])
+    groups = [user_group(user_id), ADMINS_GROUP] + [user_group(seller_id) for seller_id, in cursor.fetchall()]
+    if agent_id is not None:
+        groups.append(agent_group(agent_id))
+
+    publish(groups, event_type,
+            order_id=int(order_id),
+            order_number=order_number,
+            status=status,
+            agent_id=agent_id,
+            agent_confirmed=bool(agent_confirmed),
+            customer_confirmed=bool(customer_confirmed),
+            slot_date=delivery_date.date().isoformat() if delivery_date else None)
+
+
+def orders_assigned(assignments):
+    """Batch assignment: each customer and agent hears about their orders,
+    admins get one summary instead of an event per order"""
+    sends = []
+    for a in assignments:
+        message = {
+            'type': 'order.assigned',
+            'order_id': a.order_id,
+            'status': 'Shipped',
+            'agent_id': a.agent_id,
+            'slot_date': a.slot_date.isoformat(),
+            'slot_time': a.slot_time,
+        }
+        sends.append((user_group(a.user_id), message))
+        sends.append((agent_group(a.agent_id), message))
+    if assignments:
+        sends.append((ADMINS_GROUP, {'type': 'order.assigned', 'assigned': len(assignments)}))
+    publish_many(sends)
+
+
+def stock_changed(cursor, before):
+    """Push stock.low / stock.replenished for plants whose stock crossed
+    LOW_STOCK_THRESHOLD. `before` is {plant_id: stock before the change}"""
+    if not settings.LIVE_EVENTS_ENABLED or not before:
+        return
+    plant_ids = list(before)
+    cursor.execute(f"""
+        SELECT plant_id, name, seller_id, stock_quantity
+        FROM plants
+        WHERE plant_id IN ({', '.join(['%s'] * len(plant_ids))})
+    """, plant_ids)
+    stock_crossed([
+        (plant_id, name, seller_id, before.get(plant_id), stock)
+        for plant_id, name, seller_id, stock in cursor.fetchall()
+    ])
+
+
+def stock_crossed(changes):
+    """Same as stock_changed() when the new stock is already known:
+    `changes` is [(plant_id, name, seller_id, old stock, new stock)]"""
+    if not settings.LIVE_EVENTS_ENABLED:
+        return
+    sends = []
+    for plant_id, name, seller_id, old, stock in changes:
+        if old is None or stock is None:
+            continue
+        if stock < LOW_STOCK_THRESHOLD <= old:
+            event_type = 'stock.low'
+        elif old < LOW_STOCK_THRESHOLD <= stock:
+            event_type = 'stock.replenished'
+        else:
+            continue
+        message = {'type': event_type, 'plant_id': plant_id, 'name': name, 'stock': stock,
+                   'threshold': LOW_STOCK_THRESHOLD}
+        sends.append((ADMINS_GROUP, message))
+        if seller_id is not None:
+            sends.append((user_group(seller_id), message))
+    publish_many(sends)
@@ -0,0 +1,164 @@
+"""Image storage and the parallel upload pipeline.
+
+MEDIA_STORAGE_BACKEND picks where files go: CloudinaryStorage in
+production, or LocalStorage, which writes under MEDIA_ROOT and serves from
+MEDIA_URL (development and tests, no network).
+
+uploads.submit() reads an uploaded file, hashes it and hands it to a pool
+of MEDIA_UPLOAD_WORKERS threads, so six photos are six uploads at once
+instead of six in a row, and the view doesn't have to wait for any of them.
+The SHA-256 of the content names the stored file, so a picture is stored
+once:
+
+  * content stored before is answered from the cache, no network call;
+  * content already being uploaded joins that upload.
+
+submit() returns a PendingUpload at once. `pending.future.result(timeout)`
+waits for the StoredFile; uploads.when_stored(pending, fn) runs
+fn(StoredFile or None on failure) on an upload thread, which may use the
+database (its connection is closed afterwards).
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import cloudinary.uploader
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from greencart import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'media:{}'
+
+StoredFile = namedtuple('StoredFile', 'url public_id digest')
+PendingUpload = namedtuple('PendingUpload', 'digest filename future')
+
+
+class CloudinaryStorage:
+    name = 'cloudinary'
+
+    def save(self, content, folder, digest, filename):
+        # Named by content and never overwritten, so a re-upload returns the stored image
+        result = cloudinary.uploader.upload(
+            io.BytesIO(content),
+            folder=folder,
+            public_id=digest,
+            overwrite=False,
+            unique_filename=False,
+        )
+        return result['secure_url'], result['public_id']
+
+
+class LocalStorage:
+    name = 'local'
+
+    def save(self, content, folder, digest, filename):
+        public_id = f"{folder.strip('/')}/{digest}"
+        relative = public_id + Path(filename or '').suffix.lower()
+        path = Path(settings.MEDIA_ROOT) / relative
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.part')
+            partial.write_bytes(content)
+            os.replace(partial, path)
+        return settings.MEDIA_URL + relative, public_id
+
+
+class UploadPipeline:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._storage = None
+        self._inflight = {}   # digest -> Future of the upload running for it
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = import_string(settings.MEDIA_STORAGE_BACKEND)()
+        return self._storage
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=settings.MEDIA_UPLOAD_WORKERS,
+                                                    thread_name_prefix='media-upload')
+            return self._executor
+
+    def submit(self, upload, folder):
+        """Start storing an UploadedFile, returns a PendingUpload"""
+        # Read now, the request's temporary file is gone once it returns
+        content = upload.read()
+        digest = hashlib.sha256(content).hexdigest()
+
+        stored = cache.get(CACHE_KEY.format(digest))
+        if stored is not None:
+            metrics.media_uploads.inc(1, 'deduplicated')
+            future = Future()
+            future.set_result(StoredFile(*stored))
+            return PendingUpload(digest, upload.name, future)
+
+        pool = self._pool()
+        with self._lock:
+            future = self._inflight.get(digest)
+            if future is None:
+                future = pool.submit(self._store, content, folder, digest, upload.name)
+                self._inflight[digest] = future
+                future.add_done_callback(lambda done: self._inflight.pop(digest, None))
+            else:
+                metrics.media_uploads.inc(1, 'deduplicated')
+        return PendingUpload(digest, upload.name, future)
+
+    def _store(self, content, folder, digest, filename):
+        start = time.perf_counter()
+        try:
+            url, public_id = self.storage.save(content, folder, digest, filename)
+        except Exception:
+            metrics.media_uploads.inc(1, 'failed')
+            raise
+        metrics.media_upload_duration.observe(time.perf_counter() - start, self.storage.name)
+        metrics.media_uploads.inc(1, 'uploaded')
+
+        stored = StoredFile(url, public_id, digest)
+        cache.set(CACHE_KEY.format(digest), tuple(stored), settings.MEDIA_DEDUP_SECONDS)
+        return stored
+
+    def when_stored(self, pending, fn):
+        """Run fn(StoredFile or None) on an upload thread once `pending` settles"""
+        pool = self._pool()
+        # Resubmitted rather than run by the future itself, which would run it
+        # in the request thread when the upload is already done
+        pending.future.add_done_callback(lambda future: pool.submit(self._finish, fn, pending, future))
+
+    def _finish(self, fn, pending, future):
+        try:
+            try:
+                stored = future.result()
+            except Exception:
+                logger.exception("Upload of %s (%s) failed", pending.filename, pending.digest)
+                stored = None
+            fn(stored)
+        except Exception:
+            logger.exception("Handling upload of %s (%s) failed", pending.filename, pending.digest)
+        finally:
+            connection.close()
+
+    def wait(self, pending_uploads, timeout=None):
+        """StoredFile per PendingUpload, in order; raises if one failed"""
+        if timeout is None:
+            timeout = settings.MEDIA_UPLOAD_TIMEOUT_SECONDS
+        deadline = time.monotonic() + timeout
+        return [pending.future.result(max(0, deadline - time.monotonic())) for pending in pending_uploads]
+
+
+uploads = UploadPipeline()
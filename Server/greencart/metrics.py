@@ -0,0 +1,163 @@
+"""Request and stored procedure metrics in the Prometheus text format.
+
+SqlStatsMiddleware feeds one observation per request (labelled with the URL
+name), greencart.db.sqlstats one per callproc/callfunc (labelled with the
+procedure). Served at /metrics. Numbers are per worker process, so scrape
+every worker or run a single one behind the scraper.
+"""
+import bisect
+import threading
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, label_names, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(values, list(data)) for values, data in series]
+        for values, data in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                le = 'le="{}"'.format(_number(float(bound)))
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.label_names, values, INF_LABEL)} {data[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, values)} {_number(data[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, values)} {data[-1]}')
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        for values, total in series:
+            lines.append(f'{self.name}{_labels(self.label_names, values)} {_number(total)}')
+        return lines
+
+
+request_duration = Histogram(
+    'greencart_request_duration_seconds', 'Time spent serving requests.', ['view'])
+request_db_duration = Histogram(
+    'greencart_request_db_duration_seconds', 'Database time per request.', ['view'])
+request_statements = Histogram(
+    'greencart_request_sql_statements', 'SQL statements and procedure calls per request.', ['view'],
+    COUNT_BUCKETS)
+request_round_trips = Counter(
+    'greencart_sql_round_trips_total', 'Database round trips.', ['view'])
+request_rows = Counter(
+    'greencart_sql_rows_fetched_total', 'Rows fetched from the database.', ['view'])
+procedure_duration = Histogram(
+    'greencart_procedure_duration_seconds', 'Stored procedure and function call time.', ['procedure'])
+activity_log_dropped = Counter(
+    'greencart_activity_log_dropped_total', 'Activity log events dropped because the queue was full.', ['kind'])
+live_events_sent = Counter(
+    'greencart_live_events_sent_total', 'Live update messages sent to WebSocket groups.', ['event'])
+live_events_failed = Counter(
+    'greencart_live_events_failed_total', 'Live update messages the channel layer did not take.', ['event'])
+media_upload_duration = Histogram(
+    'greencart_media_upload_duration_seconds', 'Time to store one image.', ['backend'])
+media_uploads = Counter(
+    'greencart_media_uploads_total', 'Images uploaded, answered from an earlier upload, or failed.', ['result'])
+plant_summaries = Counter(
+    'greencart_plant_summaries_total', 'Plant summaries served from the cache or read from the database.', ['result'])
+
+REGISTRY = [
+    request_duration,
+    request_db_duration,
+    request_statements,
+    request_round_trips,
+    request_rows,
+    procedure_duration,
+    activity_log_dropped,
+    live_events_sent,
+    live_events_failed,
+    media_upload_duration,
+    media_uploads,
+    plant_summaries,
+]
+
+
+def observe_request(view, seconds, stats):
+    request_duration.observe(seconds, view)
+    if stats is not None:
+        request_db_duration.observe(stats.db_time, view)
+        request_statements.observe(stats.statements, view)
+        request_round_trips.inc(stats.round_trips, view)
+        request_rows.inc(stats.rows, view)
+
+
+def observe_procedure(name, seconds):
+    procedure_duration.observe(seconds, name.lower())
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,74 @@
+"""Project middleware.
+
+SqlStatsMiddleware collects what greencart.db.sqlstats records while the
+request is served, reports it in a Server-Timing header and feeds the
+/metrics histograms. IdentityMiddleware attaches the identity carried by
+the request's login token (greencart.tokens).
+"""
+import time
+
+from django.conf import settings
+
+from greencart import metrics
+from greencart.db import sqlstats
+from greencart.tokens import identity_from_request
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name
+
+
+def _quote(text):
+    text = ' '.join(str(text).split())[:200]
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def server_timing(stats, total_seconds):
+    parts = [
+        f'db;dur={stats.db_time * 1000:.2f};desc={_quote(f"{stats.statements} statements")}',
+        f'db-round-trips;desc="{stats.round_trips}"',
+        f'db-rows;desc="{stats.rows}"',
+    ]
+    if stats.slowest_sql is not None:
+        slowest = f'db-slowest;dur={stats.slowest_time * 1000:.2f}'
+        if settings.DEBUG:
+            # SQL text only leaves the server in development
+            slowest += f';desc={_quote(stats.slowest_sql)}'
+        parts.append(slowest)
+    parts.append(f'app;dur={total_seconds * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class SqlStatsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SQL_STATS_ENABLED', True):
+            return self.get_response(request)
+
+        token = sqlstats.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = sqlstats.finish_request(token)
+        total = time.perf_counter() - start
+
+        metrics.observe_request(_view_name(request), total, stats)
+        response['Server-Timing'] = server_timing(stats, total)
+        return response
+
+
+class IdentityMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.identity = identity_from_request(request)
+        return self.get_response(request)
@@ -0,0 +1,212 @@
+"""Process-wide registry of small reference tables.
+
+order_statuses, delivery_methods, roles, discount_types and plant_categories
+change rarely but are looked up on almost every order, delivery and seller
+request. They are loaded once per worker and reloaded when:
+
+  * bump_version() is called after writing to one of the tables (the
+    version lives in the shared cache, so every worker notices), or
+  * REFDATA_REFRESH_SECONDS have passed since the last load, or
+  * a lookup misses, at most once per REFDATA_MISS_RELOAD_SECONDS, so rows
+    added straight in the database still show up quickly.
+"""
+import re
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+
+from .versions import SharedVersion
+
+OrderStatus = namedtuple('OrderStatus', 'status_id status_name description')
+DeliveryMethod = namedtuple('DeliveryMethod', 'method_id name description base_cost estimated_days min_days is_active')
+Role = namedtuple('Role', 'role_id role_name description')
+DiscountType = namedtuple('DiscountType', 'discount_type_id name description')
+Category = namedtuple('Category', 'category_id name slug description image_url')
+
+
+def _min_days(estimated_days):
+    # "3-5 days" -> 3, None when there is no number ("Same day")
+    match = re.search(r'(\d+)', estimated_days or '')
+    if match:
+        return int(match.group(1))
+    return None
+
+
+class ReferenceData:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._version = SharedVersion('refdata:version')
+        self._last_miss_reload = 0.0
+        self.statuses = {}
+        self.delivery_methods = {}
+        self.roles = {}
+        self.discount_types = {}
+        self.categories = {}
+        self._status_by_name = {}
+        self._role_by_name = {}
+        self._discount_type_by_name = {}
+        self._category_by_slug = {}
+
+    # Loading
+
+    def load(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT status_id, status_name, description FROM order_statuses")
+            statuses = {row[0]: OrderStatus(*row) for row in cursor.fetchall()}
+
+            cursor.execute("""
+                SELECT method_id, name, description, base_cost, estimated_days, is_active
+                FROM delivery_methods
+            """)
+            delivery_methods = {}
+            for method_id, name, description, base_cost, estimated_days, is_active in cursor.fetchall():
+                delivery_methods[method_id] = DeliveryMethod(
+                    method_id, name, description, base_cost, estimated_days,
+                    _min_days(estimated_days), is_active
+                )
+
+            cursor.execute("SELECT role_id, role_name, description FROM roles")
+            roles = {row[0]: Role(*row) for row in cursor.fetchall()}
+
+            cursor.execute("SELECT discount_type_id, name, description FROM discount_types")
+            discount_types = {row[0]: DiscountType(*row) for row in cursor.fetchall()}
+
+            cursor.execute("SELECT category_id, name, slug, description, image_url FROM plant_categories")
+            categories = {row[0]: Category(*row) for row in cursor.fetchall()}
+
+        # Swap everything at once so readers never see a half-loaded registry
+        self.statuses = statuses
+        self.delivery_methods = delivery_methods
+        self.roles = roles
+        self.discount_types = discount_types
+        self.categories = categories
+        self._status_by_name = {s.status_name: s for s in statuses.values()}
+        self._role_by_name = {r.role_name: r for r in roles.values()}
+        self._discount_type_by_name = {d.name: d for d in discount_types.values()}
+        self._category_by_slug = {c.slug: c for c in categories.values()}
+        self._loaded_at = time.monotonic()
+
+    def _due(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > settings.REFDATA_REFRESH_SECONDS
+
+    def _ensure_fresh(self):
+        if self._version.changed():
+            self.expire()
+        if not self._due():
+            return
+        with self._lock:
+            # Another thread may have reloaded while this one waited
+            if self._due():
+                self.load()
+
+    def expire(self):
+        self._loaded_at = None
+
+    def _reload_on_miss(self):
+        now = time.monotonic()
+        if now - self._last_miss_reload < settings.REFDATA_MISS_RELOAD_SECONDS:
+            return False
+        with self._lock:
+            self._last_miss_reload = now
+            self.load()
+        return True
+
+    def _lookup(self, get):
+        self._ensure_fresh()
+        value = get()
+        if value is None and self._reload_on_miss():
+            value = get()
+        return value
+
+    # Order statuses
+
+    def status_id(self, status_name):
+        """status_id for a status name, None if there is no such status"""
+        status = self._lookup(lambda: self._status_by_name.get(status_name))
+        return status.status_id if status else None
+
+    def status_name(self, status_id):
+        status = self._lookup(lambda: self.statuses.get(status_id))
+        return status.status_name if status else None
+
+    # Delivery methods
+
+    def delivery_method(self, method_id):
+        """DeliveryMethod (active or not) or None"""
+        try:
+            method_id = int(method_id)
+        except (TypeError, ValueError):
+            return None
+        return self._lookup(lambda: self.delivery_methods.get(method_id))
+
+    def active_delivery_methods(self):
+        self._ensure_fresh()
+        return sorted(
+            (m for m in self.delivery_methods.values() if m.is_active == 1),
+            key=lambda m: m.method_id
+        )
+
+    # Roles
+
+    def role_id(self, role_name):
+        role = self._lookup(lambda: self._role_by_name.get(role_name))
+        return role.role_id if role else None
+
+    def role_name(self, role_id):
+        role = self._lookup(lambda: self.roles.get(role_id))
+        return role.role_name if role else None
+
+    # Discount types
+
+    def discount_type(self, discount_type_id):
+        try:
+            discount_type_id = int(discount_type_id)
+        except (TypeError, ValueError):
+            return None
+        return self._lookup(lambda: self.discount_types.get(discount_type_id))
+
+    def all_discount_types(self):
+        self._ensure_fresh()
+        return sorted(self.discount_types.values(), key=lambda d: d.discount_type_id)
+
+    # Plant categories
+
+    def category(self, category_id):
+        return self._lookup(lambda: self.categories.get(category_id))
+
+    def category_by_slug(self, slug):
+        return self._lookup(lambda: self._category_by_slug.get(slug))
+
+    def all_categories(self):
+        self._ensure_fresh()
+        return sorted(self.categories.values(), key=lambda c: c.name)
+
+    def missing_category_ids(self, category_ids):
+        """The ids in `category_ids` that aren't plant categories"""
+        self._ensure_fresh()
+        missing = [cid for cid in category_ids if cid not in self.categories]
+        if missing and self._reload_on_miss():
+            missing = [cid for cid in category_ids if cid not in self.categories]
+        return missing
+
+
+refdata = ReferenceData()
+
+
+def bump_version():
+    """Make every worker reload the registry, call after changing a reference table"""
+    refdata._version.bump()
+    refdata.expire()
+
+
+def warm_up():
+    try:
+        refdata._ensure_fresh()
+        return True
+    except Exception:
+        return False
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from pathlib import Path
 import os
 from dotenv import load_dotenv
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'corsheaders',
+    'channels',
     'home',
     'plant_collection',
     'plant_detail',
@@ -42,7 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'greencart.middleware.SqlStatsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'greencart.middleware.IdentityMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,19 +74,202 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'greencart.wsgi.application'
+ASGI_APPLICATION = 'greencart.asgi.application'
 
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.oracle',
+        'ENGINE': 'greencart.db',
         'NAME': os.getenv('ORACLE_NAME', 'xe'), 
         'USER': os.getenv('ORACLE_USER', 'system'),  
         'PASSWORD': os.getenv('ORACLE_PASSWORD', '1234'),  
         'HOST': os.getenv('ORACLE_HOST', 'localhost'),
         'PORT': os.getenv('ORACLE_PORT', '1521'),
+        # Pooled sessions are reused across requests, keep this at 0
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {},
     }
 }
 
+# Oracle session pool. Every new session fires trg_log_user_activity and the
+# NLS setup, so sessions are kept in a pool and handed out per request instead.
+# ORACLE_POOL=0 goes back to one session per request.
+if os.getenv('ORACLE_POOL', '1') == '1':
+    from greencart.db.pool import session_callback
+
+    ORACLE_POOL_OPTIONS = {
+        'min': int(os.getenv('ORACLE_POOL_MIN', '2')),
+        'max': int(os.getenv('ORACLE_POOL_MAX', '10')),
+        'increment': int(os.getenv('ORACLE_POOL_INCREMENT', '1')),
+        'stmtcachesize': int(os.getenv('ORACLE_STMT_CACHE_SIZE', '50')),
+        # Milliseconds a request waits for a free session before failing
+        'getmode': oracledb.POOL_GETMODE_TIMEDWAIT,
+        'wait_timeout': int(os.getenv('ORACLE_POOL_WAIT_TIMEOUT', '5000')),
+        # Idle sessions above `min` are closed after this many seconds
+        'timeout': int(os.getenv('ORACLE_POOL_TIMEOUT', '300')),
+        'session_callback': session_callback,
+    }
+
+    # Database Resident Connection Pooling, only when the server has it enabled
+    if os.getenv('ORACLE_DRCP_CCLASS'):
+        ORACLE_POOL_OPTIONS.update({
+            'server_type': 'pooled',
+            'cclass': os.getenv('ORACLE_DRCP_CCLASS'),
+            'purity': oracledb.PURITY_SELF,
+        })
+
+    DATABASES['default']['OPTIONS']['pool'] = ORACLE_POOL_OPTIONS
+
+# Open the pool when a worker starts instead of on the first request
+ORACLE_POOL_WARM_UP = os.getenv('ORACLE_POOL_WARM_UP', '1') == '1'
+
+# Shared cache behind the catalog response cache (greencart/cache.py).
+# Local memory works for a single worker; set REDIS_URL to share it.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'greencart',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Live updates (greencart/events.py). The in-memory layer only reaches sockets
+# on the same worker, so with REDIS_URL set the workers share Redis instead.
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+LIVE_EVENTS_ENABLED = os.getenv('LIVE_EVENTS_ENABLED', '1') == '1'
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1'
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+RESPONSE_CACHE_LOCAL_SIZE = int(os.getenv('RESPONSE_CACHE_LOCAL_SIZE', '1024'))
+
+# In-process search index for plant_collection search (plant_collection/search.py)
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', '1') == '1'
+# Matches considered when search results are sorted by price/name/rating
+SEARCH_MAX_MATCHES = int(os.getenv('SEARCH_MAX_MATCHES', '1000'))
+
+# Plant collection pages (category listing and search)
+PLANT_PAGE_SIZE = int(os.getenv('PLANT_PAGE_SIZE', '24'))
+PLANT_PAGE_SIZE_MAX = 100
+
+# Columnar catalog for filtered/faceted listings (plant_collection/catalog.py):
+# whether category pages use it too (browse/ always does), and the lower edges
+# of its price facet buckets (the last one is open-ended)
+CATALOG_INDEX_ENABLED = os.getenv('CATALOG_INDEX_ENABLED', '1') == '1'
+CATALOG_PRICE_BUCKETS = [float(edge) for edge in os.getenv('CATALOG_PRICE_BUCKETS', '0,10,25,50,100,250').split(',')]
+
+# Shared catalog snapshot (plant_collection/snapshot.py): where
+# build_catalog_snapshot writes versions for the workers to map (empty = off),
+# and how old a snapshot the home page rankings may still be served from
+CATALOG_SNAPSHOT_DIR = os.getenv('CATALOG_SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+CATALOG_SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv('CATALOG_SNAPSHOT_MAX_AGE_SECONDS', '900'))
+
+# Build the plant detail page with one JSON query instead of one query per section
+PLANT_DETAIL_SINGLE_QUERY = os.getenv('PLANT_DETAIL_SINGLE_QUERY', '1') == '1'
+
+# Most plant ids per /plant_detail/batch/ request (plant_detail/summaries.py)
+PLANT_BATCH_MAX_IDS = int(os.getenv('PLANT_BATCH_MAX_IDS', '300'))
+
+# Delivery agent dashboard KPIs are cached per agent (delivery_agent/kpis.py)
+AGENT_KPI_CACHE_SECONDS = int(os.getenv('AGENT_KPI_CACHE_SECONDS', '60'))
+
+# Delivery agent id resolver (delivery_agent/identity.py): how long an id that
+# is not an agent is remembered before asking the database again
+AGENT_RESOLVER_MISS_SECONDS = int(os.getenv('AGENT_RESOLVER_MISS_SECONDS', '30'))
+
+# Batch delivery assignment (admin_dashboard/assignment.py): days past the due
+# date an order may be pushed when no agent has a free slot
+ASSIGNMENT_MAX_SLIP_DAYS = int(os.getenv('ASSIGNMENT_MAX_SLIP_DAYS', '2'))
+
+# Delivery slot index (delivery_agent/slots.py): days of slots kept in memory
+# (and generated by generate_delivery_slots), full reload interval, and how
+# many slots a checkout tries before giving up on a reservation
+SLOT_INDEX_DAYS = int(os.getenv('SLOT_INDEX_DAYS', '30'))
+SLOT_INDEX_REFRESH_SECONDS = int(os.getenv('SLOT_INDEX_REFRESH_SECONDS', '300'))
+SLOT_RESERVE_ATTEMPTS = int(os.getenv('SLOT_RESERVE_ATTEMPTS', '5'))
+
+# Image uploads (greencart/media.py): where files are stored (LocalStorage
+# writes under MEDIA_ROOT instead of Cloudinary), parallel uploads per worker,
+# how long a content hash remembers its stored URL (0 = forever), how long
+# a view waits when it needs the URLs, and what pending images show meanwhile
+MEDIA_STORAGE_BACKEND = os.getenv('MEDIA_STORAGE_BACKEND', 'greencart.media.CloudinaryStorage')
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', str(BASE_DIR / 'media'))
+MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
+MEDIA_UPLOAD_WORKERS = int(os.getenv('MEDIA_UPLOAD_WORKERS', '8'))
+MEDIA_DEDUP_SECONDS = int(os.getenv('MEDIA_DEDUP_SECONDS', '0')) or None
+MEDIA_UPLOAD_TIMEOUT_SECONDS = int(os.getenv('MEDIA_UPLOAD_TIMEOUT_SECONDS', '60'))
+MEDIA_PENDING_IMAGE_URL = os.getenv(
+    'MEDIA_PENDING_IMAGE_URL',
+    "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 4 3'%3E"
+    "%3Crect width='4' height='3' fill='%23e6efe6'/%3E%3C/svg%3E",
+)
+
+# Bulk catalog import (seller/catalog_import.py): source rows per committed chunk
+CATALOG_IMPORT_CHUNK_ROWS = int(os.getenv('CATALOG_IMPORT_CHUNK_ROWS', '1000'))
+
+# Bulk stock sync (seller/inventory.py): most (plant_id, stock_quantity) pairs per request
+INVENTORY_SYNC_MAX_ITEMS = int(os.getenv('INVENTORY_SYNC_MAX_ITEMS', '20000'))
+
+# Reference-data registry (greencart/refdata.py): full reload interval, and how
+# often a lookup miss may trigger an early reload
+REFDATA_REFRESH_SECONDS = int(os.getenv('REFDATA_REFRESH_SECONDS', '300'))
+REFDATA_MISS_RELOAD_SECONDS = int(os.getenv('REFDATA_MISS_RELOAD_SECONDS', '60'))
+
+# Discount index and effective prices (greencart/discounts.py): full reload
+# interval of the index, and plants per statement when refreshing prices
+DISCOUNT_INDEX_REFRESH_SECONDS = int(os.getenv('DISCOUNT_INDEX_REFRESH_SECONDS', '300'))
+PRICE_REFRESH_CHUNK = int(os.getenv('PRICE_REFRESH_CHUNK', '1000'))
+
+# Batched cart changes (cart_sidebar/batch.py): most operations per request
+CART_BATCH_MAX_OPERATIONS = int(os.getenv('CART_BATCH_MAX_OPERATIONS', '500'))
+
+# Per-request SQL statistics (greencart/db/sqlstats.py): Server-Timing header,
+# /metrics, and a log of statements slower than SQL_SLOW_STATEMENT_MS
+SQL_STATS_ENABLED = os.getenv('SQL_STATS_ENABLED', '1') == '1'
+SQL_SLOW_STATEMENT_MS = float(os.getenv('SQL_SLOW_STATEMENT_MS', '500'))
+SQL_SLOW_LOG_BINDS = os.getenv('SQL_SLOW_LOG_BINDS', '1') == '1'
+
+# Activity log writer (greencart/activity.py): events are queued and written in
+# batches of up to ACTIVITY_LOG_BATCH_SIZE every ACTIVITY_LOG_FLUSH_MS. When the
+# queue is full ACTIVITY_LOG_OVERFLOW is 'drop' or 'block' (for up to
+# ACTIVITY_LOG_BLOCK_SECONDS). ACTIVITY_LOG_ASYNC=0 writes on the request path.
+ACTIVITY_LOG_ASYNC = os.getenv('ACTIVITY_LOG_ASYNC', '1') == '1'
+ACTIVITY_LOG_QUEUE_SIZE = int(os.getenv('ACTIVITY_LOG_QUEUE_SIZE', '10000'))
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv('ACTIVITY_LOG_BATCH_SIZE', '500'))
+ACTIVITY_LOG_FLUSH_MS = int(os.getenv('ACTIVITY_LOG_FLUSH_MS', '200'))
+ACTIVITY_LOG_OVERFLOW = os.getenv('ACTIVITY_LOG_OVERFLOW', 'drop')
+ACTIVITY_LOG_BLOCK_SECONDS = float(os.getenv('ACTIVITY_LOG_BLOCK_SECONDS', '0.05'))
+
+# Login tokens (greencart/tokens.py). The client has no refresh flow, so the
+# access token lives for a working day; views fall back to DB checks after it
+# expires.
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv('ACCESS_TOKEN_LIFETIME_MINUTES', '720'))),
+    'ALGORITHM': 'HS256',
+    'SIGNING_KEY': os.getenv('JWT_SIGNING_KEY') or SECRET_KEY,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
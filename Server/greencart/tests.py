@@ -0,0 +1,179 @@
+from datetime import datetime
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import SimpleTestCase, override_settings
+
+from greencart import events, metrics
+from greencart.discounts import DiscountIndex, _micros
+
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+JUNE_1 = datetime(2025, 6, 1)
+JUNE_10 = datetime(2025, 6, 10)
+JUNE_20 = datetime(2025, 6, 20)
+
+
+def discount_row(discount_id, value, start, end, plant_id=None, category_id=None, is_percentage=1):
+    return (discount_id, f'Discount {discount_id}', '', value, is_percentage, start, end, plant_id, category_id)
+
+
+def at(value):
+    return _micros(value)
+
+
+class DiscountIndexTests(SimpleTestCase):
+
+    def test_windows_are_inclusive_of_both_ends(self):
+        index = DiscountIndex([discount_row(1, 10, JUNE_1, JUNE_10, plant_id=5)])
+
+        self.assertEqual(index.candidates(5, (), at(JUNE_1) - 1), [])
+        self.assertEqual([d.discount_id for d in index.candidates(5, (), at(JUNE_1))], [1])
+        self.assertEqual([d.discount_id for d in index.candidates(5, (), at(JUNE_10))], [1])
+        self.assertEqual(index.candidates(5, (), at(JUNE_10) + 1), [])
+
+    def test_best_discount_across_plant_category_and_every_plant(self):
+        index = DiscountIndex([
+            discount_row(1, 10, JUNE_1, JUNE_20, plant_id=5),
+            discount_row(2, 15, JUNE_1, JUNE_10, category_id=7),
+            discount_row(3, 2.5, JUNE_1, JUNE_20, is_percentage=0),
+        ])
+
+        price = index.price(5, [7], 20.0, at(JUNE_1))
+        self.assertEqual((price.effective_price, price.discount.discount_id), (17.0, 2))
+        # After the category discount ends the fixed one takes more off than 10%
+        price = index.price(5, [7], 20.0, at(JUNE_10) + 1)
+        self.assertEqual((price.effective_price, price.discount.discount_id), (17.5, 3))
+        # Not in the category
+        self.assertEqual(index.price(6, [], 20.0, at(JUNE_1)).effective_price, 17.5)
+
+    def test_equal_discounts_go_to_the_lower_id(self):
+        index = DiscountIndex([
+            discount_row(4, 10, JUNE_1, JUNE_20, plant_id=5),
+            discount_row(2, 10, JUNE_1, JUNE_20, category_id=7),
+        ])
+
+        self.assertEqual(index.best(5, [7], 30.0, at(JUNE_10))[0].discount_id, 2)
+
+    def test_price_is_valid_until_the_next_window_change(self):
+        index = DiscountIndex([
+            discount_row(1, 10, JUNE_1, JUNE_20, plant_id=5),
+            discount_row(2, 15, JUNE_10, JUNE_20, category_id=7),
+        ])
+
+        self.assertEqual(index.price(5, [7], 20.0, at(JUNE_1)).valid_until, at(JUNE_10))
+        self.assertEqual(index.price(5, [7], 20.0, at(JUNE_10)).valid_until, at(JUNE_20) + 1)
+        self.assertIsNone(index.price(5, [7], 20.0, at(JUNE_20) + 1).valid_until)
+        self.assertEqual(index.boundaries, [at(JUNE_1), at(JUNE_10), at(JUNE_20) + 1])
+
+    def test_fingerprint_ignores_discounts_that_have_ended(self):
+        running = discount_row(1, 10, JUNE_1, JUNE_20, plant_id=5)
+        ended = discount_row(2, 50, JUNE_1, JUNE_10, plant_id=5)
+        t = at(JUNE_10) + 1
+
+        self.assertEqual(DiscountIndex([running, ended]).fingerprint(5, (), t),
+                         DiscountIndex([running]).fingerprint(5, (), t))
+        self.assertNotEqual(DiscountIndex([running, ended]).fingerprint(5, (), at(JUNE_1)),
+                            DiscountIndex([running]).fingerprint(5, (), at(JUNE_1)))
+        # Another plant's discounts don't change it
+        self.assertEqual(DiscountIndex([running, discount_row(3, 5, JUNE_1, JUNE_20, plant_id=6)])
+                         .fingerprint(5, (), t), DiscountIndex([running]).fingerprint(5, (), t))
+
+    def test_changed_targets(self):
+        old = DiscountIndex([discount_row(1, 10, JUNE_1, JUNE_20, plant_id=5)])
+        new = DiscountIndex([
+            discount_row(1, 10, JUNE_1, JUNE_20, plant_id=5),
+            discount_row(2, 15, JUNE_1, JUNE_20, category_id=7),
+        ])
+
+        self.assertEqual(new.changed_targets(old), {('category', 7)})
+        self.assertEqual(new.changed_targets(new), set())
+
+
+class FakeCursor:
+    """Answers ORDER_SQL and ORDER_SELLERS_SQL for one order"""
+
+    def __init__(self, order_row, seller_ids):
+        self.order_row = order_row
+        self.seller_ids = seller_ids
+        self._sql = None
+
+    def execute(self, sql, params=None):
+        self._sql = sql
+
+    def fetchone(self):
+        return self.order_row
+
+    def fetchall(self):
+        return [(seller_id,) for seller_id in self.seller_ids]
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER, LIVE_EVENTS_ENABLED=True)
+class PublishTests(SimpleTestCase):
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+
+    def listen(self, *groups):
+        channel = async_to_sync(self.layer.new_channel)()
+        for group in groups:
+            async_to_sync(self.layer.group_add)(group, channel)
+        return channel
+
+    def received(self, channel):
+        return async_to_sync(self.layer.receive)(channel)['event']
+
+    def pending(self, channel):
+        queue = self.layer.channels.get(channel)
+        return queue.qsize() if queue else 0
+
+    def test_every_group_gets_the_message(self):
+        user = self.listen('user.1')
+        admins = self.listen(events.ADMINS_GROUP)
+
+        events.publish(['user.1', events.ADMINS_GROUP, 'user.1'], 'stock.low', plant_id=5)
+
+        self.assertEqual(self.received(user), {'type': 'stock.low', 'plant_id': 5})
+        self.assertEqual(self.received(admins), {'type': 'stock.low', 'plant_id': 5})
+        # The repeated group is sent to once
+        self.assertEqual(self.pending(user), 0)
+
+    def test_a_failed_group_does_not_stop_the_others(self):
+        admins = self.listen(events.ADMINS_GROUP)
+        group_send = self.layer.group_send
+
+        async def flaky_group_send(group, message):
+            if group == 'user.1':
+                raise RuntimeError("layer full")
+            await group_send(group, message)
+
+        failed = metrics.live_events_failed._series.get(('order.status',), 0)
+        with mock.patch.object(self.layer, 'group_send', flaky_group_send), \
+                self.assertLogs('greencart.events', 'ERROR'):
+            events.publish(['user.1', events.ADMINS_GROUP], 'order.status', order_id=3)
+
+        self.assertEqual(self.received(admins), {'type': 'order.status', 'order_id': 3})
+        self.assertEqual(metrics.live_events_failed._series[('order.status',)], failed + 1)
+
+    def test_order_changed_reaches_customer_sellers_agent_and_admins(self):
+        customer = self.listen('user.1')
+        seller = self.listen('user.7')
+        agent = self.listen('agent.4')
+        admins = self.listen(events.ADMINS_GROUP)
+        cursor = FakeCursor((1, 'ORD-12345', 'Shipped', 4, 1, 0, None), [7])
+
+        events.order_changed(cursor, 9, 'order.assigned')
+
+        expected = {
+            'type': 'order.assigned', 'order_id': 9, 'order_number': 'ORD-12345', 'status': 'Shipped',
+            'agent_id': 4, 'agent_confirmed': True, 'customer_confirmed': False, 'slot_date': None,
+        }
+        for channel in (customer, seller, agent, admins):
+            self.assertEqual(self.received(channel), expected)
+
+    @override_settings(LIVE_EVENTS_ENABLED=False)
+    def test_nothing_is_sent_when_disabled(self):
+        user = self.listen('user.1')
+        events.publish(['user.1'], 'stock.low', plant_id=5)
+        self.assertEqual(self.pending(user), 0)
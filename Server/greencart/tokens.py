@@ -0,0 +1,70 @@
+"""Signed login tokens.
+
+Login hands out a simplejwt access token carrying the user's id, role and,
+where it applies, their agent_id / seller_id. IdentityMiddleware checks the
+signature and expiry of the `Authorization: Bearer` token in memory and
+puts the result on `request.identity`, so views can trust those claims
+instead of looking the role or agent up again.
+
+`request.identity` is None when there is no token, when it is expired or
+tampered with, or when it is one of the old `auth_token_<id>_<role>`
+placeholders. Views then fall back to checking the database as before.
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Identity = namedtuple('Identity', 'user_id role agent_id seller_id')
+
+
+# simplejwt reads SIGNING_KEY when its tokens module is imported, so it is
+# imported on first use: modules that only check identities (and the test
+# runner) load without a SECRET_KEY
+
+
+def issue_token(user_id, role, agent_id=None, seller_id=None):
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    token = AccessToken()
+    token['user_id'] = user_id
+    token['role'] = role
+    if agent_id is not None:
+        token['agent_id'] = agent_id
+    if seller_id is not None:
+        token['seller_id'] = seller_id
+    return str(token)
+
+
+def verify_token(raw):
+    """Identity carried by a token string, None if it doesn't verify"""
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    try:
+        payload = AccessToken(raw).payload
+    except TokenError as e:
+        logger.debug("Rejected token: %s", e)
+        return None
+    return Identity(
+        payload.get('user_id'),
+        payload.get('role'),
+        payload.get('agent_id'),
+        payload.get('seller_id'),
+    )
+
+
+def identity_from_request(request):
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, raw = header.partition(' ')
+    raw = raw.strip()
+    if scheme.lower() != 'bearer' or not raw or raw.startswith('auth_token_'):
+        return None
+    return verify_token(raw)
+
+
+def is_user(request, user_id, role):
+    """True when the request's token says it comes from `user_id` with `role`"""
+    identity = getattr(request, 'identity', None)
+    return (identity is not None and identity.role == role
+            and str(identity.user_id) == str(user_id))
@@ -1,8 +1,11 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from home import views
 from accounts import urls
 from admin_dashboard import urls 
+from greencart.metrics import metrics_view
 
 urlpatterns = [
     path('home/', include('home.urls')),
@@ -15,5 +18,9 @@ urlpatterns = [
     path('delivery_agent/', include('delivery_agent.urls')),
     path('seller/', include('seller.urls')),
     path('accounts/', include('accounts.urls')),
+    path('metrics', metrics_view, name='metrics'),
 
 ]
+
+# Images stored by LocalStorage, served by Django itself only with DEBUG on
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,47 @@
+"""Shared version numbers of the per-worker registries.
+
+Reference data, discounts, delivery slots and agent ids are loaded into
+every worker. A writer that changes one of them bumps its version in the
+shared cache; each worker looks at the version at most every
+VERSION_CHECK_SECONDS and reloads when it has moved.
+"""
+import time
+
+from django.core.cache import cache
+
+# How often a worker looks at a shared version
+VERSION_CHECK_SECONDS = 2
+
+
+class SharedVersion:
+
+    def __init__(self, key):
+        self.key = key
+        self._seen = None
+        self._checked_at = 0.0
+
+    def bump(self):
+        """Make every worker see a change"""
+        cache.add(self.key, 0, None)
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            cache.set(self.key, 1, None)
+
+    def changed(self):
+        """True once after the shared version has moved; the cache is only
+        read every VERSION_CHECK_SECONDS, in between this is False"""
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return False
+        self._checked_at = now
+        version = cache.get(self.key)
+        if version == self._seen:
+            return False
+        self._seen = version
+        return True
+
+    def catch_up(self):
+        """Take the current version as seen, for data loaded some other way"""
+        self._seen = cache.get(self.key)
+        self._checked_at = time.monotonic()
@@ -7,3 +7,17 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greencart.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+from greencart.db.pool import warm_up_pool
+from greencart.refdata import warm_up as warm_up_refdata
+from plant_collection.catalog import warm_up as warm_up_catalog
+from plant_collection.search import build_in_background as build_search_index
+
+if settings.ORACLE_POOL_WARM_UP:
+    warm_up_pool()
+    warm_up_refdata()
+    if settings.CATALOG_INDEX_ENABLED:
+        warm_up_catalog()
+    if settings.SEARCH_INDEX_ENABLED:
+        build_search_index()
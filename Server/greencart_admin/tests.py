@@ -1,3 +1,34 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase
+
+from . import views
+
+
+class AssignDeliveryAgentViewTests(SimpleTestCase):
+
+    def post(self, body):
+        return views.assign_delivery_agent_view(
+            RequestFactory().post('/delivery/assign/', json.dumps(body), content_type='application/json'))
+
+    def test_assignment_is_published(self):
+        cursor = mock.MagicMock()
+        connection = mock.Mock()
+        connection.cursor.return_value.__enter__ = mock.Mock(return_value=cursor)
+        connection.cursor.return_value.__exit__ = mock.Mock(return_value=False)
+
+        with mock.patch.object(views, 'connection', connection), \
+                mock.patch.object(views, 'order_changed') as order_changed:
+            response = self.post({'order_id': 9, 'agent_id': 4})
+
+        self.assertEqual(response.status_code, 200)
+        cursor.callproc.assert_called_once_with('assign_delivery_agent', [9, 4])
+        order_changed.assert_called_once_with(cursor, 9, 'order.assigned')
+
+    def test_order_id_is_required(self):
+        with mock.patch.object(views, 'order_changed') as order_changed:
+            response = self.post({'agent_id': 4})
+
+        self.assertEqual(response.status_code, 400)
+        order_changed.assert_not_called()
@@ -3,6 +3,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.db import connection, DatabaseError
 from datetime import datetime
 import json
+from greencart.events import order_changed
 
 # Get all orders for a user (optionally filter by status)
 def get_user_orders_view(request, user_id):
@@ -133,6 +134,7 @@ def assign_delivery_agent_view(request):
 
         with connection.cursor() as cursor:
             cursor.callproc("assign_delivery_agent", [order_id, agent_id])
+            order_changed(cursor, order_id, 'order.assigned')
             
         return JsonResponse({"success": True, "message": "Delivery agent assigned successfully"})
     except DatabaseError as e:
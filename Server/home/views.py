@@ -2,8 +2,17 @@ from django.shortcuts import render
 from django.http import JsonResponse
 from django.db import connection
 import oracledb
+from django.conf import settings
+from greencart.cache import cache_response, ALL_CATEGORIES, ALL_PLANTS, ALL_SELLERS
+from plant_collection.snapshot import get_snapshot
 
+@cache_response(lambda: [ALL_CATEGORIES])
 def top_categories(request):
+    # Rankings from a recent shared snapshot are close enough for the home page
+    snapshot = get_snapshot(max_age=settings.CATALOG_SNAPSHOT_MAX_AGE_SECONDS)
+    if snapshot is not None:
+        return JsonResponse({"categories": snapshot.top_categories(4)}, safe=False)
+
     rows = []
     with connection.cursor() as cursor:
         out_cursor = cursor.connection.cursor()  # separate cursor for ref cursor
@@ -24,16 +33,17 @@ def top_categories(request):
     return JsonResponse({"categories": categories}, safe=False)
 
 
+@cache_response(lambda: [ALL_PLANTS])
 def top_plants(request):
-    rows = []
-    with connection.cursor() as cursor:
-        out_cursor = cursor.connection.cursor()
-        out_cursor = cursor.callfunc("get_top_4_plants", oracledb.CURSOR)  # specify cursor type
-        rows = out_cursor.fetchall()
-        desc = [d[0].lower() for d in out_cursor.description]
-        out_cursor.close()
-
-    results = [dict(zip(desc, row)) for row in rows]
+    snapshot = get_snapshot(max_age=settings.CATALOG_SNAPSHOT_MAX_AGE_SECONDS)
+    results = snapshot.top_plants(4) if snapshot is not None else None
+    if results is None:
+        with connection.cursor() as cursor:
+            out_cursor = cursor.callfunc("get_top_4_plants", oracledb.CURSOR)  # specify cursor type
+            rows = out_cursor.fetchall()
+            desc = [d[0].lower() for d in out_cursor.description]
+            out_cursor.close()
+        results = [dict(zip(desc, row)) for row in rows]
     
     # Ensure image field is properly named
     for plant in results:
@@ -45,6 +55,7 @@ def top_plants(request):
     return JsonResponse(results, safe=False)
 
 
+@cache_response(lambda: [ALL_SELLERS])
 def top_sellers(request):
     rows = []
     with connection.cursor() as cursor:
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+# Delivered orders per agent and month, straight from orders
+AGENT_TOTALS_SQL = """
+    SELECT oa.agent_id,
+           earnings_month(o.actual_delivery_date, o.order_date) AS month_start,
+           COUNT(*) AS deliveries_completed,
+           SUM(o.total_amount * 0.05) AS earnings
+    FROM orders o
+    JOIN order_assignments oa ON o.order_id = oa.order_id
+    WHERE o.status_id = (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered')
+    GROUP BY oa.agent_id, earnings_month(o.actual_delivery_date, o.order_date)
+"""
+
+SELLER_TOTALS_SQL = """
+    SELECT p.seller_id,
+           earnings_month(o.actual_delivery_date, o.order_date) AS month_start,
+           SUM(oi.quantity) AS items_sold,
+           SUM(ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) * 0.9) AS earnings
+    FROM orders o
+    JOIN order_items oi ON o.order_id = oi.order_id
+    JOIN plants p ON oi.plant_id = p.plant_id
+    WHERE o.status_id = (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered')
+    AND p.seller_id IS NOT NULL
+    GROUP BY p.seller_id, earnings_month(o.actual_delivery_date, o.order_date)
+"""
+
+# (table, key column, value columns, totals query)
+ROLLUPS = [
+    ('agent_monthly_earnings', 'agent_id', ['deliveries_completed', 'earnings'], AGENT_TOTALS_SQL),
+    ('seller_monthly_earnings', 'seller_id', ['items_sold', 'earnings'], SELLER_TOTALS_SQL),
+]
+
+
+def drift_sql(table, key, columns, totals_sql):
+    # Keys whose stored row differs from the recomputed one (zero rows count as missing)
+    values = ', '.join(columns)
+    return f"""
+        SELECT DISTINCT {key} FROM (
+            (SELECT {key}, month_start, {values} FROM {table} WHERE {columns[0]} != 0
+             MINUS
+             SELECT {key}, month_start, {values} FROM ({totals_sql}))
+            UNION ALL
+            (SELECT {key}, month_start, {values} FROM ({totals_sql})
+             MINUS
+             SELECT {key}, month_start, {values} FROM {table} WHERE {columns[0]} != 0)
+        )
+        ORDER BY {key}
+    """
+
+
+class Command(BaseCommand):
+    help = "Recompute agent_monthly_earnings and seller_monthly_earnings from delivered orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report agents and sellers whose rollups are off")
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            drifted = {}
+            for table, key, columns, totals_sql in ROLLUPS:
+                cursor.execute(drift_sql(table, key, columns, totals_sql))
+                drifted[table] = [row[0] for row in cursor.fetchall()]
+
+            for table, key, columns, totals_sql in ROLLUPS:
+                ids = drifted[table]
+                self.stdout.write(f"{table}: {len(ids)} {key}(s) with stale rows")
+                for key_value in ids[:50]:
+                    self.stdout.write(f"  {key} {key_value}")
+
+            if options['check'] or not any(drifted.values()):
+                return
+
+            for table, key, columns, totals_sql in ROLLUPS:
+                values = ', '.join(columns)
+                cursor.execute(f"DELETE FROM {table}")
+                cursor.execute(f"""
+                    INSERT INTO {table} ({key}, month_start, {values})
+                    SELECT {key}, month_start, {values} FROM ({totals_sql})
+                """)
+                self.stdout.write(f"{table}: {cursor.rowcount} row(s) written")
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt earnings rollups"))
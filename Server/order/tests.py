@@ -1,3 +1,16 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .views import item_total
+
+
+class ItemTotalTests(SimpleTestCase):
+
+    def test_matches_the_rounded_stored_discount(self):
+        # A flat $3 off 29.99 is stored as 10.00%, the charge follows the stored value
+        self.assertEqual(item_total(7, 29.99, 10.00), Decimal('188.94'))
+
+    def test_half_cents_round_up_like_oracle(self):
+        self.assertEqual(item_total(1, 0.05, 50), Decimal('0.03'))
+        self.assertEqual(item_total(3, 12.5, 0), Decimal('37.50'))
@@ -1,8 +1,29 @@
 # order/views.py - Updated to fix the VariableWrapper error
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db import connection
+from django.db import connection, transaction
 import json
+from decimal import Decimal, ROUND_HALF_UP
+import oracledb
+from greencart.db.binds import number_list
+from greencart.discounts import prices
+from greencart.cache import invalidate, tags_for_plants, ALL_PLANTS, ALL_SELLERS
+from greencart.refdata import refdata
+from greencart.events import order_changed, stock_changed
+from delivery_agent.kpis import invalidate_kpis_for_order
+from delivery_agent.slots import slot_index
+from plant_collection.catalog import mark_catalog_changed
+from plant_detail.summaries import get_summaries
+
+CENTS = Decimal('0.01')
+
+
+def item_total(quantity, unit_price, discount_applied):
+    """What an order item costs, worked out like the item_total queries:
+    ROUND(quantity * unit_price * (1 - discount_applied / 100), 2)"""
+    total = quantity * Decimal(str(unit_price)) * (1 - Decimal(str(discount_applied)) / 100)
+    return total.quantize(CENTS, ROUND_HALF_UP)
+
 
 def dictfetchall(cursor):
     """Return all rows from a cursor as a list of dictionaries"""
@@ -38,11 +59,10 @@ def customer_orders(request, user_id):
                         NVL(dc.customer_confirmed, 0) AS customer_confirmed,
                         NVL(dc.agent_confirmed, 0) AS agent_confirmed,
                         dc.confirmed_date,
-                        (SELECT pi.image_url 
-                         FROM order_items oi 
-                         JOIN plants p ON oi.plant_id = p.plant_id
-                         LEFT JOIN plant_images pi ON p.plant_id = pi.plant_id AND pi.is_primary = 1
-                         WHERE oi.order_id = o.order_id AND ROWNUM = 1) AS primary_image
+                        -- First plant of the order, its picture comes from the cached plant summaries
+                        (SELECT MIN(oi.plant_id) KEEP (DENSE_RANK FIRST ORDER BY oi.order_item_id)
+                         FROM order_items oi
+                         WHERE oi.order_id = o.order_id) AS first_plant_id
                     FROM orders o
                     JOIN order_statuses os ON o.status_id = os.status_id
                     JOIN delivery_methods dm ON o.delivery_method_id = dm.method_id
@@ -60,11 +80,17 @@ def customer_orders(request, user_id):
                 
                 cursor.execute(query, params)
                 orders = dictfetchall(cursor)
-                
-                return JsonResponse({
-                    'success': True,
-                    'orders': orders
-                })
+
+            plant_ids = list({order['first_plant_id'] for order in orders if order['first_plant_id'] is not None})
+            summaries = get_summaries(plant_ids) if plant_ids else {}
+            for order in orders:
+                summary = summaries.get(order.pop('first_plant_id'))
+                order['primary_image'] = summary['primary_image'] if summary else None
+
+            return JsonResponse({
+                'success': True,
+                'orders': orders
+            })
                 
         except Exception as e:
             return JsonResponse({
@@ -294,19 +320,23 @@ def add_review_view(request):
                         'message': 'You have already reviewed this plant from this order'
                     })
                 
-                # Insert the review
-                cursor.execute("""
-                    INSERT INTO reviews (review_id, user_id, plant_id, order_id, rating, review_text, review_date, is_approved)
-                    VALUES (review_id_seq.NEXTVAL, :user_id, :plant_id, :order_id, :rating, :review_text, SYSTIMESTAMP, 1)
-                """, {
-                    'user_id': user_id,
-                    'plant_id': plant_id,
-                    'order_id': order_id,
-                    'rating': rating,
-                    'review_text': review_text
-                })
-                
-                connection.commit()
+                # The review and the plant's rating aggregates commit together
+                with transaction.atomic():
+                    cursor.execute("""
+                        INSERT INTO reviews (review_id, user_id, plant_id, order_id, rating, review_text, review_date, is_approved)
+                        VALUES (review_id_seq.NEXTVAL, :user_id, :plant_id, :order_id, :rating, :review_text, SYSTIMESTAMP, 1)
+                    """, {
+                        'user_id': user_id,
+                        'plant_id': plant_id,
+                        'order_id': order_id,
+                        'rating': rating,
+                        'review_text': review_text
+                    })
+                    cursor.callproc('apply_review_rating', [plant_id, rating, 1])
+
+                # Rating changed on the detail page, listings and top plants
+                invalidate(ALL_PLANTS, *tags_for_plants(cursor, [plant_id]))
+                mark_catalog_changed([plant_id])
                 
                 return JsonResponse({
                     'success': True,
@@ -377,7 +407,7 @@ def order_details(request, order_id):
                             ps.size_id,
                             ps.size_name,
                             ps.price_adjustment,
-                            (oi.quantity * oi.unit_price) AS subtotal,
+                            ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS subtotal,
                             CASE WHEN r.review_id IS NOT NULL THEN 1 ELSE 0 END AS has_review
                         FROM order_items oi
                         JOIN plants p ON oi.plant_id = p.plant_id
@@ -479,38 +509,22 @@ def customer_order_stats(request, user_id):
 def get_delivery_methods(request):
     if request.method == 'GET':
         try:
-            with connection.cursor() as cursor:
-                # Use direct SQL for simplicity and reliability
-                cursor.execute("""
-                    SELECT 
-                        method_id AS id,
-                        name,
-                        base_cost AS price,
-                        estimated_days AS time,
-                        description
-                    FROM delivery_methods
-                    WHERE is_active = 1
-                    ORDER BY method_id
-                """)
-                
-                methods = dictfetchall(cursor)
-                print(f"DEBUG: Found {len(methods)} delivery methods: {methods}")  # Debug log
-                
-                # Validate that we have data and required fields
-                if not methods:
-                    return JsonResponse({'success': False, 'error': 'No delivery methods found'}, status=500)
-                
-                # Check first method to ensure it has required fields
-                first_method = methods[0]
-                required_fields = ['id', 'name', 'price', 'time']
-                missing_fields = [field for field in required_fields if field not in first_method]
-                
-                if missing_fields:
-                    print(f"ERROR: Missing fields {missing_fields} in delivery method: {first_method}")
-                    print(f"Available fields: {list(first_method.keys())}")
-                    return JsonResponse({'success': False, 'error': f'Missing required fields: {missing_fields}'}, status=500)
-                
-                return JsonResponse({'success': True, 'methods': methods})
+            # Served from the reference-data registry, no query per request
+            methods = [
+                {
+                    'id': method.method_id,
+                    'name': method.name,
+                    'price': method.base_cost,
+                    'time': method.estimated_days,
+                    'description': method.description,
+                }
+                for method in refdata.active_delivery_methods()
+            ]
+            
+            if not methods:
+                return JsonResponse({'success': False, 'error': 'No delivery methods found'}, status=500)
+            
+            return JsonResponse({'success': True, 'methods': methods})
                 
         except Exception as e:
             print(f"ERROR in get_delivery_methods: {str(e)}")  # Debug log
@@ -576,88 +590,97 @@ def create_order_view(request):
             # Generate order number
             import random
             order_number = f'ORD-{random.randint(10000, 99999)}'
-            
-            with connection.cursor() as cursor:
-                # Use direct SQL instead of stored procedure to avoid VariableWrapper error
-                
-                # Get status_id for 'Processing'
-                cursor.execute("""
-                    SELECT status_id FROM order_statuses WHERE status_name = 'Processing'
-                """)
-                status_id = cursor.fetchone()[0]
-                
-                # Get delivery method details
-                cursor.execute("""
-                    SELECT base_cost, estimated_days 
-                    FROM delivery_methods 
-                    WHERE method_id = :delivery_method_id AND is_active = 1
-                """, {'delivery_method_id': delivery_method_id})
-                
-                delivery_info = cursor.fetchone()
-                print(f"DEBUG: Delivery method query result: {delivery_info}")  # Debug log
+
+            cart_id_list = []
+            if cart_ids:
+                cart_id_list = [int(x.strip()) for x in str(cart_ids).split(',') if x.strip()]
+
+            # Reload the slot index, when due, before the transaction starts
+            with connection.cursor() as cursor, cursor.connection.cursor() as raw_cursor:
+                slot_index.ensure_loaded(raw_cursor)
+
+            # The whole checkout is one transaction and a fixed number of
+            # round trips however many items are in the cart
+            with transaction.atomic(), connection.cursor() as cursor, cursor.connection.cursor() as raw_cursor:
+
+                # Delivery method and the 'Processing' status come from the registry
+                delivery_method = refdata.delivery_method(delivery_method_id)
                 
-                if not delivery_info:
-                    # Check if delivery method exists but is inactive
-                    cursor.execute("""
-                        SELECT COUNT(*), is_active FROM delivery_methods WHERE method_id = :delivery_method_id GROUP BY is_active
-                    """, {'delivery_method_id': delivery_method_id})
-                    check_result = cursor.fetchone()
-                    if check_result:
-                        error_msg = f'Delivery method {delivery_method_id} exists but is inactive (is_active={check_result[1]})'
+                if not delivery_method or delivery_method.is_active != 1:
+                    if delivery_method:
+                        error_msg = f'Delivery method {delivery_method_id} exists but is inactive (is_active={delivery_method.is_active})'
                     else:
                         error_msg = f'Delivery method {delivery_method_id} does not exist'
                     print(f"DEBUG: {error_msg}")  # Debug log
                     return JsonResponse({'success': False, 'error': error_msg}, status=400)
                 
-                delivery_cost = float(delivery_info[0]) if delivery_info[0] else 0.0
-                estimated_days_str = delivery_info[1]
+                delivery_cost = float(delivery_method.base_cost) if delivery_method.base_cost else 0.0
+                status_id = refdata.status_id('Processing')
                 
-                # Extract numeric days from string like "3-5 days" or "1-2 days"
-                import re
-                days_match = re.search(r'(\d+)', estimated_days_str)
-                estimated_days = int(days_match.group(1)) if days_match else 3  # Default to 3 days
+                # First number of "3-5 days" or "1-2 days", default to 3 days
+                estimated_days = delivery_method.min_days if delivery_method.min_days is not None else 3
                 
-                # Calculate estimated delivery date
-                from datetime import datetime, timedelta
-                estimated_delivery_date = datetime.now() + timedelta(days=estimated_days)
+                # Calculate estimated delivery date: the earliest free delivery slot the
+                # method allows, or just the method's days when no slots are set up
+                from datetime import date, datetime, timedelta
+                earliest_slot_date = date.today() + timedelta(days=estimated_days)
+                slot = slot_index.earliest(earliest_slot_date)
+                if slot:
+                    estimated_delivery_date = datetime.combine(slot.slot_date, datetime.min.time())
+                else:
+                    estimated_delivery_date = datetime.now() + timedelta(days=estimated_days)
+                
+                # All selected cart rows in one fetch, cart ids bound as a collection
+                cart_items = []
+                stock_before = {}
+                if cart_id_list:
+                    cart_id_bind = number_list(raw_cursor, cart_id_list)
+                    raw_cursor.execute("""
+                        SELECT c.plant_id, c.size_id, c.quantity, 
+                               (p.base_price + COALESCE(ps.price_adjustment, 0)) as unit_price,
+                               p.stock_quantity
+                        FROM carts c
+                        JOIN plants p ON c.plant_id = p.plant_id
+                        LEFT JOIN plant_sizes ps ON c.plant_id = ps.plant_id AND c.size_id = ps.size_id
+                        WHERE c.cart_id IN (SELECT column_value FROM TABLE(:cart_ids))
+                        AND c.user_id = :user_id
+                    """, {'cart_ids': cart_id_bind, 'user_id': user_id})
+                    cart_items = []
+                    for plant_id, size_id, quantity, unit_price, stock in raw_cursor.fetchall():
+                        cart_items.append((plant_id, size_id, int(quantity) if quantity else 0,
+                                           float(unit_price) if unit_price else 0.0))
+                        stock_before[plant_id] = stock
+                    if len(cart_items) != len(cart_id_list):
+                        print(f"WARNING: {len(cart_id_list) - len(cart_items)} cart item(s) not found for user {user_id}")  # Debug log
+                
+                # Effective prices, as the cart and catalog show them; the discount is
+                # kept on each item as the percentage taken off its unit price, and
+                # the total is charged from that stored percentage so it matches the
+                # item totals and seller earnings worked out from order_items
+                plant_prices = prices(raw_cursor, [plant_id for plant_id, _, _, _ in cart_items])
+                priced_items = []
+                for plant_id, size_id, quantity, unit_price in cart_items:
+                    price = plant_prices.get((plant_id, size_id or 0))
+                    effective_price = price.effective_price if price else unit_price
+                    discount_applied = float(
+                        (Decimal(str(unit_price - effective_price)) * 100 / Decimal(str(unit_price)))
+                        .quantize(CENTS, ROUND_HALF_UP)
+                    ) if unit_price else 0
+                    priced_items.append((plant_id, size_id, quantity, unit_price, effective_price, discount_applied))
                 
                 # Calculate total amount BEFORE inserting order
-                total_amount = delivery_cost  # Start with delivery cost
-                
-                if cart_ids:
-                    cart_id_list = [int(x.strip()) for x in cart_ids.split(',') if x.strip()]
-                    print(f"DEBUG: Processing cart IDs: {cart_id_list}")  # Debug log
-                    
-                    for cart_id in cart_id_list:
-                        # Get cart item details
-                        cursor.execute("""
-                            SELECT c.plant_id, c.size_id, c.quantity, 
-                                   (p.base_price + COALESCE(ps.price_adjustment, 0)) as unit_price
-                            FROM carts c
-                            JOIN plants p ON c.plant_id = p.plant_id
-                            LEFT JOIN plant_sizes ps ON c.plant_id = ps.plant_id AND c.size_id = ps.size_id
-                            WHERE c.cart_id = :cart_id AND c.user_id = :user_id
-                        """, {'cart_id': cart_id, 'user_id': user_id})
-                        
-                        cart_item = cursor.fetchone()
-                        if cart_item:
-                            plant_id, size_id, quantity, unit_price = cart_item
-                            unit_price = float(unit_price) if unit_price else 0.0
-                            quantity = int(quantity) if quantity else 0
-                            item_total = unit_price * quantity
-                            total_amount += item_total
-                            print(f"DEBUG: Cart item {cart_id}: price={unit_price}, qty={quantity}, total={item_total}")  # Debug log
-                        else:
-                            print(f"WARNING: Cart item {cart_id} not found for user {user_id}")  # Debug log
-                
-                print(f"DEBUG: Calculated total amount: {total_amount}")  # Debug log
+                total_amount = delivery_cost + float(sum(
+                    item_total(quantity, unit_price, discount_applied)
+                    for _, _, quantity, unit_price, _, discount_applied in priced_items
+                ))
                 
                 # Ensure total_amount is not NULL or 0
                 if total_amount <= 0:
                     return JsonResponse({'success': False, 'error': 'Invalid order total. Please check your cart items.'}, status=400)
                 
-                # Insert order with calculated total
-                cursor.execute("""
+                # Insert order with calculated total, the trigger-assigned id comes back with it
+                order_id_var = raw_cursor.var(oracledb.NUMBER)
+                raw_cursor.execute("""
                     INSERT INTO orders (
                         user_id, order_number, status_id, delivery_method_id,
                         delivery_address, delivery_notes, estimated_delivery_date, total_amount
@@ -665,6 +688,7 @@ def create_order_view(request):
                         :user_id, :order_number, :status_id, :delivery_method_id,
                         :delivery_address, :delivery_notes, :estimated_delivery_date, :total_amount
                     )
+                    RETURNING order_id INTO :order_id
                 """, {
                     'user_id': user_id,
                     'order_number': order_number,
@@ -673,60 +697,48 @@ def create_order_view(request):
                     'delivery_address': delivery_address,
                     'delivery_notes': delivery_notes,
                     'estimated_delivery_date': estimated_delivery_date,
-                    'total_amount': total_amount
+                    'total_amount': total_amount,
+                    'order_id': order_id_var
                 })
-                
-                # Get the order_id of the inserted order
-                cursor.execute("SELECT seq_orders.CURRVAL FROM DUAL")
-                order_id = cursor.fetchone()[0]
+                order_id = int(order_id_var.getvalue()[0])
                 
                 print(f"DEBUG: Created order {order_id} with total {total_amount}")  # Debug log
                 
-                # Create order items
-                if cart_ids:
-                    cart_id_list = [int(x.strip()) for x in cart_ids.split(',') if x.strip()]
-                    
-                    for cart_id in cart_id_list:
-                        # Get cart item details again for order items
-                        cursor.execute("""
-                            SELECT c.plant_id, c.size_id, c.quantity, 
-                                   (p.base_price + COALESCE(ps.price_adjustment, 0)) as unit_price
-                            FROM carts c
-                            JOIN plants p ON c.plant_id = p.plant_id
-                            LEFT JOIN plant_sizes ps ON c.plant_id = ps.plant_id AND c.size_id = ps.size_id
-                            WHERE c.cart_id = :cart_id AND c.user_id = :user_id
-                        """, {'cart_id': cart_id, 'user_id': user_id})
-                        
-                        cart_item = cursor.fetchone()
-                        if cart_item:
-                            plant_id, size_id, quantity, unit_price = cart_item
-                            unit_price = float(unit_price) if unit_price else 0.0
-                            quantity = int(quantity) if quantity else 0
-                            
-                            # Insert order item (no discount_applied since we don't have discount logic yet)
-                            cursor.execute("""
-                                INSERT INTO order_items (
-                                    order_id, plant_id, size_id, quantity, unit_price, discount_applied
-                                ) VALUES (
-                                    :order_id, :plant_id, :size_id, :quantity, :unit_price, :discount_applied
-                                )
-                            """, {
-                                'order_id': order_id,
-                                'plant_id': plant_id,
-                                'size_id': size_id,
-                                'quantity': quantity,
-                                'unit_price': unit_price,
-                                'discount_applied': 0.0  # Default to 0 since no discount logic implemented
-                            })
+                if cart_items:
+                    raw_cursor.executemany("""
+                        INSERT INTO order_items (
+                            order_id, plant_id, size_id, quantity, unit_price, discount_applied
+                        ) VALUES (
+                            :1, :2, :3, :4, :5, :6
+                        )
+                    """, [
+                        (order_id, plant_id, size_id, quantity, unit_price, discount_applied)
+                        for plant_id, size_id, quantity, unit_price, _, discount_applied in priced_items
+                    ])
                     
                     # Remove items from cart
-                    cart_ids_str = ','.join(map(str, cart_id_list))
-                    cursor.execute(f"""
+                    raw_cursor.execute("""
                         DELETE FROM carts 
-                        WHERE cart_id IN ({cart_ids_str}) AND user_id = :user_id
-                    """, {'user_id': user_id})
-                
-                connection.commit()
+                        WHERE cart_id IN (SELECT column_value FROM TABLE(:cart_ids))
+                        AND user_id = :user_id
+                    """, {'cart_ids': cart_id_bind, 'user_id': user_id})
+                
+                # Hold the delivery slot for this order; if it went to another order
+                # meanwhile the next free one is taken and the date follows it
+                if slot:
+                    reserved = slot_index.reserve(raw_cursor, order_id, earliest_slot_date)
+                    if reserved and reserved.slot_date != slot.slot_date:
+                        estimated_delivery_date = datetime.combine(reserved.slot_date, datetime.min.time())
+                        raw_cursor.execute("""
+                            UPDATE orders SET estimated_delivery_date = :1 WHERE order_id = :2
+                        """, [estimated_delivery_date, order_id])
+                
+                # Sellers and admins see the new order; stock fell through trg_update_plant_stock
+                order_changed(cursor, order_id)
+                stock_changed(cursor, stock_before)
+                transaction.on_commit(lambda: mark_catalog_changed(stock_before))
+                # Top sellers count every item sold
+                transaction.on_commit(lambda: invalidate(ALL_SELLERS))
                 
                 return JsonResponse({
                     'success': True,
@@ -786,7 +798,7 @@ def get_order_details_view(request, order_id):
                         oi.quantity,
                         oi.unit_price,
                         oi.discount_applied,
-                        (oi.quantity * oi.unit_price) AS item_total,
+                        ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS item_total,
                         pi.image_url AS plant_image
                     FROM order_items oi
                     JOIN plants p ON oi.plant_id = p.plant_id
@@ -881,6 +893,8 @@ def confirm_customer_delivery(request):
                 # If both confirmed, the trigger will automatically update the order status to Delivered
                 # We just need to commit and return the appropriate message
                 connection.commit()
+                invalidate_kpis_for_order(cursor, order_id)
+                order_changed(cursor, order_id, 'delivery.confirmation')
                 
                 if agent_confirmed == 1 and customer_confirmed == 1:
                     return JsonResponse({
@@ -0,0 +1,586 @@
+"""In-process columnar catalog for filtered and faceted plant listings.
+
+Active plants are kept as NumPy columns (price, stock, rating, review
+count, created_at, name) plus a category bitset per plant, one bit per
+category id. A listing request is answered with boolean masks over those
+columns:
+
+  * filters: categories (any of), price range, minimum rating, in stock,
+    and optionally the plant ids a search matched;
+  * facets: price buckets, rating thresholds, in-stock and per-category
+    counts, each counted with every filter except its own, so a facet
+    shows what choosing one of its values would return;
+  * the page: the next `limit` rows in sort order after the keyset cursor,
+    picked with argpartition, so only the page is fully sorted.
+
+Only the page's plant ids come out of here, the rows themselves are
+fetched from Oracle like the search results are.
+
+Updated plants are overwritten in place, new ones appended and removed
+ones masked out. Like the search index, every worker keeps its own copy
+and replays a change log kept in the shared cache: writers call
+mark_catalog_changed() for stock, price and rating changes
+(mark_plants_changed() in search.py covers both). A worker builds its copy
+from the shared snapshot (snapshot.py) when there is one, and only replays
+the log since it, instead of loading every plant from Oracle. That happens
+in the WSGI/ASGI warm-up, before requests are served; without a snapshot
+the catalog loads from Oracle in a background thread, and until it is
+ready category pages are listed in SQL and browse answers 503.
+"""
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from greencart.cache import invalidate, plant_tag
+from greencart.db.binds import number_list
+from greencart.refdata import refdata
+from .changelog import ChangeLog
+from .pagination import InvalidPageRequest
+
+logger = logging.getLogger(__name__)
+
+changes = ChangeLog('catalog')
+
+# sort name -> (column, descending); same names and tie-break as pagination.SORTS
+SORTS = {
+    'rating': ('rating', True),
+    'price': ('price', False),
+    'price_desc': ('price', True),
+    'name': ('name', False),
+    'newest': ('created', True),
+}
+
+# "4 stars & up" ... "1 star & up"
+RATING_THRESHOLDS = (4, 3, 2, 1)
+
+Filters = namedtuple('Filters', 'categories min_price max_price min_rating in_stock plant_ids')
+Filters.__new__.__defaults__ = ((), None, None, None, False, None)
+
+Page = namedtuple('Page', 'plant_ids total has_more next_after facets')
+
+LOAD_SQL = """
+    SELECT plant_id, name, base_price, stock_quantity, avg_rating, review_count, created_at
+    FROM plants
+    WHERE is_active = 1 {where}
+"""
+
+CATEGORIES_SQL = """
+    SELECT pcm.plant_id, pcm.category_id
+    FROM plant_category_mapping pcm
+    JOIN plants p ON pcm.plant_id = p.plant_id
+    WHERE p.is_active = 1 {where}
+"""
+
+
+def _micros(value):
+    return int(value.timestamp() * 1_000_000) if value is not None else 0
+
+
+def _pack(mask, words):
+    """Boolean row mask as uint64 words, bit r of word r // 64 for row r"""
+    packed = np.zeros(words * 8, np.uint8)
+    bits = np.packbits(mask, bitorder='little')
+    packed[:len(bits)] = bits
+    return packed.view(np.uint64)
+
+
+class ColumnarCatalog:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.change_seq = 0
+        self._reset(0, 0)
+
+    def _reset(self, capacity, categories):
+        self.size = 0                                    # rows in use, live or not
+        self.plant_id = np.zeros(capacity, np.int64)
+        self.price = np.zeros(capacity, np.float64)
+        self.stock = np.zeros(capacity, np.int64)
+        self.rating = np.zeros(capacity, np.float64)
+        self.reviews = np.zeros(capacity, np.int64)
+        self.created = np.zeros(capacity, np.int64)      # microseconds since the epoch
+        self.live = np.zeros(capacity, np.bool_)
+        self.names = np.empty(capacity, object)
+        # One bitset over the rows per category: category bit -> uint64 words
+        self.category_rows = np.zeros((max(categories, 1), -(-capacity // 64)), np.uint64)
+        self.row_of = {}                                 # plant_id -> row
+        self.category_bit = {}                           # category_id -> row of category_rows
+        self._derived = {}                               # column -> {name: array derived from it}
+
+    def __len__(self):
+        return len(self.row_of)
+
+    # Building
+
+    def _grow(self, rows, categories):
+        capacity = len(self.plant_id)
+        if rows > capacity:
+            capacity = max(rows, capacity * 2, 1024)
+            for name in ('plant_id', 'price', 'stock', 'rating', 'reviews', 'created', 'live', 'names'):
+                old = getattr(self, name)
+                new = np.zeros(capacity, old.dtype) if old.dtype != object else np.empty(capacity, object)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+        old = self.category_rows
+        shape = (max(categories, old.shape[0]), -(-capacity // 64))
+        if shape != old.shape:
+            self.category_rows = np.zeros(shape, np.uint64)
+            self.category_rows[:old.shape[0], :old.shape[1]] = old
+
+    def _own(self, name):
+        # Columns loaded from a snapshot are read-only views of the shared
+        # mapping; a worker copies one only when it first writes to it
+        column = getattr(self, name)
+        if not column.flags.writeable:
+            setattr(self, name, column.copy())
+
+    def _bit(self, category_id):
+        bit = self.category_bit.get(category_id)
+        if bit is None:
+            bit = self.category_bit[category_id] = len(self.category_bit)
+            self._grow(self.size, bit + 1)
+        return bit
+
+    def _put(self, plant, category_ids):
+        plant_id, name, price, stock, rating, reviews, created_at = plant
+        values = {
+            'names': name or '',
+            'price': float(price or 0),
+            'stock': int(stock or 0),
+            'rating': float(rating or 0),
+            'reviews': int(reviews or 0),
+            'created': _micros(created_at),
+        }
+        row = self.row_of.get(plant_id)
+        if row is None:
+            row = self.size
+            self._grow(row + 1, 0)
+            self.size += 1
+            self.row_of[plant_id] = row
+            self._derived.clear()
+        else:
+            # Sort orders and buckets survive changes to other columns, e.g. stock
+            for column, value in values.items():
+                if getattr(self, column)[row] != value:
+                    self._derived.pop(column, None)
+
+        for column in ('plant_id', *values):
+            self._own(column)
+        self.plant_id[row] = plant_id
+        for column, value in values.items():
+            getattr(self, column)[row] = value
+        self.live[row] = True
+        word, bit = row // 64, np.uint64(1) << np.uint64(row % 64)
+        self.category_rows[:, word] &= ~bit
+        for category_id in category_ids:
+            category_bit = self._bit(category_id)   # may grow category_rows
+            self.category_rows[category_bit, word] |= bit
+
+    def _drop(self, plant_id):
+        row = self.row_of.pop(plant_id, None)
+        if row is not None:
+            self.live[row] = False
+
+    def build(self, plants, plant_categories):
+        """Replace the catalog. `plants` are LOAD_SQL rows, `plant_categories`
+        is {plant_id: [category_id]}"""
+        n = len(plants)
+        columns = {
+            'plant_id': np.fromiter((p[0] for p in plants), np.int64, n),
+            'names': [p[1] or '' for p in plants],
+            'price': np.fromiter((float(p[2] or 0) for p in plants), np.float64, n),
+            'stock': np.fromiter((int(p[3] or 0) for p in plants), np.int64, n),
+            'rating': np.fromiter((float(p[4] or 0) for p in plants), np.float64, n),
+            'reviews': np.fromiter((int(p[5] or 0) for p in plants), np.int64, n),
+            'created': np.fromiter((_micros(p[6]) for p in plants), np.int64, n),
+        }
+        row_of = {p[0]: row for row, p in enumerate(plants)}
+        rows, category_ids = [], []
+        for plant_id, ids in plant_categories.items():
+            row = row_of.get(plant_id)
+            if row is not None:
+                rows.extend([row] * len(ids))
+                category_ids.extend(ids)
+        self._load(columns, np.asarray(rows, np.int64), np.asarray(category_ids, np.int64))
+
+    def build_from_snapshot(self, snapshot):
+        """Replace the catalog with the plants of a CatalogSnapshot. The
+        numeric columns stay views of the mapped file, shared with every
+        other worker; names, the category bitsets and row_of are this
+        worker's own"""
+        columns = {
+            'plant_id': snapshot.plant_id,
+            'names': [name or '' for name in snapshot.texts(snapshot.name)],
+            'price': snapshot.price,
+            'stock': snapshot.stock,
+            'rating': snapshot.rating,
+            'reviews': snapshot.reviews,
+            'created': snapshot.created,
+        }
+        rows = np.repeat(np.arange(len(snapshot)), np.diff(snapshot.category_start))
+        self._load(columns, rows, snapshot.category_id)
+
+    def _load(self, columns, rows, category_ids):
+        """Replace the catalog with `columns`, row r in category
+        category_ids[i] for every rows[i] == r"""
+        unique = np.unique(category_ids)
+        n = len(columns['plant_id'])
+        with self._lock:
+            self._reset(n, len(unique))
+            self.category_bit = {int(category_id): bit for bit, category_id in enumerate(unique)}
+            if not n:
+                return
+            for name, values in columns.items():
+                column = getattr(self, name)
+                if isinstance(values, np.ndarray) and values.dtype == column.dtype:
+                    # Taken as is: no copy of built arrays or of snapshot views
+                    setattr(self, name, values)
+                else:
+                    column[:] = values
+            self.live[:] = True
+            self.size = n
+            self.row_of = dict(zip(self.plant_id.tolist(), range(n)))
+            np.bitwise_or.at(self.category_rows, (np.searchsorted(unique, category_ids), rows // 64),
+                             np.left_shift(np.uint64(1), (rows % 64).astype(np.uint64)))
+
+    def update(self, plants, plant_categories, removed=()):
+        """Overwrite changed plants, append new ones, mask out removed ones"""
+        with self._lock:
+            for plant_id in removed:
+                self._drop(plant_id)
+            for plant in plants:
+                self._put(plant, plant_categories.get(plant[0], ()))
+            if len(self.row_of) < self.size // 2:
+                self._compact()
+
+    def _compact(self):
+        rows = np.flatnonzero(self.live[:self.size])
+        members = np.unpackbits(self.category_rows.view(np.uint8), axis=1, bitorder='little')[:, rows]
+        for name in ('plant_id', 'price', 'stock', 'rating', 'reviews', 'created', 'live', 'names'):
+            setattr(self, name, getattr(self, name)[rows].copy())
+        words = -(-len(rows) // 64)
+        self.category_rows = np.stack([_pack(member, words) for member in members.astype(np.bool_)]) \
+            if len(members) else np.zeros((1, words), np.uint64)
+        self.size = len(rows)
+        self.row_of = {int(plant_id): row for row, plant_id in enumerate(self.plant_id)}
+        self._derived.clear()
+
+    # Querying
+
+    def _cached(self, column, name, build):
+        """An array derived from `column`, kept until the column changes"""
+        derived = self._derived.setdefault(column, {})
+        value = derived.get(name)
+        if value is None:
+            value = derived[name] = build()
+        return value
+
+    def _sort_key(self, sort):
+        """Ascending float key per row, and a function mapping a cursor value onto it"""
+        column, descending = SORTS[sort]
+        if column == 'name':
+            def ranks():
+                unique, rank = np.unique(self.names[:self.size].astype(str), return_inverse=True)
+                return unique, rank.astype(np.float64)
+            unique, rank = self._cached('names', 'rank', ranks)
+
+            def position(value):
+                i = int(np.searchsorted(unique, value))
+                # A name that is gone sorts between its neighbours
+                return float(i) if i < len(unique) and unique[i] == value else i - 0.5
+            return rank, position
+
+        sign = -1.0 if descending else 1.0
+        key = self._cached(column, sort, lambda: getattr(self, column)[:self.size].astype(np.float64) * sign)
+        return key, lambda value: float(value) * sign
+
+    def _order(self, sort):
+        """Every row in `sort` order, with the sort key and plant_id along that order"""
+        key, cursor_key = self._sort_key(sort)
+
+        def order():
+            rows = np.lexsort((self.plant_id[:self.size], key))
+            return rows, key[rows], self.plant_id[rows]
+        column = 'names' if SORTS[sort][0] == 'name' else SORTS[sort][0]
+        return self._cached(column, f'order:{sort}', order), cursor_key
+
+    def _category_mask(self, category_ids):
+        bits = [self.category_bit[c] for c in category_ids if c in self.category_bit]
+        rows = np.bitwise_or.reduce(self.category_rows[bits], axis=0) if bits else self.category_rows[0] * 0
+        return np.unpackbits(rows.view(np.uint8), bitorder='little', count=self.size).view(np.bool_)
+
+    def _masks(self, filters):
+        n = self.size
+        masks = {}
+        if filters.categories:
+            masks['category'] = self._category_mask(filters.categories)
+        if filters.min_price is not None or filters.max_price is not None:
+            price = self.price[:n]
+            mask = np.ones(n, np.bool_)
+            if filters.min_price is not None:
+                mask &= price >= filters.min_price
+            if filters.max_price is not None:
+                mask &= price <= filters.max_price
+            masks['price'] = mask
+        if filters.min_rating is not None:
+            masks['rating'] = self.rating[:n] >= filters.min_rating
+        if filters.in_stock:
+            masks['in_stock'] = self.stock[:n] > 0
+        return masks
+
+    def _all_but(self, base, masks, skip=None):
+        mask = base.copy()
+        for name, other in masks.items():
+            if name != skip:
+                mask &= other
+        return mask
+
+    def _facets(self, base, masks):
+        n = self.size
+        edges = np.asarray(settings.CATALOG_PRICE_BUCKETS, np.float64)
+
+        def price_buckets():
+            # Below the first edge counts nowhere (len(edges))
+            buckets = np.searchsorted(edges, self.price[:n], side='right') - 1
+            return np.where(buckets >= 0, buckets, len(edges))
+        buckets = self._cached('price', 'buckets', price_buckets)
+        price_counts = np.bincount(buckets[self._all_but(base, masks, 'price')], minlength=len(edges) + 1)
+        price = [
+            {'min': float(low), 'max': float(edges[i + 1]) if i + 1 < len(edges) else None, 'count': int(count)}
+            for i, (low, count) in enumerate(zip(edges, price_counts))
+        ]
+
+        stars = self._cached('rating', 'stars', lambda: np.clip(np.floor(self.rating[:n]), 0, 5).astype(np.int64))
+        # Thresholds are whole stars, so rating >= t is the same as floor(rating) >= t
+        at_least = np.bincount(stars[self._all_but(base, masks, 'rating')], minlength=6)[::-1].cumsum()[::-1]
+        rating = [{'min': threshold, 'count': int(at_least[threshold])} for threshold in RATING_THRESHOLDS]
+
+        in_stock = int(np.count_nonzero(self.stock[:n][self._all_but(base, masks, 'in_stock')] > 0))
+
+        # Per category: popcount of its row bitset AND the matching rows
+        counted = _pack(self._all_but(base, masks, 'category'), self.category_rows.shape[1])
+        counts = np.bitwise_count(self.category_rows & counted).sum(axis=1, dtype=np.int64)
+        categories = []
+        for category in refdata.all_categories():
+            bit = self.category_bit.get(category.category_id)
+            count = int(counts[bit]) if bit is not None else 0
+            if count:
+                categories.append({'slug': category.slug, 'name': category.name, 'count': count})
+        categories.sort(key=lambda c: -c['count'])
+
+        return {'categories': categories, 'price': price, 'rating': rating, 'in_stock': in_stock}
+
+    def query(self, filters, sort, after, limit, facets=False):
+        """One page of plant ids matching `filters` in `sort` order after the
+        keyset `after` = (cursor value, plant_id)"""
+        with self._lock:
+            n = self.size
+            base = self.live[:n].copy()
+            if filters.plant_ids is not None:
+                base &= np.isin(self.plant_id[:n], np.fromiter(filters.plant_ids, np.int64))
+            masks = self._masks(filters)
+            matched = self._all_but(base, masks)
+            total = int(np.count_nonzero(matched))
+
+            (order, sorted_key, sorted_ids), cursor_key = self._order(sort)
+            start = 0
+            if after is not None:
+                value, after_id = after
+                try:
+                    after_key = cursor_key(value)
+                except (TypeError, ValueError):
+                    raise InvalidPageRequest('Invalid cursor')
+                start = int(np.searchsorted(sorted_key, after_key, side='left'))
+                ties_end = int(np.searchsorted(sorted_key, after_key, side='right'))
+                start += int(np.searchsorted(sorted_ids[start:ties_end], after_id, side='right'))
+
+            # Walk the sorted rows from the cursor in growing chunks until
+            # the page is full, a wide filter stops after the first chunk
+            found = []
+            wanted = limit + 1
+            chunk = max(256, 4 * wanted)
+            while start < n and wanted > 0:
+                candidates = order[start:start + chunk]
+                hits = candidates[matched[candidates]][:wanted]
+                found.append(hits)
+                wanted -= len(hits)
+                start += chunk
+                chunk *= 2
+            rows = np.concatenate(found) if found else np.zeros(0, np.int64)
+            plant_ids = self.plant_id[:n]
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            next_after = None
+            if has_more:
+                last = rows[-1]
+                next_after = (self._cursor_value(sort, last), int(plant_ids[last]))
+
+            return Page(
+                [int(plant_id) for plant_id in plant_ids[rows]],
+                total,
+                has_more,
+                next_after,
+                self._facets(base, masks) if facets else None,
+            )
+
+    def _cursor_value(self, sort, row):
+        column = SORTS[sort][0]
+        if column == 'name':
+            return self.names[row]
+        if column == 'created':
+            return int(self.created[row])
+        return float(getattr(self, column)[row])
+
+
+def load_plants(cursor, plant_ids=None):
+    """(plants, {plant_id: [category_id]}) for active plants, all or
+    `plant_ids`. `cursor` is a plain oracledb cursor"""
+    where, params = '', {}
+    if plant_ids is not None:
+        where = "AND p.plant_id IN (SELECT column_value FROM TABLE(:plant_ids))"
+        params = {'plant_ids': number_list(cursor, plant_ids)}
+    cursor.arraysize = 5000
+    cursor.prefetchrows = 5000
+
+    cursor.execute(LOAD_SQL.format(where=where.replace('p.plant_id', 'plant_id')), params)
+    plants = [(int(row[0]),) + tuple(row[1:]) for row in cursor.fetchall()]
+
+    cursor.execute(CATEGORIES_SQL.format(where=where), params)
+    plant_categories = {}
+    for plant_id, category_id in cursor.fetchall():
+        plant_categories.setdefault(int(plant_id), []).append(int(category_id))
+    return plants, plant_categories
+
+
+def parse_filters(request, plant_ids=None):
+    """Filters from ?category=a,b&min_price=&max_price=&min_rating=&in_stock=1"""
+    categories = []
+    for slug in filter(None, request.GET.get('category', '').split(',')):
+        category = refdata.category_by_slug(slug.strip())
+        # An unknown slug still narrows the listing, to nothing
+        categories.append(category.category_id if category else -1)
+
+    numbers = {}
+    for name in ('min_price', 'max_price', 'min_rating'):
+        value = request.GET.get(name)
+        if value in (None, ''):
+            numbers[name] = None
+            continue
+        try:
+            numbers[name] = float(value)
+        except ValueError:
+            raise InvalidPageRequest(f'{name} must be a number')
+
+    in_stock = request.GET.get('in_stock', '').lower() in ('1', 'true', 'yes')
+    return Filters(tuple(categories), numbers['min_price'], numbers['max_price'], numbers['min_rating'],
+                   in_stock, plant_ids)
+
+
+catalog = None
+_build_lock = threading.Lock()
+_builder = None
+
+
+def mark_catalog_changed(plant_ids):
+    """Record plants whose listing columns changed so every worker reloads them"""
+    plant_ids = [int(plant_id) for plant_id in plant_ids if plant_id is not None]
+    if not plant_ids:
+        return
+    # Detail pages and batch summaries show stock too, which no other tag covers
+    invalidate(*[plant_tag(plant_id) for plant_id in plant_ids])
+    seq = changes.append(plant_ids)
+    with _build_lock:
+        if catalog is not None:
+            changes.apply(catalog, seq, plant_ids, _refresh)
+
+
+def _refresh(target, plant_ids):
+    with connection.cursor() as cursor:
+        with cursor.connection.cursor() as raw_cursor:
+            plants, plant_categories = load_plants(raw_cursor, plant_ids)
+    found = {plant[0] for plant in plants}
+    target.update(plants, plant_categories, removed=[plant_id for plant_id in plant_ids if plant_id not in found])
+
+
+def _from_snapshot():
+    """A catalog built from the shared snapshot, None when there is none"""
+    # snapshot.py reads this module's change log, so it is imported here
+    from .snapshot import get_snapshot
+
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None
+    # get_catalog() replays the log since the snapshot
+    built = ColumnarCatalog()
+    built.build_from_snapshot(snapshot)
+    built.change_seq = snapshot.change_seq
+    return built
+
+
+def _build():
+    """Build a new catalog off the request path and swap it in; changes
+    logged while it was loading are replayed on the next query"""
+    global catalog
+    try:
+        built = _from_snapshot()
+        if built is None:
+            seq = changes.current()
+            built = ColumnarCatalog()
+            with connection.cursor() as cursor:
+                with cursor.connection.cursor() as raw_cursor:
+                    built.build(*load_plants(raw_cursor))
+            built.change_seq = seq
+        with _build_lock:
+            catalog = built
+    except Exception:
+        logger.exception("Could not build the catalog")
+    finally:
+        connection.close()
+
+
+def build_in_background():
+    """Start building the catalog unless a build is already running"""
+    global _builder
+    with _build_lock:
+        if _builder is None or not _builder.is_alive():
+            _builder = threading.Thread(target=_build, name='catalog-build', daemon=True)
+            _builder.start()
+
+
+def warm_up():
+    """Load the catalog before serving: from the snapshot right away when
+    there is one, otherwise from Oracle in the background"""
+    global catalog
+    try:
+        built = _from_snapshot()
+    except Exception:
+        logger.exception("Could not load the catalog from the snapshot")
+        built = None
+    if built is None:
+        build_in_background()
+        return False
+    with _build_lock:
+        if catalog is None:
+            catalog = built
+    return True
+
+
+def get_catalog():
+    """The process-wide catalog synced with the change log, or None until
+    its first build is done"""
+    if catalog is None:
+        build_in_background()
+        return None
+
+    with _build_lock:
+        # When the log can't be replayed, start over and serve this one meanwhile
+        rebuild = not changes.replay(catalog, _refresh)
+        built = catalog
+    if rebuild:
+        build_in_background()
+    return built
@@ -0,0 +1,61 @@
+"""Change logs shared by every worker through the Django cache.
+
+The search index and the catalog each keep a copy per worker. Writers
+append the ids of the plants they changed to a log; each entry gets the
+next sequence number, and a copy remembers the last one it has applied
+(its `change_seq`). Replaying a copy applies the entries after that.
+Entries expire after a day, so a copy that falls further behind, or finds
+the sequence lower than its own after the cache was flushed, is rebuilt.
+"""
+from django.core.cache import cache
+
+ENTRY_TIMEOUT = 24 * 60 * 60
+
+
+class ChangeLog:
+
+    def __init__(self, name):
+        self.seq_key = f'{name}:seq'
+        self.entry_key = f'{name}:change:{{}}'
+
+    def current(self):
+        """The sequence number of the last entry, 0 when there is none"""
+        return cache.get(self.seq_key) or 0
+
+    def append(self, plant_ids):
+        """Log changed plants and return the entry's sequence number"""
+        cache.add(self.seq_key, 0, None)
+        seq = cache.incr(self.seq_key)
+        cache.set(self.entry_key.format(seq), plant_ids, ENTRY_TIMEOUT)
+        return seq
+
+    def since(self, seq):
+        """(current sequence number, plant ids logged after `seq`), or None
+        when part of that is no longer in the log"""
+        current = self.current()
+        if current < seq:
+            return None
+        keys = [self.entry_key.format(entry) for entry in range(seq + 1, current + 1)]
+        entries = cache.get_many(keys) if keys else {}
+        if len(entries) != len(keys):
+            return None
+        return current, {plant_id for key in keys for plant_id in entries[key]}
+
+    def apply(self, target, seq, plant_ids, refresh):
+        """Apply a writer's own entry right away when it is the next one
+        `target` needs; other workers catch up on their next replay"""
+        if seq == target.change_seq + 1:
+            refresh(target, plant_ids)
+            target.change_seq = seq
+
+    def replay(self, target, refresh):
+        """Bring `target` up to date with refresh(target, plant_ids); False
+        when it has to be rebuilt instead"""
+        changes = self.since(target.change_seq)
+        if changes is None:
+            return False
+        current, plant_ids = changes
+        if plant_ids:
+            refresh(target, plant_ids)
+        target.change_seq = current
+        return True
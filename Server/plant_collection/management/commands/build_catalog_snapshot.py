@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from plant_collection.snapshot import CatalogSnapshot, build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the active plants to a new catalog snapshot version for the workers to map"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help="Snapshot directory (default CATALOG_SNAPSHOT_DIR)")
+        parser.add_argument('--watch', type=int, default=None, metavar='SECONDS',
+                            help="Keep building a new version every SECONDS")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            try:
+                path = build_snapshot(options['dir'])
+            except Exception as e:
+                if not options['watch']:
+                    raise
+                self.stderr.write(f"Snapshot failed: {e}")
+            else:
+                snapshot = CatalogSnapshot(path)
+                self.stdout.write(
+                    f"Snapshot {snapshot.version}: {len(snapshot)} plant(s), "
+                    f"{path.stat().st_size / 1e6:.1f} MB in {(time.perf_counter() - start) * 1000:.0f} ms "
+                    f"as of change {snapshot.change_seq}"
+                )
+            if not options['watch']:
+                break
+            # Don't hold a session open between builds
+            connection.close()
+            time.sleep(options['watch'])
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,116 @@
+"""Keyset (cursor) pagination for the plant collection pages.
+
+A page is fetched with `WHERE (sort_key, plant_id) > last seen` instead of
+an offset, so every page costs the same however deep the client scrolls.
+Cursors are opaque base64 strings holding the sort name and the last row's
+sort key and plant_id.
+"""
+import base64
+import json
+from decimal import Decimal
+
+import oracledb
+from django.conf import settings
+
+# sort name -> (column in the listing query, descending)
+SORTS = {
+    'rating': ('rating_key', True),
+    'price': ('base_price', False),
+    'price_desc': ('base_price', True),
+    'name': ('name', False),
+}
+
+# Search results ranked by the in-process index
+RELEVANCE = 'relevance'
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(sort, value, plant_id):
+    if isinstance(value, (int, float, Decimal)) and sort != RELEVANCE:
+        # Numbers travel as strings so the keyset comparison stays exact
+        value = str(value)
+    raw = json.dumps({'s': sort, 'v': value, 'id': int(plant_id)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, plant_id = data['v'], int(data['id'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidPageRequest('Invalid cursor')
+    if data.get('s') != sort:
+        raise InvalidPageRequest('Cursor was issued for a different sort order')
+    if sort in SORTS and SORTS[sort][0] != 'name':
+        try:
+            value = Decimal(value)
+        except (ArithmeticError, TypeError, ValueError):
+            raise InvalidPageRequest('Invalid cursor')
+    return value, plant_id
+
+
+def page_params(request, default_sort, allowed_sorts=SORTS):
+    """(sort, limit, after) from ?sort=&limit=&cursor="""
+    sort = request.GET.get('sort') or default_sort
+    if sort not in allowed_sorts:
+        raise InvalidPageRequest(f"Invalid sort. Use one of: {', '.join(allowed_sorts)}")
+
+    try:
+        limit = int(request.GET.get('limit', settings.PLANT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPageRequest('limit must be a number')
+    if limit < 1 or limit > settings.PLANT_PAGE_SIZE_MAX:
+        raise InvalidPageRequest(f'limit must be between 1 and {settings.PLANT_PAGE_SIZE_MAX}')
+
+    cursor = request.GET.get('cursor')
+    after = decode_cursor(cursor, sort) if cursor else None
+    return sort, limit, after
+
+
+def _numbered(sql):
+    """%s placeholders as :1, :2, ... for a plain oracledb cursor"""
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f':{i}{part}' for i, part in enumerate(parts[1:], 1))
+
+
+def keyset_page(cursor, columns_sql, from_sql, params, sort, after, limit):
+    """Fetch one page (limit + 1 rows to know if there is another) of
+    `SELECT columns_sql FROM from_sql` ordered by `sort`, plant_id. Takes
+    %s placeholders with either cursor; pass a plain oracledb cursor to
+    bind collections (greencart.db.binds)"""
+    column, descending = SORTS[sort]
+    direction = 'DESC' if descending else 'ASC'
+    params = list(params)
+
+    keyset = ''
+    if after is not None:
+        value, plant_id = after
+        op = '<' if descending else '>'
+        keyset = f"WHERE ({column} {op} %s OR ({column} = %s AND plant_id > %s))"
+        params += [value, value, plant_id]
+
+    sql = f"""
+        SELECT * FROM (
+            SELECT {columns_sql}
+            FROM {from_sql}
+        ) {keyset}
+        ORDER BY {column} {direction}, plant_id
+        FETCH FIRST %s ROWS ONLY
+    """
+    if isinstance(cursor, oracledb.Cursor):
+        sql = _numbered(sql)
+    cursor.execute(sql, params + [limit + 1])
+    names = [col[0].lower() for col in cursor.description]
+    rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, last[column], last['plant_id'])
+    return rows, has_more, next_cursor
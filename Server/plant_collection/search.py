@@ -0,0 +1,367 @@
+"""In-process full-text index used by search_plants.
+
+Plants are indexed on name, description, features, care tips and category
+names. Queries are ranked with BM25; query words that aren't in the
+vocabulary are expanded to known words sharing a prefix or enough trigrams,
+so "monstra" still finds "monstera".
+
+Postings are kept in flat arrays (internal doc number + weighted term
+frequency); a million synthetic plants take about 500 MB. Updating a plant
+gives it a new doc number and tombstones the old one; the index compacts
+itself once too many doc numbers are dead.
+
+Every worker keeps its own copy, built by a background thread (started at
+startup by the WSGI/ASGI warm-up, or by the first search); until it is
+ready searches match in SQL. Writers call mark_plants_changed(), which
+appends the ids to a change log in the shared Django cache; each worker
+replays the log before answering a query.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+from array import array
+from collections import Counter, defaultdict
+
+from django.db import connection
+
+from .catalog import mark_catalog_changed
+from .changelog import ChangeLog
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Weight of a word depending on the field it appears in
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'categories': 2.0,
+    'features': 1.0,
+    'care_tips': 1.0,
+    'description': 1.0,
+}
+
+K1 = 1.2
+B = 0.75
+
+# Typo tolerance
+MIN_SIMILARITY = 0.45
+MAX_EXPANSIONS = 3
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.7
+
+# Rebuild postings once this share of doc numbers is dead
+COMPACT_RATIO = 0.25
+
+changes = ChangeLog('search')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PlantSearchIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self.change_seq = 0
+
+    def _reset(self):
+        self.term_ids = {}           # term -> term id
+        self.terms = []              # term id -> term
+        self.postings = []           # term id -> (array of docnos, array of weights)
+        self.trigram_terms = defaultdict(set)
+        self.doc_plant = array('i')  # docno -> plant_id
+        self.doc_length = array('f')
+        self.doc_live = bytearray()
+        self.plant_doc = {}          # plant_id -> live docno
+        self.total_length = 0.0
+        self.dead_docs = 0
+
+    def __len__(self):
+        return len(self.plant_doc)
+
+    # Building
+
+    def _term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.term_ids[term] = term_id
+            self.terms.append(term)
+            self.postings.append((array('i'), array('f')))
+            for gram in trigrams(term):
+                self.trigram_terms[gram].add(term_id)
+        return term_id
+
+    def _weighted_terms(self, document):
+        counts = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            value = document.get(field)
+            if isinstance(value, (list, tuple)):
+                value = ' '.join(str(v) for v in value if v)
+            for token in tokenize(value):
+                counts[token] += weight
+        return counts
+
+    def _add(self, plant_id, document):
+        counts = self._weighted_terms(document)
+        docno = len(self.doc_plant)
+        length = sum(counts.values())
+        self.doc_plant.append(plant_id)
+        self.doc_length.append(length)
+        self.doc_live.append(1)
+        self.plant_doc[plant_id] = docno
+        self.total_length += length
+        for term, weight in counts.items():
+            docs, weights = self.postings[self._term_id(term)]
+            docs.append(docno)
+            weights.append(weight)
+
+    def _remove(self, plant_id):
+        docno = self.plant_doc.pop(plant_id, None)
+        if docno is None:
+            return
+        self.doc_live[docno] = 0
+        self.total_length -= self.doc_length[docno]
+        self.dead_docs += 1
+
+    def build(self, documents):
+        """Replace the index with `documents`, an iterable of (plant_id, doc)"""
+        with self._lock:
+            self._reset()
+            for plant_id, document in documents:
+                self._add(plant_id, document)
+
+    def update(self, documents, removed=()):
+        """Re-index changed plants and drop removed ones"""
+        with self._lock:
+            for plant_id in removed:
+                self._remove(plant_id)
+            for plant_id, document in documents:
+                self._remove(plant_id)
+                self._add(plant_id, document)
+            if self.dead_docs > COMPACT_RATIO * len(self.doc_plant):
+                self._compact()
+
+    def _compact(self):
+        remap = array('i', [-1]) * len(self.doc_plant)
+        doc_plant = array('i')
+        doc_length = array('f')
+        for docno, live in enumerate(self.doc_live):
+            if live:
+                remap[docno] = len(doc_plant)
+                doc_plant.append(self.doc_plant[docno])
+                doc_length.append(self.doc_length[docno])
+
+        for term_id, (docs, weights) in enumerate(self.postings):
+            new_docs, new_weights = array('i'), array('f')
+            for docno, weight in zip(docs, weights):
+                if remap[docno] >= 0:
+                    new_docs.append(remap[docno])
+                    new_weights.append(weight)
+            self.postings[term_id] = (new_docs, new_weights)
+
+        self.doc_plant = doc_plant
+        self.doc_length = doc_length
+        self.doc_live = bytearray([1]) * len(doc_plant)
+        self.plant_doc = {plant_id: docno for docno, plant_id in enumerate(doc_plant)}
+        self.dead_docs = 0
+
+    # Querying
+
+    def _expand(self, token):
+        """(term_id, weight) pairs a query token should match"""
+        term_id = self.term_ids.get(token)
+        if term_id is not None:
+            return [(term_id, 1.0)]
+
+        grams = trigrams(token)
+        shared = Counter()
+        for gram in grams:
+            for candidate in self.trigram_terms.get(gram, ()):
+                shared[candidate] += 1
+
+        matches = []
+        for candidate, common in shared.items():
+            term = self.terms[candidate]
+            if len(token) >= 3 and term.startswith(token):
+                matches.append((candidate, PREFIX_WEIGHT))
+                continue
+            similarity = common / (len(grams) + len(trigrams(term)) - common)
+            if similarity >= MIN_SIMILARITY:
+                matches.append((candidate, FUZZY_WEIGHT * similarity))
+        return heapq.nlargest(MAX_EXPANSIONS, matches, key=lambda match: match[1])
+
+    def search(self, query, top_k=50, after=None):
+        """Return [(plant_id, score)] for the best `top_k` matches, ordered by
+        score then plant_id. `after` is the (score, plant_id) of the last hit
+        of the previous page."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            live_docs = len(self.plant_doc)
+            if not live_docs:
+                return []
+            avg_length = self.total_length / live_docs
+            scores = defaultdict(float)
+
+            for token in set(tokens):
+                for term_id, query_weight in self._expand(token):
+                    docs, weights = self.postings[term_id]
+                    df = len(docs)
+                    if not df:
+                        continue
+                    idf = math.log(1 + (live_docs - df + 0.5) / (df + 0.5))
+                    doc_live = self.doc_live
+                    doc_length = self.doc_length
+                    for docno, tf in zip(docs, weights):
+                        if not doc_live[docno]:
+                            continue
+                        norm = K1 * (1 - B + B * doc_length[docno] / avg_length)
+                        scores[docno] += query_weight * idf * tf * (K1 + 1) / (tf + norm)
+
+            hits = ((self.doc_plant[docno], score) for docno, score in scores.items())
+            if after is not None:
+                after_score, after_id = after
+                hits = (
+                    (plant_id, score) for plant_id, score in hits
+                    if score < after_score or (score == after_score and plant_id > after_id)
+                )
+            return heapq.nlargest(top_k, hits, key=lambda hit: (hit[1], -hit[0]))
+
+
+def load_documents(cursor, plant_ids=None):
+    """Yield (plant_id, document) for active plants, all of them or `plant_ids`"""
+    if plant_ids is not None:
+        plant_ids = [int(plant_id) for plant_id in plant_ids]
+        if not plant_ids:
+            return
+        # Oracle allows at most 1000 expressions in an IN list
+        for start in range(0, len(plant_ids), 1000):
+            yield from _load_documents(cursor, plant_ids[start:start + 1000])
+    else:
+        yield from _load_documents(cursor, None)
+
+
+def _plant_filter(column, plant_ids):
+    if not plant_ids:
+        return ''
+    return f"AND {column} IN ({','.join(['%s'] * len(plant_ids))})"
+
+
+def _load_documents(cursor, plant_ids):
+    params = list(plant_ids or [])
+    where = _plant_filter('plant_id', plant_ids)
+
+    documents = {}
+    cursor.execute(f"""
+        SELECT plant_id, name, DBMS_LOB.SUBSTR(description, 4000, 1)
+        FROM plants
+        WHERE is_active = 1 {where}
+    """, params)
+    for plant_id, name, description in cursor.fetchall():
+        documents[plant_id] = {
+            'name': name,
+            'description': description,
+            'categories': [],
+            'features': [],
+            'care_tips': [],
+        }
+
+    children = [
+        ('categories', f"""
+            SELECT pcm.plant_id, pc.name
+            FROM plant_category_mapping pcm
+            JOIN plant_categories pc ON pcm.category_id = pc.category_id
+            WHERE 1 = 1 {_plant_filter('pcm.plant_id', plant_ids)}
+        """),
+        ('features', f"SELECT plant_id, feature_text FROM plant_features WHERE 1 = 1 {where}"),
+        ('care_tips', f"SELECT plant_id, tip_text FROM plant_care_tips WHERE 1 = 1 {where}"),
+    ]
+    for field, sql in children:
+        cursor.execute(sql, params)
+        for plant_id, text in cursor.fetchall():
+            if plant_id in documents:
+                documents[plant_id][field].append(text)
+
+    yield from documents.items()
+
+
+search_index = None
+_build_lock = threading.Lock()
+_builder = None
+
+
+def mark_plants_changed(plant_ids):
+    """Record changed plants so every worker re-indexes them (and the
+    catalog reloads them)"""
+    plant_ids = [int(plant_id) for plant_id in plant_ids if plant_id is not None]
+    if not plant_ids:
+        return
+    mark_catalog_changed(plant_ids)
+    seq = changes.append(plant_ids)
+    with _build_lock:
+        if search_index is not None:
+            changes.apply(search_index, seq, plant_ids, _refresh)
+
+
+def _refresh(index, plant_ids):
+    with connection.cursor() as cursor:
+        documents = list(load_documents(cursor, plant_ids))
+    found = {plant_id for plant_id, _ in documents}
+    index.update(documents, removed=[plant_id for plant_id in plant_ids if plant_id not in found])
+
+
+def _build():
+    """Build a new index off the request path and swap it in; changes
+    logged while it was loading are replayed on the next query"""
+    global search_index
+    try:
+        seq = changes.current()
+        index = PlantSearchIndex()
+        with connection.cursor() as cursor:
+            index.build(load_documents(cursor))
+        index.change_seq = seq
+        with _build_lock:
+            search_index = index
+    except Exception:
+        logger.exception("Could not build the search index")
+    finally:
+        connection.close()
+
+
+def build_in_background():
+    """Start building the index unless a build is already running"""
+    global _builder
+    with _build_lock:
+        if _builder is None or not _builder.is_alive():
+            _builder = threading.Thread(target=_build, name='search-index-build', daemon=True)
+            _builder.start()
+
+
+def get_search_index():
+    """The process-wide index synced with the change log, or None until its
+    first build is done; callers then match in SQL instead"""
+    if search_index is None:
+        build_in_background()
+        return None
+
+    with _build_lock:
+        index = search_index
+        # When the log can't be replayed, start over and serve this one meanwhile
+        rebuild = not changes.replay(index, _refresh)
+    if rebuild:
+        build_in_background()
+    return index
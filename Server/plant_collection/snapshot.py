@@ -0,0 +1,451 @@
+"""Catalog snapshot shared by all workers on a node through one mapped file.
+
+Every worker used to load the catalog from Oracle when it started and keep
+its own copy. `manage.py build_catalog_snapshot` writes the active plants
+once instead, as a versioned file under CATALOG_SNAPSHOT_DIR:
+
+  * fixed-width arrays, one row per plant sorted by plant_id: price, stock,
+    rating aggregates, created_at, seller; images, sizes and category ids
+    as per-plant start offsets into arrays of their own; the categories;
+  * a string heap holding the UTF-8 bytes of names, descriptions, image
+    URLs and size names, each referenced by an (offset, length) pair.
+
+Workers map the file read-only and use the arrays in place. No copy is
+made, so all of them share the same pages of the OS page cache. The builder
+writes a new file and then repoints the CURRENT file at it, both with
+os.replace(), and workers look at CURRENT every CHECK_SECONDS and swap to
+the new version. A worker therefore never sees a half-written file.
+
+What stays per worker: the columnar catalog (catalog.py) keeps the
+numeric columns as views of the mapping and copies a column only when a
+logged change first writes to it, but plant names, category bitsets, sort
+orders and the plant_id -> row map are built in each worker's memory. The
+search index (search.py) isn't in the snapshot at all; every worker still
+builds it from Oracle, in the background.
+
+A snapshot is as of the catalog change log (catalog.changes) when
+its build started. Plants logged after that are stale, and their rows come
+from Oracle as before. If part of the log since the snapshot has expired,
+the snapshot is not used until a newer one is built.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .catalog import _micros, changes
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GCSNAP01'
+PREAMBLE = struct.Struct('<8sQ')    # magic, length of the JSON header after it
+ALIGN = 64                          # every array starts on a cache line
+CURRENT = 'CURRENT'                 # names the snapshot file workers should map
+KEEP_VERSIONS = 3
+
+# How often a worker looks at CURRENT
+CHECK_SECONDS = 2
+
+PLANTS_SQL = """
+    SELECT plant_id, name, DBMS_LOB.SUBSTR(description, 4000, 1), base_price, stock_quantity,
+           avg_rating, review_count, rating_1_count, rating_2_count, rating_3_count,
+           rating_4_count, rating_5_count, created_at, seller_id
+    FROM plants
+    WHERE is_active = 1
+    ORDER BY plant_id
+"""
+
+IMAGES_SQL = """
+    SELECT pi.plant_id, pi.image_url, pi.is_primary
+    FROM plant_images pi
+    JOIN plants p ON pi.plant_id = p.plant_id
+    WHERE p.is_active = 1
+    ORDER BY pi.plant_id, pi.image_id
+"""
+
+SIZES_SQL = """
+    SELECT ps.plant_id, ps.size_id, ps.size_name, ps.price_adjustment
+    FROM plant_sizes ps
+    JOIN plants p ON ps.plant_id = p.plant_id
+    WHERE p.is_active = 1
+    ORDER BY ps.plant_id, ps.size_id
+"""
+
+MAPPINGS_SQL = """
+    SELECT pcm.plant_id, pcm.category_id
+    FROM plant_category_mapping pcm
+    JOIN plants p ON pcm.plant_id = p.plant_id
+    WHERE p.is_active = 1
+    ORDER BY pcm.plant_id, pcm.category_id
+"""
+
+# plant_count as get_top_4_categories counts it
+CATEGORIES_SQL = """
+    SELECT pc.category_id, pc.name, pc.slug, pc.image_url, COUNT(pcm.plant_id)
+    FROM plant_categories pc
+    LEFT JOIN plant_category_mapping pcm ON pc.category_id = pcm.category_id
+    GROUP BY pc.category_id, pc.name, pc.slug, pc.image_url
+    ORDER BY pc.category_id
+"""
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def _number(value):
+    """A float column as the Decimal Oracle returns for a NUMBER(p, s)"""
+    value = float(value)
+    return Decimal(int(value)) if value.is_integer() else Decimal(repr(value))
+
+
+class _Heap:
+    """UTF-8 strings appended to one byte array, each stored once"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._refs = {}
+
+    def add(self, text):
+        """(offset, length) of `text`, (-1, 0) for None"""
+        if text is None:
+            return (-1, 0)
+        ref = self._refs.get(text)
+        if ref is None:
+            encoded = text.encode()
+            ref = self._refs[text] = (len(self.data), len(encoded))
+            self.data += encoded
+        return ref
+
+    def refs(self, texts):
+        return np.array([self.add(text) for text in texts], np.int64).reshape(-1, 2)
+
+
+def _children(plant_id, rows):
+    """Rows of a child table (plant_id first, in plant_id order) that belong
+    to a plant in the snapshot, and their start offsets per plant"""
+    ids = np.fromiter((int(row[0]) for row in rows), np.int64, len(rows))
+    at = np.minimum(np.searchsorted(plant_id, ids), max(len(plant_id) - 1, 0))
+    # A plant added or retired while the snapshot was loading may have children but no row
+    keep = plant_id[at] == ids if len(plant_id) else np.zeros(len(ids), np.bool_)
+    starts = np.zeros(len(plant_id) + 1, np.int64)
+    np.cumsum(np.bincount(at[keep], minlength=len(plant_id)), out=starts[1:])
+    return [row for row, kept in zip(rows, keep) if kept], starts
+
+
+def build_sections(plants, images, sizes, mappings, categories):
+    """Snapshot arrays from PLANTS_SQL, IMAGES_SQL, SIZES_SQL, MAPPINGS_SQL
+    and CATEGORIES_SQL rows, {name: array}"""
+    heap = _Heap()
+    n = len(plants)
+    plant_id = np.fromiter((int(p[0]) for p in plants), np.int64, n)
+    rating = np.fromiter((float(p[5] or 0) for p in plants), np.float64, n)
+    reviews = np.fromiter((int(p[6] or 0) for p in plants), np.int64, n)
+    sections = {
+        'plant_id': plant_id,
+        'price': np.fromiter((float(p[3] or 0) for p in plants), np.float64, n),
+        'stock': np.fromiter((int(p[4] or 0) for p in plants), np.int64, n),
+        'rating': rating,
+        'reviews': reviews,
+        'histogram': np.array([[int(count or 0) for count in p[7:12]] for p in plants], np.int64).reshape(n, 5),
+        'created': np.fromiter((_micros(p[12]) for p in plants), np.int64, n),
+        'seller_id': np.fromiter((-1 if p[13] is None else int(p[13]) for p in plants), np.int64, n),
+        'name': heap.refs(p[1] for p in plants),
+        'description': heap.refs(p[2] for p in plants),
+        # Best rated first, as get_top_4_plants orders them
+        'rating_order': np.lexsort((plant_id, -reviews, -rating)),
+    }
+
+    images, sections['image_start'] = _children(plant_id, images)
+    sections['image_url'] = heap.refs(image[1] for image in images)
+    sections['image_primary'] = np.fromiter((bool(image[2]) for image in images), np.bool_, len(images))
+
+    sizes, sections['size_start'] = _children(plant_id, sizes)
+    sections['size_id'] = np.fromiter((int(size[1]) for size in sizes), np.int64, len(sizes))
+    sections['size_name'] = heap.refs(size[2] for size in sizes)
+    sections['size_price'] = np.fromiter((float(size[3] or 0) for size in sizes), np.float64, len(sizes))
+
+    mappings, sections['category_start'] = _children(plant_id, mappings)
+    sections['category_id'] = np.fromiter((int(m[1]) for m in mappings), np.int64, len(mappings))
+
+    sections['category_table_id'] = np.fromiter((int(c[0]) for c in categories), np.int64, len(categories))
+    sections['category_table_name'] = heap.refs(c[1] for c in categories)
+    sections['category_table_slug'] = heap.refs(c[2] for c in categories)
+    sections['category_table_image_url'] = heap.refs(c[3] for c in categories)
+    sections['category_table_plant_count'] = np.fromiter((int(c[4] or 0) for c in categories), np.int64,
+                                                         len(categories))
+
+    sections['heap'] = np.frombuffer(bytes(heap.data), np.uint8)
+    return sections
+
+
+def load_sections(cursor):
+    """Snapshot arrays for the active plants. `cursor` is a plain oracledb cursor"""
+    cursor.arraysize = 5000
+    cursor.prefetchrows = 5000
+    rows = []
+    for sql in (PLANTS_SQL, IMAGES_SQL, SIZES_SQL, MAPPINGS_SQL, CATEGORIES_SQL):
+        cursor.execute(sql)
+        rows.append(cursor.fetchall())
+    return build_sections(*rows)
+
+
+def _write_text(path, text):
+    partial = path.with_name(f'{path.name}.{os.getpid()}.part')
+    partial.write_text(text)
+    os.replace(partial, path)
+
+
+def _current_name(directory):
+    try:
+        return (Path(directory) / CURRENT).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _version(name):
+    # catalog-<version>.snap
+    return int(name[len('catalog-'):-len('.snap')])
+
+
+def write_snapshot(directory, sections, change_seq):
+    """Write `sections` as the next version under `directory` and point
+    CURRENT at it. Returns the new file's path"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    current = _current_name(directory)
+    version = max(int(time.time() * 1000), _version(current) + 1 if current else 0)
+
+    layout, end = {}, 0
+    for name, array in sections.items():
+        array = sections[name] = np.ascontiguousarray(array)
+        layout[name] = [array.dtype.str, end, list(array.shape)]
+        end = _aligned(end + array.nbytes)
+    header = json.dumps({
+        'version': version,
+        'change_seq': change_seq,
+        'built_at': time.time(),
+        'sections': layout,
+    }).encode()
+    start = _aligned(PREAMBLE.size + len(header))
+
+    path = directory / f'catalog-{version}.snap'
+    partial = path.with_name(f'{path.name}.{os.getpid()}.part')
+    with open(partial, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, array in sections.items():
+            f.seek(start + layout[name][1])
+            f.write(array.data)
+        f.truncate(start + end)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    _write_text(directory / CURRENT, path.name)
+
+    # Workers still mapping an older file keep it readable after the unlink
+    for old in sorted(directory.glob('catalog-*.snap'), key=lambda p: _version(p.name))[:-KEEP_VERSIONS]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def build_snapshot(directory=None):
+    """Load the active plants from Oracle and write them as a new version"""
+    # Taken first, so plants changed while we load count as stale
+    change_seq = changes.current()
+    with connection.cursor() as cursor:
+        with cursor.connection.cursor() as raw_cursor:
+            sections = load_sections(raw_cursor)
+    return write_snapshot(directory or settings.CATALOG_SNAPSHOT_DIR, sections, change_seq)
+
+
+class CatalogSnapshot:
+    """One mapped snapshot file; every section is a read-only array viewing the mapping"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PREAMBLE.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header = json.loads(self._map[PREAMBLE.size:PREAMBLE.size + header_length])
+        self.version = header['version']
+        self.change_seq = header['change_seq']
+        self.built_at = header['built_at']
+        start = _aligned(PREAMBLE.size + header_length)
+        for name, (dtype, offset, shape) in header['sections'].items():
+            count = int(np.prod(shape))
+            setattr(self, name, np.frombuffer(self._map, np.dtype(dtype), count, start + offset).reshape(shape))
+        # Plants changed since change_seq, kept up to date by SnapshotReader
+        self.stale = frozenset()
+
+    def __len__(self):
+        return len(self.plant_id)
+
+    def row(self, plant_id):
+        """Row of a plant, None if it wasn't active when the snapshot was built"""
+        row = int(np.searchsorted(self.plant_id, plant_id))
+        if row < len(self.plant_id) and self.plant_id[row] == plant_id:
+            return row
+        return None
+
+    def text(self, ref):
+        offset, length = int(ref[0]), int(ref[1])
+        if offset < 0:
+            return None
+        return self.heap[offset:offset + length].tobytes().decode()
+
+    def texts(self, refs):
+        return [self.text(ref) for ref in refs]
+
+    @staticmethod
+    def _span(starts, row):
+        return slice(int(starts[row]), int(starts[row + 1]))
+
+    def primary_image(self, row):
+        span = self._span(self.image_start, row)
+        primary = np.flatnonzero(self.image_primary[span])
+        return self.text(self.image_url[span.start + primary[0]]) if len(primary) else None
+
+    def image_urls(self, row):
+        """Image URLs of the plant, primary first"""
+        span = self._span(self.image_start, row)
+        primary, refs = self.image_primary[span], self.image_url[span]
+        return self.texts(refs[primary]) + self.texts(refs[~primary])
+
+    def plant_row(self, row):
+        """The plant as a plant_collection listing row (PLANT_LIST_COLUMNS)"""
+        urls = self.texts(self.image_url[self._span(self.image_start, row)])
+        return {
+            'plant_id': int(self.plant_id[row]),
+            'name': self.text(self.name[row]),
+            'description': self.text(self.description[row]),
+            'base_price': _number(self.price[row]),
+            'stock_quantity': int(self.stock[row]),
+            'primary_image': self.primary_image(row),
+            'avg_rating': _number(self.rating[row]),
+            'review_count': int(self.reviews[row]),
+            'all_images': ','.join(urls) if urls else None,
+        }
+
+    def plant_detail(self, row):
+        """The plant, its images and sizes, shaped like the plant detail page"""
+        span = self._span(self.size_start, row)
+        return {
+            'plant_id': int(self.plant_id[row]),
+            'name': self.text(self.name[row]),
+            'description': self.text(self.description[row]),
+            'base_price': float(self.price[row]),
+            'stock_quantity': int(self.stock[row]),
+            'primary_image': self.primary_image(row),
+            'avg_rating': float(self.rating[row]),
+            'review_count': int(self.reviews[row]),
+            'rating_histogram': {str(stars): int(count) for stars, count in enumerate(self.histogram[row], 1)},
+            'image_urls': self.image_urls(row),
+            'sizes': [
+                {'size_id': int(size_id), 'size_name': self.text(name), 'price_adjustment': float(adjustment)}
+                for size_id, name, adjustment in zip(self.size_id[span], self.size_name[span], self.size_price[span])
+            ],
+        }
+
+    def top_plants(self, count):
+        """Best rated plants, rows like get_top_4_plants returns. None when
+        one of them changed since the snapshot (it may have been re-rated or
+        deactivated), the list then has to come from Oracle"""
+        rows = self.rating_order[:count]
+        if any(int(self.plant_id[row]) in self.stale for row in rows):
+            return None
+        return [{
+            'plant_id': int(self.plant_id[row]),
+            'name': self.text(self.name[row]),
+            'base_price': _number(self.price[row]),
+            'primary_image': self.primary_image(row),
+            'avg_rating': _number(self.rating[row]),
+            'review_count': int(self.reviews[row]),
+        } for row in rows]
+
+    def top_categories(self, count):
+        """Categories with the most plants, like get_top_4_categories"""
+        order = np.argsort(-self.category_table_plant_count, kind='stable')[:count]
+        return [{
+            'category_id': int(self.category_table_id[i]),
+            'name': self.text(self.category_table_name[i]),
+            'slug': self.text(self.category_table_slug[i]),
+            'image_url': self.text(self.category_table_image_url[i]),
+            'plant_count': int(self.category_table_plant_count[i]),
+        } for i in order]
+
+
+class SnapshotReader:
+    """This worker's current snapshot, swapped when a new version is built"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._usable = False
+        self._checked_at = None
+        self._seq = 0
+        self._stale = set()
+
+    def _swap(self, directory):
+        name = _current_name(directory)
+        if name is None or (self._snapshot is not None and self._snapshot.path.name == name):
+            return
+        try:
+            snapshot = CatalogSnapshot(Path(directory) / name)
+        except (OSError, ValueError):
+            logger.exception("Catalog snapshot %s could not be mapped", name)
+            return
+        # The old mapping is unmapped once the last view of it is gone
+        self._snapshot, self._usable = snapshot, True
+        self._seq, self._stale = snapshot.change_seq, set()
+
+    def _catch_up(self):
+        logged = changes.since(self._seq)
+        if logged is None:
+            # Shared cache flushed or part of the log expired: can't tell what changed
+            self._usable = False
+            return
+        self._seq, plant_ids = logged
+        if plant_ids - self._stale:
+            self._stale.update(plant_ids)
+            self._snapshot.stale = frozenset(self._stale)
+
+    def get(self, max_age=None):
+        directory = settings.CATALOG_SNAPSHOT_DIR
+        if not directory:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= CHECK_SECONDS:
+                self._checked_at = now
+                self._swap(directory)
+            if self._snapshot is None or not self._usable:
+                return None
+            self._catch_up()
+            if not self._usable:
+                return None
+            snapshot = self._snapshot
+        if max_age is not None and time.time() - snapshot.built_at > max_age:
+            return None
+        return snapshot
+
+
+snapshots = SnapshotReader()
+
+
+def get_snapshot(max_age=None):
+    """The current snapshot, None when there is none the change log still
+    covers or it is older than `max_age` seconds. Rows of plants in its
+    `stale` set must come from Oracle"""
+    return snapshots.get(max_age)
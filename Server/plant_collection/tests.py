@@ -1,3 +1,344 @@
-from django.test import TestCase
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from greencart.refdata import Category
+from .catalog import ColumnarCatalog, Filters, changes
+from .pagination import (RELEVANCE, InvalidPageRequest, _numbered, decode_cursor, encode_cursor, keyset_page,
+                         page_params)
+from .search import PREFIX_WEIGHT, PlantSearchIndex, tokenize, trigrams
+from .snapshot import CURRENT, KEEP_VERSIONS, CatalogSnapshot, SnapshotReader, build_sections, write_snapshot
+
+
+def search_index(documents):
+    index = PlantSearchIndex()
+    index.build(documents.items())
+    return index
+
+
+class PlantSearchIndexTests(SimpleTestCase):
+
+    DOCUMENTS = {
+        1: {'name': 'Monstera Deliciosa', 'description': 'Large split leaves', 'categories': ['Indoor']},
+        2: {'name': 'Snake Plant', 'description': 'Hardy indoor plant, survives low light'},
+        3: {'name': 'Peace Lily', 'description': 'Likes low light', 'care_tips': 'Keep the soil moist'},
+        4: {'name': 'Fiddle Leaf Fig', 'description': 'A monstera lookalike for bright rooms'},
+    }
+
+    def ids(self, hits):
+        return [plant_id for plant_id, _ in hits]
+
+    def test_tokens_and_trigrams(self):
+        self.assertEqual(tokenize("Peace-Lily, 2 pots!"), ['peace', 'lily', '2', 'pots'])
+        self.assertEqual(trigrams('fig'), {'  f', ' fi', 'fig', 'ig '})
+
+    def test_a_match_in_the_name_outranks_one_in_the_description(self):
+        index = search_index(self.DOCUMENTS)
+
+        self.assertEqual(self.ids(index.search('monstera')), [1, 4])
+
+    def test_rarer_words_weigh_more(self):
+        index = search_index(self.DOCUMENTS)
+
+        # "light" is in two plants, "moist" in one
+        hits = dict(index.search('light moist'))
+        self.assertGreater(hits[3], hits[2])
+
+    def test_ties_go_to_the_lower_plant_id_and_pages_continue_after_the_last_hit(self):
+        index = search_index({plant_id: {'name': 'Cactus'} for plant_id in (7, 3, 5)})
+
+        first = index.search('cactus', top_k=2)
+        self.assertEqual(self.ids(first), [3, 5])
+        self.assertEqual(self.ids(index.search('cactus', top_k=2, after=(first[-1][1], first[-1][0]))), [7])
+
+    def test_unknown_words_expand_to_prefixes_and_close_spellings(self):
+        index = search_index(self.DOCUMENTS)
+
+        self.assertEqual(index._expand('monst'), [(index.term_ids['monstera'], PREFIX_WEIGHT)])
+        self.assertEqual(self.ids(index.search('monstra')), [1, 4])
+        self.assertEqual(self.ids(index.search('fidle')), [4])
+        self.assertEqual(index.search('xyz'), [])
+
+    def test_an_exact_word_is_not_expanded(self):
+        index = search_index(self.DOCUMENTS)
+
+        self.assertEqual(index._expand('plant'), [(index.term_ids['plant'], 1.0)])
+
+    def test_updates_replace_and_remove_plants(self):
+        index = search_index(self.DOCUMENTS)
+        index.update([(2, {'name': 'Monstera Adansonii'})], removed=[4])
+
+        # The shorter name ranks first
+        self.assertEqual(self.ids(index.search('monstera')), [2, 1])
+        self.assertEqual(index.search('snake'), [])
+        self.assertEqual(len(index), 3)
+
+    def test_compacting_keeps_the_results(self):
+        index = search_index(self.DOCUMENTS)
+        before = index.search('light')
+        index.update([], removed=[1, 4])
+
+        # Half the doc numbers are dead, past COMPACT_RATIO
+        self.assertEqual(len(index.doc_plant), 2)
+        self.assertEqual(self.ids(index.search('light')), self.ids(before))
+
+
+class PageCursor:
+    """Returns the given listing rows (plant_id, base_price)"""
+
+    description = [('PLANT_ID',), ('BASE_PRICE',)]
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = None
+
+    def execute(self, sql, params):
+        self.executed = (sql, params)
+
+    def fetchall(self):
+        return self.rows
+
+
+class PaginationTests(SimpleTestCase):
+
+    def test_cursors_round_trip_with_exact_numbers(self):
+        cursor = encode_cursor('price', Decimal('19.90'), 42)
+
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor, 'price'), (Decimal('19.90'), 42))
+        self.assertEqual(decode_cursor(encode_cursor('name', 'Aloe', 7), 'name'), ('Aloe', 7))
+        self.assertEqual(decode_cursor(encode_cursor(RELEVANCE, 3.25, 7), RELEVANCE), (3.25, 7))
+
+    def test_a_cursor_only_works_for_its_own_sort(self):
+        with self.assertRaisesMessage(InvalidPageRequest, 'different sort order'):
+            decode_cursor(encode_cursor('price', 10, 1), 'rating')
+
+    def test_garbage_cursors_are_rejected(self):
+        for cursor in ('not base64!', 'e30', encode_cursor('price', 'cheap', 1)):
+            with self.assertRaises(InvalidPageRequest):
+                decode_cursor(cursor, 'price')
+
+    @override_settings(PLANT_PAGE_SIZE=24, PLANT_PAGE_SIZE_MAX=100)
+    def test_page_params(self):
+        def params(**query):
+            return page_params(RequestFactory().get('/plants/', query), 'rating')
+
+        self.assertEqual(params(), ('rating', 24, None))
+        self.assertEqual(params(sort='name', limit='5', cursor=encode_cursor('name', 'Fern', 3)),
+                         ('name', 5, ('Fern', 3)))
+        for query in ({'sort': 'random'}, {'limit': '0'}, {'limit': '101'}, {'limit': 'ten'}):
+            with self.assertRaises(InvalidPageRequest):
+                params(**query)
+
+    def test_placeholders_are_numbered_for_oracledb(self):
+        self.assertEqual(_numbered("a = %s AND b IN (%s)"), "a = :1 AND b IN (:2)")
+
+    def test_keyset_page_fetches_one_extra_row_to_know_there_is_more(self):
+        cursor = PageCursor([(4, Decimal('5.00')), (9, Decimal('5.00')), (2, Decimal('6.50'))])
+
+        rows, has_more, next_cursor = keyset_page(
+            cursor, 'plant_id, base_price', 'plants', [], 'price', (Decimal('4.00'), 11), 2)
+
+        self.assertEqual([row['plant_id'] for row in rows], [4, 9])
+        self.assertTrue(has_more)
+        self.assertEqual(decode_cursor(next_cursor, 'price'), (Decimal('5.00'), 9))
+        sql, params = cursor.executed
+        self.assertIn('base_price > %s OR (base_price = %s AND plant_id > %s)', sql)
+        self.assertEqual(params, [Decimal('4.00'), Decimal('4.00'), 11, 3])
+
+
+CREATED = datetime(2025, 1, 1)
+CATEGORIES = [Category(1, 'Indoor', 'indoor', None, None), Category(2, 'Succulents', 'succulents', None, None)]
+
+
+def plant(plant_id, price, stock=5, rating=0, name=None):
+    # LOAD_SQL row
+    return (plant_id, name or f'Plant {plant_id:03d}', price, stock, rating, 0,
+            CREATED + timedelta(days=plant_id))
+
+
+def columnar_catalog(plants, plant_categories):
+    catalog = ColumnarCatalog()
+    catalog.build(plants, plant_categories)
+    return catalog
+
+
+@override_settings(CATALOG_PRICE_BUCKETS=[0, 10, 25])
+class ColumnarCatalogTests(SimpleTestCase):
+
+    def setUp(self):
+        # 150 plants so the category bitsets span three words; every third
+        # one is indoor, every fifth a succulent, every seventh out of stock
+        self.plants = [plant(plant_id, plant_id % 30, stock=0 if plant_id % 7 == 0 else 5, rating=plant_id % 5)
+                       for plant_id in range(1, 151)]
+        self.plant_categories = {}
+        for plant_id in range(1, 151):
+            ids = [category_id for category_id, every in ((1, 3), (2, 5)) if plant_id % every == 0]
+            if ids:
+                self.plant_categories[plant_id] = ids
+        self.catalog = columnar_catalog(self.plants, self.plant_categories)
+
+    def matching(self, check):
+        return sorted(p[0] for p in self.plants if check(p[0], p[2], p[3], p[4]))
+
+    def query_all(self, filters, sort='price'):
+        return sorted(self.catalog.query(filters, sort, None, 1000).plant_ids)
+
+    def test_category_filters_match_any_of_the_categories(self):
+        self.assertEqual(self.query_all(Filters(categories=(1,))), self.matching(lambda i, *_: i % 3 == 0))
+        self.assertEqual(self.query_all(Filters(categories=(1, 2))),
+                         self.matching(lambda i, *_: i % 3 == 0 or i % 5 == 0))
+        self.assertEqual(self.query_all(Filters(categories=(99,))), [])
+
+    def test_filters_combine(self):
+        filters = Filters(categories=(2,), min_price=10, max_price=20, min_rating=2, in_stock=True)
+
+        self.assertEqual(self.query_all(filters), self.matching(
+            lambda i, price, stock, rating: i % 5 == 0 and 10 <= price <= 20 and rating >= 2 and stock > 0))
+        self.assertEqual(self.query_all(Filters(plant_ids={3, 4, 6}, categories=(1,))), [3, 6])
+
+    def test_keyset_pages_walk_the_whole_sort_order(self):
+        for sort in ('price', 'price_desc', 'rating', 'name', 'newest'):
+            seen, after = [], None
+            while True:
+                page = self.catalog.query(Filters(in_stock=True), sort, after, 40)
+                seen.extend(page.plant_ids)
+                if not page.has_more:
+                    break
+                after = page.next_after
+            self.assertEqual(len(seen), page.total)
+            self.assertEqual(sorted(seen), self.matching(lambda i, price, stock, rating: stock > 0))
+        # Ties on price go to the lower plant_id
+        self.assertEqual(self.catalog.query(Filters(), 'price', None, 3).plant_ids, [30, 60, 90])
+
+    def test_updates_move_plants_between_categories_and_drop_removed_ones(self):
+        self.catalog.update([plant(3, 1), plant(200, 1)], {3: [2], 200: [1]}, removed=[6])
+
+        indoor = self.query_all(Filters(categories=(1,)))
+        self.assertIn(200, indoor)
+        self.assertNotIn(3, indoor)
+        self.assertNotIn(6, indoor)
+        self.assertIn(3, self.query_all(Filters(categories=(2,))))
+
+    def test_compacting_keeps_the_bitsets(self):
+        self.catalog.update([], {}, removed=range(1, 101))
+
+        self.assertEqual(self.catalog.size, 50)
+        self.assertEqual(self.query_all(Filters(categories=(2,))), list(range(105, 151, 5)))
+
+    def test_facets_count_every_filter_but_their_own(self):
+        filters = Filters(categories=(1,), max_price=9)
+        with mock.patch('plant_collection.catalog.refdata.all_categories', return_value=CATEGORIES):
+            facets = self.catalog.query(filters, 'price', None, 10, facets=True).facets
+
+        indoor_or_cheap = {
+            'indoor': self.matching(lambda i, price, *_: i % 3 == 0 and price <= 9),
+            'succulents': self.matching(lambda i, price, *_: i % 5 == 0 and price <= 9),
+        }
+        self.assertEqual({c['slug']: c['count'] for c in facets['categories']},
+                         {slug: len(ids) for slug, ids in indoor_or_cheap.items()})
+        self.assertEqual([bucket['count'] for bucket in facets['price']],
+                         [len(self.matching(lambda i, price, *_: i % 3 == 0 and low <= price < high))
+                          for low, high in ((0, 10), (10, 25), (25, 1000))])
+        self.assertEqual(facets['in_stock'], len(self.matching(
+            lambda i, price, stock, rating: i % 3 == 0 and price <= 9 and stock > 0)))
+
+
+# PLANTS_SQL, IMAGES_SQL, SIZES_SQL, MAPPINGS_SQL and CATEGORIES_SQL rows
+SNAPSHOT_ROWS = (
+    [
+        (2, 'Aloe Vera', 'Soothing gel', Decimal('12.5'), 8, Decimal('4.5'), 2, 0, 0, 0, 1, 1, CREATED, 9),
+        (5, 'Jade Plant', None, Decimal('20'), 0, Decimal('4.5'), 6, 0, 0, 1, 1, 4, CREATED, None),
+        (7, 'Aloe Vera', 'Same name, new plant', Decimal('9.99'), 3, Decimal('0'), 0, 0, 0, 0, 0, 0, CREATED, 9),
+    ],
+    [(2, 'a.jpg', 0), (2, 'b.jpg', 1), (4, 'gone.jpg', 1), (7, 'c.jpg', 0)],
+    [(2, 10, 'Small', Decimal('0')), (2, 11, 'Large', Decimal('4.5'))],
+    [(2, 1), (2, 2), (5, 2), (6, 1)],
+    [(1, 'Indoor', 'indoor', None, 1), (2, 'Succulents', 'succulents', 'succ.jpg', 2)],
+)
+
+
+class SnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = Path(temporary.name)
+
+    def write(self, change_seq=0):
+        return write_snapshot(self.directory, build_sections(*SNAPSHOT_ROWS), change_seq)
+
+    def test_round_trip(self):
+        snapshot = CatalogSnapshot(self.write(change_seq=4))
+
+        self.assertEqual((len(snapshot), snapshot.change_seq), (3, 4))
+        self.assertIsNone(snapshot.row(4))
+        self.assertFalse(snapshot.price.flags.writeable)
+        self.assertEqual(snapshot.plant_row(snapshot.row(2)), {
+            'plant_id': 2, 'name': 'Aloe Vera', 'description': 'Soothing gel', 'base_price': Decimal('12.5'),
+            'stock_quantity': 8, 'primary_image': 'b.jpg', 'avg_rating': Decimal('4.5'), 'review_count': 2,
+            'all_images': 'a.jpg,b.jpg',
+        })
+        detail = snapshot.plant_detail(snapshot.row(2))
+        self.assertEqual(detail['image_urls'], ['b.jpg', 'a.jpg'])
+        self.assertEqual(detail['rating_histogram'], {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1})
+        self.assertEqual(detail['sizes'][1], {'size_id': 11, 'size_name': 'Large', 'price_adjustment': 4.5})
+        self.assertIsNone(snapshot.plant_row(snapshot.row(5))['description'])
+        # Children of a plant that isn't in the snapshot are dropped
+        self.assertEqual(snapshot.texts(snapshot.image_url), ['a.jpg', 'b.jpg', 'c.jpg'])
+        self.assertEqual(snapshot.category_id.tolist(), [1, 2, 2])
+
+    def test_top_plants_and_categories(self):
+        snapshot = CatalogSnapshot(self.write())
+
+        # Equal ratings: more reviews first
+        self.assertEqual([p['plant_id'] for p in snapshot.top_plants(2)], [5, 2])
+        self.assertEqual([c['slug'] for c in snapshot.top_categories(2)], ['succulents', 'indoor'])
+        snapshot.stale = frozenset({2})
+        self.assertIsNone(snapshot.top_plants(2))
+        self.assertIsNotNone(snapshot.top_plants(1))
+
+    def test_new_versions_replace_current_and_old_ones_are_removed(self):
+        paths = [self.write() for _ in range(KEEP_VERSIONS + 2)]
+
+        self.assertEqual((self.directory / CURRENT).read_text(), paths[-1].name)
+        self.assertEqual(sorted(self.directory.glob('catalog-*.snap')), sorted(paths[-KEEP_VERSIONS:]))
+
+    def test_catalog_built_from_a_snapshot_matches_one_built_from_rows(self):
+        snapshot = CatalogSnapshot(self.write())
+        from_snapshot = ColumnarCatalog()
+        from_snapshot.build_from_snapshot(snapshot)
+        plants = [(p[0], p[1], p[3], p[4], p[5], p[6], p[12]) for p in SNAPSHOT_ROWS[0]]
+        from_rows = columnar_catalog(plants, {2: [1, 2], 5: [2]})
+
+        for filters in (Filters(), Filters(categories=(2,)), Filters(in_stock=True, min_price=10)):
+            for sort in ('price', 'name', 'rating'):
+                self.assertEqual(from_snapshot.query(filters, sort, None, 10),
+                                 from_rows.query(filters, sort, None, 10))
+        self.assertIs(from_snapshot.price, snapshot.price)
+
+        # A change copies the column and leaves the mapping alone
+        from_snapshot.update([plant(2, 1)], {2: [1]})
+        self.assertEqual(from_snapshot.query(Filters(), 'price', None, 1).plant_ids, [2])
+        self.assertEqual(snapshot.price[snapshot.row(2)], 12.5)
+
+    def test_the_reader_marks_logged_plants_stale(self):
+        cache.delete(changes.seq_key)
+        self.write(change_seq=0)
+        reader = SnapshotReader()
+
+        with override_settings(CATALOG_SNAPSHOT_DIR=str(self.directory)):
+            self.assertEqual(reader.get().stale, frozenset())
+            changes.append([5])
+            self.assertEqual(reader.get().stale, {5})
+            self.assertIsNone(reader.get().top_plants(1))
+            # Part of the log is gone: the snapshot can't be trusted
+            cache.delete(changes.entry_key.format(1))
+            changes.append([2])
+            reader = SnapshotReader()
+            self.assertIsNone(reader.get())
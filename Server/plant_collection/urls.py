@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     path("category/<slug:slug>/", views.plants_by_category, name="plants_by_category"),
     path("search/", views.search_plants, name="search_plants"),
+    path("browse/", views.browse_plants, name="browse_plants"),
     path("categories/", views.all_categories, name="all_categories"),  
 ]
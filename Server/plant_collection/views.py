@@ -2,78 +2,238 @@ from django.http import JsonResponse
 from django.db import connection
 import oracledb
 import json
+from django.conf import settings
+from greencart.db.binds import django_numbers, number_list
+from greencart.cache import cache_response, category_tag, ALL_CATEGORIES
+from greencart.refdata import refdata
+from .catalog import SORTS as CATALOG_SORTS, get_catalog, parse_filters
+from .search import get_search_index
+from .snapshot import get_snapshot
+from .pagination import (
+    InvalidPageRequest, RELEVANCE, SORTS, encode_cursor, keyset_page, page_params
+)
 
+PLANT_LIST_COLUMNS = """
+    p.plant_id,
+    p.name,
+    DBMS_LOB.SUBSTR(p.description, 4000, 1) AS description,
+    p.base_price,
+    p.stock_quantity,
+    (SELECT pi.image_url FROM plant_images pi
+     WHERE pi.plant_id = p.plant_id AND pi.is_primary = 1 AND ROWNUM = 1) AS primary_image,
+    p.avg_rating,
+    p.review_count,
+    (SELECT LISTAGG(pi2.image_url, ',') WITHIN GROUP (ORDER BY pi2.image_id)
+     FROM plant_images pi2
+     WHERE pi2.plant_id = p.plant_id) AS all_images
+"""
+
+# Stored rounded to 4 places, so the value in the page cursor compares exactly on the next page
+RATING_KEY_COLUMN = """
+    p.avg_rating AS rating_key
+"""
+
+PAGE_COLUMNS = PLANT_LIST_COLUMNS + ',' + RATING_KEY_COLUMN
+
+
+def fetch_plants_by_ids(cursor, plant_ids):
+    """Rows shaped like search_plants_with_rating for `plant_ids`, in the same
+    order. Served from the shared snapshot when there is one, only plants
+    changed since it was built are read from Oracle"""
+    if not plant_ids:
+        return []
+    by_id = {}
+    fetch = list(plant_ids)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        fetch = []
+        for plant_id in plant_ids:
+            if plant_id in snapshot.stale:
+                fetch.append(plant_id)
+                continue
+            row = snapshot.row(plant_id)
+            if row is not None:
+                by_id[plant_id] = snapshot.plant_row(row)
+
+    if fetch:
+        # The ids as one collection bind, the statement is the same for any count
+        with django_numbers(cursor.connection.cursor()) as raw_cursor:
+            raw_cursor.execute(f"""
+                SELECT {PLANT_LIST_COLUMNS}
+                FROM plants p
+                WHERE p.plant_id IN (SELECT column_value FROM TABLE(:plant_ids)) AND p.is_active = 1
+            """, {'plant_ids': number_list(raw_cursor, fetch)})
+            columns = [col[0].lower() for col in raw_cursor.description]
+            by_id.update((row['plant_id'], row) for row in (dict(zip(columns, r)) for r in raw_cursor.fetchall()))
+    return [by_id[plant_id] for plant_id in plant_ids if plant_id in by_id]
+
+
+def format_plants(rows):
+    # Ensure image fields are properly named and id field is set
+    for plant in rows:
+        plant.pop('rating_key', None)
+        # Map plant_id to id for frontend compatibility
+        if 'plant_id' in plant and 'id' not in plant:
+            plant['id'] = plant['plant_id']
+        # Map primary_image to image for frontend compatibility
+        if 'primary_image' in plant and 'image' not in plant:
+            plant['image'] = plant['primary_image']
+        # Ensure image_url field exists
+        if 'image_url' not in plant and 'image' in plant:
+            plant['image_url'] = plant['image']
+        # Map other fields for consistency
+        if 'base_price' in plant and 'price' not in plant:
+            plant['price'] = float(plant['base_price'])
+        # Format rating for display
+        if 'avg_rating' in plant:
+            rating = float(plant['avg_rating'])
+            full_stars = int(round(rating))
+            plant['ratingStars'] = '★' * full_stars + '☆' * (5 - full_stars)
+            plant['reviewCount'] = plant.get('review_count', 0)
+    return rows
+
+
+def catalog_page(request, cursor, catalog, filters, facets):
+    """Listing response for one page of the columnar catalog"""
+    sort, limit, after = page_params(request, 'rating', CATALOG_SORTS)
+    page = catalog.query(filters, sort, after, limit, facets=facets)
+    response = {
+        "plants": format_plants(fetch_plants_by_ids(cursor, page.plant_ids)),
+        "has_more": page.has_more,
+        "next_cursor": encode_cursor(sort, *page.next_after) if page.has_more else None,
+        "total": page.total
+    }
+    if page.facets is not None:
+        response["facets"] = page.facets
+    return response
+
+
+@cache_response(lambda slug: [category_tag(slug)])
 def plants_by_category(request, slug):
-    rows = []
     try:
+        # Until this worker's catalog is loaded, the page is listed in SQL
+        catalog = get_catalog() if settings.CATALOG_INDEX_ENABLED else None
+        if catalog is not None:
+            # Filters, facets and sorts from the in-memory catalog, only the page from Oracle
+            category = refdata.category_by_slug(slug)
+            filters = parse_filters(request)._replace(categories=(category.category_id if category else -1,))
+            with connection.cursor() as cursor:
+                return JsonResponse(catalog_page(request, cursor, catalog, filters, request.GET.get('facets') == '1'))
+
+        sort, limit, after = page_params(request, 'rating')
         with connection.cursor() as cursor:
-            out_cursor = cursor.connection.cursor()
-            cursor.callproc("get_plants_by_category_with_rating", [slug, out_cursor])
-            columns = [col[0].lower() for col in out_cursor.description]
-            rows = [dict(zip(columns, row)) for row in out_cursor.fetchall()]
-            out_cursor.close()
-        
-        # Ensure image fields are properly named and id field is set
-        for plant in rows:
-            # Map plant_id to id for frontend compatibility
-            if 'plant_id' in plant and 'id' not in plant:
-                plant['id'] = plant['plant_id']
-            # Map primary_image to image for frontend compatibility
-            if 'primary_image' in plant and 'image' not in plant:
-                plant['image'] = plant['primary_image']
-            # Ensure image_url field exists
-            if 'image_url' not in plant and 'image' in plant:
-                plant['image_url'] = plant['image']
-            # Map other fields for consistency
-            if 'base_price' in plant and 'price' not in plant:
-                plant['price'] = float(plant['base_price'])
-            # Format rating for display
-            if 'avg_rating' in plant:
-                rating = float(plant['avg_rating'])
-                full_stars = int(round(rating))
-                plant['ratingStars'] = '★' * full_stars + '☆' * (5 - full_stars)
-                plant['reviewCount'] = plant.get('review_count', 0)
-                
-        return JsonResponse({"plants": rows})
+            rows, has_more, next_cursor = keyset_page(
+                cursor,
+                PAGE_COLUMNS,
+                """plants p
+                   JOIN plant_category_mapping pcm ON p.plant_id = pcm.plant_id
+                   JOIN plant_categories pc ON pcm.category_id = pc.category_id
+                   WHERE pc.slug = %s AND p.is_active = 1""",
+                [slug], sort, after, limit
+            )
+
+        return JsonResponse({
+            "plants": format_plants(rows),
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        })
+    except InvalidPageRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+def browse_plants(request):
+    """All plants with ?category=, price, rating and in-stock filters and
+    facets; ?q= narrows the listing to the search matches"""
+    try:
+        catalog = get_catalog()
+        if catalog is None:
+            response = JsonResponse({"error": "The catalog is still loading, try again shortly"}, status=503)
+            response['Retry-After'] = '5'
+            return response
+        query = request.GET.get("q", "").strip()
+        plant_ids = None
+        with connection.cursor() as cursor:
+            if query:
+                plant_ids = match_plant_ids(cursor, query)
+            filters = parse_filters(request, plant_ids)
+            return JsonResponse(catalog_page(request, cursor, catalog, filters, request.GET.get('facets', '1') == '1'))
+    except InvalidPageRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+def match_plant_ids(cursor, query):
+    """Ids of the best SEARCH_MAX_MATCHES plants for the query, from the
+    search index or, while it is still being built, in SQL"""
+    index = get_search_index() if settings.SEARCH_INDEX_ENABLED else None
+    if index is not None:
+        return [plant_id for plant_id, score in index.search(query, top_k=settings.SEARCH_MAX_MATCHES)]
+    term = f"%{query.lower()}%"
+    cursor.execute("""
+        SELECT plant_id FROM plants
+        WHERE (LOWER(name) LIKE %s OR LOWER(DBMS_LOB.SUBSTR(description, 4000, 1)) LIKE %s)
+        AND is_active = 1
+        ORDER BY avg_rating DESC, plant_id
+        FETCH FIRST %s ROWS ONLY
+    """, [term, term, settings.SEARCH_MAX_MATCHES])
+    return [plant_id for plant_id, in cursor.fetchall()]
+
 def search_plants(request):
     query = request.GET.get("q", "")
-    rows = []
     try:
+        # Until this worker's index is built, search matches in SQL
+        index = get_search_index() if settings.SEARCH_INDEX_ENABLED and query.strip() else None
+        use_index = index is not None
+        if use_index:
+            sort, limit, after = page_params(request, RELEVANCE, [RELEVANCE, *SORTS])
+        else:
+            sort, limit, after = page_params(request, 'rating')
+
         with connection.cursor() as cursor:
-            out_cursor = cursor.connection.cursor()
-            cursor.callproc("search_plants_with_rating", [f"%{query}%", out_cursor])
-            columns = [col[0].lower() for col in out_cursor.description]
-            rows = [dict(zip(columns, row)) for row in out_cursor.fetchall()]
-            out_cursor.close()
-        
-        # Ensure image fields are properly named and id field is set
-        for plant in rows:
-            # Map plant_id to id for frontend compatibility
-            if 'plant_id' in plant and 'id' not in plant:
-                plant['id'] = plant['plant_id']
-            # Map primary_image to image for frontend compatibility
-            if 'primary_image' in plant and 'image' not in plant:
-                plant['image'] = plant['primary_image']
-            # Ensure image_url field exists
-            if 'image_url' not in plant and 'image' in plant:
-                plant['image_url'] = plant['image']
-            # Map other fields for consistency
-            if 'base_price' in plant and 'price' not in plant:
-                plant['price'] = float(plant['base_price'])
-            # Format rating for display
-            if 'avg_rating' in plant:
-                rating = float(plant['avg_rating'])
-                full_stars = int(round(rating))
-                plant['ratingStars'] = '★' * full_stars + '☆' * (5 - full_stars)
-                plant['reviewCount'] = plant.get('review_count', 0)
-                
-        return JsonResponse({"plants": rows})
+            if sort == RELEVANCE:
+                # Rank in memory, only load the page's plants from Oracle
+                hits = index.search(query, top_k=limit + 1, after=after)
+                has_more = len(hits) > limit
+                hits = hits[:limit]
+                rows = fetch_plants_by_ids(cursor, [plant_id for plant_id, score in hits])
+                next_cursor = encode_cursor(RELEVANCE, hits[-1][1], hits[-1][0]) if has_more else None
+            elif use_index:
+                # Sorted by a column: page through the best matches in SQL
+                hits = index.search(query, top_k=settings.SEARCH_MAX_MATCHES)
+                if not hits:
+                    return JsonResponse({"plants": [], "has_more": False, "next_cursor": None})
+                with django_numbers(cursor.connection.cursor()) as raw_cursor:
+                    rows, has_more, next_cursor = keyset_page(
+                        raw_cursor,
+                        PAGE_COLUMNS,
+                        "plants p WHERE p.plant_id IN (SELECT column_value FROM TABLE(%s)) AND p.is_active = 1",
+                        [number_list(raw_cursor, [plant_id for plant_id, score in hits])], sort, after, limit
+                    )
+            else:
+                # Same match as search_plants_with_rating
+                term = f"%{query.lower()}%"
+                rows, has_more, next_cursor = keyset_page(
+                    cursor,
+                    PAGE_COLUMNS,
+                    """plants p
+                       WHERE (LOWER(p.name) LIKE %s
+                              OR LOWER(DBMS_LOB.SUBSTR(p.description, 4000, 1)) LIKE %s)
+                       AND p.is_active = 1""",
+                    [term, term], sort, after, limit
+                )
+
+        return JsonResponse({
+            "plants": format_plants(rows),
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        })
+    except InvalidPageRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@cache_response(lambda: [ALL_CATEGORIES])
 def all_categories(request):
     rows = []
     try:
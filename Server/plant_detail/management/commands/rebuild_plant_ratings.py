@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from greencart.cache import invalidate, tags_for_plants, ALL_PLANTS
+from plant_collection.catalog import mark_catalog_changed
+
+# Per-plant aggregates straight from reviews, plants without reviews included
+REVIEW_TOTALS_SQL = """
+    SELECT p.plant_id,
+           COUNT(r.review_id) AS review_count,
+           NVL(SUM(r.rating), 0) AS rating_sum,
+           NVL(ROUND(AVG(r.rating), 4), 0) AS avg_rating,
+           COUNT(CASE WHEN r.rating = 1 THEN 1 END) AS rating_1_count,
+           COUNT(CASE WHEN r.rating = 2 THEN 1 END) AS rating_2_count,
+           COUNT(CASE WHEN r.rating = 3 THEN 1 END) AS rating_3_count,
+           COUNT(CASE WHEN r.rating = 4 THEN 1 END) AS rating_4_count,
+           COUNT(CASE WHEN r.rating = 5 THEN 1 END) AS rating_5_count
+    FROM plants p
+    LEFT JOIN reviews r ON p.plant_id = r.plant_id
+    GROUP BY p.plant_id
+"""
+
+DRIFT_CONDITION = """
+    p.review_count != t.review_count
+    OR p.rating_sum != t.rating_sum
+    OR p.avg_rating != t.avg_rating
+    OR p.rating_1_count != t.rating_1_count
+    OR p.rating_2_count != t.rating_2_count
+    OR p.rating_3_count != t.rating_3_count
+    OR p.rating_4_count != t.rating_4_count
+    OR p.rating_5_count != t.rating_5_count
+"""
+
+
+class Command(BaseCommand):
+    help = "Recompute avg_rating, review_count and the star histogram on plants from reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report plants whose aggregates are off")
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT p.plant_id
+                FROM plants p
+                JOIN ({REVIEW_TOTALS_SQL}) t ON p.plant_id = t.plant_id
+                WHERE {DRIFT_CONDITION}
+                ORDER BY p.plant_id
+            """)
+            drifted = [row[0] for row in cursor.fetchall()]
+
+            if options['check'] or not drifted:
+                self.stdout.write(f"{len(drifted)} plant(s) with stale rating aggregates")
+                for plant_id in drifted[:50]:
+                    self.stdout.write(f"  plant {plant_id}")
+                return
+
+            cursor.execute(f"""
+                MERGE INTO plants p
+                USING ({REVIEW_TOTALS_SQL}) t
+                ON (p.plant_id = t.plant_id)
+                WHEN MATCHED THEN UPDATE SET
+                    p.review_count = t.review_count,
+                    p.rating_sum = t.rating_sum,
+                    p.avg_rating = t.avg_rating,
+                    p.rating_1_count = t.rating_1_count,
+                    p.rating_2_count = t.rating_2_count,
+                    p.rating_3_count = t.rating_3_count,
+                    p.rating_4_count = t.rating_4_count,
+                    p.rating_5_count = t.rating_5_count
+                WHERE {DRIFT_CONDITION}
+            """)
+            updated = cursor.rowcount
+            tags = tags_for_plants(cursor, drifted)
+
+        invalidate(ALL_PLANTS, *tags)
+        mark_catalog_changed(drifted)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} plant(s)"))
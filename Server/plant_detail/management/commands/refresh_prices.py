@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from greencart.discounts import refresh_due
+
+
+class Command(BaseCommand):
+    help = "Recompute effective prices whose discount window opened or closed, or whose discounts changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute every active plant")
+        parser.add_argument('--watch', type=int, default=None, metavar='SECONDS',
+                            help="Keep refreshing every SECONDS")
+
+    def handle(self, *args, **options):
+        # The discounts of the last run, plants whose discounts changed since are refreshed
+        since = None
+        while True:
+            start = time.perf_counter()
+            try:
+                with transaction.atomic(), connection.cursor() as cursor, cursor.connection.cursor() as raw_cursor:
+                    count, since = refresh_due(raw_cursor, since, everything=options['all'])
+            except Exception as e:
+                if not options['watch']:
+                    raise
+                self.stderr.write(f"Price refresh failed: {e}")
+            else:
+                if count or not options['watch']:
+                    self.stdout.write(
+                        f"Refreshed prices of {count} plant(s) in {(time.perf_counter() - start) * 1000:.0f} ms"
+                    )
+            if not options['watch']:
+                break
+            # Don't hold a session open between runs
+            connection.close()
+            time.sleep(options['watch'])
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,119 @@
+"""Compact plant summaries for many plants at once.
+
+The cart sidebar, order history and seller dashboards each show a handful
+of plants: name, price, primary image, rating, stock and the discount in
+force. get_summaries() answers for all of them together:
+
+  * every summary is cached on its own (summary:<plant_id>), tagged
+    plant:<id> and discount:*, so it is dropped with the plant's detail
+    page, and also once a discount window on the plant opens or closes;
+  * the cache is read with one lookup for all the ids, and the misses are
+    read with one query that binds their ids as a single collection, their
+    prices with two more: categories and stored price rows
+    (greencart/discounts.py).
+"""
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from greencart import metrics
+from greencart.cache import ALL_DISCOUNTS, plant_tag, response_cache
+from greencart.db.binds import number_list
+from greencart.discounts import discount_detail, prices
+
+SUMMARY_KEY = 'summary:{}'
+
+SUMMARY_SQL = """
+    SELECT p.plant_id, p.name, p.base_price, p.stock_quantity, p.avg_rating, p.review_count, p.is_active,
+           (SELECT pi.image_url FROM plant_images pi
+            WHERE pi.plant_id = p.plant_id AND pi.is_primary = 1 AND ROWNUM = 1) AS primary_image
+    FROM plants p
+    WHERE p.plant_id IN (SELECT column_value FROM TABLE(:plant_ids))
+"""
+
+
+def parse_ids(value):
+    """Plant ids from "1,2,3", in order without repeats"""
+    try:
+        plant_ids = [int(item) for item in (value or '').split(',') if item.strip()]
+    except ValueError:
+        raise ValueError("ids must be a comma separated list of plant ids")
+    if not plant_ids:
+        raise ValueError("ids is required")
+    plant_ids = list(dict.fromkeys(plant_ids))
+    if len(plant_ids) > settings.PLANT_BATCH_MAX_IDS:
+        raise ValueError(f"At most {settings.PLANT_BATCH_MAX_IDS} ids per request")
+    return plant_ids
+
+
+def _summary(row, price):
+    """(summary, when it stops being current) from a SUMMARY_SQL row and
+    the plant's Price"""
+    plant_id, name, base_price, stock, rating, reviews, is_active, primary_image = row
+    summary = {
+        'plant_id': int(plant_id),
+        'name': name,
+        'price': float(base_price or 0),
+        'effective_price': price.effective_price if price else float(base_price or 0),
+        'primary_image': primary_image,
+        'avg_rating': float(rating or 0),
+        'review_count': int(reviews or 0),
+        'stock_quantity': int(stock or 0),
+        'is_active': bool(is_active),
+        'discount': None,
+    }
+    if price is None:
+        return summary, None
+    discount = price.discount
+    if discount is not None:
+        summary['discount'] = {
+            'discount_id': discount.discount_id,
+            'name': discount.name,
+            'discount_value': discount.value,
+            'is_percentage': discount.is_percentage,
+            'end_date': discount_detail(discount)['end_date'],
+        }
+    valid_until = price.valid_until / 1_000_000 if price.valid_until is not None else None
+    return summary, valid_until
+
+
+def _fetch(plant_ids):
+    with connection.cursor() as cursor:
+        with cursor.connection.cursor() as raw_cursor:
+            raw_cursor.arraysize = len(plant_ids)
+            raw_cursor.execute(SUMMARY_SQL, {'plant_ids': number_list(raw_cursor, plant_ids)})
+            rows = raw_cursor.fetchall()
+            plant_prices = prices(raw_cursor, [row[0] for row in rows])
+            return [_summary(row, plant_prices.get((int(row[0]), 0))) for row in rows]
+
+
+def get_summaries(plant_ids):
+    """{plant_id: summary} for the given plants that exist, active or not"""
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return {summary['plant_id']: summary for summary, valid_until in _fetch(plant_ids)}
+
+    keys = {SUMMARY_KEY.format(plant_id): plant_id for plant_id in plant_ids}
+    now = time.time()
+    summaries = {
+        keys[key]: entry['summary']
+        for key, entry in response_cache.get_many(list(keys)).items()
+        if entry['valid_until'] is None or entry['valid_until'] > now
+    }
+    misses = [plant_id for plant_id in plant_ids if plant_id not in summaries]
+    metrics.plant_summaries.inc(len(summaries), 'hit')
+    if not misses:
+        return summaries
+    metrics.plant_summaries.inc(len(misses), 'miss')
+
+    # Versions are read before the query so a write landing meanwhile leaves the entries stale
+    versions = response_cache.tag_versions([plant_tag(plant_id) for plant_id in misses] + [ALL_DISCOUNTS])
+    entries = {}
+    for summary, valid_until in _fetch(misses):
+        plant_id = summary['plant_id']
+        summaries[plant_id] = summary
+        tags = {plant_tag(plant_id): versions[plant_tag(plant_id)], ALL_DISCOUNTS: versions[ALL_DISCOUNTS]}
+        entries[SUMMARY_KEY.format(plant_id)] = {'tags': tags, 'summary': summary, 'valid_until': valid_until}
+    if entries:
+        response_cache.set_many(entries)
+    return summaries
@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('plant/<int:plant_id>/', views.plant_details, name='plant_details'),
+    path('batch/', views.plant_batch, name='plant_batch'),
     path('add-to-cart/', views.add_to_cart, name='add_to_cart'),
     path('add-review/<int:plant_id>/', views.add_review, name='add_review'),
 ]
\ No newline at end of file
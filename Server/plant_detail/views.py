@@ -1,197 +1,339 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 from django.db import connection
+from django.conf import settings
 import json
+from greencart.cache import cache_response, invalidate, tags_for_plants, plant_tag, ALL_DISCOUNTS, ALL_PLANTS
+from greencart.discounts import discount_detail, plant_prices
+from plant_collection.catalog import mark_catalog_changed
+from plant_collection.snapshot import get_snapshot
+from .summaries import get_summaries, parse_ids
 
 def dictfetchall(cursor):
     """Return all rows from a cursor as a list of dictionaries"""
     columns = [col[0].lower() for col in cursor.description]  # Convert to lowercase
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
+# Sections of the detail page the catalog snapshot doesn't hold, and the
+# plant's categories its discounts are worked out from
+PLANT_EXTRA_FIELDS = """
+        'category_ids' VALUE (
+            SELECT JSON_ARRAYAGG(pcm.category_id ORDER BY pcm.category_id)
+            FROM plant_category_mapping pcm
+            WHERE pcm.plant_id = p.plant_id) FORMAT JSON,
+        'features' VALUE (
+            SELECT JSON_ARRAYAGG(pf.feature_text ORDER BY pf.feature_id RETURNING CLOB)
+            FROM plant_features pf
+            WHERE pf.plant_id = p.plant_id) FORMAT JSON,
+        'care_tips' VALUE (
+            SELECT JSON_ARRAYAGG(pct.tip_text ORDER BY pct.tip_id RETURNING CLOB)
+            FROM plant_care_tips pct
+            WHERE pct.plant_id = p.plant_id) FORMAT JSON,
+        'reviews' VALUE (
+            SELECT JSON_ARRAYAGG(
+                       JSON_OBJECT(
+                           'review_id' VALUE r.review_id,
+                           'author' VALUE u.first_name || ' ' || u.last_name,
+                           'rating' VALUE r.rating,
+                           'review_text' VALUE DBMS_LOB.SUBSTR(r.review_text, 1000, 1),
+                           'review_date' VALUE TO_CHAR(r.review_date, 'YYYY-MM-DD'))
+                       ORDER BY r.review_date DESC RETURNING CLOB)
+            FROM reviews r
+            JOIN users u ON r.user_id = u.user_id
+            WHERE r.plant_id = p.plant_id AND r.is_approved = 1) FORMAT JSON
+"""
+
+PLANT_DOCUMENT_SQL = """
+    SELECT JSON_OBJECT(
+        'plant_id' VALUE p.plant_id,
+        'name' VALUE p.name,
+        'description' VALUE DBMS_LOB.SUBSTR(p.description, 4000, 1),
+        'base_price' VALUE p.base_price,
+        'stock_quantity' VALUE p.stock_quantity,
+        'primary_image' VALUE (
+            SELECT pi.image_url
+            FROM plant_images pi
+            WHERE pi.plant_id = p.plant_id AND pi.is_primary = 1
+            AND ROWNUM = 1),
+        'avg_rating' VALUE p.avg_rating,
+        'review_count' VALUE p.review_count,
+        'rating_histogram' VALUE JSON_OBJECT(
+            '1' VALUE p.rating_1_count,
+            '2' VALUE p.rating_2_count,
+            '3' VALUE p.rating_3_count,
+            '4' VALUE p.rating_4_count,
+            '5' VALUE p.rating_5_count),
+        'image_urls' VALUE (
+            SELECT JSON_ARRAYAGG(pi.image_url ORDER BY pi.is_primary DESC, pi.image_id RETURNING CLOB)
+            FROM plant_images pi
+            WHERE pi.plant_id = p.plant_id) FORMAT JSON,
+        'sizes' VALUE (
+            SELECT JSON_ARRAYAGG(
+                       JSON_OBJECT(
+                           'size_id' VALUE ps.size_id,
+                           'size_name' VALUE ps.size_name,
+                           'price_adjustment' VALUE ps.price_adjustment)
+                       ORDER BY ps.size_id RETURNING CLOB)
+            FROM plant_sizes ps
+            WHERE ps.plant_id = p.plant_id) FORMAT JSON,
+""" + PLANT_EXTRA_FIELDS + """
+        RETURNING CLOB)
+    FROM plants p
+    WHERE p.plant_id = :plant_id AND p.is_active = 1
+"""
+
+PLANT_EXTRAS_SQL = """
+    SELECT JSON_OBJECT(
+""" + PLANT_EXTRA_FIELDS + """
+        RETURNING CLOB)
+    FROM plants p
+    WHERE p.plant_id = :plant_id AND p.is_active = 1
+"""
+
+
+def fetch_plant_document(cursor, plant_id):
+    """Build the plant detail dict in one round trip, None if missing/inactive"""
+    plant = _fetch_document(cursor, PLANT_DOCUMENT_SQL, plant_id)
+    if plant is None:
+        return None
+
+    result = {
+        'plant_id': plant.get('plant_id'),
+        'name': plant.get('name', ''),
+        'description': plant.get('description', ''),
+        'base_price': float(plant.get('base_price', 0)),
+        'stock_quantity': plant.get('stock_quantity', 0),
+        'primary_image': plant.get('primary_image', ''),
+        'avg_rating': float(plant.get('avg_rating', 0)),
+        'review_count': plant.get('review_count', 0),
+        'rating_histogram': plant.get('rating_histogram') or {},
+        'image_urls': [url for url in plant.get('image_urls') or [] if url],
+        'sizes': [],
+    }
+
+    for size in plant.get('sizes') or []:
+        size['price_adjustment'] = float(size.get('price_adjustment', 0))
+        result['sizes'].append(size)
+
+    return _add_extras(result, plant)
+
+
+def fetch_plant_snapshot(cursor, snapshot, plant_id):
+    """Plant detail dict with the plant, images and sizes from the catalog
+    snapshot and the rest in one query, None if missing/inactive"""
+    row = snapshot.row(plant_id)
+    if row is None:
+        return None
+    extras = _fetch_document(cursor, PLANT_EXTRAS_SQL, plant_id)
+    if extras is None:
+        return None
+    return _add_extras(snapshot.plant_detail(row), extras)
+
+
+def _fetch_document(cursor, sql, plant_id):
+    cursor.execute(sql, {'plant_id': plant_id})
+    row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+
+    document = row[0]
+    if hasattr(document, 'read'):
+        document = document.read()
+    return json.loads(document)
+
+
+def _add_extras(result, plant):
+    """Fill in the PLANT_EXTRA_FIELDS sections"""
+    result['category_ids'] = plant.get('category_ids') or []
+    result['features'] = [feat for feat in plant.get('features') or [] if feat]
+    result['care_tips'] = [tip for tip in plant.get('care_tips') or [] if tip]
+    result['reviews'] = []
+
+    for review in plant.get('reviews') or []:
+        result['reviews'].append({
+            'review_id': review.get('review_id'),
+            'author': review.get('author', 'Anonymous'),
+            'rating': float(review.get('rating', 0)),
+            'review_text': review.get('review_text', ''),
+            'review_date': review.get('review_date', '')
+        })
+
+    return result
+
+
+def _add_prices(result):
+    """Discount in force and effective prices, as the cart and checkout
+    charge them, from this worker's discount index and the categories the
+    detail query returned (no round trip of its own)"""
+    unit_prices = {0: result['base_price']}
+    unit_prices.update((size['size_id'], result['base_price'] + size['price_adjustment'])
+                       for size in result['sizes'])
+    by_size = plant_prices(result['plant_id'], result.pop('category_ids'), unit_prices)
+    result['discount'] = discount_detail(by_size[0].discount)
+    result['effective_price'] = by_size[0].effective_price
+    for size in result['sizes']:
+        size['effective_price'] = by_size[size['size_id']].effective_price
+    return result
+
+
+def fetch_plant_details(cursor, plant_id):
+    """Build the plant detail dict with one query per section, None if missing/inactive"""
+    # First, check if plant exists and is active
+    cursor.execute("""
+        SELECT COUNT(*) 
+        FROM plants 
+        WHERE plant_id = :plant_id AND is_active = 1
+    """, {'plant_id': plant_id})
+    
+    plant_exists = cursor.fetchone()[0]
+    if plant_exists == 0:
+        return None
+    
+    # Get basic plant information
+    cursor.execute("""
+        SELECT 
+            p.plant_id,
+            p.name,
+            DBMS_LOB.SUBSTR(p.description, 4000, 1) AS description,
+            p.base_price,
+            p.stock_quantity,
+            (SELECT pi.image_url 
+             FROM plant_images pi 
+             WHERE pi.plant_id = p.plant_id AND pi.is_primary = 1 
+             AND ROWNUM = 1) AS primary_image,
+            p.avg_rating,
+            p.review_count,
+            p.rating_1_count,
+            p.rating_2_count,
+            p.rating_3_count,
+            p.rating_4_count,
+            p.rating_5_count
+        FROM plants p
+        WHERE p.plant_id = :plant_id
+    """, {'plant_id': plant_id})
+    
+    plant_data = dictfetchall(cursor)
+    if not plant_data:
+        return None
+    
+    plant = plant_data[0]
+    
+    # Build result with safe field access
+    result = {
+        'plant_id': plant.get('plant_id'),
+        'name': plant.get('name', ''),
+        'description': plant.get('description', ''),
+        'base_price': float(plant.get('base_price', 0)),
+        'stock_quantity': plant.get('stock_quantity', 0),
+        'primary_image': plant.get('primary_image', ''),
+        'avg_rating': float(plant.get('avg_rating', 0)),
+        'review_count': plant.get('review_count', 0),
+        'rating_histogram': {str(stars): plant.get(f'rating_{stars}_count', 0) for stars in range(1, 6)},
+        'image_urls': [],
+        'sizes': [],
+        'features': [],
+        'care_tips': [],
+        'reviews': [],
+    }
+    
+    # Get additional images
+    cursor.execute("""
+        SELECT image_url 
+        FROM plant_images 
+        WHERE plant_id = :plant_id 
+        ORDER BY is_primary DESC, image_id
+    """, {'plant_id': plant_id})
+    images = dictfetchall(cursor)
+    result['image_urls'] = [img.get('image_url', '') for img in images if img.get('image_url')]
+    
+    # Get sizes
+    cursor.execute("""
+        SELECT size_id, size_name, price_adjustment
+        FROM plant_sizes 
+        WHERE plant_id = :plant_id 
+        ORDER BY size_id
+    """, {'plant_id': plant_id})
+    sizes = dictfetchall(cursor)
+    for size in sizes:
+        size['price_adjustment'] = float(size.get('price_adjustment', 0))
+    result['sizes'] = sizes
+    
+    # Get features
+    cursor.execute("""
+        SELECT feature_text
+        FROM plant_features 
+        WHERE plant_id = :plant_id 
+        ORDER BY feature_id
+    """, {'plant_id': plant_id})
+    features = dictfetchall(cursor)
+    result['features'] = [feat.get('feature_text', '') for feat in features if feat.get('feature_text')]
+    
+    # Get care tips
+    cursor.execute("""
+        SELECT tip_text
+        FROM plant_care_tips 
+        WHERE plant_id = :plant_id 
+        ORDER BY tip_id
+    """, {'plant_id': plant_id})
+    care_tips = dictfetchall(cursor)
+    result['care_tips'] = [tip.get('tip_text', '') for tip in care_tips if tip.get('tip_text')]
+
+    # Get categories, for the discounts
+    cursor.execute("""
+        SELECT category_id
+        FROM plant_category_mapping
+        WHERE plant_id = :plant_id
+    """, {'plant_id': plant_id})
+    result['category_ids'] = [category_id for category_id, in cursor.fetchall()]
+    
+    # Get reviews (only approved ones)
+    cursor.execute("""
+        SELECT 
+            r.review_id,
+            u.first_name || ' ' || u.last_name AS author,
+            r.rating,
+            DBMS_LOB.SUBSTR(r.review_text, 1000, 1) AS review_text,
+            TO_CHAR(r.review_date, 'YYYY-MM-DD') AS review_date
+        FROM reviews r
+        JOIN users u ON r.user_id = u.user_id
+        WHERE r.plant_id = :plant_id AND r.is_approved = 1
+        ORDER BY r.review_date DESC
+    """, {'plant_id': plant_id})
+    
+    reviews = dictfetchall(cursor)
+    # Safe access to review fields
+    formatted_reviews = []
+    for review in reviews:
+        formatted_reviews.append({
+            'review_id': review.get('review_id'),
+            'author': review.get('author', 'Anonymous'),
+            'rating': float(review.get('rating', 0)),
+            'review_text': review.get('review_text', ''),
+            'review_date': review.get('review_date', '')
+        })
+    result['reviews'] = formatted_reviews
+    return result
+
+
 @csrf_exempt
+@cache_response(lambda plant_id: [plant_tag(plant_id), ALL_DISCOUNTS])
 def plant_details(request, plant_id):
     if request.method == 'GET':
         try:
             with connection.cursor() as cursor:
-                # First, check if plant exists and is active
-                cursor.execute("""
-                    SELECT COUNT(*) 
-                    FROM plants 
-                    WHERE plant_id = :plant_id AND is_active = 1
-                """, {'plant_id': plant_id})
-                
-                plant_exists = cursor.fetchone()[0]
-                if plant_exists == 0:
+                snapshot = get_snapshot()
+                if snapshot is not None and plant_id not in snapshot.stale:
+                    result = fetch_plant_snapshot(cursor, snapshot, plant_id)
+                elif settings.PLANT_DETAIL_SINGLE_QUERY:
+                    result = fetch_plant_document(cursor, plant_id)
+                else:
+                    result = fetch_plant_details(cursor, plant_id)
+
+                if result is None:
                     return JsonResponse({'success': False, 'error': 'Plant not found or inactive'}, status=404)
-                
-                # Get basic plant information
-                cursor.execute("""
-                    SELECT 
-                        p.plant_id,
-                        p.name,
-                        DBMS_LOB.SUBSTR(p.description, 4000, 1) AS description,
-                        p.base_price,
-                        p.stock_quantity,
-                        (SELECT pi.image_url 
-                         FROM plant_images pi 
-                         WHERE pi.plant_id = p.plant_id AND pi.is_primary = 1 
-                         AND ROWNUM = 1) AS primary_image,
-                        NVL(AVG(r.rating), 0) AS avg_rating,
-                        COUNT(r.review_id) AS review_count
-                    FROM plants p
-                    LEFT JOIN reviews r ON p.plant_id = r.plant_id
-                    WHERE p.plant_id = :plant_id
-                    GROUP BY p.plant_id, p.name, DBMS_LOB.SUBSTR(p.description, 4000, 1), 
-                             p.base_price, p.stock_quantity
-                """, {'plant_id': plant_id})
-                
-                plant_data = dictfetchall(cursor)
-                if not plant_data:
-                    return JsonResponse({'success': False, 'error': 'Plant data not found'}, status=404)
-                
-                plant = plant_data[0]
-                
-                # Build result with safe field access
-                result = {
-                    'plant_id': plant.get('plant_id'),
-                    'name': plant.get('name', ''),
-                    'description': plant.get('description', ''),
-                    'base_price': float(plant.get('base_price', 0)),
-                    'stock_quantity': plant.get('stock_quantity', 0),
-                    'primary_image': plant.get('primary_image', ''),
-                    'avg_rating': float(plant.get('avg_rating', 0)),
-                    'review_count': plant.get('review_count', 0),
-                    'image_urls': [],
-                    'sizes': [],
-                    'features': [],
-                    'care_tips': [],
-                    'reviews': [],
-                    'discount': None  # Add discount information
-                }
-                
-                # Get discount information for the plant (including category discounts)
-                cursor.execute("""
-                    SELECT 
-                        d.discount_id,
-                        d.name,
-                        d.description,
-                        d.discount_value,
-                        d.is_percentage,
-                        d.start_date,
-                        d.end_date
-                    FROM plant_discounts pd
-                    JOIN discounts d ON pd.discount_id = d.discount_id
-                    JOIN discount_types dt ON d.discount_type_id = dt.discount_type_id
-                    WHERE (pd.plant_id = :plant_id OR pd.category_id IN (
-                        SELECT category_id FROM plant_category_mapping WHERE plant_id = :plant_id
-                    ))
-                    AND d.is_active = 1
-                    AND d.start_date <= SYSTIMESTAMP
-                    AND d.end_date >= SYSTIMESTAMP
-                    ORDER BY d.discount_value DESC
-                """, {'plant_id': plant_id})
-                
-                discount_data = dictfetchall(cursor)
-                print(f"Discount data for plant {plant_id}: {discount_data}")  # Debug log
-                
-                if discount_data:
-                    # Get the highest discount for display
-                    discount = discount_data[0]
-                    # Handle datetime conversion properly
-                    start_date_iso = None
-                    end_date_iso = None
-                    
-                    if discount.get('start_date'):
-                        try:
-                            start_date_iso = discount['start_date'].isoformat() if hasattr(discount['start_date'], 'isoformat') else str(discount['start_date'])
-                        except:
-                            start_date_iso = str(discount['start_date'])
-                    
-                    if discount.get('end_date'):
-                        try:
-                            end_date_iso = discount['end_date'].isoformat() if hasattr(discount['end_date'], 'isoformat') else str(discount['end_date'])
-                        except:
-                            end_date_iso = str(discount['end_date'])
-                    
-                    result['discount'] = {
-                        'discount_id': discount.get('discount_id'),
-                        'name': discount.get('name', ''),
-                        'description': discount.get('description', ''),
-                        'discount_value': float(discount.get('discount_value', 0)),
-                        'is_percentage': int(discount.get('is_percentage', 0)),
-                        'start_date': start_date_iso,
-                        'end_date': end_date_iso
-                    }
-                
-                # Get additional images
-                cursor.execute("""
-                    SELECT image_url 
-                    FROM plant_images 
-                    WHERE plant_id = :plant_id 
-                    ORDER BY is_primary DESC, image_id
-                """, {'plant_id': plant_id})
-                images = dictfetchall(cursor)
-                result['image_urls'] = [img.get('image_url', '') for img in images if img.get('image_url')]
-                
-                # Get sizes
-                cursor.execute("""
-                    SELECT size_id, size_name, price_adjustment
-                    FROM plant_sizes 
-                    WHERE plant_id = :plant_id 
-                    ORDER BY size_id
-                """, {'plant_id': plant_id})
-                sizes = dictfetchall(cursor)
-                for size in sizes:
-                    size['price_adjustment'] = float(size.get('price_adjustment', 0))
-                result['sizes'] = sizes
-                
-                # Get features
-                cursor.execute("""
-                    SELECT feature_text
-                    FROM plant_features 
-                    WHERE plant_id = :plant_id 
-                    ORDER BY feature_id
-                """, {'plant_id': plant_id})
-                features = dictfetchall(cursor)
-                result['features'] = [feat.get('feature_text', '') for feat in features if feat.get('feature_text')]
-                
-                # Get care tips
-                cursor.execute("""
-                    SELECT tip_text
-                    FROM plant_care_tips 
-                    WHERE plant_id = :plant_id 
-                    ORDER BY tip_id
-                """, {'plant_id': plant_id})
-                care_tips = dictfetchall(cursor)
-                result['care_tips'] = [tip.get('tip_text', '') for tip in care_tips if tip.get('tip_text')]
-                
-                # Get reviews (only approved ones)
-                cursor.execute("""
-                    SELECT 
-                        r.review_id,
-                        u.first_name || ' ' || u.last_name AS author,
-                        r.rating,
-                        DBMS_LOB.SUBSTR(r.review_text, 1000, 1) AS review_text,
-                        TO_CHAR(r.review_date, 'YYYY-MM-DD') AS review_date
-                    FROM reviews r
-                    JOIN users u ON r.user_id = u.user_id
-                    WHERE r.plant_id = :plant_id AND r.is_approved = 1
-                    ORDER BY r.review_date DESC
-                """, {'plant_id': plant_id})
-                
-                reviews = dictfetchall(cursor)
-                # Safe access to review fields
-                formatted_reviews = []
-                for review in reviews:
-                    formatted_reviews.append({
-                        'review_id': review.get('review_id'),
-                        'author': review.get('author', 'Anonymous'),
-                        'rating': float(review.get('rating', 0)),
-                        'review_text': review.get('review_text', ''),
-                        'review_date': review.get('review_date', '')
-                    })
-                result['reviews'] = formatted_reviews
-                
+                _add_prices(result)
+
                 print(f"Final result for plant {plant_id}: {result}")  # Debug log
                 return JsonResponse({'success': True, 'plant': result})
                 
@@ -202,6 +344,27 @@ def plant_details(request, plant_id):
             return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
+@require_GET
+def plant_batch(request):
+    """Summaries of ?ids=1,2,3 in the order asked; ids of plants that
+    don't exist come back in `missing`"""
+    try:
+        plant_ids = parse_ids(request.GET.get('ids'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    try:
+        summaries = get_summaries(plant_ids)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+    return JsonResponse({
+        'success': True,
+        'plants': [summaries[plant_id] for plant_id in plant_ids if plant_id in summaries],
+        'missing': [plant_id for plant_id in plant_ids if plant_id not in summaries],
+    })
+
+
 # Keep the other functions (add_to_cart, add_review) the same
 @csrf_exempt
 def add_to_cart(request):
@@ -370,6 +533,8 @@ def add_review(request, plant_id):
                         INSERT INTO reviews (review_id, user_id, plant_id, order_id, rating, review_text, review_date, is_approved)
                         VALUES (review_id_seq.NEXTVAL, :user_id, :plant_id, :order_id, :rating, :review_text, SYSTIMESTAMP, 1);
                         
+                        apply_review_rating(:plant_id, :rating, 1);
+                        
                         COMMIT;
                     EXCEPTION
                         WHEN NO_DATA_FOUND THEN
@@ -385,6 +550,10 @@ def add_review(request, plant_id):
                     'rating': rating,
                     'review_text': review_text
                 })
+
+                # Rating changed on the detail page, listings and top plants
+                invalidate(ALL_PLANTS, *tags_for_plants(cursor, [plant_id]))
+                mark_catalog_changed([plant_id])
                 
                 return JsonResponse({
                     'success': True,
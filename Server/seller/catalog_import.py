@@ -0,0 +1,348 @@
+"""Bulk catalog import for sellers.
+
+Reads CSV (with a header row) or JSONL, one plant per row:
+
+  name, base_price, stock_quantity    required
+  description
+  category_ids or categories          category ids, or slugs
+  images, features, care_tips         a list, or comma separated
+  sizes                               "Small:0,Large:5.5", a list of
+                                      {"name", "price_adjustment"} or {name: adjustment}
+
+Rows are parsed as they are read, categories checked against the
+reference-data registry, and written CATALOG_IMPORT_CHUNK_ROWS at a time:
+the chunk's plant ids come from seq_plants in one query, then one
+executemany per table (plants, category mappings, images, features, care
+tips and sizes).
+Each chunk commits together with the import's progress in catalog_imports,
+so running an import again with its import_id skips the rows already
+committed and carries on from there.
+
+Rows that don't validate, or that the database refuses, are skipped and
+recorded with their row number in catalog_import_errors.
+"""
+import codecs
+import csv
+import json
+import time
+from collections import namedtuple
+
+import oracledb
+from django.conf import settings
+from django.db import transaction
+
+from greencart.cache import invalidate, ALL_PLANTS, ALL_CATEGORIES
+from greencart.refdata import refdata
+from plant_collection.search import mark_plants_changed
+
+FORMATS = ('csv', 'jsonl')
+
+# How many row errors a summary lists, all of them are in catalog_import_errors
+REPORTED_ERRORS = 100
+
+Plant = namedtuple('Plant', 'row name description base_price stock_quantity '
+                            'category_ids images features care_tips sizes')
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(filename, explicit=None):
+    fmt = (explicit or '').lower()
+    if not fmt and filename:
+        fmt = 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown import format {fmt!r}, expected csv or jsonl")
+    return fmt
+
+
+def read_rows(stream, fmt):
+    """(row number, dict or RowError) for each data row of a binary stream"""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'csv':
+        for number, raw in enumerate(csv.DictReader(lines), 1):
+            yield number, raw
+        return
+
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            raw = json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f"Invalid JSON: {e}")
+            continue
+        yield number, raw if isinstance(raw, dict) else RowError("Expected a JSON object")
+
+
+def _list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def _text(value, field, limit, required=False):
+    text = str(value).strip() if value is not None else ''
+    if required and not text:
+        raise RowError(f"{field} is required")
+    if len(text) > limit:
+        raise RowError(f"{field} is longer than {limit} characters")
+    return text
+
+
+def _number(value, field, cast, minimum):
+    if value is None or str(value).strip() == '':
+        raise RowError(f"{field} is required")
+    try:
+        number = cast(str(value).strip())
+    except ValueError:
+        raise RowError(f"{field} is not a number: {value!r}")
+    if number < minimum:
+        raise RowError(f"{field} must be at least {minimum}")
+    return number
+
+
+def _categories(raw):
+    ids = []
+    for value in _list(raw.get('category_ids')):
+        try:
+            ids.append(int(value))
+        except ValueError:
+            raise RowError(f"Invalid category id {value!r}")
+    for slug in _list(raw.get('categories')):
+        category = refdata.category_by_slug(slug)
+        if category is None:
+            raise RowError(f"Unknown category {slug!r}")
+        ids.append(category.category_id)
+    ids = list(dict.fromkeys(ids))
+    missing = refdata.missing_category_ids(ids)
+    if missing:
+        raise RowError(f"Unknown category ids {missing}")
+    return ids
+
+
+def _sizes(value):
+    if not value:
+        return []
+    if isinstance(value, dict):
+        pairs = list(value.items())
+    elif isinstance(value, list) and all(isinstance(item, dict) for item in value):
+        pairs = [(item.get('name'), item.get('price_adjustment', 0)) for item in value]
+    else:
+        pairs = [item.split(':', 1) if ':' in item else (item, 0) for item in _list(value)]
+
+    sizes = []
+    for name, adjustment in pairs:
+        name = _text(name, 'size name', 50, required=True)
+        try:
+            sizes.append((name, float(adjustment or 0)))
+        except (TypeError, ValueError):
+            raise RowError(f"Invalid price adjustment for size {name!r}")
+    return sizes
+
+
+def parse_row(number, raw):
+    """Plant for a raw row, RowError if it doesn't validate"""
+    if isinstance(raw, RowError):
+        raise raw
+    raw = {str(key).strip().lower(): value for key, value in raw.items() if key is not None}
+    images = _list(raw.get('images'))
+    features = _list(raw.get('features'))
+    care_tips = _list(raw.get('care_tips'))
+    for field, values in (('image URL', images), ('feature', features), ('care tip', care_tips)):
+        for value in values:
+            _text(value, field, 255)
+    return Plant(
+        number,
+        _text(raw.get('name'), 'name', 100, required=True),
+        str(raw.get('description') or '').strip() or None,
+        _number(raw.get('base_price'), 'base_price', float, 0.01),
+        _number(raw.get('stock_quantity'), 'stock_quantity', int, 0),
+        _categories(raw),
+        images,
+        features,
+        care_tips,
+        _sizes(raw.get('sizes')),
+    )
+
+
+def child_rows(plants, plant_ids):
+    """Bind arrays of the child tables for plants stored under plant_ids;
+    each row starts with its index in `plants`"""
+    mappings, images, features, care_tips, sizes = [], [], [], [], []
+    for i, (plant, plant_id) in enumerate(zip(plants, plant_ids)):
+        if plant_id is None:
+            continue
+        mappings.extend((i, plant_id, category_id) for category_id in plant.category_ids)
+        images.extend((i, plant_id, url, 1 if n == 0 else 0) for n, url in enumerate(plant.images))
+        features.extend((i, plant_id, text) for text in plant.features)
+        care_tips.extend((i, plant_id, text) for text in plant.care_tips)
+        sizes.extend((i, plant_id, name, adjustment) for name, adjustment in plant.sizes)
+    return {
+        'mappings': mappings,
+        'images': images,
+        'features': features,
+        'care_tips': care_tips,
+        'sizes': sizes,
+    }
+
+
+PLANT_IDS_SQL = "SELECT seq_plants.NEXTVAL FROM dual CONNECT BY LEVEL <= :1"
+
+PLANT_SQL = """
+    INSERT INTO plants (plant_id, name, description, base_price, stock_quantity, seller_id, created_at, is_active)
+    VALUES (:1, :2, :3, :4, :5, :6, SYSTIMESTAMP, 1)
+"""
+
+CHILD_SQL = {
+    'mappings': "INSERT INTO plant_category_mapping (plant_id, category_id) VALUES (:1, :2)",
+    'images': "INSERT INTO plant_images (plant_id, image_url, is_primary) VALUES (:1, :2, :3)",
+    'features': "INSERT INTO plant_features (plant_id, feature_text) VALUES (:1, :2)",
+    'care_tips': "INSERT INTO plant_care_tips (plant_id, tip_text) VALUES (:1, :2)",
+    'sizes': "INSERT INTO plant_sizes (plant_id, size_name, price_adjustment) VALUES (:1, :2, :3)",
+}
+
+
+class CatalogImport:
+
+    def __init__(self, cursor, seller_id, import_id=None, source_name=None, chunk_rows=None):
+        """`cursor` is a plain oracledb cursor"""
+        self.cursor = cursor
+        self.seller_id = seller_id
+        self.import_id = import_id
+        self.source_name = source_name
+        self.chunk_rows = chunk_rows or settings.CATALOG_IMPORT_CHUNK_ROWS
+        self.rows_done = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.seconds = 0.0
+        self.rows_read = 0
+
+    def _start(self):
+        if self.import_id is None:
+            import_id = self.cursor.var(oracledb.DB_TYPE_NUMBER)
+            self.cursor.execute("""
+                INSERT INTO catalog_imports (seller_id, source_name) VALUES (:1, :2)
+                RETURNING import_id INTO :3
+            """, [self.seller_id, (self.source_name or '')[:255] or None, import_id])
+            self.import_id = int(import_id.getvalue()[0])
+            return
+
+        self.cursor.execute("""
+            SELECT rows_done, rows_imported, rows_failed FROM catalog_imports
+            WHERE import_id = :1 AND seller_id = :2
+        """, [self.import_id, self.seller_id])
+        row = self.cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Import {self.import_id} not found for seller {self.seller_id}")
+        self.rows_done, self.imported, self.failed = row
+
+    def run(self, rows):
+        """Import (row number, raw row) pairs, returns the summary"""
+        start = time.perf_counter()
+        # The chunk's new plant ids come back in one fetch
+        self.cursor.arraysize = self.chunk_rows
+        self.cursor.prefetchrows = self.chunk_rows
+        with transaction.atomic():
+            self._start()
+
+        resume_after = self.rows_done
+        plants, errors = [], []
+        last_row = resume_after
+        for number, raw in rows:
+            if number <= resume_after:
+                continue
+            self.rows_read += 1
+            last_row = number
+            try:
+                plants.append(parse_row(number, raw))
+            except RowError as e:
+                errors.append((number, str(e)))
+            if len(plants) + len(errors) >= self.chunk_rows:
+                self._write_chunk(plants, errors, last_row)
+                plants, errors = [], []
+        self._write_chunk(plants, errors, last_row, completed=True)
+
+        self.seconds = time.perf_counter() - start
+        return self.summary()
+
+    def _write_chunk(self, plants, errors, last_row, completed=False):
+        """One transaction: the chunk's plants and their details, its errors
+        and the import's progress. `errors` are the rows that didn't validate"""
+        cursor = self.cursor
+        failed = list(errors)
+        incomplete = []
+        plant_ids = [None] * len(plants)
+
+        with transaction.atomic():
+            if plants:
+                cursor.execute(PLANT_IDS_SQL, [len(plants)])
+                new_ids = [int(row[0]) for row in cursor.fetchall()]
+                # Descriptions are CLOBs and may be longer than a VARCHAR2 bind
+                cursor.setinputsizes(None, None, oracledb.DB_TYPE_LONG)
+                cursor.executemany(PLANT_SQL, [
+                    (plant_id, p.name, p.description, p.base_price, p.stock_quantity, self.seller_id)
+                    for plant_id, p in zip(new_ids, plants)
+                ], batcherrors=True)
+                refused = {error.offset: error.message for error in cursor.getbatcherrors()}
+                for i, plant in enumerate(plants):
+                    if i in refused:
+                        failed.append((plant.row, refused[i]))
+                    else:
+                        plant_ids[i] = new_ids[i]
+
+                # A detail the database refuses leaves the plant without it, the row still counts
+                refused_details = {}
+                for table, binds in child_rows(plants, plant_ids).items():
+                    if not binds:
+                        continue
+                    cursor.executemany(CHILD_SQL[table], [row[1:] for row in binds], batcherrors=True)
+                    for error in cursor.getbatcherrors():
+                        refused_details.setdefault(binds[error.offset][0], f"{table}: {error.message}")
+                for i, message in sorted(refused_details.items()):
+                    incomplete.append((plants[i].row, f"Plant {plant_ids[i]} stored without some {message}"))
+
+            stored = len(plants) - (len(failed) - len(errors))
+            if failed or incomplete:
+                cursor.executemany("""
+                    INSERT INTO catalog_import_errors (import_id, source_row, message) VALUES (:1, :2, :3)
+                """, [(self.import_id, number, message[:500]) for number, message in failed + incomplete])
+
+            cursor.execute("""
+                UPDATE catalog_imports
+                SET rows_done = :1,
+                    rows_imported = rows_imported + :2,
+                    rows_failed = rows_failed + :3,
+                    status = :4,
+                    updated_at = SYSTIMESTAMP
+                WHERE import_id = :5
+            """, [last_row, stored, len(failed), 'completed' if completed else 'running', self.import_id])
+
+        self.rows_done = last_row
+        self.imported += stored
+        self.failed += len(failed)
+        reported = sorted(failed + incomplete)
+        self.errors.extend(reported[:max(0, REPORTED_ERRORS - len(self.errors))])
+
+        stored_ids = [plant_id for plant_id in plant_ids if plant_id is not None]
+        if stored_ids:
+            invalidate(ALL_PLANTS, ALL_CATEGORIES)
+            mark_plants_changed(stored_ids)
+
+    def summary(self):
+        return {
+            'import_id': self.import_id,
+            'rows_done': self.rows_done,
+            'rows_read': self.rows_read,
+            'imported': self.imported,
+            'failed': self.failed,
+            'seconds': round(self.seconds, 2),
+            'rows_per_second': round(self.rows_read / self.seconds) if self.seconds else None,
+            'errors': [{'row': number, 'error': message} for number, message in self.errors],
+        }
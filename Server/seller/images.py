@@ -0,0 +1,69 @@
+"""Plant images that are still uploading.
+
+add_plant stores the plant right away with a plant_images row per photo.
+A photo whose content was stored before gets its URL at once; the others
+get MEDIA_PENDING_IMAGE_URL and upload_status 'pending' until the upload
+pipeline (greencart/media.py) has stored them. Then the row gets the real
+URL (or 'failed'), the plant's cached listings are dropped and the seller
+is told over the live updates socket.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from greencart.cache import invalidate, tags_for_plants, ALL_PLANTS
+from greencart.events import publish, user_group
+from greencart.media import uploads
+from plant_collection.search import mark_plants_changed
+
+logger = logging.getLogger(__name__)
+
+PLANTS_FOLDER = 'plants/'
+
+
+def add_plant_images(cursor, plant_id, seller_id, pending_uploads):
+    """plant_images rows for PendingUploads, the first one primary.
+    Returns what the response reports per image"""
+    images = []
+    rows = []
+    for i, pending in enumerate(pending_uploads):
+        ready = pending.future.done() and pending.future.exception() is None
+        url = pending.future.result().url if ready else settings.MEDIA_PENDING_IMAGE_URL
+        status = 'ready' if ready else 'pending'
+        rows.append([plant_id, url, 1 if i == 0 else 0, pending.digest, status])
+        images.append({'filename': pending.filename, 'content_hash': pending.digest, 'url': url, 'status': status})
+
+    if rows:
+        cursor.executemany("""
+            INSERT INTO plant_images (plant_id, image_url, is_primary, content_hash, upload_status)
+            VALUES (%s, %s, %s, %s, %s)
+        """, rows)
+
+    for pending, row in zip(pending_uploads, rows):
+        if row[4] == 'pending':
+            uploads.when_stored(pending, lambda stored, digest=pending.digest: _stored(plant_id, seller_id, digest, stored))
+    return images
+
+
+def _stored(plant_id, seller_id, digest, stored):
+    """Upload thread: fill in the rows waiting for `digest`"""
+    with connection.cursor() as cursor:
+        if stored is None:
+            cursor.execute("""
+                UPDATE plant_images SET upload_status = 'failed'
+                WHERE plant_id = %s AND content_hash = %s AND upload_status = 'pending'
+            """, [plant_id, digest])
+        else:
+            cursor.execute("""
+                UPDATE plant_images SET image_url = %s, upload_status = 'ready'
+                WHERE plant_id = %s AND content_hash = %s AND upload_status = 'pending'
+            """, [stored.url, plant_id, digest])
+        invalidate(ALL_PLANTS, *tags_for_plants(cursor, [plant_id]))
+    mark_plants_changed([plant_id])
+
+    publish([user_group(seller_id)], 'plant.image',
+            plant_id=int(plant_id),
+            content_hash=digest,
+            status='failed' if stored is None else 'ready',
+            url=stored.url if stored else None)
@@ -0,0 +1,118 @@
+"""Bulk stock sync for sellers, e.g. a nightly export from their ERP.
+
+sync_stock() applies thousands of (plant_id, stock_quantity) pairs in one
+transaction and a handful of statements:
+
+  1. lock the seller's active plants among them and read their stock, the
+     plant ids bound as one collection;
+  2. write the ones that changed with one array-bound MERGE;
+  3. settle low-stock alerts for the whole set: one INSERT opens an alert
+     for every plant that fell below LOW_STOCK_THRESHOLD, one UPDATE
+     resolves those that climbed back to it.
+
+trg_check_low_stock and trg_resolve_low_stock would otherwise look up and
+write alerts row by row; they stand aside while stock_sync.g_active is set
+around the MERGE.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from greencart.db.binds import number_list
+from greencart.events import LOW_STOCK_THRESHOLD
+
+StockChange = namedtuple('StockChange', 'plant_id name old new')
+
+LOCK_SQL = """
+    SELECT plant_id, name, stock_quantity
+    FROM plants
+    WHERE plant_id IN (SELECT column_value FROM TABLE(:plant_ids))
+    AND seller_id = :seller_id AND is_active = 1
+    FOR UPDATE OF stock_quantity
+"""
+
+MERGE_SQL = """
+    MERGE INTO plants p
+    USING (SELECT :1 AS plant_id, :2 AS stock_quantity FROM dual) s
+    ON (p.plant_id = s.plant_id)
+    WHEN MATCHED THEN UPDATE SET
+        p.stock_quantity = s.stock_quantity,
+        p.updated_at = SYSTIMESTAMP
+"""
+
+OPEN_ALERTS_SQL = """
+    INSERT INTO low_stock_alerts (plant_id, current_stock, threshold)
+    SELECT p.plant_id, p.stock_quantity, :threshold
+    FROM plants p
+    WHERE p.plant_id IN (SELECT column_value FROM TABLE(:plant_ids))
+    AND NOT EXISTS (
+        SELECT 1 FROM low_stock_alerts a WHERE a.plant_id = p.plant_id AND a.is_resolved = 0
+    )
+"""
+
+RESOLVE_ALERTS_SQL = """
+    UPDATE low_stock_alerts
+    SET is_resolved = 1, resolved_date = SYSTIMESTAMP
+    WHERE plant_id IN (SELECT column_value FROM TABLE(:plant_ids))
+    AND is_resolved = 0
+"""
+
+
+def parse_items(items):
+    """{plant_id: stock_quantity} from [{"plant_id", "stock_quantity"}] or
+    [[plant_id, stock_quantity]]; a plant listed twice keeps its last value"""
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    if len(items) > settings.INVENTORY_SYNC_MAX_ITEMS:
+        raise ValueError(f"At most {settings.INVENTORY_SYNC_MAX_ITEMS} items per request")
+
+    stock = {}
+    for i, item in enumerate(items):
+        try:
+            if isinstance(item, dict):
+                plant_id, quantity = item['plant_id'], item['stock_quantity']
+            else:
+                plant_id, quantity = item
+            plant_id, quantity = int(plant_id), int(quantity)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Item {i}: expected plant_id and a whole stock_quantity")
+        if quantity < 0:
+            raise ValueError(f"Item {i}: stock_quantity can't be negative")
+        stock[plant_id] = quantity
+    return stock
+
+
+def sync_stock(cursor, seller_id, stock):
+    """Set stock for the seller's plants, `stock` is {plant_id: quantity}.
+    `cursor` is a plain oracledb cursor. Returns (changes, unchanged,
+    missing): StockChange per plant written, how many already had that
+    stock, and the plant ids that aren't the seller's active plants"""
+    with transaction.atomic():
+        cursor.arraysize = 1000
+        cursor.prefetchrows = 1000
+        cursor.execute(LOCK_SQL, {'plant_ids': number_list(cursor, stock), 'seller_id': seller_id})
+        current = {int(plant_id): (name, old) for plant_id, name, old in cursor.fetchall()}
+
+        changes = [
+            StockChange(plant_id, name, old, stock[plant_id])
+            for plant_id, (name, old) in current.items()
+            if old != stock[plant_id]
+        ]
+        if changes:
+            cursor.execute("BEGIN stock_sync.g_active := TRUE; END;")
+            try:
+                cursor.executemany(MERGE_SQL, [(change.plant_id, change.new) for change in changes])
+            finally:
+                cursor.execute("BEGIN stock_sync.g_active := FALSE; END;")
+
+            fell = [c.plant_id for c in changes if c.new < LOW_STOCK_THRESHOLD <= c.old]
+            rose = [c.plant_id for c in changes if c.old < LOW_STOCK_THRESHOLD <= c.new]
+            if fell:
+                cursor.execute(OPEN_ALERTS_SQL, {'threshold': LOW_STOCK_THRESHOLD,
+                                                 'plant_ids': number_list(cursor, fell)})
+            if rose:
+                cursor.execute(RESOLVE_ALERTS_SQL, {'plant_ids': number_list(cursor, rose)})
+
+    missing = sorted(set(stock) - set(current))
+    return changes, len(current) - len(changes), missing
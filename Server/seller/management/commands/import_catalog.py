@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from seller.catalog_import import CatalogImport, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk import a seller's plants from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (with a header row) or JSONL file")
+        parser.add_argument('--seller', type=int, required=True, help="Seller's user_id")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help="Default from the file extension")
+        parser.add_argument('--resume', type=int, default=None, metavar='IMPORT_ID',
+                            help="Carry on an import that stopped part way")
+        parser.add_argument('--chunk', type=int, default=None,
+                            help="Rows per committed chunk (default CATALOG_IMPORT_CHUNK_ROWS)")
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        job = None
+        try:
+            with open(options['path'], 'rb') as stream, connection.cursor() as cursor, \
+                    cursor.connection.cursor() as raw_cursor:
+                job = CatalogImport(raw_cursor, options['seller'], options['resume'], options['path'],
+                                    options['chunk'])
+                summary = job.run(read_rows(stream, fmt))
+        except Exception as e:
+            if job is not None and job.import_id is not None:
+                raise CommandError(f"{e}\nRows up to {job.rows_done} are committed, "
+                                   f"rerun with --resume {job.import_id}")
+            raise
+
+        self.stdout.write(
+            f"Import {summary['import_id']}: {summary['imported']} plant(s) imported, {summary['failed']} row(s) "
+            f"failed, {summary['rows_read']} row(s) in {summary['seconds']} s "
+            f"({summary['rows_per_second']} rows/s)"
+        )
+        for error in summary['errors'][:20]:
+            self.stdout.write(f"  row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS("Done"))
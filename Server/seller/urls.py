@@ -10,6 +10,8 @@ urlpatterns = [
     path('<int:seller_id>/low-stock/', views.low_stock_plants, name='low_stock_plants'),
     path('<int:seller_id>/plants/', views.seller_plants, name='seller_plants'),
     path('<int:seller_id>/sales/', views.sales_records, name='sales_records'),
+    path('<int:seller_id>/catalog-import/', views.import_catalog, name='import_catalog'),
+    path('<int:seller_id>/inventory/', views.sync_inventory, name='sync_inventory'),
     
     # Plant Management
     path('plants/add/', views.add_plant, name='add_plant'),
@@ -4,6 +4,16 @@ from django.db import connection
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
+from greencart.cache import invalidate, tags_for_plants, ALL_PLANTS, ALL_CATEGORIES, ALL_SELLERS
+from greencart.events import LOW_STOCK_THRESHOLD, stock_changed, stock_crossed
+from greencart.media import uploads
+from greencart.refdata import refdata, bump_version
+from greencart.tokens import is_user
+from plant_collection.catalog import mark_catalog_changed
+from plant_collection.search import mark_plants_changed
+from .images import PLANTS_FOLDER, add_plant_images
+from .catalog_import import CatalogImport, detect_format, read_rows
+from .inventory import parse_items, sync_stock
 import cloudinary
 import cloudinary.uploader
 import os
@@ -55,23 +65,16 @@ def seller_dashboard(request, seller_id):
             cursor.execute("""
                 SELECT 
                     (SELECT COUNT(*) FROM plants WHERE seller_id = %s AND is_active = 1) AS total_plants,
+                    -- Delivered sales come from the monthly rollup
                     (
-                        SELECT NVL(SUM(oi.quantity), 0) 
-                        FROM order_items oi 
-                        JOIN plants p ON oi.plant_id = p.plant_id 
-                        JOIN orders o ON oi.order_id = o.order_id 
-                        JOIN order_statuses os ON o.status_id = os.status_id
-                        WHERE p.seller_id = %s 
-                        AND os.status_name = 'Delivered'
+                        SELECT NVL(SUM(items_sold), 0) 
+                        FROM seller_monthly_earnings 
+                        WHERE seller_id = %s
                     ) AS total_sold,
                     (
-                        SELECT NVL(SUM(oi.quantity * oi.unit_price * 0.9), 0) 
-                        FROM order_items oi 
-                        JOIN plants p ON oi.plant_id = p.plant_id 
-                        JOIN orders o ON oi.order_id = o.order_id 
-                        JOIN order_statuses os ON o.status_id = os.status_id
-                        WHERE p.seller_id = %s 
-                        AND os.status_name = 'Delivered'
+                        SELECT NVL(SUM(earnings), 0) 
+                        FROM seller_monthly_earnings 
+                        WHERE seller_id = %s
                     ) AS total_earnings,
                     (
                         SELECT COUNT(*) FROM plants 
@@ -89,7 +92,7 @@ def seller_dashboard(request, seller_id):
                     TO_CHAR(o.order_date, 'YYYY-MM-DD') AS order_date,
                     p.name AS plant_name,
                     oi.quantity,
-                    (oi.quantity * oi.unit_price) AS total_amount
+                    ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS total_amount
                 FROM order_items oi
                 JOIN plants p ON oi.plant_id = p.plant_id
                 JOIN orders o ON oi.order_id = o.order_id
@@ -191,23 +194,16 @@ def seller_stats(request, seller_id):
             cursor.execute("""
                 SELECT 
                     (SELECT COUNT(*) FROM plants WHERE seller_id = %s AND is_active = 1) AS total_plants,
+                    -- Delivered sales come from the monthly rollup
                     (
-                        SELECT NVL(SUM(oi.quantity), 0) 
-                        FROM order_items oi 
-                        JOIN plants p ON oi.plant_id = p.plant_id 
-                        JOIN orders o ON oi.order_id = o.order_id 
-                        JOIN order_statuses os ON o.status_id = os.status_id
-                        WHERE p.seller_id = %s 
-                        AND os.status_name = 'Delivered'
+                        SELECT NVL(SUM(items_sold), 0) 
+                        FROM seller_monthly_earnings 
+                        WHERE seller_id = %s
                     ) AS total_sold,
                     (
-                        SELECT NVL(SUM(oi.quantity * oi.unit_price * 0.9), 0) 
-                        FROM order_items oi 
-                        JOIN plants p ON oi.plant_id = p.plant_id 
-                        JOIN orders o ON oi.order_id = o.order_id 
-                        JOIN order_statuses os ON o.status_id = os.status_id
-                        WHERE p.seller_id = %s 
-                        AND os.status_name = 'Delivered'
+                        SELECT NVL(SUM(earnings), 0) 
+                        FROM seller_monthly_earnings 
+                        WHERE seller_id = %s
                     ) AS total_earnings
                 FROM dual
             """, [seller_id, seller_id, seller_id])
@@ -250,7 +246,7 @@ def recent_sales(request, seller_id):
                     TO_CHAR(o.order_date, 'YYYY-MM-DD') AS order_date,
                     p.name AS plant_name,
                     oi.quantity,
-                    (oi.quantity * oi.unit_price) AS total_amount
+                    ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS total_amount
                 FROM order_items oi
                 JOIN plants p ON oi.plant_id = p.plant_id
                 JOIN orders o ON oi.order_id = o.order_id
@@ -365,8 +361,8 @@ def sales_records(request, seller_id):
                     p.name AS plant_name,
                     oi.quantity,
                     oi.unit_price,
-                    (oi.quantity * oi.unit_price) AS total_amount,
-                    (oi.quantity * oi.unit_price * 0.9) AS seller_earnings,
+                    ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) AS total_amount,
+                    ROUND(oi.quantity * oi.unit_price * (1 - NVL(oi.discount_applied, 0) / 100), 2) * 0.9 AS seller_earnings,
                     os.status_name AS order_status
                 FROM order_items oi
                 JOIN plants p ON oi.plant_id = p.plant_id
@@ -394,6 +390,16 @@ def sales_records(request, seller_id):
 def get_categories(request):
     """Get all available plant categories"""
     try:
+        results = [
+            {'CATEGORY_ID': c.category_id, 'NAME': c.name, 'SLUG': c.slug, 'DESCRIPTION': c.description}
+            for c in refdata.all_categories()
+        ]
+        if results:
+            return JsonResponse({
+                'success': True,
+                'categories': results
+            })
+        
         with connection.cursor() as cursor:
             cursor.execute("""
                 SELECT category_id, name, slug, description
@@ -417,6 +423,7 @@ def get_categories(request):
                         INSERT INTO plant_categories (name, slug, description)
                         VALUES (%s, %s, %s)
                     """, [name, slug, description])
+                bump_version()
                 
                 cursor.execute("""
                     SELECT category_id, name, slug, description
@@ -439,7 +446,7 @@ def get_categories(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def add_plant(request):
-    """Add a new plant with image upload to Cloudinary - WITH CATEGORY VALIDATION"""
+    """Add a new plant; uploaded photos are stored in the background - WITH CATEGORY VALIDATION"""
     try:
         if request.content_type == 'application/json':
             data = json.loads(request.body)
@@ -462,48 +469,35 @@ def add_plant(request):
         if category_ids:
             category_id_list = [int(cid.strip()) for cid in category_ids.split(',') if cid.strip()]
             
-            with connection.cursor() as cursor:
-                if category_id_list:
-                    placeholders = ','.join(['%s'] * len(category_id_list))
-                    cursor.execute(f"""
-                        SELECT COUNT(*) FROM plant_categories 
-                        WHERE category_id IN ({placeholders})
-                    """, category_id_list)
-                    
-                    valid_categories_count = cursor.fetchone()[0]
-                    
-                    if valid_categories_count != len(category_id_list):
-                        return JsonResponse({
-                            'success': False,
-                            'error': 'One or more category IDs are invalid. Use /seller/categories/ to get valid categories.'
-                        }, status=400)
+            if refdata.missing_category_ids(category_id_list):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'One or more category IDs are invalid. Use /seller/categories/ to get valid categories.'
+                }, status=400)
         
         image_urls = []
+        pending_uploads = []
         
         if images:
-            for image_file in images:
-                upload_result = cloudinary.uploader.upload(
-                    image_file,
-                    folder="plants/"
-                )
-                image_urls.append(upload_result['secure_url'])
+            # All photos upload in parallel while the plant is stored
+            pending_uploads = [uploads.submit(image_file, PLANTS_FOLDER) for image_file in images]
         else:
             image_urls_str = data.get('images', '')
             if image_urls_str:
                 image_urls = [url.strip() for url in image_urls_str.split(',') if url.strip()]
         
-        image_urls_str = ','.join(image_urls)
-        
         with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM users u
-                JOIN user_roles ur ON u.user_id = ur.user_id
-                JOIN roles r ON ur.role_id = r.role_id
-                WHERE u.user_id = %s AND r.role_name = 'seller'
-            """, [seller_id])
-            
-            seller_count = cursor.fetchone()[0]
+            # A seller token for this seller_id already says so, otherwise ask the database
+            if is_user(request, seller_id, 'seller'):
+                seller_count = 1
+            else:
+                cursor.execute("""
+                    SELECT COUNT(*) 
+                    FROM user_roles ur
+                    WHERE ur.user_id = %s AND ur.role_id = %s
+                """, [seller_id, refdata.role_id('seller')])
+                
+                seller_count = cursor.fetchone()[0]
             
             if seller_count == 0:
                 return JsonResponse({
@@ -526,7 +520,10 @@ def add_plant(request):
                         VALUES (%s, %s)
                     """, [new_plant_id, category_id])
             
-            if image_urls:
+            uploaded_images = add_plant_images(cursor, new_plant_id, seller_id, pending_uploads)
+            if uploaded_images:
+                image_urls = [image['url'] for image in uploaded_images]
+            elif image_urls:
                 for i, image_url in enumerate(image_urls):
                     is_primary = 1 if i == 0 else 0
                     cursor.execute("""
@@ -563,12 +560,17 @@ def add_plant(request):
                             """, [new_plant_id, size_name.strip(), price_adjustment])
                         except ValueError:
                             pass
+
+            # New plant shows up in its categories, category counts and top plants
+            invalidate(ALL_PLANTS, ALL_CATEGORIES, *tags_for_plants(cursor, [new_plant_id]))
+            mark_plants_changed([new_plant_id])
             
             return JsonResponse({
                 'success': True,
                 'message': 'Plant added successfully',
                 'plant_id': new_plant_id,
-                'image_urls': image_urls
+                'image_urls': image_urls,
+                'images': uploaded_images
             })
             
     except Exception as e:
@@ -586,6 +588,14 @@ def update_plant(request, plant_id):
         requestor_id = data.get('requestor_id')
         
         with connection.cursor() as cursor:
+            # Categories may change, so drop both the old and the new listings
+            old_tags = tags_for_plants(cursor, [plant_id])
+            stock_before = {}
+            if data.get('stock_quantity') is not None:
+                cursor.execute("SELECT stock_quantity FROM plants WHERE plant_id = %s", [plant_id])
+                row = cursor.fetchone()
+                if row:
+                    stock_before[plant_id] = row[0]
             cursor.callproc('update_plant_details', [
                 int(requestor_id), 
                 int(plant_id),
@@ -599,6 +609,9 @@ def update_plant(request, plant_id):
                 data.get('care_tips'),
                 data.get('sizes')
             ])
+            invalidate(ALL_PLANTS, ALL_CATEGORIES, *old_tags, *tags_for_plants(cursor, [plant_id]))
+            mark_plants_changed([plant_id])
+            stock_changed(cursor, stock_before)
             
             return JsonResponse({
                 'success': True,
@@ -636,7 +649,7 @@ def plant_details(request, plant_id):
 @csrf_exempt
 @require_http_methods(["POST"])
 def upload_images(request):
-    """Upload multiple images to Cloudinary and return URLs"""
+    """Upload multiple images in parallel and return URLs"""
     try:
         if 'images' not in request.FILES:
             return JsonResponse({
@@ -644,18 +657,15 @@ def upload_images(request):
                 'error': 'No image files provided'
             }, status=400)
         
-        image_urls = []
         image_files = request.FILES.getlist('images')
+        pending_uploads = [uploads.submit(image_file, PLANTS_FOLDER) for image_file in image_files]
         
-        for image_file in image_files:
-            upload_result = cloudinary.uploader.upload(
-                image_file,
-                folder="plants/"
-            )
+        image_urls = []
+        for pending, stored in zip(pending_uploads, uploads.wait(pending_uploads)):
             image_urls.append({
-                'url': upload_result['secure_url'],
-                'public_id': upload_result['public_id'],
-                'filename': image_file.name
+                'url': stored.url,
+                'public_id': stored.public_id,
+                'filename': pending.filename
             })
         
         return JsonResponse({
@@ -713,14 +723,14 @@ def record_manual_sale(request):
                 ) VALUES (
                     'MANUAL_' || TO_CHAR(SYSTIMESTAMP, 'YYYYMMDDHH24MISS') || '_' || %s,
                     (SELECT user_id FROM users WHERE email = %s AND ROWNUM = 1),
-                    (SELECT status_id FROM order_statuses WHERE status_name = 'Delivered'),
+                    %s,
                     %s,
                     SYSTIMESTAMP,
                     'Manual Sale - No Delivery',
                     'Completed',
                     1
                 )
-            """, [seller_id, customer_email, sale_price * quantity])
+            """, [seller_id, customer_email, refdata.status_id('Delivered'), sale_price * quantity])
             
             cursor.execute("SELECT seq_orders.CURRVAL FROM dual")
             order_id = cursor.fetchone()[0]
@@ -735,6 +745,9 @@ def record_manual_sale(request):
                 SET stock_quantity = stock_quantity - %s
                 WHERE plant_id = %s
             """, [quantity, plant_id])
+            stock_changed(cursor, {int(plant_id): stock_quantity})
+            mark_catalog_changed([plant_id])
+            invalidate(ALL_SELLERS)
             
             return JsonResponse({
                 'success': True,
@@ -770,6 +783,103 @@ def test_connection(request):
             'error': str(e)
         }, status=500)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def import_catalog(request, seller_id):
+    """Bulk import plants from a CSV or JSONL upload ('file'), or the raw request body.
+    Pass import_id to resume an import that stopped part way"""
+    job = None
+    try:
+        upload = request.FILES.get('file')
+        if upload is not None:
+            stream, source_name = upload, upload.name
+        else:
+            stream, source_name = request, None
+        content_type = request.content_type or ''
+        fmt = request.GET.get('format') or ('jsonl' if 'json' in content_type else None)
+        try:
+            fmt = detect_format(source_name, fmt) if (fmt or source_name) else 'csv'
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        import_id = request.GET.get('import_id') or request.POST.get('import_id')
+        
+        with connection.cursor() as cursor:
+            if not is_user(request, seller_id, 'seller'):
+                cursor.execute("""
+                    SELECT COUNT(*) 
+                    FROM user_roles ur
+                    WHERE ur.user_id = %s AND ur.role_id = %s
+                """, [seller_id, refdata.role_id('seller')])
+                if cursor.fetchone()[0] == 0:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'User is not a seller. Please register as a seller first.'
+                    }, status=400)
+            
+            with cursor.connection.cursor() as raw_cursor:
+                job = CatalogImport(raw_cursor, seller_id, int(import_id) if import_id else None, source_name)
+                summary = job.run(read_rows(stream, fmt))
+        
+        return JsonResponse({'success': True, **summary})
+        
+    except Exception as e:
+        # Committed chunks stay, the same import_id picks up after them
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'import_id': job.import_id if job else None,
+            'rows_done': job.rows_done if job else 0
+        }, status=400 if isinstance(e, ValueError) else 500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def sync_inventory(request, seller_id):
+    """Set stock for many plants at once: {"items": [{"plant_id", "stock_quantity"}, ...]}.
+    All or nothing, plants that aren't the seller's come back in not_found"""
+    try:
+        data = json.loads(request.body)
+        try:
+            stock = parse_items(data.get('items'))
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        
+        with connection.cursor() as cursor:
+            if not is_user(request, seller_id, 'seller'):
+                cursor.execute("""
+                    SELECT COUNT(*) 
+                    FROM user_roles ur
+                    WHERE ur.user_id = %s AND ur.role_id = %s
+                """, [seller_id, refdata.role_id('seller')])
+                if cursor.fetchone()[0] == 0:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'User is not a seller. Please register as a seller first.'
+                    }, status=400)
+            
+            with cursor.connection.cursor() as raw_cursor:
+                changes, unchanged, missing = sync_stock(raw_cursor, seller_id, stock)
+            
+            changed_ids = [change.plant_id for change in changes]
+            if changed_ids:
+                invalidate(ALL_PLANTS, *tags_for_plants(cursor, changed_ids))
+                mark_catalog_changed(changed_ids)
+                stock_crossed([(c.plant_id, c.name, seller_id, c.old, c.new) for c in changes])
+        
+        return JsonResponse({
+            'success': True,
+            'updated': len(changes),
+            'unchanged': unchanged,
+            'not_found': missing,
+            'low_stock': [c.plant_id for c in changes if c.new < LOW_STOCK_THRESHOLD <= c.old],
+            'replenished': [c.plant_id for c in changes if c.old < LOW_STOCK_THRESHOLD <= c.new]
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def debug_seller(request, seller_id):
@@ -6,6 +6,9 @@ import os
 import cloudinary
 import cloudinary.uploader
 from dotenv import load_dotenv
+from greencart.activity import log_activity
+from greencart.events import publish, user_group
+from greencart.media import uploads
 
 load_dotenv()
 
@@ -77,6 +80,18 @@ def user_profile_view(request, user_id):
     except Exception as e:
         return JsonResponse({"error": f"Server error: {str(e)}"}, status=500)
 
+PROFILE_FOLDER = 'user_profiles'
+
+
+def _profile_image_stored(user_id, stored):
+    """Upload thread: put the stored profile image on the user"""
+    if stored is not None:
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE users SET profile_image = %s WHERE user_id = %s", [stored.url, user_id])
+    publish([user_group(user_id)], 'profile.image',
+            status='failed' if stored is None else 'ready',
+            url=stored.url if stored else None)
+
 # Update user profile
 @csrf_exempt
 def update_user_profile_view(request, requestor_id, user_id):
@@ -98,13 +113,18 @@ def update_user_profile_view(request, requestor_id, user_id):
         address = data.get("address")
         profile_image = data.get("profile_image")
         
-        # Handle file upload if present
+        # Handle file upload if present: it's stored in the background and the
+        # new image replaces the old one once it is (None keeps the old one)
+        pending_image = None
         if "profile_image" in request.FILES:
             try:
-                upload_result = cloudinary.uploader.upload(request.FILES["profile_image"])
-                profile_image = upload_result.get("secure_url")
+                pending_image = uploads.submit(request.FILES["profile_image"], PROFILE_FOLDER)
             except Exception as e:
                 return JsonResponse({"error": f"Image upload failed: {str(e)}"}, status=400)
+            profile_image = None
+            if pending_image.future.done() and pending_image.future.exception() is None:
+                profile_image = pending_image.future.result().url
+                pending_image = None
 
         # Call the stored procedure
         with connection.cursor() as cursor:
@@ -113,14 +133,17 @@ def update_user_profile_view(request, requestor_id, user_id):
                 [requestor_id, user_id, username, email, first_name, last_name, phone, address, profile_image]
             )
             
+        if pending_image is not None:
+            uploads.when_stored(pending_image, lambda stored: _profile_image_stored(user_id, stored))
+            
         # Log the activity
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO activity_log (user_id, activity_type, activity_details, ip_address)
-                VALUES (%s, 'PROFILE_UPDATE', 'User updated their profile', %s)
-            """, [requestor_id, get_client_ip(request)])
+        log_activity('PROFILE_UPDATE', 'User updated their profile', requestor_id, get_client_ip(request))
             
-        return JsonResponse({"success": True, "message": "Profile updated successfully"})
+        return JsonResponse({
+            "success": True,
+            "message": "Profile updated successfully",
+            "profile_image_pending": pending_image is not None
+        })
         
     except DatabaseError as e:
         error_msg = str(e)
@@ -151,11 +174,7 @@ def delete_user_account_view(request, requestor_id, user_id):
             cursor.callproc("delete_user_account", [requestor_id, user_id])
             
         # Log the activity
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO activity_log (user_id, activity_type, activity_details, ip_address)
-                VALUES (%s, 'ACCOUNT_DELETED', 'User account deleted', %s)
-            """, [requestor_id, get_client_ip(request)])
+        log_activity('ACCOUNT_DELETED', 'User account deleted', requestor_id, get_client_ip(request))
             
         return JsonResponse({"success": True, "message": "Account deleted successfully"})
         